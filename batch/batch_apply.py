@@ -416,7 +416,7 @@ class BatchApplyTask(BatchTask):
         saveJson |= jsonModified
 
         if self.deleteJson:
-            self.deleteJsonFile(captionFile.jsonPath)
+            self.deleteJsonFile(captionFile)
 
         if saveJson:
             captionFile.saveToJson()
@@ -477,12 +477,11 @@ class BatchApplyTask(BatchTask):
         return False
 
 
-    def deleteJsonFile(self, path: str) -> None:
-        if path.endswith(".json") and os.path.isfile(path):
-            os.remove(path)
-            self.log(f"Deleted {path}")
+    def deleteJsonFile(self, captionFile: CaptionFile) -> None:
+        if captionFile.deleteJson():
+            self.log(f"Deleted {captionFile.jsonPath}")
         else:
-            self.log(f"WARNING: Could not delete {path}")
+            self.log(f"WARNING: Could not delete {captionFile.jsonPath}")
 
 
 
@@ -199,9 +199,10 @@ class BatchCrop(QtWidgets.QWidget):
         layout.addWidget(self.cboOutputMaskMode, row, 1)
 
         config = Config.exportPresets.get(self.EXPORT_PRESET_KEY_OUTMASK, {})
-        self.outputMaskPathSettings = export.PathSettings(self.outputPathParser, showInfo=False)
+        self.outputMaskPathSettings = export.PathSettings(self.outputPathParser, showInfo=False, showEncoder=True)
         self.outputMaskPathSettings.pathTemplate   = config.get("path_template", "{{path}}_{{region}}_{{w}}x{{h}}-masklabel.png")
         self.outputMaskPathSettings.overwriteFiles = config.get("overwrite", False)
+        self.outputMaskPathSettings.encoderProfile = export.getPresetEncoderProfile(config)
         layout.addWidget(self.outputMaskPathSettings, row, 3, 3, 1)
 
         row += 1
@@ -231,9 +232,10 @@ class BatchCrop(QtWidgets.QWidget):
         layout.addWidget(self.cboInterpUp, row, 1)
 
         config = Config.exportPresets.get(self.EXPORT_PRESET_KEY_IMG, {})
-        self.outputImagePathSettings = export.PathSettings(self.outputPathParser, showInfo=False)
+        self.outputImagePathSettings = export.PathSettings(self.outputPathParser, showInfo=False, showEncoder=True)
         self.outputImagePathSettings.pathTemplate   = config.get("path_template", "{{path}}_{{region}}_{{w}}x{{h}}.png")
         self.outputImagePathSettings.overwriteFiles = config.get("overwrite", False)
+        self.outputImagePathSettings.encoderProfile = export.getPresetEncoderProfile(config)
         layout.addWidget(self.outputImagePathSettings, row, 3, 4, 1)
 
         row += 1
@@ -335,12 +337,14 @@ class BatchCrop(QtWidgets.QWidget):
 
         Config.exportPresets[self.EXPORT_PRESET_KEY_OUTMASK] = {
             "path_template": self.outputMaskPathSettings.pathTemplate,
-            "overwrite": self.outputMaskPathSettings.overwriteFiles
+            "overwrite": self.outputMaskPathSettings.overwriteFiles,
+            "encoder_profile": self.outputMaskPathSettings.encoderProfile
         }
 
         Config.exportPresets[self.EXPORT_PRESET_KEY_IMG] = {
             "path_template": self.outputImagePathSettings.pathTemplate,
-            "overwrite": self.outputImagePathSettings.overwriteFiles
+            "overwrite": self.outputImagePathSettings.overwriteFiles,
+            "encoder_profile": self.outputImagePathSettings.encoderProfile
         }
 
 
@@ -476,19 +480,20 @@ def createAlphaMaskSource() -> MaskSource:
 
 
 
-MaskDest = Callable[[str, np.ndarray, list[np.ndarray], CropRegion, int, SizeBucket, Callable], np.ndarray]
+MaskDest = Callable[[str, np.ndarray, list[np.ndarray], CropRegion, int, SizeBucket, export.ExportWriter], np.ndarray]
 
 def createDiscardMaskDest() -> MaskDest:
-    def writeMask(imgPath: str, imgCropped: np.ndarray, maskLayers: list[np.ndarray], region: CropRegion, regionIndex: int, targetSize: SizeBucket, log):
+    def writeMask(imgPath: str, imgCropped: np.ndarray, maskLayers: list[np.ndarray], region: CropRegion, regionIndex: int, targetSize: SizeBucket, writer: export.ExportWriter):
         return imgCropped
     return writeMask
 
 def createFileMaskDest(pathSettings: export.PathSettings) -> MaskDest:
     pathTemplate   = pathSettings.pathTemplate
     overwriteFiles = pathSettings.overwriteFiles
+    encoderProfile = pathSettings.encoderProfile
     parser = export.ExportVariableParser()
 
-    def writeMask(imgPath: str, imgCropped: np.ndarray, maskLayers: list[np.ndarray], region: CropRegion, regionIndex: int, targetSize: SizeBucket, log):
+    def writeMask(imgPath: str, imgCropped: np.ndarray, maskLayers: list[np.ndarray], region: CropRegion, regionIndex: int, targetSize: SizeBucket, writer: export.ExportWriter):
         masks = list()
         for mask in maskLayers[:4]:
             masks.append( mask[region.slice2D()] )
@@ -509,14 +514,14 @@ def createFileMaskDest(pathSettings: export.PathSettings) -> MaskDest:
         parser.region = regionIndex
 
         path = parser.parsePath(pathTemplate, overwriteFiles)
-        export.saveImage(path, scaled, log)
+        writer.write(path, scaled, profile=encoderProfile)
 
         return imgCropped
 
     return writeMask
 
 def createAlphaMaskDest() -> MaskDest:
-    def writeMask(imgPath: str, imgCropped: np.ndarray, maskLayers: list[np.ndarray], region: CropRegion, regionIndex: int, targetSize: SizeBucket, log):
+    def writeMask(imgPath: str, imgCropped: np.ndarray, maskLayers: list[np.ndarray], region: CropRegion, regionIndex: int, targetSize: SizeBucket, writer: export.ExportWriter):
         channels = imgCropped.shape[2] if len(imgCropped.shape) > 2 else 1
         if channels == 1:
             imgChannels = [imgCropped] * 3
@@ -547,10 +552,18 @@ class BaseBatchCropTask:
         self.interpUp       = -1
         self.interpDown     = -1
 
+        self.writer = export.ExportWriter(lambda line: self.log(line), imgPathSettings.encoderProfile)
+
     def runPrepare(self):
         self.outPathParser = export.ExportVariableParser()
 
+    def runFinish(self) -> int:
+        self.writer.finish()
+        return self.writer.numFailed
+
     def runCleanup(self):
+        self.writer.finish()
+
         import gc
         gc.collect()
 
@@ -573,7 +586,7 @@ class BaseBatchCropTask:
             if fitRegion and targetSize:
                 self.log(f"Saving region {fitRegion.width()}x{fitRegion.height()} as {targetSize.w}x{targetSize.h}")
                 cropped = imgMat[fitRegion.slice3D(0,3)] # Remove alpha
-                cropped = self.maskDestFunc(imgFile, cropped, maskLayers, fitRegion, i, targetSize, self.log)
+                cropped = self.maskDestFunc(imgFile, cropped, maskLayers, fitRegion, i, targetSize, self.writer)
                 savePath = self.saveCroppedImage(i, cropped, targetSize)
             else:
                 self.log(f"No suitable target size found for region {i} ({region.width()}x{region.height()})")
@@ -709,7 +722,7 @@ class BaseBatchCropTask:
         self.outPathParser.region = index
 
         path = self.outPathParser.parsePath(self.outPathTemplate, self.outOverwriteFiles)
-        export.saveImage(path, scaled, self.log)
+        self.writer.write(path, scaled)
         return path
 
 
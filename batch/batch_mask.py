@@ -54,9 +54,10 @@ class BatchMask(QtWidgets.QWidget):
         self.srcPathSettings.pathTemplate = srcConfig.get("path_template", "{{path}}-masklabel.png")
 
         destConfig = Config.exportPresets.get(self.EXPORT_PRESET_KEY_DEST, {})
-        self.destPathSettings = export.PathSettings(self.parser, showInfo=False, showSkip=True)
+        self.destPathSettings = export.PathSettings(self.parser, showInfo=False, showSkip=True, showEncoder=True)
         self.destPathSettings.pathTemplate   = destConfig.get("path_template", "{{path}}-masklabel.png")
         self.destPathSettings.overwriteFiles = destConfig.get("overwrite", True)
+        self.destPathSettings.encoderProfile = export.getPresetEncoderProfile(destConfig)
 
         self._build()
         self.reloadMacros()
@@ -248,7 +249,8 @@ class BatchMask(QtWidgets.QWidget):
 
         Config.exportPresets[self.EXPORT_PRESET_KEY_DEST] = {
             "path_template": self.destPathSettings.pathTemplate,
-            "overwrite": self.destPathSettings.overwriteFiles
+            "overwrite": self.destPathSettings.overwriteFiles,
+            "encoder_profile": self.destPathSettings.encoderProfile
         }
 
 
@@ -354,13 +356,16 @@ class BaseBatchMaskTask:
         self.maskSource: Callable = None
         self.maskProcessFunc: Callable = None
 
+        # Child classes set the 'self.log' attribute
+        self.writer = export.ExportWriter(lambda line: self.log(line), destPathSettings.encoderProfile)
+
     def checkDestinationPath(self, w: int, h: int) -> str:
         self.parser.width = w
         self.parser.height = h
 
         noCounter = self.overwriteFiles or self.skipExistingFiles
         path = self.parser.parsePath(self.pathTemplate, noCounter)
-        if self.skipExistingFiles and os.path.lexists(path):
+        if self.skipExistingFiles and export.destinationExists(path):
             raise MaskSkipException()
         return path
 
@@ -372,7 +377,13 @@ class BaseBatchMaskTask:
             case MaskDestMode.Alpha: self.maskProcessFunc = self.processAsAlpha
             case _: raise ValueError("Invalid destination mode")
 
+    def runFinish(self) -> int:
+        self.writer.finish()
+        return self.writer.numFailed
+
     def runCleanup(self):
+        self.writer.finish()
+
         import gc
         gc.collect()
 
@@ -427,7 +438,7 @@ class BatchMaskTask(BaseBatchMaskTask, BatchTask):
         # Creates a copy of the data.
         combined = np.dstack(layers)
 
-        export.saveImage(destPath, combined, self.log)
+        self.writer.write(destPath, combined)
         return destPath
 
 
@@ -485,7 +496,7 @@ class BatchInferenceMaskTask(BaseBatchMaskTask, BatchInferenceTask):
         # Creates a copy of the data.
         combined = np.dstack(layers)
 
-        export.saveImage(destPath, combined, self.log)
+        self.writer.write(destPath, combined)
         return destPath
 
 
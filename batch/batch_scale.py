@@ -1,4 +1,3 @@
-import os
 from typing import Callable, NamedTuple
 from typing_extensions import override
 from PySide6 import QtWidgets
@@ -7,6 +6,7 @@ import cv2 as cv
 import numpy as np
 from config import Config
 from lib import colorlib, imagerw
+from lib.mediasize import MediaSizeCache
 import tools.scale as scale
 import ui.export_settings as export
 from ui.tab import ImgTab
@@ -34,9 +34,10 @@ class BatchScale(QtWidgets.QWidget):
         self.parser.setup(self.tab.filelist.getCurrentFile(), None)
 
         config = Config.exportPresets.get(self.EXPORT_PRESET_KEY, {})
-        self.pathSettings = export.PathSettings(self.parser, showSkip=True)
+        self.pathSettings = export.PathSettings(self.parser, showSkip=True, showEncoder=True)
         self.pathSettings.pathTemplate   = config.get("path_template", "{{path}}_{{w}}x{{h}}.png")
         self.pathSettings.overwriteFiles = config.get("overwrite", False)
+        self.pathSettings.encoderProfile = export.getPresetEncoderProfile(config)
 
         self._build()
 
@@ -190,7 +191,8 @@ class BatchScale(QtWidgets.QWidget):
     def saveExportPreset(self):
         Config.exportPresets[self.EXPORT_PRESET_KEY] = {
             "path_template": self.pathSettings.pathTemplate,
-            "overwrite": self.pathSettings.overwriteFiles
+            "overwrite": self.pathSettings.overwriteFiles,
+            "encoder_profile": self.pathSettings.encoderProfile
         }
 
 
@@ -215,6 +217,7 @@ class BatchScaleTask(BatchTask):
         self.pathTemplate      = pathSettings.pathTemplate
         self.overwriteFiles    = pathSettings.overwriteFiles
         self.skipExistingFiles = pathSettings.skipExistingFiles
+        self.writer = export.ExportWriter(log, pathSettings.encoderProfile)
 
         # Initialize kernels in main thread
         export.ImageExportTask.initKernels()
@@ -223,9 +226,20 @@ class BatchScaleTask(BatchTask):
     def runPrepare(self):
         self.parser = export.ExportVariableParser()
 
+    @override
+    def runFinish(self) -> int:
+        self.writer.finish()
+        return self.writer.numFailed
+
+    @override
+    def runCleanup(self):
+        self.writer.finish()
+        export.ExportBuffers.clear()
+        MediaSizeCache().save()
+
     @override
     def runProcessFile(self, imgFile: str) -> str | None:
-        origW, origH = imagerw.readSize(imgFile)
+        origW, origH, _ = MediaSizeCache().readSize(imgFile)
         targetW, targetH = self.scaleFunc(origW, origH)
 
         self.parser.setup(imgFile)
@@ -234,7 +248,7 @@ class BatchScaleTask(BatchTask):
 
         noCounter = self.overwriteFiles or self.skipExistingFiles
         destPath = self.parser.parsePath(self.pathTemplate, noCounter)
-        if self.skipExistingFiles and os.path.lexists(destPath):
+        if self.skipExistingFiles and export.destinationExists(destPath):
             return None
 
         mat = imagerw.loadMatBGR(imgFile, rgb=True)
@@ -246,7 +260,7 @@ class BatchScaleTask(BatchTask):
         else:
             self.log(f"Kept size {origW}x{origH}")
 
-        export.saveImage(destPath, mat, self.log, convertFromBGR=False)
+        self.writer.write(destPath, mat, convertFromBGR=False)
         return destPath
 
     @staticmethod
@@ -286,6 +300,7 @@ class BatchInferenceScaleTask(BatchInferenceTask):
         self.pathTemplate      = pathSettings.pathTemplate
         self.overwriteFiles    = pathSettings.overwriteFiles
         self.skipExistingFiles = pathSettings.skipExistingFiles
+        self.writer = export.ExportWriter(log, pathSettings.encoderProfile)
 
         # Initialize kernels in main thread
         export.ImageExportTask.initKernels()
@@ -294,9 +309,20 @@ class BatchInferenceScaleTask(BatchInferenceTask):
     def runPrepare(self, proc):
         self.parser = export.ExportVariableParser()
 
+    @override
+    def runFinish(self) -> int:
+        self.writer.finish()
+        return self.writer.numFailed
+
+    @override
+    def runCleanup(self):
+        self.writer.finish()
+        export.ExportBuffers.clear()
+        MediaSizeCache().save()
+
     @override
     def runCheckFile(self, imgFile: str, proc: InferenceProcess) -> Callable | InferenceChain | None:
-        origW, origH = imagerw.readSize(imgFile)
+        origW, origH, _ = MediaSizeCache().readSize(imgFile)
         targetW, targetH = self.scaleFunc(origW, origH)
 
         self.parser.setup(imgFile)
@@ -305,7 +331,7 @@ class BatchInferenceScaleTask(BatchInferenceTask):
 
         noCounter = self.overwriteFiles or self.skipExistingFiles
         destPath = self.parser.parsePath(self.pathTemplate, noCounter)
-        if self.skipExistingFiles and os.path.lexists(destPath):
+        if self.skipExistingFiles and export.destinationExists(destPath):
             return None
 
         mat = imagerw.loadMatBGR(imgFile, rgb=True)
@@ -344,7 +370,7 @@ class BatchInferenceScaleTask(BatchInferenceTask):
         origW, origH, modelPath, mat, destPath = results[0]
 
         # Check for existing file again because this was a potentially long-running task
-        if self.skipExistingFiles and os.path.lexists(destPath):
+        if self.skipExistingFiles and export.destinationExists(destPath):
             return None
 
         h, w = mat.shape[:2]
@@ -355,5 +381,5 @@ class BatchInferenceScaleTask(BatchInferenceTask):
         else:
             self.log(f"Kept size {origW}x{origH}")
 
-        export.saveImage(destPath, mat, self.log, convertFromBGR=False)
+        self.writer.write(destPath, mat, convertFromBGR=False)
         return destPath
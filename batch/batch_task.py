@@ -126,6 +126,7 @@ class BatchTask(QRunnable):
                     update = BatchProgressUpdate(timeAvg, numFiles, numFilesDone, numFilesSkipped)
                     self.signals.progress.emit(outputFile, update)
 
+        update.filesFailed = self.runFinish()
         self.log(f"Batch {self.name} finished, processed {numFiles} files{update.getSkippedText()} in {update.timeSpent:.2f} seconds")
         self.signals.done.emit(update.finalize())
 
@@ -136,6 +137,13 @@ class BatchTask(QRunnable):
     def runProcessFile(self, imgFile: str) -> str | None:
         return None
 
+    def runFinish(self) -> int:
+        '''
+        Called after all files were processed, before the batch is reported as finished.
+        Returns the number of files that failed after processing, like queued writes.
+        '''
+        return 0
+
     def runCleanup(self):
         pass
 
@@ -257,6 +265,7 @@ class BatchProgressUpdate:
         self.filesTotal     = numFilesTotal
         self.filesProcessed = numFilesProcessed
         self.filesSkipped   = numFilesSkipped
+        self.filesFailed    = 0
 
         self.timePerFile    = timeAvg.getAvgTime()
         self.timeRemaining  = self.timePerFile * (numFilesTotal - numFilesProcessed)
@@ -264,6 +273,8 @@ class BatchProgressUpdate:
 
     def getSkippedText(self, numRemaining=0) -> str:
         msgs = [f"{self.filesSkipped} skipped"] if self.filesSkipped > 0 else []
+        if self.filesFailed > 0:
+            msgs.append(f"{self.filesFailed} failed")
         if numRemaining > 0:
             msgs.append(f"{numRemaining} remaining")
         msgs = ", ".join(msgs)
@@ -460,11 +471,11 @@ class BatchTaskHandler(QObject):
     @Slot()
     def onFinished(self, update: BatchProgressUpdate):
         msg = f"Processed {update.filesTotal} files{update.getSkippedText()}"
-        self._lastMessage = (msg, True)
+        self._lastMessage = (msg, update.filesFailed == 0)
         self._lastUpdate = update
 
         if self._tabActive:
-            self.statusBar.showColoredMessage(msg, True, 0)
+            self.statusBar.showColoredMessage(msg, update.filesFailed == 0, 0)
             self.progressBar.setTime(update)
 
         self.taskDone()
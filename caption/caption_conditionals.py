@@ -1,7 +1,7 @@
 from __future__ import annotations
 import re, ast, operator
-from itertools import chain
-from typing import Generator, Callable, ForwardRef, Any
+from itertools import chain, product
+from typing import Generator, Callable, ForwardRef, Any, Iterable, NamedTuple
 from PySide6 import QtWidgets
 from PySide6.QtCore import Qt, Slot, Signal, QSignalBlocker
 from lib import colorlib, qtlib
@@ -403,6 +403,38 @@ class ConditionalRule(QtWidgets.QWidget):
 
 
 
+class TagBitset:
+    '''
+    Presence of tags as bits of an int. The bits are assigned to all tags that are tested by the compiled rules,
+    so each rule can check its tag conditions with a few integer operations instead of looping over the tags.
+    '''
+
+    __slots__ = ('tags', 'tagBits', 'mask', 'distinct')
+
+    def __init__(self, tags: list[str], tagBits: dict[str, int]):
+        self.tags = tags
+        self.tagBits = tagBits
+
+        mask = 0
+        numFound = 0
+        for tag in tags:
+            if bit := tagBits.get(tag):
+                mask |= bit
+                numFound += 1
+
+        self.mask = mask
+        self.distinct = (numFound == mask.bit_count())
+
+    def count(self, condMask: int) -> int:
+        'Returns the number of tags with bits in condMask, including duplicates.'
+        if self.distinct:
+            return (self.mask & condMask).bit_count()
+
+        tagBits = self.tagBits
+        return sum(1 for tag in self.tags if tagBits.get(tag, 0) & condMask)
+
+
+
 class ConditionalFilterRule:
     OPS: dict[Any, Any] = {
         ast.Not:        operator.not_,
@@ -415,12 +447,20 @@ class ConditionalFilterRule:
 
     def __init__(self):
         # Conditions can be empty, but that only works for custom expressions (like "True")
+        # Conditions must not change after the rule was compiled.
         self.conditions = dict[str, ConditionFunc]()
         self.actions = list[ActionFunc]()
 
         self._expression = ""
         self._parsedExpression: ast.Expression | None = None
 
+        # Compiled
+        self._tagBits: dict[str, int] | None = None
+        self._requiredMask = 0
+        self._condTests = list[tuple[str, Callable[[TagBitset], bool]]]()
+        self._exprFunc: Callable[[dict[str, bool], dict[str, list[str]]], Any] = self._falseExpression
+        self._exprUsesVariables = False
+
     @staticmethod
     def fromPreset(presetConditional: CaptionPresetConditional) -> ConditionalFilterRule:
         rule = ConditionalFilterRule()
@@ -442,6 +482,7 @@ class ConditionalFilterRule:
 
     def setExpression(self, expression: str):
         self._expression, self._parsedExpression = self.prepareExpression(expression)
+        self._tagBits = None
 
     @staticmethod
     def prepareExpression(expression: str) -> tuple[str, ast.Expression|None]:
@@ -463,16 +504,177 @@ class ConditionalFilterRule:
             return "", None
 
 
-    def evaluateExpression(self, tags: list[str]) -> ConditionVariableParser | None:
+    @staticmethod
+    def assignTagBits(rules: Iterable[ConditionalFilterRule]) -> dict[str, int]:
+        'Assigns a bit to each tag that is tested by the tag conditions of the rules.'
+        tagBits = dict[str, int]()
+        for rule in rules:
+            for cond in rule.conditions.values():
+                if tagCond := getattr(cond, "tagCondition", None):
+                    for tag in tagCond.tags:
+                        if tag not in tagBits:
+                            tagBits[tag] = 1 << len(tagBits)
+        return tagBits
+
+    def compile(self, tagBits: dict[str, int] | None = None):
+        '''
+        Compiles the conditions into tests on a TagBitset and the expression into closures.
+        When rules are evaluated together, the same tagBits must be used for all rules.
+        '''
+
+        if tagBits is None:
+            tagBits = self.assignTagBits((self,))
+
+        self._condTests = [(var, self._compileCondition(cond, tagBits)) for var, cond in self.conditions.items()]
+
+        self._exprUsesVariables = False
         if self._parsedExpression:
-            results, variables = self._evalAll(tags)
-            if self._eval(results, variables):
-                return ConditionVariableParser(variables)
+            try:
+                self._exprFunc = self._compileExpression(self._parsedExpression.body)
+            except Exception:
+                # Invalid expressions always evaluate to false
+                self._exprFunc = self._falseExpression
+        else:
+            self._exprFunc = self._falseExpression
+
+        self._requiredMask = self._getRequiredMask(tagBits)
+        self._tagBits = tagBits
+
+    @staticmethod
+    def _compileCondition(cond: ConditionFunc, tagBits: dict[str, int]) -> Callable[[TagBitset], bool]:
+        tagCond: TagCondition | None = getattr(cond, "tagCondition", None)
+        if tagCond is None:
+            return lambda bitset: cond(bitset.tags)[0]
+
+        condMask = 0
+        for tag in tagCond.tags:
+            condMask |= tagBits[tag]
+
+        minCount, maxCount = tagCond.minCount, tagCond.maxCount
+        if tagCond.countDuplicates:
+            return lambda bitset: minCount <= bitset.count(condMask) <= maxCount
+        if maxCount >= len(tagCond.tags):
+            if minCount == len(tagCond.tags):
+                return lambda bitset: (bitset.mask & condMask) == condMask
+            if minCount == 1:
+                return lambda bitset: (bitset.mask & condMask) != 0
+        return lambda bitset: minCount <= (bitset.mask & condMask).bit_count() <= maxCount
+
+    def _getRequiredMask(self, tagBits: dict[str, int]) -> int:
+        'Returns the bits of which at least one must be set for the rule to pass, or 0 if the rule must always be evaluated.'
+
+        condMasks = dict[str, int]()
+        for var, cond in self.conditions.items():
+            tagCond: TagCondition | None = getattr(cond, "tagCondition", None)
+            condMask = 0
+            if tagCond and tagCond.minCount > 0:
+                for tag in tagCond.tags:
+                    condMask |= tagBits[tag]
+            condMasks[var] = condMask
+
+        requiredMask = 0
+        for mask in condMasks.values():
+            requiredMask |= mask
+
+        if self._parsedExpression:
+            # Conditions with a mask are false if none of their tags are present.
+            # Check if the expression is false for those, regardless of the results of the other conditions.
+            otherVars = [var for var, mask in condMasks.items() if not mask]
+            if len(otherVars) > 4 or (otherVars and self._exprUsesVariables):
+                return 0
+
+            for otherResults in product((False, True), repeat=len(otherVars)):
+                results = dict.fromkeys(condMasks, False)
+                results.update(zip(otherVars, otherResults))
+                try:
+                    if self._exprFunc(results, {}):
+                        return 0
+                except:
+                    pass
+
+            return requiredMask
+
+        match self._expression:
+            case "and":
+                # All conditions are required: Use the most selective one
+                requiredMasks = [mask for mask in condMasks.values() if mask]
+                return min(requiredMasks, key=int.bit_count, default=0)
+            case "or":
+                # One of the conditions is required
+                return 0 if 0 in condMasks.values() else requiredMask
+
+        return 0
+
+    def _compileExpression(self, node) -> Callable[[dict[str, bool], dict[str, list[str]]], Any]:
+        # Raises for unsupported nodes. All nodes are evaluated unconditionally, so these expressions would always fail.
+        match node:
+            case ast.UnaryOp(op=op, operand=operand):
+                opFunc = self.OPS[type(op)]
+                operandFunc = self._compileExpression(operand)
+                return lambda results, vars: opFunc(operandFunc(results, vars))
+
+            case ast.BinOp(left=left, op=op, right=right) | ast.Compare(left=left, ops=[op], comparators=[right]):
+                opFunc = self.OPS[type(op)]
+                leftFunc  = self._compileExpression(left)
+                rightFunc = self._compileExpression(right)
+                return lambda results, vars: opFunc(leftFunc(results, vars), rightFunc(results, vars))
+
+            case ast.Attribute(value=ast.Name(id=id), attr="val"):
+                self._exprUsesVariables = True
+                return lambda results, vars: vars.get(id, [""])[0]
+
+            case ast.Attribute():
+                return lambda results, vars: False
+
+            case ast.Constant(value=value):
+                return lambda results, vars: value
+
+            case ast.Name(id=id):
+                return lambda results, vars: results.get(id, False)
+
+            case _:
+                raise TypeError(node)
+
+    @staticmethod
+    def _falseExpression(results: dict[str, bool], vars: dict[str, list[str]]) -> bool:
+        return False
+
+
+    def evaluateExpression(self, tags: list[str]) -> ConditionVariableParser | None:
+        if self._tagBits is None:
+            self.compile()
+        return self.evaluateBitset(TagBitset(tags, self._tagBits))
+
+    def evaluateBitset(self, bitset: TagBitset) -> ConditionVariableParser | None:
+        'The bitset must be created with the same tagBits that were used for compiling this rule.'
+        if self._requiredMask and not (bitset.mask & self._requiredMask):
             return None
 
+        if self._parsedExpression:
+            results = {var: test(bitset) for var, test in self._condTests}
+            variables = self._getVariables(bitset.tags, results) if self._exprUsesVariables else {}
+
+            try:
+                if not self._exprFunc(results, variables):
+                    return None
+            except:
+                return None
+
+            if not self._exprUsesVariables:
+                variables = self._getVariables(bitset.tags, results)
+            return ConditionVariableParser(variables)
+
         match self._expression:
-            case "and": variables = self._evalAnd(tags)
-            case "or":  variables = self._evalOr(tags)
+            case "and":
+                if not self._condTests or not all(test(bitset) for var, test in self._condTests):
+                    return None
+                variables = self._evalAnd(bitset.tags)
+
+            case "or":
+                if not any(test(bitset) for var, test in self._condTests):
+                    return None
+                variables = self._evalOr(bitset.tags)
+
             case _:
                 return None
 
@@ -484,7 +686,12 @@ class ConditionalFilterRule:
         results, variables = self._evalAll(tags)
 
         if self._parsedExpression:
-            exprResult = self._eval(results, variables)
+            if self._tagBits is None:
+                self.compile()
+            try:
+                exprResult = bool(self._exprFunc(results, variables))
+            except:
+                exprResult = False
         else:
             match self._expression:
                 case "and": exprResult = all(results.values())
@@ -530,42 +737,11 @@ class ConditionalFilterRule:
 
         return results, variables
 
-
-    def _eval(self, condResults: dict[str, bool], condVariables: dict[str, list[str]]) -> bool:
-        def getAttr(value, attr: str):
-            match attr:
-                case "val":
-                    return condVariables.get(value, [""])[0]
-                case _:
-                    return False
-
-        def eval(node):
-            match node:
-                case ast.UnaryOp(op=op, operand=operand):
-                    return self.OPS[type(op)](eval(operand))
-
-                case ast.BinOp(left=left, op=op, right=right):
-                    return self.OPS[type(op)](eval(left), eval(right))
-
-                case ast.Compare(left=left, ops=[op], comparators=[comparator]):
-                    return self.OPS[type(op)](eval(left), eval(comparator))
-
-                case ast.Attribute(value=value, attr=attr):
-                    return getAttr(value.id, attr) if isinstance(value, ast.Name) else False
-
-                case ast.Constant(value=value):
-                    return value
-
-                case ast.Name(id=id):
-                    return condResults.get(id, False)
-
-                case _:
-                    raise TypeError(node)
-
-        try:
-            return bool(eval(self._parsedExpression.body))
-        except:
-            return False
+    def _getVariables(self, tags: list[str], results: dict[str, bool]) -> dict[str, list[str]]:
+        return {
+            var: self.conditions[var](tags)[1] or []
+            for var, result in results.items() if result
+        }
 
 
 
@@ -828,6 +1004,17 @@ def findWord(text: str, search: str) -> Generator[int]:
 
 # ===== Conditions =====
 
+class TagCondition(NamedTuple):
+    '''
+    Marks conditions that only depend on the presence of tags, so compiled rules can test them on a TagBitset.
+    The condition is true if the number of found tags is between minCount and maxCount (inclusive).
+    '''
+    tags: frozenset[str]
+    minCount: int
+    maxCount: int
+    countDuplicates: bool
+
+
 def falseCondition(tags: list[str]) -> ConditionResult:
     return False, None
 
@@ -850,6 +1037,7 @@ def createCondAllTagsPresent(params: list[str]) -> ConditionFunc:
         else:
             return False, None
 
+    condAllTagsPresent.tagCondition = TagCondition(frozenset(searchSet), len(searchSet), len(searchSet), False)
     return condAllTagsPresent
 
 
@@ -863,6 +1051,7 @@ def createCondAnyTagsPresent(params: list[str]) -> ConditionFunc:
                 return True, [tag]
         return False, None
 
+    condAnyTagsPresent.tagCondition = TagCondition(frozenset(searchSet), 1, len(searchSet), False)
     return condAnyTagsPresent
 
 
@@ -881,6 +1070,7 @@ def createCondNumTagsPresent(params: list[str]) -> ConditionFunc:
             return True, foundTags
         return False, None
 
+    condNumTagsPresent.tagCondition = TagCondition(frozenset(searchSet), minTags, maxTags, True)
     return condNumTagsPresent
 
 
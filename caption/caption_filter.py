@@ -1,14 +1,16 @@
-import re
+import re, os
 import numpy as np
-from typing import Iterable
+from typing import Iterable, Callable, Generic, TypeVar
 from typing_extensions import override
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from itertools import chain
 from lib.csv import ColumnNameCsvLoader
 from lib.template_parser import TemplateVariableParser
 from .caption_preset import MutualExclusivity
-from .caption_conditionals import ConditionalFilterRule
+from .caption_conditionals import ConditionalFilterRule, TagBitset
 from .caption_highlight import MatcherNode
+from .caption_implications import ImplicationGraph
 
 
 class CaptionFilter(ABC):
@@ -21,6 +23,38 @@ class CaptionFilter(ABC):
 
 
 
+TValue = TypeVar("TValue")
+
+class TagCache(Generic[TValue]):
+    'Memoizes per-tag results of a filter. Must be cleared when the filter is set up again.'
+
+    MAX_SIZE = 100_000
+
+    def __init__(self):
+        self.values: dict[str, TValue] = dict()
+
+    def get(self, tag: str, func: Callable[[str], TValue]) -> TValue:
+        try:
+            return self.values[tag]
+        except KeyError:
+            pass
+
+        # Clearing the whole dict keeps this threadsafe without locking
+        if len(self.values) >= self.MAX_SIZE:
+            self.values = dict()
+
+        self.values[tag] = value = func(tag)
+        return value
+
+    def map(self, tags: Iterable[str], func: Callable[[str], TValue]) -> list[TValue]:
+        values = self.values
+        return [value if (value := values.get(tag)) is not None else self.get(tag, func) for tag in tags]
+
+    def clear(self):
+        self.values = dict()
+
+
+
 class DuplicateCaptionFilter(CaptionFilter):
     def __init__(self):
         super().__init__()
@@ -49,6 +83,7 @@ class BannedCaptionFilter(CaptionFilter):
 class WhitelistGroupsFilter(CaptionFilter):
     def __init__(self):
         self.matcherNode: MatcherNode[bool] = None
+        self.validCache = TagCache[bool]()
 
     def setup(self, captionGroups: Iterable[list[str]]) -> None:
         self.matcherNode = MatcherNode[bool]()
@@ -56,23 +91,21 @@ class WhitelistGroupsFilter(CaptionFilter):
             for caption in group:
                 self.matcherNode.add(caption, True)
 
-    def filterCaptions(self, captions: list[str]) -> list[str]:
-        newCaptions: list[str] = list()
-        validWords: set[str] = set()
+        self.validCache.clear()
 
-        for cap in captions:
-            words = [word for word in cap.split(" ") if word]
-            validWords.clear()
-            for matchWords in self.matcherNode.splitWords(words):
-                validWords.update(matchWords)
+    def filterCaptions(self, captions: list[str]) -> list[str]:
+        return [cap for cap, valid in zip(captions, self.validCache.map(captions, self._isValid)) if valid]
 
-            # Extra words in combined tags are not allowed:
-            # When group-tags are subsets of other tags, there's no guarantee that extra words can safely be removed,
-            # without introducing a new tag that is not present in the original caption.
-            if validWords.issuperset(words):
-                newCaptions.append(cap)
+    def _isValid(self, caption: str) -> bool:
+        words = [word for word in caption.split(" ") if word]
+        validWords: set[str] = set()
+        for matchWords in self.matcherNode.splitWords(words):
+            validWords.update(matchWords)
 
-        return newCaptions
+        # Extra words in combined tags are not allowed:
+        # When group-tags are subsets of other tags, there's no guarantee that extra words can safely be removed,
+        # without introducing a new tag that is not present in the original caption.
+        return validWords.issuperset(words)
 
 
 
@@ -109,10 +142,12 @@ class SortCaptionFilter(CaptionFilter):
 
         self.captionOrder = dict[str, int]()
         self.matcherNode: MatcherNode[int] = None
+        self.sortKeyCache = TagCache[int]()
 
     def setup(self, captionGroups: Iterable[list[str]], prefix: str, suffix: str, separator: str) -> None:
         self.captionOrder.clear()
         self.matcherNode = MatcherNode[int]()
+        self.sortKeyCache.clear()
 
         i = 1  # Only truthy values
         for group in captionGroups:
@@ -132,6 +167,9 @@ class SortCaptionFilter(CaptionFilter):
 
 
     def _sortKey(self, caption: str) -> int:
+        return self.sortKeyCache.get(caption, self._calcSortKey)
+
+    def _calcSortKey(self, caption: str) -> int:
         if order := self.captionOrder.get(caption):
             return order
 
@@ -272,7 +310,8 @@ class SortCaptionFilter(CaptionFilter):
 # Removes tags depending on their position inside caption text
 class MutuallyExclusiveFilter(CaptionFilter):
     def __init__(self, exclusivity: MutualExclusivity):
-        self.groups: list[set[str]] = list()
+        # Tag -> indices of the groups it belongs to. Captions are processed in one pass, independent of the number of groups.
+        self.tagGroups: dict[str, tuple[int, ...]] = dict()
 
         match exclusivity:
             case MutualExclusivity.KeepLast:
@@ -283,23 +322,30 @@ class MutuallyExclusiveFilter(CaptionFilter):
                 raise ValueError("Invalid exclusivity mode")
 
     def setup(self, captionGroups: Iterable[list[str]]) -> None:
-        self.groups.clear()
-        self.groups.extend(set(caps) for caps in captionGroups)
+        tagGroups = defaultdict[str, list[int]](list)
+        for groupIndex, caps in enumerate(captionGroups):
+            for cap in set(caps):
+                tagGroups[cap].append(groupIndex)
+
+        self.tagGroups = {tag: tuple(groups) for tag, groups in tagGroups.items()}
 
     def filterCaptions(self, captions: list[str]) -> list[str]:
-        enumerated = self.enumerate(captions)
-        deleteIndices = set()
-
-        for group in self.groups:
-            exists = False
-            for i, cap in enumerated:
-                if cap in group:
-                    if exists:
-                        deleteIndices.add(i)
-                    exists = True
-
-        for i in sorted(deleteIndices, reverse=True):
-            del captions[i]
+        if not self.tagGroups:
+            return captions
+
+        existingGroups = set[int]()
+        deleteIndices = list[int]()
+
+        for i, cap in self.enumerate(captions):
+            if groups := self.tagGroups.get(cap):
+                # Remove tag if any of its groups already exists, but mark all its groups as existing
+                if not existingGroups.isdisjoint(groups):
+                    deleteIndices.append(i)
+                existingGroups.update(groups)
+
+        if deleteIndices:
+            for i in sorted(deleteIndices, reverse=True):
+                del captions[i]
         return captions
 
     @staticmethod
@@ -316,35 +362,40 @@ class MutuallyExclusiveFilter(CaptionFilter):
 # Prioritizes tags that come later in the group.
 class PriorityFilter():
     def __init__(self):
-        self.groups: list[dict[str, int]] = list()
+        # Tag -> (group index, priority) for all groups it belongs to
+        self.tagGroups: dict[str, tuple[tuple[int, int], ...]] = dict()
 
     def setup(self, captionGroups: Iterable[list[str]]) -> None:
-        self.groups.clear()
-        for group in captionGroups:
-            self.groups.append({ cap: prio for prio, cap in enumerate(group) })
+        tagGroups = defaultdict[str, list[tuple[int, int]]](list)
+        for groupIndex, group in enumerate(captionGroups):
+            groupPrios = { cap: prio for prio, cap in enumerate(group) }
+            for cap, prio in groupPrios.items():
+                tagGroups[cap].append((groupIndex, prio))
+
+        self.tagGroups = {tag: tuple(groups) for tag, groups in tagGroups.items()}
 
     def filterCaptions(self, captions: list[str]) -> list[str]:
-        enumerated = list(enumerate(captions))
-        allDeleteIndices: set[int] = set()
-        deleteIndices: set[int] = set()
+        if not self.tagGroups:
+            return captions
 
-        for group in self.groups:
-            deleteIndices.clear()
-            keepIndex = -1
-            maxPrio = -1
+        # Group index -> [max priority, index to keep, indices]
+        groupStates = dict[int, list]()
 
-            for i, cap in enumerated:
-                prio = group.get(cap)
-                if prio is None:
+        for i, cap in enumerate(captions):
+            for groupIndex, prio in self.tagGroups.get(cap, ()):
+                state = groupStates.get(groupIndex)
+                if state is None:
+                    groupStates[groupIndex] = [prio, i, [i]]
                     continue
 
-                deleteIndices.add(i)
-                if prio > maxPrio:
-                    maxPrio = prio
-                    keepIndex = i
+                state[2].append(i)
+                if prio > state[0]:
+                    state[0] = prio
+                    state[1] = i
 
-            deleteIndices.discard(keepIndex)
-            allDeleteIndices.update(deleteIndices)
+        allDeleteIndices: set[int] = set()
+        for maxPrio, keepIndex, indices in groupStates.values():
+            allDeleteIndices.update(i for i in indices if i != keepIndex)
 
         for i in sorted(allDeleteIndices, reverse=True):
             del captions[i]
@@ -355,6 +406,7 @@ class PriorityFilter():
 class ConditionalsFilter(CaptionFilter):
     def __init__(self):
         self.rules = list[ConditionalFilterRule]()
+        self.tagBits = dict[str, int]()
         self.separator = ", "
 
         self.filterCaptions = self._filterCaptionsKeep
@@ -363,25 +415,36 @@ class ConditionalsFilter(CaptionFilter):
         self.rules = list(rules)
         self.separator = separator
 
+        # All rules are evaluated against the same bitset of tags
+        self.tagBits = ConditionalFilterRule.assignTagBits(self.rules)
+        for rule in self.rules:
+            rule.compile(self.tagBits)
+
         self.filterCaptions = self._filterCaptionsSidechain if sidechain else self._filterCaptionsKeep
 
     def filterCaptions(self, captions: list[str]) -> list[str]:
         raise NotImplementedError()
 
     def _filterCaptionsKeep(self, captions: list[str]) -> list[str]:
+        bitset = TagBitset(captions, self.tagBits)
         for rule in self.rules:
-            if varParser := rule.evaluateExpression(captions):
+            if varParser := rule.evaluateBitset(bitset):
                 varParser.separator = self.separator
                 for action in rule.actions:
                     captions = action(varParser, captions)
 
+                # Following rules are evaluated on the changed tags
+                bitset = TagBitset(captions, self.tagBits)
+
         return captions
 
     def _filterCaptionsSidechain(self, captions: list[str]) -> list[str]:
         newCaptions = list[str]()
 
+        # Input tags don't change
+        bitset = TagBitset(captions, self.tagBits)
         for rule in self.rules:
-            if varParser := rule.evaluateExpression(captions):
+            if varParser := rule.evaluateBitset(bitset):
                 # Don't set varParser separator: Keep default separator (comma) for joining with {{var.all}}
                 for action in rule.actions:
                     newCaptions = action(varParser, newCaptions)
@@ -405,6 +468,7 @@ class TagCombineFilter(CaptionFilter):
         self._nextOrder = 0
 
         self.matcherNode: MatcherNode[bool] = None
+        self.splitCache = TagCache[tuple[str, ...]]()
 
     def setup(self, captionGroups: Iterable[list[str]]) -> None:
         self.groupMap.clear()
@@ -416,6 +480,8 @@ class TagCombineFilter(CaptionFilter):
             self.registerCombinationGroup(caps)
 
     def registerCombinationGroup(self, captions: list[str]) -> None:
+        self.splitCache.clear()
+
         # Create new group index for each different end-word.
         groupWords: dict[str, int] = dict()
 
@@ -436,6 +502,9 @@ class TagCombineFilter(CaptionFilter):
     def _sortKey(self, tag: str) -> int:
         return self.tagOrder.get(tag, -1)
 
+    def _split(self, caption: str) -> tuple[str, ...]:
+        return tuple(self.matcherNode.splitAllPreserveExtra((caption,)))
+
     def filterCaptions(self, captions: list[str]) -> list[str]:
         newCaptions = list[str | list[str]]()
         groups = dict[int, list[str]]()
@@ -445,7 +514,7 @@ class TagCombineFilter(CaptionFilter):
         # Other tried methods failed with combining and sorting 3-word tags.
         # The current limitation here: When the combined tag contains another word that doesn't belong to the group,
         # like when it was manually edited, that tag is not split, because the order is undefined.
-        for caption in self.matcherNode.splitAllPreserveExtra(captions):
+        for caption in chain.from_iterable(self.splitCache.map(captions, self._split)):
             groupIndex = self.groupMap.get(caption)
 
             # Not registered for combination: Append unmodified string.
@@ -502,28 +571,39 @@ class TagCombineFilter(CaptionFilter):
 # Also removes newly added duplicate tags when it were already combined with others in TagCombineFilter.
 class SubsetFilter(CaptionFilter):
     def __init__(self):
-        pass
+        self.wordsCache = TagCache[frozenset[str]]()
+
+    @staticmethod
+    def _getWords(caption: str) -> frozenset[str]:
+        return frozenset(w.lower() for word in caption.split(" ") if (w := word.strip()))
 
     def filterCaptions(self, captions: list[str]) -> list[str]:
-        captionWords: list[set[str]] = list()
-        for cap in captions:
-            words = (w.lower() for word in cap.split(" ") if (w := word.strip()))
-            captionWords.append(set(words))
+        captionWords = self.wordsCache.map(captions, self._getWords)
 
-        newCaptions: list[str] = list()
-        for i, cap in enumerate(captions):
-            if not self._supersetExists(captionWords, i):
-                newCaptions.append(cap)
+        # Word -> distinct word sets containing the word
+        wordSets = defaultdict[str, set[frozenset[str]]](set)
+        for words in set(captionWords):
+            for word in words:
+                wordSets[word].add(words)
 
-        return newCaptions
+        return [
+            cap for cap, words in zip(captions, captionWords)
+            if not self._supersetExists(wordSets, words)
+        ]
 
     @staticmethod
-    def _supersetExists(captionWords: list[set[str]], index: int) -> bool:
-        for k in range(len(captionWords)):
-            # Don't remove exact duplicates. It would remove all duplicates.
-            if k != index and captionWords[k] != captionWords[index] and captionWords[k].issuperset(captionWords[index]):
-                return True
-        return False
+    def _supersetExists(wordSets: dict[str, set[frozenset[str]]], words: frozenset[str]) -> bool:
+        # Don't remove exact duplicates. It would remove all duplicates.
+        # Only a set with more words can be a different superset. All candidates contain the least frequent word.
+        numWords = len(words)
+        if numWords == 1:
+            # All other sets with this word are supersets
+            return len(wordSets[next(iter(words))]) > 1
+        if numWords == 0:
+            return bool(wordSets)
+
+        candidates = min((wordSets[word] for word in words), key=len)
+        return any(len(other) > numWords and other.issuperset(words) for other in candidates)
 
 
 
@@ -578,18 +658,28 @@ class ImplicationFilter(CaptionFilter):
             print(f"Implications: Couldn't load tag implications from '{file}'")
 
         @classmethod
-        def loadImplications(cls):
+        def loadImplications(cls) -> ImplicationGraph:
+            # Load the compiled graph if the CSV files didn't change since it was saved
+            stamp = ImplicationGraph.getFolderStamp(cls.FOLDER)
+            cachePath = os.path.join(cls.FOLDER, ImplicationGraph.CACHE_FILE)
+            if stamp and (graph := ImplicationGraph.load(cachePath, stamp)) is not None:
+                print(f"Implications: Loaded {len(graph)} tags from compiled cache '{cachePath}'")
+                return graph
+
             loader = cls()
             loader.loadAll(cls.FOLDER)
 
             if not loader.implications:
                 print("Warning: No tag implications loaded. Make sure to place CSV files into the 'qapyq/user/tag-implications' folder.")
+                return ImplicationGraph.compile({})
 
-            return {k: frozenset(v) for k, v in loader.implications.items()}
+            graph = ImplicationGraph.compile(loader.implications)
+            graph.save(cachePath, stamp)
+            return graph
 
 
-    # antecedent -> consequent (remove consequent tags)
-    IMPLICATIONS = None
+    # antecedent -> transitive consequents (remove consequent tags)
+    IMPLICATIONS: ImplicationGraph | None = None
 
     def __init__(self):
         super().__init__()
@@ -603,7 +693,7 @@ class ImplicationFilter(CaptionFilter):
                 ImplicationFilter.IMPLICATIONS = self.ImplicationCsvLoader.loadImplications()
 
         except Exception:
-            ImplicationFilter.IMPLICATIONS = {}
+            ImplicationFilter.IMPLICATIONS = ImplicationGraph.compile({})
             import traceback
             traceback.print_exc()
 
@@ -617,19 +707,18 @@ class ImplicationFilter(CaptionFilter):
         return bool(cls.IMPLICATIONS)
 
     def filterCaptions(self, captions: list[str]) -> list[str]:
-        impliedTags = set[str]()
-        for cap in self.matcherNode.splitAll(captions):
-            self._addImpliedTags(impliedTags, cap)
+        graph = self.IMPLICATIONS
+        tagIds = graph.tagIds
 
-        return [cap for cap in captions if cap not in impliedTags] if impliedTags else captions
+        # The closure is precompiled: Lookup is linear in the number of tags
+        impliedIds = set[int]()
+        for cap in self.matcherNode.splitAll(captions):
+            if (tagId := tagIds.get(cap)) is not None:
+                impliedIds.update(graph.getImpliedIds(tagId))
 
-    @classmethod
-    def _addImpliedTags(cls, impliedTags: set[str], tag: str):
-        if consequents := cls.IMPLICATIONS.get(tag):
-            impliedTags.update(consequents)
-            # Resolve transitive implications with recursion
-            for consTag in consequents:
-                cls._addImpliedTags(impliedTags, consTag)
+        if not impliedIds:
+            return captions
+        return [cap for cap in captions if tagIds.get(cap) not in impliedIds]
 
 
 
@@ -657,23 +746,40 @@ class SearchReplaceFilter:
 
 
     def __init__(self):
-        self.replacePairs: list[tuple[re.Pattern, str]] = list()
-        self.varParser = self.ReplacementParser()
+        # Replacements without variables are parsed once and passed to re.sub as escaped string.
+        # Replacements with variables are stored as template (isTemplate=True) and parsed for each match.
+        self.replacePairs: list[tuple[re.Pattern, str, bool]] = list()
+        self.deterministic = True
 
     def setup(self, searchReplacePairs: list[tuple[str, str]]) -> None:
         self.replacePairs.clear()
+        self.deterministic = True
         for pattern, replace in searchReplacePairs:
             self.addReplacePair(pattern, replace)
 
     def addReplacePair(self, pattern: str, replace: str) -> None:
         try:
-            self.replacePairs.append((re.compile(pattern), replace))
+            regex = re.compile(pattern)
         except re.error as err:
             print(f"SearchReplaceFilter: Ignoring invalid regex pattern '{pattern}': {err}")
+            return
+
+        if TemplateVariableParser.PATTERN_VARS.search(replace):
+            self.replacePairs.append((regex, replace, True))
+            self.deterministic &= TemplateVariableParser.isDeterministic(replace)
+        else:
+            replace = self.ReplacementParser().parse(replace)
+            self.replacePairs.append((regex, replace.replace("\\", "\\\\"), False))
 
     def filterText(self, text: str) -> str:
-        for pattern, replacement in self.replacePairs:
-            text = pattern.sub(lambda match: self.varParser.getReplacement(replacement, match), text)
+        varParser = None
+        for pattern, replacement, isTemplate in self.replacePairs:
+            if isTemplate:
+                # Parser has state: Create one per call for thread safety
+                varParser = varParser or self.ReplacementParser()
+                text = pattern.sub(lambda match: varParser.getReplacement(replacement, match), text)
+            else:
+                text = pattern.sub(replacement, text)
         return text
 
 
@@ -738,9 +844,30 @@ class CaptionRulesSettings:
         activeRules = list(filter(None, rules))
         return len(activeRules), len(rules)
 
+    def key(self) -> tuple[bool, ...]:
+        return (
+            self.searchReplace,
+            self.ban,
+            self.removeDuplicates,
+            self.removeImplications,
+            self.removeMutuallyExclusive,
+            self.sort,
+            self.combineTags,
+            self.conditionals,
+            self.prefixSuffix
+        )
+
 
 
 class CaptionRulesProcessor:
+    '''
+    The filters are compiled into lookup tables when they are set up. Afterwards, the processor is treated as immutable
+    and results are memoized per caption text and settings. Setting up the processor again invalidates the results.
+    Memoization is disabled when search & replace templates use random or time-dependent values.
+    '''
+
+    MEMO_SIZE = 20_000
+
     def __init__(self, separator: str, removeDup: bool, removeImplications: bool, sortCaptions: bool, sortNonGroupCaptions: bool, whitelistGroups: bool):
         self.separator = separator
         self.joinSeparator = separator
@@ -764,15 +891,23 @@ class CaptionRulesProcessor:
         self.implicationFilter = ImplicationFilter()
         self.prefixSuffixFilter = PrefixSuffixFilter()
 
+        self._memo = dict[tuple[str, tuple], str]()
+
+    def _invalidate(self):
+        self._memo = dict()
+
 
     def setPrefixSuffix(self, prefix: str, suffix: str, prefixSep: bool, suffixSep: bool):
         self.prefixSuffixFilter.setup(prefix, suffix, self.separator, prefixSep, suffixSep)
+        self._invalidate()
 
     def setSearchReplacePairs(self, pairs: list[tuple[str, str]]) -> None:
         self.replaceFilter.setup(pairs)
+        self._invalidate()
 
     def setBannedCaptions(self, bannedCaptions: list[str]) -> None:
         self.banFilter.setup(bannedCaptions)
+        self._invalidate()
 
     def setCaptionGroups(self, captionGroups: Iterable[ tuple[list[str], MutualExclusivity, bool] ]) -> None:
         'Takes iterable with tuples of `captions: list[str]`, `MutualExclusivity`, `combine: bool`'
@@ -795,14 +930,36 @@ class CaptionRulesProcessor:
             # Shared MatcherNode to split combined tags
             self.implicationFilter.setup(self.combineFilter.matcherNode)
 
+        self._invalidate()
+
     def setConditionalRules(self, rules: Iterable[ConditionalFilterRule], sidechain: bool) -> None:
         self.conditionalsFilter.setup(rules, self.separator, sidechain)
 
         # Always join sidechain tags with comma
         self.joinSeparator = ", " if sidechain else self.separator
+        self._invalidate()
 
 
     def process(self, text: str, settings: CaptionRulesSettings = CaptionRulesSettings()) -> str:
+        if not self.replaceFilter.deterministic:
+            return self._process(text, settings)
+
+        key = (text, settings.key())
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+
+        result = self._process(text, settings)
+
+        # Clearing the whole dict keeps this threadsafe without locking
+        memo = self._memo
+        if len(memo) >= self.MEMO_SIZE:
+            self._memo = memo = dict()
+        memo[key] = result
+        return result
+
+    def _process(self, text: str, settings: CaptionRulesSettings) -> str:
         if settings.searchReplace:
             text = self.replaceFilter.filterText(text)
 
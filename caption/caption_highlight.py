@@ -475,9 +475,12 @@ class TextLayoutHighlightContext:
 TPayload = TypeVar("TPayload")
 
 class MatcherNode(Generic[TPayload]):
-    'Matches and splits captions into components as defined in Caption Groups.'
+    '''
+    Matches and splits captions into components as defined in Caption Groups.
+    Matching uses a MatcherAutomaton which is compiled from the trie on first use. Changes must be made through the root node.
+    '''
 
-    __slots__ = ('name', 'children', 'payload')
+    __slots__ = ('name', 'children', 'payload', '_automaton')
 
     def __init__(self, name: str = ""):
         self.name = name
@@ -488,8 +491,11 @@ class MatcherNode(Generic[TPayload]):
         # End nodes can have children.
         self.payload: Optional[TPayload] = None
 
+        self._automaton: MatcherAutomaton[TPayload] | None = None
+
     def __setitem__(self, key: str, node: MatcherNode):
         self.children[key] = node
+        self._automaton = None
 
     def __getitem__(self, key: str) -> MatcherNode:
         node = self.children.get(key)
@@ -503,6 +509,7 @@ class MatcherNode(Generic[TPayload]):
             if word:
                 node = node[word]
         node.payload = payload
+        self._automaton = None
 
     def add(self, text: str, payload: TPayload):
         self.addWords(text.split(" "), payload)
@@ -518,78 +525,140 @@ class MatcherNode(Generic[TPayload]):
             v.printTree(level+1)
 
 
-    class MatcherStackEntry:
-        def __init__(self, node: MatcherNode, index: int):
-            self.node = node
-            self.index = index
+    @property
+    def automaton(self) -> MatcherAutomaton[TPayload]:
+        # Compiling in multiple threads at the same time produces equal automatons
+        automaton = self._automaton
+        if automaton is None:
+            self._automaton = automaton = MatcherAutomaton(self)
+        return automaton
 
     def match(self, words: list[str]) -> dict[int, TPayload]:
-        node = self
-        stack = list[self.MatcherStackEntry]()
-        payloads = dict[int, TPayload]()
+        return self.automaton.match(words)
 
-        def checkMatch(node: MatcherNode, child: MatcherNode, index: int, override=False) -> MatcherNode:
-            if child.payload is not None:
-                for entry in stack:
-                    if override or (entry.index not in payloads):
-                        payloads[entry.index] = child.payload
-                payloads[index] = child.payload
-
-            if child.children:
-                stack.append(self.MatcherStackEntry(child, index))
-                return child
-            return node
+    def splitWords(self, words: list[str]) -> list[list[str]]:
+        'The returned word lists are shared and must not be modified.'
+        return self.automaton.splitWords(words)
 
-        for i in range(len(words)-1, -1, -1):
-            word = words[i]
-            if not word:
-                continue
+    def split(self, words: list[str]) -> list[str]:
+        return self.automaton.split(words)
 
-            if child := node.children.get(word):
-                node = checkMatch(node, child, i, True)
+    def splitAll(self, captions: Iterable[str]) -> Generator[str]:
+        return self.automaton.splitAll(captions)
 
-            # Search for a different transition by unwinding stack
-            elif len(stack) > 1 and (child := stack[-2].node.children.get(word)):
-                stack.pop()
-                node = checkMatch(stack[-1].node, child, i)
+    def splitAllPreserveExtra(self, captions: Iterable[str]) -> Generator[str]:
+        return self.automaton.splitAllPreserveExtra(captions)
+
+
+
+class MatcherAutomaton(Generic[TPayload]):
+    '''
+    The MatcherNode trie compiled into flat tables: Trie nodes are numbered and their transitions, payloads and
+    matched words are stored in lists, so matching doesn't create stack entries or join words.
+
+    Matching walks the words backwards in a single pass. When a word has no transition from the current node,
+    the failure link to the parent node is tried. This allows combined tags like "long black hair",
+    which is split into "long hair" and "black hair".
+    '''
+
+    ROOT = 0
+
+    def __init__(self, root: MatcherNode[TPayload]):
+        # Per node
+        self.children = list[dict[str, int]]()      # word -> child node
+        self.failure  = list[int]()                 # Parent node if depth >= 2, otherwise -1
+        self.nextNode = list[int]()                 # Node after reaching this node: Itself if it has children, otherwise parent
+        self.branch   = list[bool]()                # Has children
+        self.payloads = list[TPayload | None]()
+        self.words    = list[list[str]]()           # Words of matched tag
+        self.texts    = list[str]()                 # Joined words
+
+        self._build(root)
+
+    def _build(self, root: MatcherNode[TPayload]):
+        # Iterative depth-first traversal with (trie node, parent, failure, words from end)
+        stack = [(root, -1, -1, list[str]())]
+        while stack:
+            trieNode, parent, failure, reversedWords = stack.pop()
+            node = len(self.payloads)
+            words = reversedWords[::-1]
+
+            self.children.append({})
+            self.failure.append(failure)
+            self.nextNode.append(node if trieNode.children else parent)
+            self.branch.append(bool(trieNode.children))
+            self.payloads.append(trieNode.payload)
+            self.words.append(words)
+            self.texts.append(" ".join(words))
+
+            if parent >= 0:
+                self.children[parent][trieNode.name] = node
+
+            childFailure = node if parent >= 0 else -1
+            for childNode in trieNode.children.values():
+                stack.append((childNode, node, childFailure, reversedWords + [childNode.name]))
+
+
+    def _walk(self, words: list[str]) -> list[int]:
+        'Returns the matched nodes.'
+        children = self.children
+        failure = self.failure
+        nextNode = self.nextNode
+        payloads = self.payloads
+
+        matches = list[int]()
+        state = self.ROOT
+        for word in reversed(words):
+            if (node := children[state].get(word)) is None:
+                if (fail := failure[state]) < 0 or (node := children[fail].get(word)) is None:
+                    continue
 
-        return payloads
+            if payloads[node] is not None:
+                matches.append(node)
+            state = nextNode[node]
 
+        return matches
 
-    def splitWords(self, words: list[str]) -> list[list[str]]:
-        node = self
-        stack = list[MatcherNode]()
-        groups = list[list[str]]()
+    def match(self, words: list[str]) -> dict[int, TPayload]:
+        'Returns the payload for each word index.'
+        children = self.children
+        failure = self.failure
+        nextNode = self.nextNode
+        branch = self.branch
+        payloads = self.payloads
 
-        def checkMatch(node: MatcherNode, child: MatcherNode) -> MatcherNode:
-            if child.payload is not None:
-                group = [n.name for n in stack]
-                group.append(child.name)
-                group.reverse()
-                groups.append(group)
+        result = dict[int, TPayload]()
+        stackIndices = list[int]()  # Word index where each node on the path was reached
+        state = self.ROOT
 
-            if child.children:
-                stack.append(child)
-                return child
-            return node
+        for i in range(len(words)-1, -1, -1):
+            override = True
+            if (node := children[state].get(words[i])) is None:
+                if (fail := failure[state]) < 0 or (node := children[fail].get(words[i])) is None:
+                    continue
+                stackIndices.pop()
+                override = False
 
-        for word in reversed(words):
-            if not word:
-                continue
+            if (payload := payloads[node]) is not None:
+                for index in stackIndices:
+                    if override or (index not in result):
+                        result[index] = payload
+                result[i] = payload
 
-            if child := node.children.get(word):
-                node = checkMatch(node, child)
+            if branch[node]:
+                stackIndices.append(i)
+            state = nextNode[node]
 
-            # Search for a different transition by unwinding stack
-            elif len(stack) > 1 and (child := stack[-2].children.get(word)):
-                stack.pop()
-                node = checkMatch(stack[-1], child)
+        return result
 
-        return groups
+    def splitWords(self, words: list[str]) -> list[list[str]]:
+        'The returned word lists are shared and must not be modified.'
+        allWords = self.words
+        return [allWords[node] for node in self._walk(words)]
 
     def split(self, words: list[str]) -> list[str]:
-        groups = self.splitWords(words)
-        return [" ".join(groupWords) for groupWords in groups]
+        texts = self.texts
+        return [texts[node] for node in self._walk(words)]
 
     def splitAll(self, captions: Iterable[str]) -> Generator[str]:
         for cap in captions:
@@ -601,26 +670,28 @@ class MatcherNode(Generic[TPayload]):
     def splitAllPreserveExtra(self, captions: Iterable[str]) -> Generator[str]:
         'Splits captions but only if no extra words are present. No subsets.'
 
-        splitCaptionWords = list[list[str]]()
+        allWords = self.words
+        texts = self.texts
+        splitNodes = list[int]()
         usedWords = set[str]()
 
         for cap in captions:
             captionWords = cap.split(" ")
 
-            if matchSplitWords := self.splitWords(captionWords):
-                splitCaptionWords.clear()
+            if matchNodes := self._walk(captionWords):
+                splitNodes.clear()
                 usedWords.clear()
 
                 # Don't split into subsets: Start with longest and only add captions if they have new words.
-                matchSplitWords.sort(key=len, reverse=True)
-                for matchWords in matchSplitWords:
-                    if not usedWords.issuperset(matchWords):
-                        usedWords.update(matchWords)
-                        splitCaptionWords.append(matchWords)
+                matchNodes.sort(key=lambda node: len(allWords[node]), reverse=True)
+                for node in matchNodes:
+                    if not usedWords.issuperset(allWords[node]):
+                        usedWords.update(allWords[node])
+                        splitNodes.append(node)
 
                 # Only use the split captions if all words are allowed to be combined (no extra words).
                 if usedWords.issuperset(word for word in captionWords if word):
-                    yield from (" ".join(matchWords) for matchWords in splitCaptionWords)
+                    yield from (texts[node] for node in splitNodes)
                     continue
 
             # Preserve original caption if extra words are present.
@@ -0,0 +1,199 @@
+import os, json
+from typing import Iterable
+import numpy as np
+from lib.csv import CsvLoader
+
+
+FolderStamp = list[tuple[str, int, int]]  # relative path, size, mtime_ns for each CSV file
+
+
+class ImplicationGraph:
+    '''
+    Tag implications compiled into their transitive closure.
+    Tags are interned as ids. The implied ids of all tags are stored in one flat list, indexed by offsets (CSR layout),
+    so the lookup of implied tags per caption is independent of the table size.
+
+    Tags which imply each other in a cycle are treated as equivalent: They don't imply themselves or each other.
+    '''
+
+    VERSION = 1
+    CACHE_FILE = "implications-compiled.npz"
+
+    def __init__(self, tags: list[str], offsets: list[int], impliedIds: list[int]):
+        self.tags = tags
+        self.tagIds = {tag: i for i, tag in enumerate(tags)}
+        self.offsets = offsets
+        self.impliedIds = impliedIds
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def getImpliedIds(self, tagId: int) -> list[int]:
+        return self.impliedIds[self.offsets[tagId] : self.offsets[tagId+1]]
+
+    def getImpliedTags(self, tag: str) -> list[str]:
+        tagId = self.tagIds.get(tag)
+        if tagId is None:
+            return []
+        return [self.tags[i] for i in self.getImpliedIds(tagId)]
+
+
+    @classmethod
+    def compile(cls, implications: dict[str, Iterable[str]]) -> 'ImplicationGraph':
+        'Takes a dict with antecedent -> consequents.'
+        tagSet = set(implications.keys())
+        for consequents in implications.values():
+            tagSet.update(consequents)
+
+        tags = sorted(tagSet)
+        tagIds = {tag: i for i, tag in enumerate(tags)}
+
+        edges: list[list[int]] = [[] for _ in range(len(tags))]
+        for antecedent, consequents in implications.items():
+            edges[tagIds[antecedent]] = [tagIds[cons] for cons in consequents]
+
+        components, componentIndex = cls._findComponents(edges)
+
+        # Components are sorted in reverse topological order: Implied components are always resolved before.
+        componentClosures = list[frozenset[int]]()
+        numCycles = 0
+        for comp, members in enumerate(components):
+            closure = set[int]()
+            for node in members:
+                for target in edges[node]:
+                    if (targetComp := componentIndex[target]) != comp:
+                        closure.update(components[targetComp])
+                        closure.update(componentClosures[targetComp])
+
+            componentClosures.append(frozenset(closure))
+            if len(members) > 1:
+                numCycles += 1
+
+        if numCycles:
+            print(f"Implications: Found {numCycles} cycles. Tags inside a cycle are treated as equivalent and won't be removed.")
+
+        offsets = [0]
+        impliedIds = list[int]()
+        for tagId in range(len(tags)):
+            impliedIds.extend(sorted(componentClosures[componentIndex[tagId]]))
+            offsets.append(len(impliedIds))
+
+        return cls(tags, offsets, impliedIds)
+
+    @staticmethod
+    def _findComponents(edges: list[list[int]]) -> tuple[list[list[int]], list[int]]:
+        '''
+        Iterative Tarjan algorithm for strongly connected components.
+        Returns the components in reverse topological order and the component index of each node.
+        '''
+
+        numNodes = len(edges)
+        index = [-1] * numNodes
+        lowLink = [0] * numNodes
+        onStack = [False] * numNodes
+        componentIndex = [-1] * numNodes
+
+        components = list[list[int]]()
+        stack = list[int]()
+        nextIndex = 0
+
+        for root in range(numNodes):
+            if index[root] >= 0:
+                continue
+
+            # Call stack with (node, next edge position)
+            callStack = [(root, 0)]
+            index[root] = lowLink[root] = nextIndex
+            nextIndex += 1
+            stack.append(root)
+            onStack[root] = True
+
+            while callStack:
+                node, edgePos = callStack[-1]
+                nodeEdges = edges[node]
+
+                if edgePos < len(nodeEdges):
+                    callStack[-1] = (node, edgePos+1)
+                    target = nodeEdges[edgePos]
+                    if index[target] < 0:
+                        index[target] = lowLink[target] = nextIndex
+                        nextIndex += 1
+                        stack.append(target)
+                        onStack[target] = True
+                        callStack.append((target, 0))
+                    elif onStack[target]:
+                        lowLink[node] = min(lowLink[node], index[target])
+                    continue
+
+                callStack.pop()
+                if callStack:
+                    parent = callStack[-1][0]
+                    lowLink[parent] = min(lowLink[parent], lowLink[node])
+
+                if lowLink[node] == index[node]:
+                    comp = len(components)
+                    members = list[int]()
+                    while True:
+                        member = stack.pop()
+                        onStack[member] = False
+                        componentIndex[member] = comp
+                        members.append(member)
+                        if member == node:
+                            break
+                    components.append(members)
+
+        return components, componentIndex
+
+
+    @staticmethod
+    def getFolderStamp(folder: str) -> FolderStamp:
+        stamp = list[tuple[str, int, int]]()
+        for path in sorted(CsvLoader.listFiles(folder)):
+            try:
+                stat = os.stat(path)
+                stamp.append((os.path.relpath(path, folder), stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                pass
+        return stamp
+
+    def save(self, path: str, stamp: FolderStamp):
+        tagData = "\0".join(self.tags).encode("utf-8")
+        stampData = json.dumps(stamp).encode("utf-8")
+
+        # Write to temporary file and replace, so an interrupted write doesn't leave a broken cache
+        tempPath = path + ".tmp"
+        try:
+            with open(tempPath, 'wb') as file:
+                np.savez(file,
+                    version=np.array(self.VERSION),
+                    stamp=np.frombuffer(stampData, dtype=np.uint8),
+                    tags=np.frombuffer(tagData, dtype=np.uint8),
+                    offsets=np.array(self.offsets, dtype=np.int64),
+                    impliedIds=np.array(self.impliedIds, dtype=np.int32)
+                )
+            os.replace(tempPath, path)
+        except OSError as ex:
+            print(f"WARNING: Failed to save compiled implications to '{path}': {ex}")
+
+    @classmethod
+    def load(cls, path: str, stamp: FolderStamp) -> 'ImplicationGraph | None':
+        'Returns None if the file is missing or if it was compiled from different CSV files.'
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != cls.VERSION:
+                    return None
+
+                savedStamp = json.loads(data["stamp"].tobytes().decode("utf-8"))
+                if [tuple(entry) for entry in savedStamp] != stamp:
+                    return None
+
+                tagData = data["tags"].tobytes().decode("utf-8")
+                tags = tagData.split("\0") if tagData else []
+                return cls(tags, data["offsets"].tolist(), data["impliedIds"].tolist())
+
+        except Exception as ex:
+            print(f"WARNING: Failed to load compiled implications from '{path}': {ex} ({type(ex).__name__})")
+            return None
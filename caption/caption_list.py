@@ -300,7 +300,7 @@ class CaptionList(CaptionTab):
                 return
 
         captionFile = CaptionFile(currentFile)
-        jsonExists = os.path.exists(captionFile.jsonPath)
+        jsonExists = captionFile.jsonExists()
 
         if jsonExists and not captionFile.loadFromJson():
             msg = f"Failed to save caption list: Could not load existing captions from '{captionFile.jsonPath}'"
@@ -2,7 +2,7 @@ from __future__ import annotations
 from collections import defaultdict
 from typing import Iterable, Callable, Generator
 from lib.filelist import FileList, DataKeys, CachedPathSort
-from lib.captionfile import FileTypeSelector
+from lib.captionfile import FileTypeSelector, CaptionFileWriter
 from .caption_highlight import MatcherNode
 
 # https://docs.python.org/3/library/difflib.html
@@ -221,15 +221,21 @@ class CaptionMultiEdit:
         if not self._files:
             return False
 
+        # Files with the same name but different extension share a JSON file: Write it once
         success = True
-        for file in self._files:
-            caption = self.separator.join(file.tags)
-            if captionDest.saveCaption(file.file, caption, cascade):
-                self.filelist.removeData(file.file, DataKeys.Caption)
-                self.filelist.setData(file.file, DataKeys.CaptionState, DataKeys.IconStates.Saved)
-                file.edited = False
-            else:
-                success = False
+        savedFiles = list[FileTags]()
+        with CaptionFileWriter() as writer:
+            for file in self._files:
+                caption = self.separator.join(file.tags)
+                if captionDest.saveCaption(file.file, caption, cascade, writer):
+                    savedFiles.append(file)
+                else:
+                    success = False
+
+        for file in savedFiles:
+            self.filelist.removeData(file.file, DataKeys.Caption)
+            self.filelist.setData(file.file, DataKeys.CaptionState, DataKeys.IconStates.Saved)
+            file.edited = False
 
         if success:
             self._edited = False
@@ -28,6 +28,11 @@ class Config:
     pathMaskMacros          = "./user/mask-macros/"
     pathEmbeddingTemplates  = "./user/embedding-prompt-templates/"
     pathEmbeddingCache      = "./.cache/embedding/"
+    pathSizeCache           = "./.cache/imgsize/"
+    pathVideoIndex          = "./.cache/videoindex/"
+    pathSeekSprites         = "./.cache/seeksprites/"
+    pathAutocompleteCache   = "./.cache/autocomplete/"
+    pathTileCache           = "./.cache/tiles/"  # Temporary mip levels of tiled images. Should be on a disk, not in RAM (tmpfs).
     pathVaeConfig           = "./res/vae-conf/"
     pathExport              = "."
     pathDebugLoad           = ""
@@ -60,6 +65,10 @@ class Config:
     # View
     viewZoomFactor          = 1.15
     viewZoomMinimum         = 0.5
+    viewPrefetchCount       = 2     # Number of next and previous images which are loaded in the background
+    viewPrefetchThreads     = 2
+    viewCacheSize           = 1024  # MB of decoded images
+    viewTiledMinPixels      = 100_000_000  # Larger images are shown with tiles
 
     # Slideshow
     slideshowInterval       = 4.0
@@ -151,10 +160,12 @@ class Config:
     captionRulesLoadMode    = "previous"
     captionCountTokens      = False
     captionShowPreview      = False
+    captionJsonCompact      = False
 
     # Gallery
     galleryThumbnailSize    = 200
     galleryThumbnailThreads = 6
+    galleryCaptionThreads   = 2
     galleryCacheSize        = 5000
 
     # Window state
@@ -205,6 +216,7 @@ class Config:
 
         cls.pathExport            = data.get("path_export", cls.pathExport)
         cls.pathDebugLoad         = data.get("path_debug_load", cls.pathDebugLoad)
+        cls.pathTileCache         = data.get("path_tile_cache", cls.pathTileCache)
 
         cls.exportPresets         = data.get("export_presets", cls.exportPresets)
         cls.exportVideoFps        = float(data.get("export_video_fps", cls.exportVideoFps))
@@ -217,6 +229,10 @@ class Config:
 
         cls.viewZoomFactor        = float(data.get("view_zoom_factor", cls.viewZoomFactor))
         cls.viewZoomMinimum       = float(data.get("view_zoom_minimum", cls.viewZoomMinimum))
+        cls.viewPrefetchCount     = int(data.get("view_prefetch_count", cls.viewPrefetchCount))
+        cls.viewPrefetchThreads   = int(data.get("view_prefetch_threads", cls.viewPrefetchThreads))
+        cls.viewCacheSize         = int(data.get("view_cache_size", cls.viewCacheSize))
+        cls.viewTiledMinPixels    = int(data.get("view_tiled_min_pixels", cls.viewTiledMinPixels))
 
         cls.slideshowInterval     = float(data.get("slideshow_interval", cls.slideshowInterval))
         cls.slideshowShuffle      = bool(data.get("slideshow_shuffle", cls.slideshowShuffle))
@@ -256,9 +272,11 @@ class Config:
         cls.captionRulesLoadMode  = data.get("caption_rules_load_mode", cls.captionRulesLoadMode)
         cls.captionCountTokens    = bool(data.get("caption_count_tokens", cls.captionCountTokens))
         cls.captionShowPreview    = bool(data.get("caption_show_preview", cls.captionShowPreview))
+        cls.captionJsonCompact    = bool(data.get("caption_json_compact", cls.captionJsonCompact))
 
         cls.galleryThumbnailSize    = int(data.get("gallery_thumbnail_size", cls.galleryThumbnailSize))
         cls.galleryThumbnailThreads = int(data.get("gallery_thumbnail_threads", cls.galleryThumbnailThreads))
+        cls.galleryCaptionThreads   = int(data.get("gallery_caption_threads", cls.galleryCaptionThreads))
         cls.galleryCacheSize        = int(data.get("gallery_cache_size", cls.galleryCacheSize))
 
         cls.windowStates          = data.get("window_states", cls.windowStates)
@@ -288,6 +306,7 @@ class Config:
 
         data["path_export"]                 = cls.pathExport
         data["path_debug_load"]             = cls.pathDebugLoad
+        data["path_tile_cache"]             = cls.pathTileCache
 
         data["export_presets"]              = cls.exportPresets
         data["export_video_fps"]            = cls.exportVideoFps
@@ -300,6 +319,10 @@ class Config:
 
         data["view_zoom_factor"]            = cls.viewZoomFactor
         data["view_zoom_minimum"]           = cls.viewZoomMinimum
+        data["view_prefetch_count"]         = cls.viewPrefetchCount
+        data["view_prefetch_threads"]       = cls.viewPrefetchThreads
+        data["view_cache_size"]             = cls.viewCacheSize
+        data["view_tiled_min_pixels"]       = cls.viewTiledMinPixels
 
         data["slideshow_interval"]          = cls.slideshowInterval
         data["slideshow_shuffle"]           = cls.slideshowShuffle
@@ -339,9 +362,11 @@ class Config:
         data["caption_rules_load_mode"]     = cls.captionRulesLoadMode
         data["caption_count_tokens"]        = cls.captionCountTokens
         data["caption_show_preview"]        = cls.captionShowPreview
+        data["caption_json_compact"]        = cls.captionJsonCompact
 
         data["gallery_thumbnail_size"]      = cls.galleryThumbnailSize
         data["gallery_thumbnail_threads"]   = cls.galleryThumbnailThreads
+        data["gallery_caption_threads"]     = cls.galleryCaptionThreads
         data["gallery_cache_size"]          = cls.galleryCacheSize
 
         data["window_states"]               = cls.windowStates
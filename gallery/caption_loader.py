@@ -0,0 +1,97 @@
+import weakref
+from PySide6.QtCore import Qt, Slot, Signal, SignalInstance, QThreadPool, QObject, QRunnable, QTimer
+from config import Config
+from .gallery_model import GalleryModel
+
+
+class CaptionLoader(QObject):
+    '''
+    Loads, filters and processes gallery captions in a background thread pool, so scrolling doesn't wait for I/O.
+    Requests from one event loop iteration are collected and loaded in batches with bulk reads.
+    The results are passed back to the model, which caches them and batches the updates of the view.
+    '''
+
+    BATCH_SIZE = 64
+
+    _instance = None
+
+    done = Signal(object, str, str, int)
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(CaptionLoader, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, '_singleton_initialized', False):
+            return
+
+        super().__init__()
+        self._singleton_initialized = True
+
+        self._active = True
+        self._pending = dict[tuple[GalleryModel, int], list[str]]()
+
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(Config.galleryCaptionThreads)
+
+        self.done.connect(self._onCaptionLoaded, Qt.ConnectionType.QueuedConnection)
+
+    def shutdown(self):
+        self._active = False
+        self._pending.clear()
+        self.done.disconnect()
+        self.threadpool.clear()
+
+
+    def loadCaption(self, model: GalleryModel, file: str, generation: int):
+        if self._active:
+            if not self._pending:
+                QTimer.singleShot(0, self._startPending)
+            self._pending.setdefault((model, generation), []).append(file)
+
+    @Slot()
+    def _startPending(self):
+        if not self._active:
+            return
+
+        for (model, generation), files in self._pending.items():
+            for i in range(0, len(files), self.BATCH_SIZE):
+                task = CaptionLoadTask(self.done, model, files[i:i+self.BATCH_SIZE], generation)
+                self.threadpool.start(task)
+        self._pending.clear()
+
+    @Slot(object, str, str, int)
+    def _onCaptionLoaded(self, model: GalleryModel, file: str, caption: str, generation: int):
+        model.onCaptionLoaded(file, caption, generation)
+
+
+
+class CaptionLoadTask(QRunnable):
+    def __init__(self, doneSignal: SignalInstance, model: GalleryModel, files: list[str], generation: int):
+        super().__init__()
+        self.setAutoDelete(True)
+        self.done = doneSignal
+
+        self.model = weakref.ref(model)
+        self.files = files
+        self.generation = generation
+
+    @Slot()
+    def run(self):
+        model = self.model()
+        if model is None:
+            return
+
+        files = [file for file in self.files if model.isCaptionRequested(file, self.generation)]
+        if not files:
+            return
+
+        try:
+            captions = model.galleryCaption.loadCaptions(files)
+        except Exception as ex:
+            print(f"Couldn't load captions: {ex} ({type(ex).__name__})")
+            captions = [""] * len(files)
+
+        for file, caption in zip(files, captions):
+            self.done.emit(model, file, caption, self.generation)
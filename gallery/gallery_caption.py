@@ -41,7 +41,12 @@ class GalleryCaption:
 
 
     def loadCaption(self, file: str) -> str:
-        caption = self.captionSrc.loadCaption(file)
+        return self.processCaption(self.captionSrc.loadCaption(file))
+
+    def loadCaptions(self, files: list[str]) -> list[str]:
+        return [self.processCaption(caption) for caption in self.captionSrc.loadCaptions(files)]
+
+    def processCaption(self, caption: str | None) -> str:
         if caption is None:
             return ""
 
@@ -308,6 +308,7 @@ class GalleryDelegate(QtWidgets.QStyledItemDelegate):
 
 class GalleryGridDelegate(GalleryDelegate):
     TEXT_MAX_HEIGHT = 200
+    PLACEHOLDER_OPACITY = 0.4
     TEXT_SPACING = 4
     TEXT_SPACING_BOTTOM = TEXT_SPACING + GalleryDelegate.BORDER_SIZE_HALF + 2
 
@@ -339,17 +340,21 @@ class GalleryGridDelegate(GalleryDelegate):
         return False
 
 
-    def _getCaptionLayouts(self, w: int, h: int, index: QModelIndex | QPersistentModelIndex) -> LayoutInfo:
+    def _getCaptionLayouts(self, w: int, h: int, index: QModelIndex | QPersistentModelIndex) -> LayoutInfo | None:
         # When a row consists of images with different aspect ratios, the tallest image+caption defines the row height.
         # The space available for each caption is different. Therefore, to always use all available vertical space,
         # don't cache and reuse the layout which was used to calculate the size hint,
         # but do full relayouting when the final row height becomes available in the first paintItem().
+        # Returns None while the caption is loading.
 
         key = (index.row(), index.column())
         layoutInfo = self.layoutCache.get(key)
 
         if layoutInfo is None:
             text = index.data(GalleryModel.ROLE_CAPTION)
+            if text is None:
+                return None
+
             layoutInfo = self.caption.layoutCaption(text, w, h)
 
             self.layoutCache[key] = layoutInfo
@@ -396,13 +401,19 @@ class GalleryGridDelegate(GalleryDelegate):
 
         # Only load caption when thumbnail and final size hint is ready
         if self.caption.captionsEnabled and imgH > 0:
-            p = QPoint(textX, textY)
             layoutInfo = self._getCaptionLayouts(textW, textH, index)
-            for textLayout in layoutInfo.layouts:
-                textLayout.draw(painter, p)
-        else:
-            textRect = QRect(textX, textY, textW, textH)
-            painter.drawText(textRect, filename, self.textOpt)
+            if layoutInfo is not None:
+                p = QPoint(textX, textY)
+                for textLayout in layoutInfo.layouts:
+                    textLayout.draw(painter, p)
+                return
+
+            # Show dimmed filename while the caption is loading
+            painter.setOpacity(self.PLACEHOLDER_OPACITY)
+
+        textRect = QRect(textX, textY, textW, textH)
+        painter.drawText(textRect, filename, self.textOpt)
+        painter.setOpacity(1.0)
 
 
     @override
@@ -412,12 +423,13 @@ class GalleryGridDelegate(GalleryDelegate):
 
         textW = w - self.BORDER_SIZE
 
-        if self.caption.captionsEnabled:
-            text = index.data(GalleryModel.ROLE_CAPTION)
+        text = index.data(GalleryModel.ROLE_CAPTION) if self.caption.captionsEnabled else None
+        if text is not None:
             layoutInfo = self.caption.layoutCaption(text, textW, self.TEXT_MAX_HEIGHT)
             if layoutInfo.height > 0:
                 h += layoutInfo.height + self.TEXT_SPACING_BOTTOM
         else:
+            # Filename, or placeholder while the caption is loading
             label = index.data(GalleryModel.ROLE_FILENAME)
             textRect = self.labelFontMetrics.boundingRect(0, 0, textW, self.TEXT_MAX_HEIGHT, self.textFlags, label)
             h += min(textRect.height(), self.TEXT_MAX_HEIGHT) + self.TEXT_SPACING_BOTTOM
@@ -687,9 +699,9 @@ class GalleryCaptionEditor(QtWidgets.QWidget):
 
     @Slot()
     def reloadCaption(self):
-        index = self.delegate.view.model().getFileIndex(self.file)
-        if index.isValid():
-            text = index.data(GalleryModel.ROLE_CAPTION)
+        model: GalleryModel = self.delegate.view.model()
+        if model.getFileIndex(self.file).isValid():
+            text = model.reloadCaption(self.file)
             with QSignalBlocker(self.txtCaption):
                 self.txtCaption.setCaption(text)
             self.setEdited(False)
@@ -9,13 +9,15 @@ from PySide6.QtGui import QTextCursor, QTextDocument
 from PySide6.QtWidgets import QPlainTextDocumentLayout
 from lib import qtlib
 from lib.filelist import FileList, DataKeys
-from lib.util import returnOnException
+from lib.util import returnOnException, getFileStamp
+from lib.mediasize import MediaSizeCache
 from config import Config
 from .gallery_caption import GalleryCaption
 from .gallery_header import GalleryHeader
 
 # Imported at the bottom
 # from .thumbnail_cache import ThumbnailCache
+# from .caption_loader import CaptionLoader
 
 
 class SelectionState:
@@ -145,11 +147,15 @@ class GalleryModel(QAbstractTableModel):
         self._highlightedFiles: set[str] = set()
 
         # A small time-bounded cache to avoid I/O during relayouting. Includes the filtering/processing.
+        # Captions are loaded in the background by CaptionLoader. Results of outdated requests are discarded using the generation.
         self._captionCache: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self._captionRequests: dict[str, int] = {}
+        self._captionGeneration: int = 0
 
         # In list view, captions are cached in documents that include the undo stack.
         self._docs: OrderedDict[str, QTextDocument] = OrderedDict()
         self._docsEdited: dict[str, QTextDocument] = {}
+        self._docsPending: set[str] = set()
         self._docFont = qtlib.getMonospaceFont()
 
         self._cascadeSaveEnabled: bool = True
@@ -175,12 +181,20 @@ class GalleryModel(QAbstractTableModel):
         return max(index-1, 0)
 
 
+    def _clearCaptionCache(self):
+        self._captionCache = OrderedDict()
+        self._captionRequests = {}
+        self._captionGeneration += 1
+
+        for file in self._docsPending:
+            self._requestCaption(file)
+
     @Slot()
     def _onCaptionSourceChanged(self):
-        self._captionCache = OrderedDict()
+        self._clearCaptionCache()
 
     def resetCaptions(self, clearDocs: bool = True, modelReset: bool = True):
-        self._captionCache = OrderedDict()
+        self._clearCaptionCache()
 
         if clearDocs:
             for doc in chain(self._docs.values(), self._docsEdited.values()):
@@ -188,6 +202,7 @@ class GalleryModel(QAbstractTableModel):
 
             self._docs = OrderedDict()
             self._docsEdited = {}
+            self._docsPending = set()
 
         if modelReset:
             self.modelReset.emit()
@@ -223,6 +238,7 @@ class GalleryModel(QAbstractTableModel):
         for doc in self._docs.values():
             doc.deleteLater()
         self._docs = OrderedDict()
+        self._docsPending = set()
 
         # Always reset headers when reloading
         self.headersEnabled = None
@@ -332,17 +348,14 @@ class GalleryModel(QAbstractTableModel):
 
         roles = [self.ROLE_ICONS]
 
-        # Reload caption when it was edited and saved in CaptionWindow
+        # Reload caption when it was edited and saved in CaptionWindow.
+        # Unedited documents are updated when the caption is loaded.
         if (self.galleryCaption.captionsEnabled
             and key == DataKeys.CaptionState
             and self.filelist.getData(file, key) == DataKeys.IconStates.Saved
         ):
-            roles.append(self.ROLE_CAPTION)
             self._captionCache.pop(file, None)
-
-            if doc := self._docs.get(file): # Only reload when document is unedited
-                with QSignalBlocker(doc):
-                    qtlib.setTextPreserveUndo(QTextCursor(doc), self._getCaption(file))
+            self._requestCaption(file)
 
         if item := self.fileItems.get(file):
             index = self.index(*item.pos)
@@ -369,25 +382,70 @@ class GalleryModel(QAbstractTableModel):
         return len(self._highlightedFiles)
 
 
-    def _getCaption(self, file: str) -> str:
+    def _getImageSize(self, file: str) -> tuple[int, int] | None:
+        imgSize = self.filelist.getData(file, DataKeys.ImageSize)
+        if imgSize is None and not self.filelist.getData(file, DataKeys.ImageSizeLookup):
+            # Use persisted size before the thumbnail is loaded, so the layout doesn't change.
+            # Only checked once per file: Misses would otherwise stat the file on every repaint.
+            self.filelist.setData(file, DataKeys.ImageSizeLookup, True, False)
+            found, size = MediaSizeCache().lookup(file, getFileStamp(file))
+            if found:
+                imgSize = size[:2]
+                self.filelist.setData(file, DataKeys.ImageSize, imgSize, False)
+        return imgSize
+
+    def _getCaption(self, file: str) -> str | None:
+        'Returns None while the caption is loading. Expired captions are returned until the reloaded caption is available.'
         entry = self._captionCache.get(file)
-        now = time.monotonic_ns()
-
         if entry is None:
-            caption = self.galleryCaption.loadCaption(file)
-            self._captionCache[file] = (caption, now)
+            self._requestCaption(file)
+            return None
 
-            if len(self._captionCache) > self.CAPTION_CACHE_SIZE:
-                self._captionCache.popitem(last=False)
+        caption, insertTime = entry
+        if insertTime < (time.monotonic_ns() - self.CAPTION_CACHE_TTL):
+            self._requestCaption(file)
 
-        else:
-            caption, insertTime = entry
-            if insertTime < (now - self.CAPTION_CACHE_TTL):
-                caption = self.galleryCaption.loadCaption(file)
-                self._captionCache[file] = (caption, now)
+        self._captionCache.move_to_end(file)
+        return caption
 
-            self._captionCache.move_to_end(file)
+    def _requestCaption(self, file: str):
+        if self._captionRequests.get(file) != self._captionGeneration:
+            self._captionRequests[file] = self._captionGeneration
+            CaptionLoader().loadCaption(self, file, self._captionGeneration)
 
+    def isCaptionRequested(self, file: str, generation: int) -> bool:
+        'Called from the loader threads to skip outdated requests.'
+        return self._captionRequests.get(file) == generation
+
+    def onCaptionLoaded(self, file: str, caption: str, generation: int):
+        if generation != self._captionGeneration:
+            return
+
+        self._captionRequests.pop(file, None)
+        self._storeCaption(file, caption)
+
+        if doc := self._docs.get(file): # Only update unedited documents
+            with QSignalBlocker(doc):
+                if file in self._docsPending:
+                    self._docsPending.discard(file)
+                    doc.setPlainText(caption)
+                elif doc.toPlainText() != caption:
+                    qtlib.setTextPreserveUndo(QTextCursor(doc), caption)
+
+        if item := self.fileItems.get(file):
+            self._thumbnailUpdateQueue.add(item.pos.row)
+
+    def _storeCaption(self, file: str, caption: str):
+        self._captionCache[file] = (caption, time.monotonic_ns())
+        self._captionCache.move_to_end(file)
+        if len(self._captionCache) > self.CAPTION_CACHE_SIZE:
+            self._captionCache.popitem(last=False)
+
+    def reloadCaption(self, file: str) -> str:
+        'Loads the caption synchronously. Used when reloading is explicitly requested.'
+        caption = self.galleryCaption.loadCaption(file)
+        self._captionRequests.pop(file, None)
+        self._storeCaption(file, caption)
         return caption
 
 
@@ -402,14 +460,21 @@ class GalleryModel(QAbstractTableModel):
         doc = QTextDocument(self)
         doc.setDocumentLayout(QPlainTextDocumentLayout(doc))
         doc.setDefaultFont(self._docFont)
-        doc.setPlainText(self._getCaption(file))
+
+        caption = self._getCaption(file)
+        if caption is None:
+            self._docsPending.add(file)
+        else:
+            doc.setPlainText(caption)
+
         self._storeUnchangedDocument(file, doc)
         return doc
 
     def _storeUnchangedDocument(self, file: str, doc: QTextDocument):
         self._docs[file] = doc
         if len(self._docs) > Config.galleryCacheSize:
-            self._docs.popitem(last=False)
+            evictedFile, _ = self._docs.popitem(last=False)
+            self._docsPending.discard(evictedFile)
 
 
     # === QAbstractTableModel Interface ===
@@ -465,7 +530,7 @@ class GalleryModel(QAbstractTableModel):
                     return item.path in self._highlightedFiles
 
                 case self.ROLE_IMGSIZE:
-                    return self.filelist.getData(item.path, DataKeys.ImageSize)
+                    return self._getImageSize(item.path)
 
                 case self.ROLE_CAPTION:
                     return self._getCaption(item.path)
@@ -498,6 +563,7 @@ class GalleryModel(QAbstractTableModel):
             if value:
                 if doc := self._docs.pop(item.path, None):
                     self._docsEdited[item.path] = doc
+                    self._docsPending.discard(item.path)
             else:
                 if doc := self._docsEdited.pop(item.path, None):
                     self._storeUnchangedDocument(item.path, doc)
@@ -530,3 +596,4 @@ class GalleryModel(QAbstractTableModel):
 
 
 from .thumbnail_cache import ThumbnailCache
+from .caption_loader import CaptionLoader
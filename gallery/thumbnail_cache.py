@@ -3,6 +3,9 @@ from PySide6.QtCore import Qt, Slot, Signal, SignalInstance, QThreadPool, QObjec
 from PySide6.QtGui import QPixmap, QImage
 from lib.filelist import DataKeys
 from lib import imagerw, videorw
+from lib.util import getFileStamp
+from lib.captionstore import CaptionStore
+from lib.mediasize import MediaSizeCache
 from config import Config
 from .gallery_model import GalleryModel
 
@@ -112,6 +115,7 @@ class ThumbnailTask(QRunnable):
                 img, (w, h) = videorw.thumbnailVideoQImage(self.file, ThumbnailCache.THUMBNAIL_SIZE, 2)
             else:
                 img, (w, h) = imagerw.thumbnailQImage(self.file, ThumbnailCache.THUMBNAIL_SIZE)
+                MediaSizeCache().store(self.file, getFileStamp(self.file), (w, h, 0))
         except Exception as ex:
             print(f"Couldn't load thumbnail: {ex} ({type(ex).__name__})")
             img = QImage()
@@ -126,7 +130,7 @@ class ThumbnailTask(QRunnable):
         if self.icons[DataKeys.CaptionState] is None:
             captionFile = filenameNoExt + ".txt"
             jsonFile    = filenameNoExt + ".json"
-            if self._fileExists(captionFile) or self._fileExists(jsonFile):
+            if self._fileExists(captionFile) or self._jsonExists(jsonFile):
                 self.icons[DataKeys.CaptionState] = DataKeys.IconStates.Exists
 
         if self.icons[DataKeys.MaskState] is None:
@@ -134,6 +138,12 @@ class ThumbnailTask(QRunnable):
             if os.path.exists(maskFile):
                 self.icons[DataKeys.MaskState] = DataKeys.IconStates.Exists
 
+    @classmethod
+    def _jsonExists(cls, path: str) -> bool:
+        if store := CaptionStore.forJsonPath(path):
+            return store.contains(path)
+        return cls._fileExists(path)
+
     @staticmethod
     def _fileExists(path: str) -> bool:
         try:
@@ -1,8 +1,10 @@
 from __future__ import annotations
 import base64
-from typing import Callable, Iterable
+from typing import Callable, Hashable, Iterable
+from threading import Lock
 from io import BytesIO
 from lib import imagerw, videorw
+from lib.util import Singleton, getFileStamp
 
 
 class ImageFile:
@@ -55,14 +57,14 @@ class ImageFile:
         self._callbacks = None
 
 
-    def openCvMat(self, rgb=False, forceRGB=False, allowGreyscale=True, allowAlpha=True):
+    def openCvMat(self, rgb=False, forceRGB=False, allowGreyscale=True, allowAlpha=True, minSize: int | tuple[int, int] | None = None):
         if self.data:
-            return imagerw.decodeMatBGR(self.data, rgb, forceRGB, allowGreyscale, allowAlpha)
-        return imagerw.loadMatBGR(self.file, rgb, forceRGB, allowGreyscale, allowAlpha)
+            return imagerw.decodeMatBGR(self.data, rgb, forceRGB, allowGreyscale, allowAlpha, minSize)
+        return imagerw.loadMatBGR(self.file, rgb, forceRGB, allowGreyscale, allowAlpha, minSize)
 
-    def openPIL(self, forceRGB=False, allowGreyscale=True, allowAlpha=True):
+    def openPIL(self, forceRGB=False, allowGreyscale=True, allowAlpha=True, minSize: int | tuple[int, int] | None = None):
         source = BytesIO(self.data) if self.data else self.file
-        return imagerw.loadImagePIL(source, forceRGB, allowGreyscale, allowAlpha)
+        return imagerw.loadImagePIL(source, forceRGB, allowGreyscale, allowAlpha, minSize)
 
 
     def _normalizeEncoding(self) -> tuple[bytes, str]:
@@ -94,12 +96,17 @@ class ImageFile:
         return videorw.isVideoFile(self.file)
 
     def getVideoFrames(self, sampleFps: float, maxFrames: int = 32):
-        source = BytesIO(self.data) if self.data else self.file
-        return videorw.extractFramesPIL(source, sampleFps, maxFrames)
+        if videorw.FrameExtractor is None:
+            source = BytesIO(self.data) if self.data else self.file
+            return videorw.extractFramesPIL(source, sampleFps, maxFrames)
 
-    def getVideoFramesCvMat(self, sampleFps: float, maxFrames: int, converterFactory: videorw.ConverterFactory):
-        source = BytesIO(self.data) if self.data else self.file
-        return videorw.extractFramesMat(source, sampleFps, maxFrames, converterFactory)
+        request = VideoFrameCache().extract(self, videorw.SampleFramesPIL(sampleFps, maxFrames))
+        return request.result()
+
+    def getVideoFramesCvMat(self, sampleFps: float, maxFrames: int, converterFactory: videorw.ConverterFactory, key: Hashable | None = None):
+        'The key identifies the conversion of converterFactory and allows sharing the decoding with other consumers.'
+        request = VideoFrameCache().extract(self, videorw.SampleFramesMat(sampleFps, maxFrames, converterFactory, key))
+        return request.result()
 
 
     def getVideoFramesEncodedBytes(self, sampleFps: float, maxFrames: int = 32) -> Iterable[bytes]:
@@ -142,3 +149,62 @@ class ImageCache:
     def clear(self):
         self.images.clear()
         self.totalSize = 0
+
+
+
+class VideoFrameCache(metaclass=Singleton):
+    '''
+    Consumers like captioning and tagging request frames of the same video one after another.
+    The shareable requests for the previous video are remembered and extracted together with the first request
+    for the next video, so the video is decoded once. Their frames are kept until the consumer requests them,
+    or until another video is requested. Each result is only returned once, so the frames aren't pinned after use.
+    '''
+
+    MAX_SHARED_REQUESTS = 4
+
+    def __init__(self):
+        self.extractor = videorw.FrameExtractor()
+        self.sharedRequests: dict[Hashable, videorw.FrameRequest] = dict()
+        self.fileKey: tuple | None = None
+        self.results: dict[Hashable, videorw.FrameRequest] = dict()
+        self.requestedKeys: set[Hashable] = set()
+        self._lock = Lock()
+
+    def _setFile(self, imgFile: ImageFile):
+        # Videos that are overwritten in place have a different stamp
+        fileKey = (imgFile.file, len(imgFile.data) if imgFile.data else -1, getFileStamp(imgFile.file))
+        if fileKey == self.fileKey:
+            return
+
+        # Forget requests that weren't used for the previous video
+        if self.fileKey is not None:
+            for key in [key for key in self.sharedRequests if key not in self.requestedKeys]:
+                del self.sharedRequests[key]
+
+        self.fileKey = fileKey
+        self.results.clear()
+        self.requestedKeys.clear()
+
+    def extract(self, imgFile: ImageFile, request: videorw.FrameRequest) -> videorw.FrameRequest:
+        with self._lock:
+            self._setFile(imgFile)
+
+            requests = [request]
+            if (key := request.key) is not None:
+                self.requestedKeys.add(key)
+                if cached := self.results.pop(key, None):
+                    return cached
+
+                self.sharedRequests.pop(key, None)
+                self.sharedRequests[key] = request.clone()
+                while len(self.sharedRequests) > self.MAX_SHARED_REQUESTS:
+                    del self.sharedRequests[next(iter(self.sharedRequests))]
+
+                requests.extend(shared.clone() for sharedKey, shared in self.sharedRequests.items() if sharedKey != key and sharedKey not in self.results)
+
+            source = BytesIO(imgFile.data) if imgFile.data else imgFile.file
+            self.extractor.extract(source, requests)
+
+            for req in requests[1:]:
+                self.results[req.key] = req
+            return request
@@ -174,7 +174,7 @@ class SinglePatchEmbeddingStrategy(ImageEmbeddingStrategy):
 class FixedResizeEmbedding(SinglePatchEmbeddingStrategy):
     @override
     def loadSinglePatch(self, imgFile: ImageFile) -> np.ndarray:
-        img = imgFile.openPIL(forceRGB=True)
+        img = imgFile.openPIL(forceRGB=True, minSize=self._size)
         img = img.resize(self._size, resample=Image.Resampling.BICUBIC)
 
         mat = np.array(img, dtype=np.float32)
@@ -185,7 +185,7 @@ class FixedResizeEmbedding(SinglePatchEmbeddingStrategy):
 class CenterCropEmbedding(SinglePatchEmbeddingStrategy):
     @override
     def loadSinglePatch(self, imgFile: ImageFile) -> np.ndarray:
-        img = imgFile.openPIL(forceRGB=True)
+        img = imgFile.openPIL(forceRGB=True, minSize=self._size)
         origW, origH = img.size
 
         targetW, targetH = self._size
@@ -261,7 +261,7 @@ class MultiPatchEmbedding(MultiPatchEmbeddingStrategy):
 
 
     def loadPatches(self, imgFile: ImageFile) -> list[np.ndarray]:
-        img = imgFile.openPIL(forceRGB=True)
+        img = imgFile.openPIL(forceRGB=True, minSize=self._size)
         origW, origH = img.size
 
         targetW, targetH = self._size
@@ -50,7 +50,7 @@ class PixAiTag(WDTag):
 
     @override
     def _loadImage(self, imgFile: ImageFile) -> np.ndarray:
-        img = imgFile.openCvMat(allowGreyscale=False, rgb=True)
+        img = imgFile.openCvMat(allowGreyscale=False, rgb=True, minSize=(self.modelTargetSize, self.modelTargetSize))
         srcHeight, srcWidth, srcChannels = img.shape
 
         # Resize & squish to 448x448
@@ -69,7 +69,7 @@ class PixAiTag(WDTag):
             interp = videorw.Interpolation.AREA if max(w, h) < self.modelTargetSize else videorw.Interpolation.BILINEAR
             return videorw.createFrameConverter(self.modelTargetSize, self.modelTargetSize, interpolation=interp, format="rgb24")
 
-        frames = imgFile.getVideoFramesCvMat(self.VIDEO_SAMPLE_FPS, self.VIDEO_MAX_FRAMES, converterFactory)
+        frames = imgFile.getVideoFramesCvMat(self.VIDEO_SAMPLE_FPS, self.VIDEO_MAX_FRAMES, converterFactory, ("squish", self.modelTargetSize))
         frames = [self._prepareMat(frame) for frame in frames]
 
         batches = [np.stack(batchFrames) for batchFrames in self.getVideoBatches(frames)]
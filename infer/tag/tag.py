@@ -55,7 +55,7 @@ class TagBackend:
 
     @staticmethod
     def loadImageSquare(imgFile: ImageFile, targetSize: int, rgb: bool = False) -> np.ndarray:
-        imgSrc = imgFile.openCvMat(rgb=rgb, allowGreyscale=False)
+        imgSrc = imgFile.openCvMat(rgb=rgb, allowGreyscale=False, minSize=targetSize)
         srcHeight, srcWidth, srcChannels = imgSrc.shape
 
         if srcHeight < srcWidth:
@@ -98,7 +98,7 @@ class TagBackend:
             format = "rgb24" if rgb else "bgr24"
             return videorw.createFrameConverter(w, h, interpolation=interp, format=format)
 
-        frames = imgFile.getVideoFramesCvMat(cls.VIDEO_SAMPLE_FPS, cls.VIDEO_MAX_FRAMES, converterFactory)
+        frames = imgFile.getVideoFramesCvMat(cls.VIDEO_SAMPLE_FPS, cls.VIDEO_MAX_FRAMES, converterFactory, ("square", targetSize, rgb))
         h, w = frames[0].shape[:2]
 
         if h < w:
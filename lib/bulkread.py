@@ -0,0 +1,115 @@
+import json, os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, TypeVar
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+T = TypeVar("T")
+
+
+def parseJson(data: bytes | str):
+    'Uses orjson when it is installed.'
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+
+class BulkReader:
+    '''
+    Reads many small files with a small thread pool.
+
+    Files are grouped by folder and sorted by inode, which is close to their position on disk for most file systems.
+    Folders with many requested files are listed once, so missing files are skipped without trying to open them.
+    '''
+
+    NUM_THREADS = 4
+    CHUNK_SIZE  = 64
+    MIN_SCAN    = 64    # Only list folders with at least this number of requested files
+
+    _mutex = Lock()
+    _executor: ThreadPoolExecutor | None = None
+    _executorPid = 0
+
+
+    @classmethod
+    def getExecutor(cls) -> ThreadPoolExecutor:
+        with cls._mutex:
+            # Threads are not inherited by forked processes
+            if cls._executor is None or cls._executorPid != os.getpid():
+                cls._executor = ThreadPoolExecutor(cls.NUM_THREADS, thread_name_prefix="qapyq-bulkread")
+                cls._executorPid = os.getpid()
+            return cls._executor
+
+
+    @classmethod
+    def read(cls, paths: list[str], readFunc: Callable[[str], T]) -> list[T | None]:
+        '''
+        Calls 'readFunc' for each path and returns the results in input order.
+        Missing files, and files for which 'readFunc' raises FileNotFoundError, return None.
+        '''
+        results: list[T | None] = [None] * len(paths)
+        chunks = cls._orderChunks(paths)
+
+        def readChunk(chunk: list[tuple[int, str]]) -> None:
+            for index, path in chunk:
+                try:
+                    results[index] = readFunc(path)
+                except FileNotFoundError:
+                    pass
+
+        if len(chunks) > 1:
+            for _ in cls.getExecutor().map(readChunk, chunks):
+                pass
+        elif chunks:
+            readChunk(chunks[0])
+        return results
+
+    @classmethod
+    def _orderChunks(cls, paths: list[str]) -> list[list[tuple[int, str]]]:
+        folders = dict[str, list[tuple[int, str]]]()
+        for index, path in enumerate(paths):
+            folders.setdefault(os.path.dirname(path), []).append((index, path))
+
+        ordered = list[tuple[int, str]]()
+        for folder in sorted(folders):
+            items = folders[folder]
+            if len(items) >= cls.MIN_SCAN:
+                items = cls._sortByInode(folder, items)
+            else:
+                items.sort(key=lambda item: item[1])
+            ordered.extend(items)
+
+        return [ordered[i:i+cls.CHUNK_SIZE] for i in range(0, len(ordered), cls.CHUNK_SIZE)]
+
+    @staticmethod
+    def _sortByInode(folder: str, items: list[tuple[int, str]]) -> list[tuple[int, str]]:
+        try:
+            with os.scandir(folder or ".") as it:
+                # On Windows, inode() needs an additional stat call
+                inodes = {entry.name: (entry.inode() if os.name != "nt" else 0) for entry in it}
+        except OSError:
+            return items
+
+        foldedInodes: dict[str, int] | None = None
+        sortItems = list[tuple[int, str, int]]()
+        for index, path in items:
+            name = os.path.basename(path)
+            inode = inodes.get(name)
+            if inode is None:
+                # Case-insensitive file systems open files with differently cased names
+                if foldedInodes is None:
+                    foldedInodes = {name.casefold(): inode for name, inode in inodes.items()}
+                inode = foldedInodes.get(name.casefold())
+                if inode is None:
+                    continue
+
+            sortItems.append((inode, path, index))
+
+        sortItems.sort()
+        return [(index, path) for _, path, index in sortItems]
@@ -1,9 +1,17 @@
-import json, os
+import json, os, stat, time
+from threading import Lock, get_ident
 from typing import Callable
 from PySide6 import QtWidgets
 from PySide6.QtCore import Qt, Slot, Signal, QObject, QSignalBlocker
 import lib.qtlib as qtlib
 from config import Config
+from .captionstore import CaptionStore
+from .bulkread import BulkReader, parseJson
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Imported in FileTypeSelector.saveCaption()
 # from .cascade import CascadeUpdate
@@ -19,6 +27,111 @@ class Keys:
 
 
 
+class CaptionFileLock:
+    '''
+    Advisory lock for a caption file. Serializes writers of the same file inside this process,
+    and across processes where fcntl is available (not on Windows).
+    Readers don't need the lock because files are replaced atomically.
+    '''
+
+    _mutex = Lock()
+    _locks: dict[str, tuple[Lock, int]] = dict()  # Path -> lock, number of users
+
+    def __init__(self, path: str):
+        self.path = os.path.normcase(os.path.abspath(path))
+        self._lock: Lock | None = None
+        self._file = None
+
+    def __enter__(self):
+        with self._mutex:
+            lock, numUsers = self._locks.get(self.path, (None, 0))
+            if lock is None:
+                lock = Lock()
+            self._locks[self.path] = (lock, numUsers+1)
+
+        lock.acquire()
+        self._lock = lock
+        if fcntl is not None:
+            self._file = self._lockFile()
+        return self
+
+    def __exit__(self, excType, excVal, excTb):
+        if self._file is not None:
+            self._file.close() # Releases flock
+            self._file = None
+
+        self._lock.release()
+        self._lock = None
+
+        with self._mutex:
+            lock, numUsers = self._locks[self.path]
+            if numUsers > 1:
+                self._locks[self.path] = (lock, numUsers-1)
+            else:
+                del self._locks[self.path]
+
+    def _lockFile(self):
+        while True:
+            try:
+                file = open(self.path, 'rb')
+            except OSError:
+                return None # New file: Only serialized inside this process
+
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+            # Check if the file was replaced while waiting for the lock
+            try:
+                if os.path.samestat(os.fstat(file.fileno()), os.stat(self.path)):
+                    return file
+            except OSError:
+                pass
+            file.close()
+
+
+def writeJsonAtomic(path: str, data: dict, compact: bool = False) -> None:
+    '''
+    Writes to a temporary file in the same folder, syncs it to disk, and then replaces the target.
+    A crash or error during writing leaves the previous file intact.
+    '''
+
+    tempPath = f"{path}.{os.getpid()}-{get_ident()}.tmp"
+    try:
+        fd = os.open(tempPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        with os.fdopen(fd, 'w') as file:
+            if compact:
+                json.dump(data, file, separators=(",", ":"))
+            else:
+                json.dump(data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+
+        try:
+            os.chmod(tempPath, stat.S_IMODE(os.stat(path).st_mode))
+        except OSError:
+            pass
+
+        _replaceFile(tempPath, path)
+    except BaseException:
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+        raise
+
+
+def _replaceFile(src: str, dest: str, retries: int = 10):
+    # On Windows, replacing fails while another thread or process has the target open for reading
+    for retry in range(retries):
+        try:
+            os.replace(src, dest)
+            return
+        except PermissionError:
+            if os.name != "nt" or retry == retries-1:
+                raise
+            time.sleep(0.02)
+
+
+
 class CaptionFile:
     VERSION = "1.0"
 
@@ -74,13 +187,20 @@ class CaptionFile:
 
 
     def jsonExists(self) -> bool:
+        if store := CaptionStore.forJsonPath(self.jsonPath):
+            return store.contains(self.jsonPath)
         return os.path.exists(self.jsonPath)
 
 
     def loadFromJson(self) -> bool:
         try:
-            with open(self.jsonPath, 'r') as file:
-                data = json.load(file)
+            if store := CaptionStore.forJsonPath(self.jsonPath):
+                data = store.get(self.jsonPath)
+                if data is None:
+                    return False
+            else:
+                with open(self.jsonPath, 'rb') as file:
+                    data = parseJson(file.read())
             if Keys.VERSION not in data:
                 return False
         except FileNotFoundError:
@@ -89,41 +209,103 @@ class CaptionFile:
             print(f"Warning: Failed to load captions from '{self.jsonPath}': {ex} ({type(ex).__name__})")
             return False
 
-        self.captions = data.get(Keys.CAPTIONS, {})
-        self.prompts  = data.get(Keys.PROMPTS, {})
-        self.tags     = data.get(Keys.TAGS, {})
-        self.metrics  = data.get(Keys.METRICS, {})
-        self.cascade  = data.get(Keys.CASCADE, {})
+        self._fromData(data)
         return True
 
-
-    def updateToJson(self) -> bool:
+    @staticmethod
+    def _readJsonData(path: str) -> dict | None:
         try:
-            with open(self.jsonPath, 'r') as file:
-                data = json.load(file)
-            if Keys.VERSION not in data:
-                return False
+            with open(path, 'rb') as file:
+                data = parseJson(file.read())
         except FileNotFoundError:
-            data = dict()
+            return None
         except Exception as ex:
-            print(f"Warning: Failed to load captions from '{self.jsonPath}': {ex} ({type(ex).__name__})")
-            return False
+            print(f"Warning: Failed to load captions from '{path}': {ex} ({type(ex).__name__})")
+            return None
+        return data if isinstance(data, dict) and Keys.VERSION in data else None
 
-        data[Keys.VERSION] = CaptionFile.VERSION
+    @classmethod
+    def loadMany(cls, files: list[str]) -> dict[str, 'CaptionFile']:
+        '''
+        Loads the captions of many files. JSON files are read with a BulkReader,
+        and files in a folder with a CaptionStore are read in bulk queries.
+        Returns a dict which maps the given paths to their CaptionFile. Files that couldn't be loaded are omitted.
+        '''
+        captionFiles = [CaptionFile(file) for file in files]
+        jsonPaths = [captionFile.jsonPath for captionFile in captionFiles]
+        values: list[dict | None] = [None] * len(files)
 
-        self._updateDict(data, self.captions, Keys.CAPTIONS)
-        self._updateDict(data, self.prompts, Keys.PROMPTS)
-        self._updateDict(data, self.tags, Keys.TAGS)
-        self._updateDict(data, self.metrics, Keys.METRICS, self._predNotNone)
-        self._updateDict(data, self.cascade, Keys.CASCADE)
+        storeIndices, fileIndices = CaptionStore.groupByStore(jsonPaths)
+        for store, indices in storeIndices.items():
+            storeValues = store.getMany(jsonPaths[i] for i in indices)
+            for i in indices:
+                values[i] = storeValues.get(jsonPaths[i])
+
+        fileValues = BulkReader.read([jsonPaths[i] for i in fileIndices], cls._readJsonData)
+        for i, data in zip(fileIndices, fileValues):
+            values[i] = data
 
-        with open(self.jsonPath, 'w') as file:
-            json.dump(data, file, indent=4)
+        results = dict[str, CaptionFile]()
+        for file, captionFile, data in zip(files, captionFiles, values):
+            if data is not None and Keys.VERSION in data:
+                captionFile._fromData(data)
+                results[file] = captionFile
+        return results
+
+
+    def updateToJson(self) -> bool:
+        'Merges the values into the existing file. The file is locked while reading and writing, so concurrent updates are not lost.'
+        if store := CaptionStore.forJsonPath(self.jsonPath):
+            # Rows always have the version key, an empty dict is a new row
+            return store.update(self.jsonPath, lambda data: self._mergeData(data) if not data or Keys.VERSION in data else None)
+
+        with CaptionFileLock(self.jsonPath):
+            try:
+                with open(self.jsonPath, 'r') as file:
+                    data = json.load(file)
+                if Keys.VERSION not in data:
+                    return False
+            except FileNotFoundError:
+                data = dict()
+            except Exception as ex:
+                print(f"Warning: Failed to load captions from '{self.jsonPath}': {ex} ({type(ex).__name__})")
+                return False
+
+            data = self._mergeData(data)
+            writeJsonAtomic(self.jsonPath, data, Config.captionJsonCompact)
 
         return True
 
 
     def saveToJson(self) -> None:
+        data = self._toData()
+        if store := CaptionStore.forJsonPath(self.jsonPath):
+            store.put(self.jsonPath, data)
+            return
+
+        with CaptionFileLock(self.jsonPath):
+            writeJsonAtomic(self.jsonPath, data, Config.captionJsonCompact)
+
+
+    def deleteJson(self) -> bool:
+        if store := CaptionStore.forJsonPath(self.jsonPath):
+            return store.delete(self.jsonPath)
+
+        if self.jsonPath.endswith(".json") and os.path.isfile(self.jsonPath):
+            os.remove(self.jsonPath)
+            return True
+        return False
+
+
+    def _fromData(self, data: dict):
+        # Copy, because the data may be shared when files with different extensions use the same JSON file
+        self.captions = dict(data.get(Keys.CAPTIONS, {}))
+        self.prompts  = dict(data.get(Keys.PROMPTS, {}))
+        self.tags     = dict(data.get(Keys.TAGS, {}))
+        self.metrics  = dict(data.get(Keys.METRICS, {}))
+        self.cascade  = dict(data.get(Keys.CASCADE, {}))
+
+    def _toData(self) -> dict:
         data = dict()
         data[Keys.VERSION] = CaptionFile.VERSION
 
@@ -142,8 +324,17 @@ class CaptionFile:
         if cascade := self._deleteEmpty(self.cascade):
             data[Keys.CASCADE] = cascade
 
-        with open(self.jsonPath, 'w') as file:
-            json.dump(data, file, indent=4)
+        return data
+
+    def _mergeData(self, data: dict) -> dict:
+        data[Keys.VERSION] = CaptionFile.VERSION
+
+        self._updateDict(data, self.captions, Keys.CAPTIONS)
+        self._updateDict(data, self.prompts, Keys.PROMPTS)
+        self._updateDict(data, self.tags, Keys.TAGS)
+        self._updateDict(data, self.metrics, Keys.METRICS, self._predNotNone)
+        self._updateDict(data, self.cascade, Keys.CASCADE)
+        return data
 
 
     @classmethod
@@ -163,6 +354,55 @@ class CaptionFile:
 
 
 
+class CaptionFileWriter:
+    '''
+    Collects changed caption files and writes each JSON file once when flushed.
+    Files are loaded through the writer, so several updates of the same JSON file within a batch
+    (for example from 'image.png' and 'image.jpg') build on each other and are coalesced into one write.
+    '''
+
+    def __init__(self):
+        self.files: dict[str, CaptionFile] = dict()
+        self._cascade = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excVal, excTb):
+        self.flush()
+
+    def load(self, path: str) -> CaptionFile | None:
+        'Returns the pending CaptionFile if the JSON file was already changed. Returns None if the existing file could not be loaded.'
+        captionFile = CaptionFile(path)
+        if pending := self.files.get(captionFile.jsonPath):
+            return pending
+
+        if captionFile.jsonExists() and not captionFile.loadFromJson():
+            return None
+        return captionFile
+
+    def save(self, captionFile: CaptionFile):
+        self.files[captionFile.jsonPath] = captionFile
+
+    def getCascadeUpdate(self):
+        'Returns a CascadeUpdate with cached graphs, which is reused for all files of the batch.'
+        if self._cascade is None:
+            from .cascade import CascadeUpdate
+            self._cascade = CascadeUpdate()
+            self._cascade.enableCache()
+        return self._cascade
+
+    def flush(self) -> int:
+        'Returns the number of written files.'
+        files = list(self.files.values())
+        self.files.clear()
+        for captionFile in files:
+            captionFile.saveToJson()
+            print(f"Saved captions to file: {captionFile.jsonPath}")
+        return len(files)
+
+
+
 class FileTypeSelector(QtWidgets.QHBoxLayout):
     TYPE_TXT = "text"
     TYPE_TAGS = "tags"
@@ -243,6 +483,10 @@ class FileTypeSelector(QtWidgets.QHBoxLayout):
         else:
             return self.loadCaptionJson(self.type, self.name, imgPath)
 
+    def loadCaptions(self, imgPaths: list[str]) -> list[str | None]:
+        'Loads the captions of many files with a CaptionBulkLoader. Returns the captions in input order.'
+        return CaptionBulkLoader(self.type, self.name).loadMany(imgPaths)
+
     @staticmethod
     def loadCaptionTxt(imgPath: str) -> str | None:
         try:
@@ -263,13 +507,20 @@ class FileTypeSelector(QtWidgets.QHBoxLayout):
         else:
             return captionFile.getTags(key)
 
-    def createLoadFunc(self) -> Callable[[str], str | None]:
-        if self.type == self.TYPE_TXT:
-            return self.loadCaptionTxt
-        return JsonCaptionLoadFunctor(self.type, self.name)
+    @staticmethod
+    def getCaptionPath(keyType: str, imgPath: str) -> str:
+        ext = FileTypeSelector.CAPTION_FILE_EXT if keyType == FileTypeSelector.TYPE_TXT else ".json"
+        return os.path.splitext(imgPath)[0] + ext
 
+    def createLoadFunc(self) -> 'CaptionBulkLoader':
+        return CaptionBulkLoader(self.type, self.name)
 
-    def saveCaption(self, imgPath: str, text: str, cascade: bool = False) -> bool:
+
+    def saveCaption(self, imgPath: str, text: str, cascade: bool = False, writer: CaptionFileWriter | None = None) -> bool:
+        '''
+        With a CaptionFileWriter, the JSON file is written when the writer is flushed.
+        Text files are always written immediately.
+        '''
         if not imgPath:
             print(f"Failed to save caption to file: Path is empty")
             return False
@@ -282,9 +533,9 @@ class FileTypeSelector(QtWidgets.QHBoxLayout):
         keyType = self.type
         keyName = self.name
 
-        captionFile = CaptionFile(imgPath)
-        if captionFile.jsonExists() and not captionFile.loadFromJson():
-            print(f"Failed to save caption to file: {captionFile.jsonPath} [{keyType}.{keyName}] (couldn't load file for updating)")
+        captionFile = (writer or CaptionFileWriter()).load(imgPath)
+        if captionFile is None:
+            print(f"Failed to save caption to file: {os.path.splitext(imgPath)[0]}.json [{keyType}.{keyName}] (couldn't load file for updating)")
             return False
 
         if keyType == FileTypeSelector.TYPE_CAPTIONS:
@@ -293,11 +544,18 @@ class FileTypeSelector(QtWidgets.QHBoxLayout):
             captionFile.addTags(keyName, text)
 
         if cascade:
-            from .cascade import CascadeUpdate
-            CascadeUpdate().saveCascade(imgPath, captionFile, keyType, keyName)
-
-        captionFile.saveToJson()
-        print(f"Saved caption to file: {captionFile.jsonPath} [{keyType}.{keyName}]")
+            if writer:
+                cascadeUpdate = writer.getCascadeUpdate()
+            else:
+                from .cascade import CascadeUpdate
+                cascadeUpdate = CascadeUpdate()
+            cascadeUpdate.saveCascade(imgPath, captionFile, keyType, keyName)
+
+        if writer:
+            writer.save(captionFile)
+        else:
+            captionFile.saveToJson()
+            print(f"Saved caption to file: {captionFile.jsonPath} [{keyType}.{keyName}]")
         return True
 
     @classmethod
@@ -310,20 +568,65 @@ class FileTypeSelector(QtWidgets.QHBoxLayout):
 
 
 # Pickleable
-class JsonCaptionLoadFunctor:
+class CaptionBulkLoader:
+    '''
+    Loads the caption of one type and key for many files. Files are read with a BulkReader,
+    and files in folders with a CaptionStore are read in bulk queries.
+    Also callable with a single file, like the function returned by FileTypeSelector.createLoadFunc().
+    '''
+
     def __init__(self, keyType: str, key: str):
+        self.keyType = keyType
         self.key = key
 
-        if keyType == FileTypeSelector.TYPE_CAPTIONS:
-            self.getCaptionFunc = CaptionFile.getCaption
-        else:
-            self.getCaptionFunc = CaptionFile.getTags
+        match keyType:
+            case FileTypeSelector.TYPE_CAPTIONS: self.dataKey = Keys.CAPTIONS
+            case FileTypeSelector.TYPE_TAGS:     self.dataKey = Keys.TAGS
+            case _:                              self.dataKey = None
 
     def __call__(self, imgPath: str) -> str | None:
-        captionFile = CaptionFile(imgPath)
-        if captionFile.loadFromJson():
-            return self.getCaptionFunc(captionFile, self.key)
-        return None
+        return self.loadMany([imgPath])[0]
+
+    def loadMany(self, imgPaths: list[str]) -> list[str | None]:
+        'Returns the captions in input order, or None for files without caption.'
+        if self.dataKey is None:
+            paths = [os.path.splitext(path)[0] + FileTypeSelector.CAPTION_FILE_EXT for path in imgPaths]
+            return BulkReader.read(paths, self._readTxt)
+
+        results: list[str | None] = [None] * len(imgPaths)
+        jsonPaths = [os.path.splitext(path)[0] + ".json" for path in imgPaths]
+
+        storeIndices, fileIndices = CaptionStore.groupByStore(jsonPaths)
+        for store, indices in storeIndices.items():
+            values = store.getMany(jsonPaths[i] for i in indices)
+            for i in indices:
+                results[i] = self._getValue(values.get(jsonPaths[i]))
+
+        fileResults = BulkReader.read([jsonPaths[i] for i in fileIndices], self._readJson)
+        for i, caption in zip(fileIndices, fileResults):
+            results[i] = caption
+        return results
+
+    @staticmethod
+    def _readTxt(path: str) -> str:
+        with open(path, 'r') as file:
+            return file.read()
+
+    def _readJson(self, path: str) -> str | None:
+        try:
+            with open(path, 'rb') as file:
+                data = parseJson(file.read())
+        except FileNotFoundError:
+            raise
+        except Exception as ex:
+            print(f"Warning: Failed to load captions from '{path}': {ex} ({type(ex).__name__})")
+            return None
+        return self._getValue(data)
+
+    def _getValue(self, data) -> str | None:
+        if not isinstance(data, dict) or Keys.VERSION not in data:
+            return None
+        return data.get(self.dataKey, {}).get(self.key)
 
 
 
@@ -0,0 +1,312 @@
+import json, os, sqlite3, time
+from pathlib import Path
+from threading import Lock, local
+from typing import Callable, Iterable, Iterator
+from .bulkread import parseJson
+
+
+class CaptionStore:
+    '''
+    Stores the content of caption JSON files in one SQLite database, as an optional replacement for per-file sidecars.
+
+    The database is placed in a dataset folder and holds the captions of all files in that folder and its subfolders.
+    Rows are keyed by the path of the JSON file relative to the database folder, and the value is the same JSON object
+    that would be written to the file. When a database exists, CaptionFile reads and writes it instead of JSON files.
+
+    The database uses WAL mode, so readers don't block the writer. Each thread uses its own connection.
+
+    Lookups of the store for a folder are cached for LOOKUP_TTL, so databases which are created or removed
+    by other processes (like the caption store CLI) are found after a short delay.
+    '''
+
+    FILENAME = "qapyq_captions.db"
+    SCHEMA_VERSION = 1
+    CHUNK_SIZE = 500  # Below SQLite's default limit of host parameters
+    LOOKUP_TTL = 2_000_000_000  # ns
+
+    _mutex = Lock()
+    _stores: dict[str, 'CaptionStore'] = dict()
+    _folderStores: dict[str, tuple['CaptionStore | None', int]] = dict()  # Folder -> (Store of folder or nearest parent folder, lookup time)
+
+
+    def __init__(self, folder: str, create: bool = False):
+        self.folder = folder
+        self._prefix = os.path.join(folder, "")
+        self.dbPath = os.path.join(folder, self.FILENAME)
+        self._uri = Path(self.dbPath).as_uri()
+        self._local = local()
+        self._connections = list[sqlite3.Connection]()
+        self._connectionsLock = Lock()
+
+        con = self._connect(create)
+        con.execute("CREATE TABLE IF NOT EXISTS captions (path TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID")
+        con.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+
+    @classmethod
+    def forFolder(cls, folder: str) -> 'CaptionStore | None':
+        'Returns the store of the folder or its nearest parent folder. The lookup is cached per folder.'
+        folder = os.path.abspath(folder)
+        with cls._mutex:
+            return cls._lookup(folder, time.monotonic_ns())
+
+    @classmethod
+    def forJsonPath(cls, jsonPath: str) -> 'CaptionStore | None':
+        return cls.forFolder(os.path.dirname(jsonPath) or ".")
+
+    @classmethod
+    def groupByStore(cls, paths: Iterable[str]) -> tuple[dict['CaptionStore', list[int]], list[int]]:
+        'Returns the indices of paths for each store, and the indices of paths without store.'
+        storeIndices = dict[CaptionStore, list[int]]()
+        otherIndices = list[int]()
+        folderStores = dict[str, CaptionStore | None]()
+
+        for i, path in enumerate(paths):
+            folder = os.path.dirname(path)
+            try:
+                store = folderStores[folder]
+            except KeyError:
+                folderStores[folder] = store = cls.forFolder(folder or ".")
+
+            if store is None:
+                otherIndices.append(i)
+            else:
+                storeIndices.setdefault(store, []).append(i)
+
+        return storeIndices, otherIndices
+
+    @classmethod
+    def _lookup(cls, folder: str, now: int) -> 'CaptionStore | None':
+        entry = cls._folderStores.get(folder)
+        if entry is not None and now - entry[1] < cls.LOOKUP_TTL:
+            return entry[0]
+
+        if os.path.isfile(os.path.join(folder, cls.FILENAME)):
+            store = cls._stores.get(folder)
+            if store is None:
+                cls._stores[folder] = store = CaptionStore(folder)
+        else:
+            # Database was removed externally
+            if removedStore := cls._stores.pop(folder, None):
+                removedStore.close()
+
+            if (parent := os.path.dirname(folder)) != folder:
+                store = cls._lookup(parent, now)
+            else:
+                store = None
+
+        cls._folderStores[folder] = (store, now)
+        return store
+
+    @classmethod
+    def create(cls, folder: str) -> 'CaptionStore':
+        folder = os.path.abspath(folder)
+        with cls._mutex:
+            store = cls._stores.get(folder)
+            if store is None or not os.path.isfile(store.dbPath):
+                if store is not None:
+                    store.close()
+                cls._stores[folder] = store = CaptionStore(folder, create=True)
+            cls._folderStores.clear()
+            return store
+
+    @classmethod
+    def resetLookup(cls):
+        'Closes all stores and clears the cached lookup, so databases which were created or removed externally are found immediately.'
+        with cls._mutex:
+            for store in cls._stores.values():
+                store.close()
+            cls._stores.clear()
+            cls._folderStores.clear()
+
+
+    def _connect(self, create: bool = False) -> sqlite3.Connection:
+        # Connections are not shared with forked processes
+        if getattr(self._local, "pid", None) == os.getpid():
+            return self._local.con
+
+        # Only create() makes new databases. A removed database is not recreated when other threads connect.
+        uri = self._uri + ("?mode=rwc" if create else "?mode=rw")
+        con = sqlite3.connect(uri, uri=True, timeout=30, isolation_level=None, check_same_thread=False)
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = NORMAL")
+        self._local.con = con
+        self._local.pid = os.getpid()
+        with self._connectionsLock:
+            self._connections.append(con)
+        return con
+
+    def close(self):
+        'Closes the connections of all threads.'
+        with self._connectionsLock:
+            connections = self._connections
+            self._connections = list()
+            self._local = local()
+
+        for con in connections:
+            try:
+                con.close()
+            except sqlite3.Error:
+                pass
+
+    def getKey(self, jsonPath: str) -> str:
+        jsonPath = os.path.abspath(jsonPath)
+        if jsonPath.startswith(self._prefix):
+            key = jsonPath[len(self._prefix):]
+        else:
+            key = os.path.relpath(jsonPath, self.folder)
+        return key.replace(os.sep, "/") if os.sep != "/" else key
+
+    def getPath(self, key: str) -> str:
+        return os.path.join(self.folder, *key.split("/"))
+
+
+    def contains(self, jsonPath: str) -> bool:
+        cur = self._connect().execute("SELECT 1 FROM captions WHERE path = ?", (self.getKey(jsonPath),))
+        return cur.fetchone() is not None
+
+    def get(self, jsonPath: str) -> dict | None:
+        cur = self._connect().execute("SELECT data FROM captions WHERE path = ?", (self.getKey(jsonPath),))
+        row = cur.fetchone()
+        return parseJson(row[0]) if row else None
+
+    def getMany(self, jsonPaths: Iterable[str]) -> dict[str, dict]:
+        'Loads the values of many files with few queries. Returns a dict which maps the given paths to their value, missing files are omitted.'
+        keyPaths = {self.getKey(path): path for path in jsonPaths}
+        keys = list(keyPaths.keys())
+        con = self._connect()
+
+        results = dict[str, dict]()
+        for i in range(0, len(keys), self.CHUNK_SIZE):
+            chunk = keys[i:i+self.CHUNK_SIZE]
+            params = ",".join("?" * len(chunk))
+            for key, data in con.execute(f"SELECT path, data FROM captions WHERE path IN ({params})", chunk):
+                results[keyPaths[key]] = parseJson(data)
+        return results
+
+    def getAll(self) -> Iterator[tuple[str, dict]]:
+        'Yields (json path, value) of all files.'
+        for key, data in self._connect().execute("SELECT path, data FROM captions ORDER BY path"):
+            yield self.getPath(key), parseJson(data)
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+
+
+    def put(self, jsonPath: str, data: dict) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO captions (path, data) VALUES (?, ?)",
+            (self.getKey(jsonPath), json.dumps(data, separators=(",", ":")))
+        )
+
+    def putMany(self, items: Iterable[tuple[str, dict]]) -> None:
+        'Writes all values in one transaction.'
+        rows = ((self.getKey(path), json.dumps(data, separators=(",", ":"))) for path, data in items)
+        con = self._connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.executemany("INSERT OR REPLACE INTO captions (path, data) VALUES (?, ?)", rows)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def update(self, jsonPath: str, updateFunc: Callable[[dict], dict | None]) -> bool:
+        '''
+        Reads the current value (or an empty dict), passes it to 'updateFunc' and writes the returned value.
+        The database is locked for writing in the meantime, so concurrent updates are not lost.
+        Returns False without writing if 'updateFunc' returns None.
+        '''
+        key = self.getKey(jsonPath)
+        con = self._connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = con.execute("SELECT data FROM captions WHERE path = ?", (key,)).fetchone()
+            data = updateFunc(parseJson(row[0]) if row else dict())
+            if data is None:
+                con.execute("ROLLBACK")
+                return False
+
+            con.execute("INSERT OR REPLACE INTO captions (path, data) VALUES (?, ?)", (key, json.dumps(data, separators=(",", ":"))))
+            con.execute("COMMIT")
+            return True
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def delete(self, jsonPath: str) -> bool:
+        cur = self._connect().execute("DELETE FROM captions WHERE path = ?", (self.getKey(jsonPath),))
+        return cur.rowcount > 0
+
+
+
+def importJson(folder: str, deleteJson: bool = False, progress: Callable[[str], None] | None = None) -> int:
+    '''
+    Imports all caption JSON files in the folder and its subfolders into the folder's store, and creates it if necessary.
+    Other JSON files, which don't have the caption file format, are skipped.
+    Returns the number of imported files.
+    '''
+
+    # Imported here because captionfile uses this module
+    from .captionfile import Keys
+
+    items = list[tuple[str, dict]]()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith(".json"):
+                continue
+
+            path = os.path.join(root, filename)
+            try:
+                with open(path, 'r') as file:
+                    data = json.load(file)
+            except Exception as ex:
+                print(f"WARNING: Failed to import '{path}': {ex} ({type(ex).__name__})")
+                continue
+
+            if isinstance(data, dict) and Keys.VERSION in data:
+                items.append((path, data))
+                if progress:
+                    progress(path)
+
+    store = CaptionStore.create(folder)
+    store.putMany(items)
+
+    if deleteJson:
+        for path, _ in items:
+            os.remove(path)
+    return len(items)
+
+
+def exportJson(folder: str, deleteStore: bool = False, progress: Callable[[str], None] | None = None) -> int:
+    '''
+    Writes the content of the folder's store to per-file JSON sidecars, for tools that read the JSON files directly.
+    Existing files are overwritten. Returns the number of written files.
+    '''
+
+    from .captionfile import writeJsonAtomic, CaptionFileLock
+    from config import Config
+
+    folder = os.path.abspath(folder)
+    if not os.path.isfile(os.path.join(folder, CaptionStore.FILENAME)):
+        raise FileNotFoundError(f"No caption store in '{folder}'")
+
+    store = CaptionStore.create(folder)
+    count = 0
+    for path, data in store.getAll():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with CaptionFileLock(path):
+            writeJsonAtomic(path, data, Config.captionJsonCompact)
+        count += 1
+        if progress:
+            progress(path)
+
+    if deleteStore:
+        CaptionStore.resetLookup()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(store.dbPath + suffix)
+            except FileNotFoundError:
+                pass
+    return count
@@ -15,7 +15,7 @@ class DfsState(enum.IntEnum):
 
 
 class CascadeNode:
-    __slots__ = ('key', 'keyType', 'keyName', 'state', 'template', 'inNodes', 'outNodes')
+    __slots__ = ('key', 'keyType', 'keyName', 'state', 'template', 'inNodes', 'outNodes', 'inputKeys', 'deterministic')
 
     def __init__(self, key: str, keyType: str = "", keyName: str = ""):
         self.key: str = key
@@ -31,6 +31,12 @@ class CascadeNode:
         self.outNodes: set[CascadeNode] = set()
         "Nodes with templates that contain variables referencing this node"
 
+        self.inputKeys: tuple[str, ...] = ()
+        "All caption file keys used by the template, including keys which are no nodes (prompts)."
+
+        self.deterministic = False
+        "True if the template only depends on the input keys and the file path, so evaluations can be reused."
+
     @staticmethod
     def fromKey(key: str) -> 'CascadeNode':
         if key == FileTypeSelector.TYPE_TXT:
@@ -77,6 +83,9 @@ class CascadeGraph:
             keyNode.template = template
 
             parser.parse(template)
+            keyNode.inputKeys = tuple(sorted(parser.missingVars))
+            keyNode.deterministic = TemplateVariableParser.isDeterministic(template)
+
             for var in filter(cls.checkKey, parser.missingVars):
                 varNode = nodes.get(var)
                 if varNode is None:
@@ -103,8 +112,9 @@ class CascadeGraph:
     def checkKey(key: str) -> bool:
         return key == FileTypeSelector.TYPE_TXT or key.startswith("tags.") or key.startswith("captions.")
 
-    def resetState(self):
-        for node in self.nodes.values():
+    def resetState(self, nodes: Iterable[CascadeNode] | None = None):
+        'Resets all nodes, or only the given nodes when the other nodes are known to be unvisited.'
+        for node in (self.nodes.values() if nodes is None else nodes):
             node.state = DfsState.Unvisited
 
 
@@ -197,7 +207,7 @@ class CascadeGraphCache:
         if captionFile.loadFromJson() and captionFile.cascade:
             return CascadeGraph(templates | captionFile.cascade)  # Copy templates
         elif graph := self.graphCache.get(folder):
-            graph.resetState()
+            # CascadeUpdate resets the visited nodes after each update
             return graph
         else:
             # No cached folder graph (when CascadeUpdate.getJsonFiles() returns no folders)
@@ -206,10 +216,23 @@ class CascadeGraphCache:
 
 
 class CascadeUpdate:
+    '''
+    Evaluates the templates downstream of a changed key in topological order.
+
+    Results of deterministic templates are remembered with their inputs (template and values of the used keys)
+    for the last updated file. When the same file is updated again, for example when several keys are written
+    one after another, templates with unchanged inputs are not evaluated again. Unchanged text files are not written.
+    '''
+
     def __init__(self):
         self.parser = TemplateVariableParser()
         self._cache: CascadeGraphCache | None = None
 
+        self._resultPath = ""
+        self._results: dict[str, tuple[tuple, str]] = {}  # Key => (Input values, text) of the last evaluation for '_resultPath'
+        self.numEvaluated = 0
+        self.numSkipped = 0
+
     def enableCache(self):
         self._cache = CascadeGraphCache()
 
@@ -231,13 +254,17 @@ class CascadeUpdate:
 
         # Collect upstream dependencies where values are missing but a template exists.
         # These templates are evaluated to fill values in downstream templates, but the value is not saved to disk.
-        upstreamNodes, missingNodes = self._collectUpstreamNodes(startNode, captionFile)
-        graph.resetState()
+        # Only the visited nodes are reset afterwards, so the cost doesn't depend on the size of the graph.
+        visitedNodes = [startNode]
+        upstreamNodes, missingNodes = self._collectUpstreamNodes(startNode, captionFile, visitedNodes)
+        graph.resetState(visitedNodes)
 
         try:
             nodeOrder = graph.topologicalSortMultiStart(chain((startNode,), upstreamNodes))
+            graph.resetState(nodeOrder)
             nodeOrder.remove(startNode)
         except CycleError as ex:
+            graph.resetState()
             print(f"Warning: Failed to cascade updates due to reference cycle ({ex.pathStr})")
             return
 
@@ -246,11 +273,31 @@ class CascadeUpdate:
 
         self._printUpdates(imgPath, startNode, nodeOrder, upstreamNodes, missingNodes)
 
+        if self._resultPath != imgPath:
+            self._resultPath = imgPath
+            self._results = {}
+
         self.parser.setup(imgPath, captionFile)
         with self.parser.withTemporaryOverrides() as upstreamValues:
             for node in nodeOrder:
                 assert node.template is not None
-                text = self.parser.parse(node.template)
+                inputs = self._getInputs(node, captionFile, upstreamValues) if node.deterministic else None
+
+                # Skip templates whose inputs didn't change since the last evaluation, if the stored value wasn't changed either
+                if inputs is not None and (result := self._results.get(node.key)) and result[0] == inputs:
+                    text = result[1]
+                    if node in upstreamNodes:
+                        upstreamValues[node.key] = text
+                        self.numSkipped += 1
+                        continue
+                    if self._getText(captionFile, node) == text:
+                        self.numSkipped += 1
+                        continue
+                else:
+                    text = self.parser.parse(node.template)
+                    self.numEvaluated += 1
+                    if inputs is not None:
+                        self._results[node.key] = (inputs, text)
 
                 # Immediately save or store in CaptionFile because downstream templates may depend on it
                 if node in upstreamNodes:
@@ -260,11 +307,14 @@ class CascadeUpdate:
 
 
     @classmethod
-    def _collectUpstreamNodes(cls, node: CascadeNode, captionFile: CaptionFile) -> tuple[set[CascadeNode], set[CascadeNode]]:
+    def _collectUpstreamNodes(cls, node: CascadeNode, captionFile: CaptionFile, visitedNodes: list[CascadeNode] | None = None) -> tuple[set[CascadeNode], set[CascadeNode]]:
+        'The optional list is extended with all nodes that were marked as visited (except the start node).'
         def visit(nodes: set[CascadeNode]):
             for node in nodes:
                 if node.state == DfsState.Unvisited:
                     node.state = DfsState.Done
+                    if visitedNodes is not None:
+                        visitedNodes.append(node)
                     yield node
 
         node.state = DfsState.Done
@@ -319,10 +369,42 @@ class CascadeUpdate:
                 raise ValueError(f"Failed to get value: Invalid key ({node.key})")
 
     @staticmethod
-    def _storeText(captionFile: CaptionFile, node: CascadeNode, text: str):
+    def _getInputs(node: CascadeNode, captionFile: CaptionFile, overrides: dict[str, str]) -> tuple[str | None, ...]:
+        'Returns the template and the values it reads. Stored and compared as a whole, because equal hashes are not equal inputs.'
+        values: list[str | None] = [node.template]
+        for key in node.inputKeys:
+            value = overrides.get(key)
+            if value is None:
+                keyType, _, keyName = key.partition(".")
+                keyName = keyName.lstrip()
+                match keyType:
+                    case FileTypeSelector.TYPE_TAGS:     value = captionFile.getTags(keyName)
+                    case FileTypeSelector.TYPE_CAPTIONS: value = captionFile.getCaption(keyName)
+                    case "prompts":                      value = captionFile.getPrompt(keyName)
+            values.append(value)
+        return tuple(values)
+
+    @staticmethod
+    def _getText(captionFile: CaptionFile, node: CascadeNode) -> str | None:
+        match node.keyType:
+            case FileTypeSelector.TYPE_TXT:
+                try:
+                    return FileTypeSelector.loadCaptionTxt(captionFile.jsonPath)
+                except OSError:
+                    return None
+            case FileTypeSelector.TYPE_TAGS:
+                return captionFile.getTags(node.keyName)
+            case FileTypeSelector.TYPE_CAPTIONS:
+                return captionFile.getCaption(node.keyName)
+            case _:
+                raise ValueError(f"Failed to get value: Invalid key ({node.key})")
+
+    @classmethod
+    def _storeText(cls, captionFile: CaptionFile, node: CascadeNode, text: str):
         match node.keyType:
             case FileTypeSelector.TYPE_TXT:
-                FileTypeSelector.saveCaptionTxt(captionFile.jsonPath, text)
+                if cls._getText(captionFile, node) != text:
+                    FileTypeSelector.saveCaptionTxt(captionFile.jsonPath, text)
             case FileTypeSelector.TYPE_TAGS:
                 captionFile.addTags(node.keyName, text)
             case FileTypeSelector.TYPE_CAPTIONS:
@@ -16,16 +16,22 @@ class CsvLoader(ABC):
     def __init__(self):
         pass
 
+    @staticmethod
+    def listFiles(folder: str) -> list[str]:
+        return [
+            os.path.join(root, file)
+            for (root, dirs, files) in os.walk(folder, topdown=True, followlinks=True)
+            for file in filter(csvFileFilter, files)
+        ]
+
     def loadAll(self, folder: str):
-        for (root, dirs, files) in os.walk(folder, topdown=True, followlinks=True):
-            for file in filter(csvFileFilter, files):
-                path = os.path.join(root, file)
-                try:
-                    self.load(path)
-                except Exception:
-                    import traceback
-                    traceback.print_exc()
-                    self.fileFail(path)
+        for path in self.listFiles(folder):
+            try:
+                self.load(path)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                self.fileFail(path)
 
     def load(self, file: str):
         t = time.monotonic_ns()
@@ -104,6 +104,7 @@ class CachedPathSort:
 
 class DataKeys:
     ImageSize               = "img_size"                # tuple[w, h]
+    ImageSizeLookup         = "img_size_lookup"         # bool, True after MediaSizeCache was checked
 
     Caption                 = "caption"                 # str
     CaptionState            = "caption_state"           # IconStates
@@ -605,6 +606,46 @@ class FileList:
             print(f"Warning: {ex}")
 
 
+    def getAdjacentFiles(self, count: int) -> list[str]:
+        '''
+        Returns the files which setNextFile() and setPrevFile() would show, up to 'count' steps in each direction,
+        without changing the current file. The files are ordered by distance, alternating forward and backward.
+        '''
+        numFiles = len(self.files)
+        if self.currentIndex < 0 or numFiles < 2 or count <= 0:
+            return []
+
+        if self.selection:
+            if self.order:
+                def step(index: int, direction: int) -> int:
+                    return self.order.nextSelected(index, direction)
+            else:
+                sortedSelection = self.selection.sorted
+                def step(index: int, direction: int) -> int:
+                    selIndex = (self.selection.sortedIndexOf(self.files[index]) + direction) % len(sortedSelection)
+                    return self.indexOf(sortedSelection[selIndex])
+        elif self.order:
+            def step(index: int, direction: int) -> int:
+                return self.order.unmap((self.order[index] + direction) % numFiles)
+        else:
+            def step(index: int, direction: int) -> int:
+                return (index + direction) % numFiles
+
+        files = dict[str, None]()
+        nextIndex = prevIndex = self.currentIndex
+        try:
+            for _ in range(count):
+                nextIndex = step(nextIndex, 1)
+                prevIndex = step(prevIndex, -1)
+                files[self.files[nextIndex]] = None
+                files[self.files[prevIndex]] = None
+        except ValueError:
+            pass
+
+        files.pop(self.currentFile, None)
+        return list(files)
+
+
     def setNextFolder(self):
         self._lazyLoadFolder()
         currentIndex = max(self.currentIndex, 0)
@@ -0,0 +1,237 @@
+import struct
+from typing import BinaryIO
+
+# Reads image dimensions from the file header without decoding the image.
+# Only small parts of the file are read. Large segments (EXIF thumbnails, ICC profiles, image data) are skipped with seek.
+# Like QImageReader, only the EXIF orientation of JPEG files is considered.
+
+MAX_SEGMENTS = 128
+MAX_EXIF_BYTES = 4096
+MAX_META_BYTES = 65536
+
+
+class HeaderError(Exception): pass
+
+
+ImageHeaderSize = tuple[int, int, bool]  # width, height, EXIF orientation swaps width/height
+
+
+def readImageSize(path: str) -> ImageHeaderSize | None:
+    '''
+    Returns the stored width and height, and whether the EXIF orientation swaps them.
+    Returns None if the format is not supported or the header couldn't be parsed.
+    '''
+
+    try:
+        with open(path, 'rb', buffering=0) as file:
+            head = file.read(32)
+            if parser := _detectFormat(head):
+                return parser(file, head)
+    except (OSError, HeaderError, struct.error, IndexError, ValueError):
+        pass
+    return None
+
+
+def _detectFormat(head: bytes):
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return _readPng
+    if head.startswith(b'\xff\xd8\xff'):
+        return _readJpeg
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return _readWebp
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return _readGif
+    if head.startswith(b'BM'):
+        return _readBmp
+    if head[4:8] == b'ftyp' and _isAvif(head):
+        return _readAvif
+    return None
+
+
+def _readExact(file: BinaryIO, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise HeaderError("Unexpected end of file")
+    return data
+
+def _checkSize(w: int, h: int):
+    if w <= 0 or h <= 0:
+        raise HeaderError("Invalid size")
+
+
+def _exifOrientationSwaps(data: bytes) -> bool:
+    'Parses IFD0 of TIFF-structured EXIF data and returns True if the orientation tag rotates by 90°.'
+    if data.startswith(b'Exif\x00\x00'):
+        data = data[6:]
+
+    match data[:2]:
+        case b'II': endian = '<'
+        case b'MM': endian = '>'
+        case _:     return False
+
+    ifdOffset = struct.unpack_from(endian + 'I', data, 4)[0]
+    numEntries = struct.unpack_from(endian + 'H', data, ifdOffset)[0]
+    for i in range(numEntries):
+        tag, type, count, value = struct.unpack_from(endian + 'HHIH', data, ifdOffset + 2 + i*12)
+        if tag == 0x0112:
+            return value in (5, 6, 7, 8)
+    return False
+
+
+def _readPng(file: BinaryIO, head: bytes) -> ImageHeaderSize:
+    if head[12:16] != b'IHDR':
+        raise HeaderError("Missing IHDR")
+    w, h = struct.unpack_from('>II', head, 16)
+    _checkSize(w, h)
+    return w, h, False
+
+
+# SOF markers without DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+
+def _readJpeg(file: BinaryIO, head: bytes) -> ImageHeaderSize:
+    swap = False
+    pos = 2
+    for _ in range(MAX_SEGMENTS):
+        file.seek(pos)
+        segHead = _readExact(file, 4)
+        while segHead[1] == 0xFF:  # Fill bytes
+            pos += 1
+            segHead = segHead[1:] + _readExact(file, 1)
+
+        if segHead[0] != 0xFF:
+            raise HeaderError("Invalid marker")
+
+        marker = segHead[1]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # Markers without length
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # EOI, SOS: No frame header found
+            raise HeaderError("Missing SOF")
+
+        length = struct.unpack_from('>H', segHead, 2)[0]
+        if marker in JPEG_SOF_MARKERS:
+            h, w = struct.unpack('>xHH', _readExact(file, 5))
+            _checkSize(w, h)
+            return w, h, swap
+        if marker == 0xE1 and not swap:
+            data = file.read(min(length-2, MAX_EXIF_BYTES))
+            if data.startswith(b'Exif\x00\x00'):
+                swap = _exifOrientationSwaps(data)
+
+        pos += 2 + length
+
+    raise HeaderError("Too many segments")
+
+
+def _readWebp(file: BinaryIO, head: bytes) -> ImageHeaderSize:
+    match head[12:16]:
+        case b'VP8 ':
+            if head[23:26] != b'\x9d\x01\x2a':
+                raise HeaderError("Invalid VP8 start code")
+            w, h = struct.unpack_from('<HH', head, 26)
+            w &= 0x3FFF
+            h &= 0x3FFF
+
+        case b'VP8L':
+            if head[20] != 0x2F:
+                raise HeaderError("Invalid VP8L signature")
+            bits = struct.unpack_from('<I', head, 21)[0]
+            w = (bits & 0x3FFF) + 1
+            h = ((bits >> 14) & 0x3FFF) + 1
+
+        case b'VP8X':
+            w = int.from_bytes(head[24:27], 'little') + 1
+            h = int.from_bytes(head[27:30], 'little') + 1
+
+        case _:
+            raise HeaderError("Unknown WebP chunk")
+
+    _checkSize(w, h)
+    return w, h, False
+
+
+def _readGif(file: BinaryIO, head: bytes) -> ImageHeaderSize:
+    w, h = struct.unpack_from('<HH', head, 6)
+    _checkSize(w, h)
+    return w, h, False
+
+
+def _readBmp(file: BinaryIO, head: bytes) -> ImageHeaderSize:
+    headerSize = struct.unpack_from('<I', head, 14)[0]
+    if headerSize == 12:  # BITMAPCOREHEADER
+        w, h = struct.unpack_from('<HH', head, 18)
+    elif headerSize >= 40:
+        w, h = struct.unpack_from('<ii', head, 18)
+        h = abs(h)  # Negative height: Top-down
+    else:
+        raise HeaderError("Unknown BMP header")
+
+    _checkSize(w, h)
+    return w, h, False
+
+
+AVIF_BRANDS = (b'avif', b'avis')
+
+def _isAvif(head: bytes) -> bool:
+    if head[8:12] in AVIF_BRANDS:
+        return True
+    boxSize = struct.unpack_from('>I', head, 0)[0]
+    compatible = head[16:min(boxSize, len(head))]
+    return any(compatible[i:i+4] in AVIF_BRANDS for i in range(0, len(compatible)-3, 4))
+
+def _iterBoxes(data: bytes, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        size, boxType = struct.unpack_from('>I4s', data, pos)
+        headerSize = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, pos+8)[0]
+            headerSize = 16
+        elif size == 0:
+            size = end - pos
+        if size < headerSize:
+            raise HeaderError("Invalid box size")
+
+        yield boxType, pos + headerSize, min(pos + size, end)
+        pos += size
+
+def _readAvif(file: BinaryIO, head: bytes) -> ImageHeaderSize:
+    # Find the 'meta' box at top level
+    pos = 0
+    for _ in range(MAX_SEGMENTS):
+        file.seek(pos)
+        boxHead = _readExact(file, 8)
+        size, boxType = struct.unpack('>I4s', boxHead)
+        if boxType == b'meta':
+            break
+        if size == 1:
+            size = struct.unpack('>Q', _readExact(file, 8))[0]
+        if size < 8:
+            raise HeaderError("Invalid box size")
+        pos += size
+    else:
+        raise HeaderError("Missing meta box")
+
+    meta = _readExact(file, min(size-8, MAX_META_BYTES))
+    maxArea = 0
+    w = h = 0
+    for boxType, start, end in _iterBoxes(meta, 4, len(meta)):  # Skip version and flags of full box
+        if boxType != b'iprp':
+            continue
+        for ipcoType, ipcoStart, ipcoEnd in _iterBoxes(meta, start, end):
+            if ipcoType != b'ipco':
+                continue
+            for propType, propStart, propEnd in _iterBoxes(meta, ipcoStart, ipcoEnd):
+                if propType in (b'irot', b'imir'):
+                    # Transformations are applied differently by the decoders: Let them read the size
+                    raise HeaderError("Transformed AVIF")
+                if propType == b'ispe':
+                    # The primary image (or grid) is the largest. Other items are thumbnails or alpha planes of same size.
+                    propW, propH = struct.unpack_from('>II', meta, propStart+4)
+                    if propW * propH > maxArea:
+                        maxArea = propW * propH
+                        w, h = propW, propH
+
+    _checkSize(w, h)
+    return w, h, False
@@ -2,8 +2,12 @@
 try: import pillow_jxl
 except: pass
 
+import hashlib, math
 import numpy as np
+from threading import Lock
+from typing import Callable, TypeVar
 from config import Config
+from .imageheader import readImageSize as _readHeaderSize
 
 from io import BytesIO
 from PIL import Image, ImageCms, ImageOps, ExifTags
@@ -76,6 +80,13 @@ def _exifSwapSizePIL(img: Image.Image) -> bool:
     return False
 
 
+def _readSizeHeader(imgPath: str) -> tuple[int, int] | None:
+    'Fast path for common formats without decoding.'
+    if header := _readHeaderSize(imgPath):
+        w, h, swap = header
+        return (h, w) if swap and Config.exifTransform else (w, h)
+    return None
+
 def _readSizePIL(imgPath: str) -> tuple[int, int]:
     with Image.open(imgPath) as img:
         size = img.size
@@ -83,8 +94,33 @@ def _readSizePIL(imgPath: str) -> tuple[int, int]:
             size = (size[1], size[0])
         return size
 
-def _readImagePIL(source) -> Image.Image:
+def _draftPIL(img: Image.Image, minSize: int | tuple[int, int]):
+    '''
+    Lets JPEGs decode at a reduced resolution (1/2, 1/4 or 1/8) using DCT scaling.
+    An int is the minimum length of the longest side, for images that are scaled to fit into a square.
+    A tuple is the minimum width and height, for images that are scaled to cover the size or squished to it.
+    Other formats are fully decoded.
+    '''
+
+    if img.format != "JPEG":
+        return
+
+    w, h = img.size
+    if isinstance(minSize, int):
+        scale = minSize / max(w, h)
+    else:
+        minW, minH = minSize
+        if Config.exifTransform and _exifSwapSizePIL(img):
+            minW, minH = minH, minW
+        scale = max(minW / w, minH / h)
+
+    if scale < 0.5:
+        img.draft(None, (math.ceil(w * scale), math.ceil(h * scale)))
+
+def _readImagePIL(source, minSize: int | tuple[int, int] | None = None) -> Image.Image:
     with Image.open(source) as img:
+        if minSize:
+            _draftPIL(img, minSize)
         img.load()
         normalizeColorSpacePIL(img)
         if Config.exifTransform:
@@ -99,13 +135,59 @@ def _getSrgbProfile():
         __srgbProfile = ImageCms.createProfile('sRGB')
     return __srgbProfile
 
+T = TypeVar("T")
+
+class ColorTransformCache:
+    '''
+    Holds prebuilt transforms from embedded ICC profiles to sRGB, keyed by a hash of the profile.
+    Images of a dataset usually share a few profiles, so parsing the profile and building the transform is only done once.
+    The transforms are shared between threads.
+    '''
+
+    MAX_SIZE = 64
+
+    _mutex = Lock()
+    _transforms: dict[tuple, object] = dict()
+
+    @classmethod
+    def get(cls, iccProfile: bytes, variant: str, build: Callable[[], T]) -> T:
+        key = (hashlib.sha1(iccProfile).digest(), variant)
+        with cls._mutex:
+            try:
+                return cls._transforms[key]
+            except KeyError:
+                pass
+
+        transform = build()
+        with cls._mutex:
+            if len(cls._transforms) >= cls.MAX_SIZE:
+                del cls._transforms[next(iter(cls._transforms))]
+            cls._transforms[key] = transform
+        return transform
+
+    @classmethod
+    def clear(cls):
+        with cls._mutex:
+            cls._transforms.clear()
+
+
+def _buildTransformPIL(iccProfile: bytes, mode: str) -> ImageCms.ImageCmsTransform | None:
+    'Returns None if no conversion is needed.'
+    profile = ImageCms.ImageCmsProfile(BytesIO(iccProfile))
+    profileName = ImageCms.getProfileName(profile).lower()
+    if ("srgb" in profileName) and ("linear" not in profileName):
+        return None
+
+    # Without cache, a transform can be applied by multiple threads at once
+    return ImageCms.buildTransform(profile, _getSrgbProfile(), mode, mode, flags=ImageCms.Flags.NOCACHE)
+
 def normalizeColorSpacePIL(img: Image.Image):
     try:
         if iccProfile := img.info.get('icc_profile'):
-            profile = ImageCms.ImageCmsProfile(BytesIO(iccProfile))
-            profileName = ImageCms.getProfileName(profile).lower()
-            if ("srgb" not in profileName) or ("linear" in profileName):
-                ImageCms.profileToProfile(img, profile, _getSrgbProfile(), inPlace=True)
+            mode = img.mode
+            transform = ColorTransformCache.get(iccProfile, mode, lambda: _buildTransformPIL(iccProfile, mode))
+            if transform is not None:
+                ImageCms.applyTransform(img, transform, inPlace=True)
     except Exception as ex:
         print(f"WARNING: Error while verifying image color profile: {ex} ({type(ex).__name__})")
 
@@ -132,6 +214,9 @@ try:
 
 
     def readSize(imgPath: str) -> tuple[int, int]:
+        if size := _readSizeHeader(imgPath):
+            return size
+
         try:
             reader = QImageReader(imgPath)
             w, h = reader.size().toTuple()
@@ -202,12 +287,14 @@ try:
         if not colorSpace.isValid():
             qimage.setColorSpace(QColorSpace.NamedColorSpace.SRgb)
         elif colorSpace != QColorSpace.NamedColorSpace.SRgb:
+            # Qt already reuses the lookup tables of its transforms, so ColorTransformCache isn't used here
             qimage.convertToColorSpace(QColorSpace.NamedColorSpace.SRgb)
 
 except:
     QT_READ_EXTENSIONS = set[str]()
 
-    readSize = _readSizePIL
+    def readSize(imgPath: str) -> tuple[int, int]:
+        return _readSizeHeader(imgPath) or _readSizePIL(imgPath)
 
 
 READ_EXTENSIONS = frozenset(PIL_READ_EXTENSIONS | QT_READ_EXTENSIONS)
@@ -215,8 +302,9 @@ READ_EXTENSIONS = frozenset(PIL_READ_EXTENSIONS | QT_READ_EXTENSIONS)
 
 # FIXME: Some RGB images with 3 channels are loaded in RGBA mode
 
-def loadImagePIL(source, forceRGB=False, allowGreyscale=True, allowAlpha=True):
-    img = _readImagePIL(source)
+def loadImagePIL(source, forceRGB=False, allowGreyscale=True, allowAlpha=True, minSize: int | tuple[int, int] | None = None):
+    'The image is loaded at a reduced resolution if it is at least `minSize` large, see `_draftPIL`.'
+    img = _readImagePIL(source, minSize)
     if convertMode := _getConversionMode(img, forceRGB, allowGreyscale, allowAlpha):
         img = img.convert(convertMode)
     return img
@@ -224,16 +312,16 @@ def loadImagePIL(source, forceRGB=False, allowGreyscale=True, allowAlpha=True):
 
 # Always load with PIL: OpenCV has problems with loading certain modes (like P)
 
-def loadMatBGR(imgPath: str, rgb=False, forceRGB=False, allowGreyscale=True, allowAlpha=True):
-    img = loadImagePIL(imgPath, forceRGB, allowGreyscale, allowAlpha)
+def loadMatBGR(imgPath: str, rgb=False, forceRGB=False, allowGreyscale=True, allowAlpha=True, minSize: int | tuple[int, int] | None = None):
+    img = loadImagePIL(imgPath, forceRGB, allowGreyscale, allowAlpha, minSize)
     mat = np.array(img)
 
     if not rgb:
         mat[..., :3] = mat[..., 2::-1] # Convert RGB(A) -> BGR(A)
     return mat
 
-def decodeMatBGR(data: bytes | bytearray, rgb=False, forceRGB=False, allowGreyscale=True, allowAlpha=True):
-    img = loadImagePIL(BytesIO(data), forceRGB, allowGreyscale, allowAlpha)
+def decodeMatBGR(data: bytes | bytearray, rgb=False, forceRGB=False, allowGreyscale=True, allowAlpha=True, minSize: int | tuple[int, int] | None = None):
+    img = loadImagePIL(BytesIO(data), forceRGB, allowGreyscale, allowAlpha, minSize)
     mat = np.array(img)
 
     if not rgb:
@@ -0,0 +1,132 @@
+import os, hashlib
+from threading import Lock
+import numpy as np
+from config import Config
+from lib.util import Singleton, FileStamp, getFileStamp
+from lib import imagerw, videorw
+
+
+MediaSize = tuple[int, int, int]  # width, height, frame count (0 for images)
+
+
+def readMediaSize(path: str) -> MediaSize:
+    'Image sizes are read from the file header if possible. Video sizes are probed from the container.'
+    if videorw.isVideoFile(path):
+        w, h, _, frames, _ = videorw.readMetadata(path)
+        return w, h, frames
+
+    w, h = imagerw.readSize(path)
+    return w, h, 0
+
+
+
+class MediaSizeCache(metaclass=Singleton):
+    '''
+    Persisted dimensions of images and videos, stored per folder in Config.pathSizeCache.
+    Entries are validated with size and mtime of the file, so changed files are read again.
+    The sizes depend on Config.exifTransform, which is stored with each entry.
+    '''
+
+    VERSION = 1
+
+    def __init__(self):
+        # Folder key -> filename -> (file size, mtime_ns, exifTransform, w, h, frames)
+        self.folders: dict[str, dict[str, tuple]] = dict()
+        self.changedFolders: set[str] = set()
+        self._folderKeys: dict[str, str] = dict()
+        self._lock = Lock()
+
+    def _getFolderKey(self, folder: str) -> str:
+        key = self._folderKeys.get(folder)
+        if key is None:
+            normFolder = os.path.normcase(os.path.abspath(folder))
+            key = hashlib.md5(normFolder.encode("utf-8"), usedforsecurity=False).hexdigest()
+            self._folderKeys[folder] = key
+        return key
+
+    def _getCacheFile(self, folderKey: str) -> str:
+        return os.path.join(Config.pathSizeCache, f"{folderKey}.npz")
+
+    def _getFolderDict(self, folderKey: str) -> dict[str, tuple]:
+        folderDict = self.folders.get(folderKey)
+        if folderDict is None:
+            folderDict = dict()
+            cacheFile = self._getCacheFile(folderKey)
+            if os.path.exists(cacheFile):
+                try:
+                    folderDict = self._loadFolderDict(cacheFile)
+                except Exception as ex:
+                    print(f"WARNING: Failed to load size cache '{cacheFile}': {ex} ({type(ex).__name__})")
+            self.folders[folderKey] = folderDict
+        return folderDict
+
+    @classmethod
+    def _loadFolderDict(cls, cacheFile: str) -> dict[str, tuple]:
+        with np.load(cacheFile) as data:
+            if int(data["version"]) != cls.VERSION:
+                return dict()
+
+            nameData = data["names"].tobytes().decode("utf-8")
+            entries = data["entries"].tolist()
+
+        filenames = nameData.split("\0") if nameData else []
+        return dict(zip(filenames, map(tuple, entries)))
+
+    @classmethod
+    def _saveFolderDict(cls, cacheFile: str, folderDict: dict[str, tuple]):
+        # Write to temporary file and replace, so an interrupted write doesn't leave a broken cache
+        tempPath = cacheFile + ".tmp"
+        with open(tempPath, 'wb') as file:
+            np.savez(file,
+                version=np.array(cls.VERSION),
+                names=np.frombuffer("\0".join(folderDict.keys()).encode("utf-8"), dtype=np.uint8),
+                entries=np.array(list(folderDict.values()), dtype=np.int64).reshape(-1, 6)
+            )
+        os.replace(tempPath, cacheFile)
+
+
+    def lookup(self, path: str, stamp: FileStamp) -> tuple[bool, MediaSize | None]:
+        if stamp is None:
+            return False, None
+
+        folder, filename = os.path.split(path)
+        with self._lock:
+            entry = self._getFolderDict(self._getFolderKey(folder)).get(filename)
+
+        if entry is not None and entry[:3] == (*stamp, Config.exifTransform):
+            return True, entry[3:]
+        return False, None
+
+    def store(self, path: str, stamp: FileStamp, size: MediaSize):
+        if stamp is None or size[0] < 0:
+            return
+
+        folder, filename = os.path.split(path)
+        with self._lock:
+            folderKey = self._getFolderKey(folder)
+            self._getFolderDict(folderKey)[filename] = (*stamp, Config.exifTransform, *size)
+            self.changedFolders.add(folderKey)
+
+    def readSize(self, path: str) -> MediaSize:
+        stamp = getFileStamp(path)
+        found, size = self.lookup(path, stamp)
+        if not found:
+            size = readMediaSize(path)
+            self.store(path, stamp, size)
+        return size
+
+    def save(self):
+        with self._lock:
+            if not self.changedFolders:
+                return
+
+            os.makedirs(Config.pathSizeCache, exist_ok=True)
+            for folderKey in self.changedFolders:
+                cacheFile = self._getCacheFile(folderKey)
+                try:
+                    self._saveFolderDict(cacheFile, self.folders[folderKey])
+                except OSError as ex:
+                    print(f"WARNING: Failed to save size cache '{cacheFile}': {ex}")
+
+            print(f"Updated size cache ({len(self.changedFolders)} folders)")
+            self.changedFolders.clear()
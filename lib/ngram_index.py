@@ -0,0 +1,267 @@
+import os, json, mmap
+from typing import Iterable
+import numpy as np
+
+
+def getNgrams(text: str, n: int) -> Iterable[str]:
+    if len(text) < n:
+        text = text.center(n, " ") # 'ab' => ' ab' (right-justified)
+
+    for i in range(len(text) - n + 1):
+        yield text[i:i+n]
+
+
+
+class NGramIndex:
+    '''
+    Tag table with trigram posting lists, stored in one file and memory-mapped when loaded.
+
+    Tags are stored as UTF-8 in one byte buffer, indexed by offsets. Category, frequency and alias target
+    are stored in columns by tag id. Trigrams are packed into integers (21 bits per code point) and sorted,
+    so the posting list of a trigram is found with a binary search. The posting lists are concatenated
+    and indexed by offsets (CSR layout).
+
+    Tags are indexed with a leading space, but scored without it. The number of scored n-grams and the
+    leading n-gram which is only in the index are stored per tag, so the Jaccard index of all candidates
+    is calculated from the posting lists without decoding the tags.
+
+    File layout: Magic, header size, JSON header with the array positions, arrays aligned to 64 bytes.
+    '''
+
+    VERSION = 2
+    MAGIC = b"QPQNGRAM"
+    N = 3
+    ALIGN = 64
+
+    ARRAYS = {
+        "tagBytes":     np.uint8,
+        "tagOffsets":   np.int64,
+        "category":     np.int32,
+        "freq":         np.int64,
+        "aliasFor":     np.int32,   # Tag id or -1
+        "ngramCount":   np.int32,   # Number of distinct n-grams without leading space
+        "leadKey":      np.uint64,  # Leading n-gram which is only in the index, or 0
+        "ngramKeys":    np.uint64,
+        "ngramOffsets": np.int64,
+        "postings":     np.int32,
+    }
+
+    def __init__(self, arrays: dict[str, np.ndarray], buildId: str = "", buffer: mmap.mmap | None = None, tagDataStart: int = 0):
+        self.buildId = buildId
+        self.tagBytes: np.ndarray     = arrays["tagBytes"]
+        self.tagOffsets: np.ndarray   = arrays["tagOffsets"]
+        self.category: np.ndarray     = arrays["category"]
+        self.freq: np.ndarray         = arrays["freq"]
+        self.aliasFor: np.ndarray     = arrays["aliasFor"]
+        self.ngramCount: np.ndarray   = arrays["ngramCount"]
+        self.leadKey: np.ndarray      = arrays["leadKey"]
+        self.ngramKeys: np.ndarray    = arrays["ngramKeys"]
+        self.ngramOffsets: np.ndarray = arrays["ngramOffsets"]
+        self.postings: np.ndarray     = arrays["postings"]
+
+        # Slicing the raw buffer returns bytes without creating intermediate arrays
+        self._buffer = buffer
+        self._tagData: bytes | mmap.mmap = buffer if buffer is not None else self.tagBytes.tobytes()
+        self._tagDataStart = tagDataStart
+
+    def __len__(self) -> int:
+        return len(self.tagOffsets) - 1
+
+    def close(self):
+        if self._buffer is not None:
+            for name in self.ARRAYS:
+                setattr(self, name, None)
+            self._tagData = b""
+            try:
+                self._buffer.close()
+            except BufferError:
+                pass # Arrays are still referenced elsewhere, the mapping is closed when they are released
+            self._buffer = None
+
+
+    def getTag(self, tagId: int) -> str:
+        start = self._tagDataStart
+        return self._tagData[start + int(self.tagOffsets[tagId]) : start + int(self.tagOffsets[tagId+1])].decode("utf-8")
+
+    def getTags(self, tagIds: np.ndarray) -> list[str]:
+        start = self._tagDataStart
+        tagData = self._tagData
+        starts = (self.tagOffsets[tagIds] + start).tolist()
+        ends   = (self.tagOffsets[tagIds+1] + start).tolist()
+        return [tagData[s:e].decode("utf-8") for s, e in zip(starts, ends)]
+
+    @classmethod
+    def packNgram(cls, ngram: str) -> int:
+        key = 0
+        for char in ngram:
+            key = (key << 21) | ord(char)
+        return key
+
+    def getPostings(self, ngram: str) -> np.ndarray:
+        key = self.packNgram(ngram)
+        i = int(np.searchsorted(self.ngramKeys, key))
+        if i < len(self.ngramKeys) and int(self.ngramKeys[i]) == key:
+            return self.postings[self.ngramOffsets[i] : self.ngramOffsets[i+1]]
+        return self.postings[:0]
+
+    def getCandidates(self, ngrams: Iterable[str]) -> np.ndarray:
+        'Returns the sorted ids of all tags that contain at least one of the n-grams.'
+        postings = [p for ngram in ngrams if len(p := self.getPostings(ngram))]
+        if not postings:
+            return np.empty(0, dtype=np.int32)
+        if len(postings) == 1:
+            return postings[0]
+        return np.unique(np.concatenate(postings))
+
+    def getRatios(self, searchNgrams: set[str]) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the sorted ids of all tags that contain at least one of the n-grams, and their Jaccard index
+        with the search n-grams. The tag n-grams don't include the leading space, like NGramAutoCompleteSource.
+        '''
+        postings = [p for ngram in searchNgrams if len(p := self.getPostings(ngram))]
+        if not postings:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        # Count how many search n-grams each candidate contains
+        if len(postings) == 1:
+            candidateIds = postings[0]
+            counts = np.ones(len(candidateIds), dtype=np.int64)
+        else:
+            candidateIds, counts = np.unique(np.concatenate(postings), return_counts=True)
+
+        # Remove the leading n-gram which isn't part of the scored n-grams
+        searchKeys = np.array([self.packNgram(ngram) for ngram in searchNgrams], dtype=np.uint64)
+        leadKeys = self.leadKey[candidateIds]
+        intersect = counts - ((leadKeys != 0) & np.isin(leadKeys, searchKeys))
+
+        # Tags shorter than n are padded differently with the leading space: Count their n-grams directly
+        tagLengths = self.tagOffsets[candidateIds+1] - self.tagOffsets[candidateIds]
+        if len(shortIdx := np.flatnonzero(tagLengths <= 4)):
+            shortTags = self.getTags(candidateIds[shortIdx])
+            intersect[shortIdx] = [len(searchNgrams.intersection(getNgrams(tag, self.N))) for tag in shortTags]
+
+        union = len(searchNgrams) + self.ngramCount[candidateIds] - intersect
+        return candidateIds, intersect / union
+
+
+    def save(self, path: str):
+        header = {"version": self.VERSION, "n": self.N, "build": self.buildId, "arrays": {}}
+        pos = 0
+        for name, dtype in self.ARRAYS.items():
+            array: np.ndarray = getattr(self, name)
+            header["arrays"][name] = [pos, len(array)]
+            pos += -(-array.size * np.dtype(dtype).itemsize // self.ALIGN) * self.ALIGN
+
+        headerData = json.dumps(header).encode("utf-8")
+        dataStart  = -(-(len(self.MAGIC) + 8 + len(headerData)) // self.ALIGN) * self.ALIGN
+
+        # Write to temporary file and replace, so an interrupted write doesn't leave a broken index
+        tempPath = path + ".tmp"
+        with open(tempPath, 'wb') as file:
+            file.write(self.MAGIC)
+            file.write(len(headerData).to_bytes(8, "little"))
+            file.write(headerData)
+
+            for name, dtype in self.ARRAYS.items():
+                file.seek(dataStart + header["arrays"][name][0])
+                file.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+
+            file.truncate(dataStart + pos)
+        os.replace(tempPath, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'NGramIndex | None':
+        'Memory-maps the index file. Returns None if the file is missing or has a different version.'
+        try:
+            with open(path, 'rb') as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            if buffer[:len(cls.MAGIC)] != cls.MAGIC:
+                raise ValueError("Invalid file")
+
+            headerStart = len(cls.MAGIC) + 8
+            headerSize  = int.from_bytes(buffer[len(cls.MAGIC):headerStart], "little")
+            header = json.loads(buffer[headerStart:headerStart+headerSize].decode("utf-8"))
+            if header.get("version") != cls.VERSION or header.get("n") != cls.N:
+                buffer.close()
+                return None
+
+            dataStart = -(-(headerStart + headerSize) // cls.ALIGN) * cls.ALIGN
+            arrays = dict[str, np.ndarray]()
+            for name, dtype in cls.ARRAYS.items():
+                offset, count = header["arrays"][name]
+                arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=dataStart+offset)
+            return cls(arrays, header.get("build", ""), buffer, dataStart + header["arrays"]["tagBytes"][0])
+
+        except Exception as ex:
+            print(f"WARNING: Failed to load n-gram index from '{path}': {ex} ({type(ex).__name__})")
+            buffer.close()
+            return None
+
+
+
+class NGramIndexBuilder:
+    'Collects tags in the same way as NGramAutoCompleteSource.addTag() and builds an NGramIndex.'
+
+    def __init__(self):
+        self.tags = list[str]()
+        self.tagIds = dict[str, int]()
+        self.category = list[int]()
+        self.freq = list[int]()
+        self.aliasFor = list[str | None]()
+        self.ngramCount = list[int]()
+        self.leadKey = list[int]()
+        self.ngramPostings = dict[str, list[int]]()
+
+    def addTag(self, tag: str, category: int, freq: int, aliasFor: str | None = None):
+        tagId = len(self.tags)
+        self.tags.append(tag)
+        self.tagIds.setdefault(tag, tagId)
+        self.category.append(category)
+        self.freq.append(freq)
+        self.aliasFor.append(aliasFor)
+
+        indexNgrams = set(getNgrams(" " + tag, NGramIndex.N))
+        scoreNgrams = set(getNgrams(tag, NGramIndex.N))
+        self.ngramCount.append(len(scoreNgrams))
+
+        leadNgrams = indexNgrams - scoreNgrams
+        self.leadKey.append(NGramIndex.packNgram(leadNgrams.pop()) if leadNgrams else 0)
+
+        ngramPostings = self.ngramPostings
+        for ngram in indexNgrams:
+            if (postings := ngramPostings.get(ngram)) is None:
+                ngramPostings[ngram] = [tagId]
+            else:
+                postings.append(tagId)
+
+    def build(self, buildId: str = "") -> NGramIndex:
+        tagData = [tag.encode("utf-8") for tag in self.tags]
+        tagOffsets = np.zeros(len(tagData)+1, dtype=np.int64)
+        np.cumsum([len(data) for data in tagData], out=tagOffsets[1:])
+
+        aliasFor = [-1 if alias is None else self.tagIds.get(alias, -1) for alias in self.aliasFor]
+
+        packedNgrams = sorted((NGramIndex.packNgram(ngram), ngram) for ngram in self.ngramPostings)
+        ngramOffsets = np.zeros(len(packedNgrams)+1, dtype=np.int64)
+        np.cumsum([len(self.ngramPostings[ngram]) for _, ngram in packedNgrams], out=ngramOffsets[1:])
+
+        postings = np.empty(int(ngramOffsets[-1]), dtype=np.int32)
+        for i, (_, ngram) in enumerate(packedNgrams):
+            postings[ngramOffsets[i]:ngramOffsets[i+1]] = self.ngramPostings[ngram]
+
+        return NGramIndex({
+            "tagBytes":     np.frombuffer(b"".join(tagData), dtype=np.uint8),
+            "tagOffsets":   tagOffsets,
+            "category":     np.array(self.category, dtype=np.int32),
+            "freq":         np.array(self.freq, dtype=np.int64),
+            "aliasFor":     np.array(aliasFor, dtype=np.int32),
+            "ngramCount":   np.array(self.ngramCount, dtype=np.int32),
+            "leadKey":      np.array(self.leadKey, dtype=np.uint64),
+            "ngramKeys":    np.array([key for key, _ in packedNgrams], dtype=np.uint64),
+            "ngramOffsets": ngramOffsets,
+            "postings":     postings,
+        }, buildId)
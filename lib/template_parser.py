@@ -21,6 +21,10 @@ class TemplateVariableParser:
     PREFIX_PROMPT       = "prompts."
     PREFIX_TAG          = "tags."
 
+    # Variables and functions which can return different values for the same input
+    PATTERN_NAMES       = re.compile( r'\w+' )
+    NONDETERMINISTIC    = frozenset(("date", "time", "coinflip", "shuffle", "shufflekeep", "text", "rules"))
+
 
     def __init__(self, imgPath: str = None):
         self.imgPath: str = imgPath
@@ -35,6 +39,15 @@ class TemplateVariableParser:
         self.storedVars: dict[str, str] = dict()
 
 
+    @classmethod
+    def isDeterministic(cls, text: str) -> bool:
+        'Conservative check: Returns False if any variable in the template might depend on time, randomness or file contents.'
+        for match in cls.PATTERN_VARS.finditer(text):
+            if not cls.NONDETERMINISTIC.isdisjoint(cls.PATTERN_NAMES.findall(match.group(1))):
+                return False
+        return True
+
+
     def setup(self, imgPath: str, captionFile: CaptionFile | None = None):
         self.imgPath = imgPath
         self.captionFile = captionFile
@@ -1,4 +1,4 @@
-import random, traceback
+import os, random, traceback
 from functools import wraps
 
 
@@ -29,6 +29,16 @@ def formatTime(timeMs: float, addMilliseconds: bool = False) -> str:
     return text
 
 
+FileStamp = tuple[int, int] | None  # (size, mtime_ns) or None if the file doesn't exist
+
+def getFileStamp(path: str) -> FileStamp:
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
 def returnOnException(default=None):
     def decorator(func):
         @wraps(func)
@@ -0,0 +1,195 @@
+import os, hashlib
+from fractions import Fraction
+from threading import Lock
+from typing import NamedTuple
+import numpy as np
+from config import Config
+from lib.util import Singleton, FileStamp, getFileStamp
+from lib import videorw
+from lib.videorw import VideoInfo
+
+
+class KeyframeTable(NamedTuple):
+    timeBase: Fraction
+    pts: np.ndarray  # int64, sorted
+
+    def timesMs(self) -> np.ndarray:
+        return np.round(self.pts * (1000 * float(self.timeBase))).astype(np.int64)
+
+    def keyframesInRange(self, start: int, end: int) -> list[int]:
+        'Returns the keyframe timestamps in milliseconds within [start, end].'
+        times = self.timesMs()
+        lo = np.searchsorted(times, start, side="left")
+        hi = np.searchsorted(times, end, side="right")
+        return times[lo:hi].tolist()
+
+
+
+class VideoIndex(metaclass=Singleton):
+    '''
+    Persisted stream info and keyframe tables of videos, stored per folder in Config.pathVideoIndex.
+    Entries are validated with size and mtime of the file, so changed files are probed again.
+    The keyframe table is only built when first needed, because it requires demuxing the whole video.
+    '''
+
+    VERSION = 1
+
+    def __init__(self):
+        # Folder key -> filename -> (file size, mtime_ns, info tuple, (time base, keyframe pts) or None)
+        self.folders: dict[str, dict[str, tuple]] = dict()
+        self.changedFolders: set[str] = set()
+        self._folderKeys: dict[str, str] = dict()
+        self._lock = Lock()
+
+    def _getFolderKey(self, folder: str) -> str:
+        key = self._folderKeys.get(folder)
+        if key is None:
+            normFolder = os.path.normcase(os.path.abspath(folder))
+            key = hashlib.md5(normFolder.encode("utf-8"), usedforsecurity=False).hexdigest()
+            self._folderKeys[folder] = key
+        return key
+
+    def _getCacheFile(self, folderKey: str) -> str:
+        return os.path.join(Config.pathVideoIndex, f"{folderKey}.npz")
+
+    def _getFolderDict(self, folderKey: str) -> dict[str, tuple]:
+        folderDict = self.folders.get(folderKey)
+        if folderDict is None:
+            folderDict = dict()
+            cacheFile = self._getCacheFile(folderKey)
+            if os.path.exists(cacheFile):
+                try:
+                    folderDict = self._loadFolderDict(cacheFile)
+                except Exception as ex:
+                    print(f"WARNING: Failed to load video index '{cacheFile}': {ex} ({type(ex).__name__})")
+            self.folders[folderKey] = folderDict
+        return folderDict
+
+    @classmethod
+    def _loadFolderDict(cls, cacheFile: str) -> dict[str, tuple]:
+        with np.load(cacheFile) as data:
+            if int(data["version"]) != cls.VERSION:
+                return dict()
+
+            nameData = data["names"].tobytes().decode("utf-8")
+            stamps = data["stamps"].tolist()
+            infos = data["infos"].tolist()
+            fps = data["fps"].tolist()
+            timeBases = data["timeBases"].tolist()
+            offsets = data["keyframeOffsets"].tolist()
+            keyframePts = data["keyframePts"]
+
+        folderDict = dict[str, tuple]()
+        for i, filename in enumerate(nameData.split("\0") if nameData else []):
+            w, h, frameCount, duration, rotation = infos[i]
+            info = (w, h, fps[i], frameCount, duration, rotation)
+
+            num, den = timeBases[i]
+            keyframes = (Fraction(num, den), keyframePts[offsets[i]:offsets[i+1]]) if den > 0 else None
+            folderDict[filename] = (*stamps[i], info, keyframes)
+
+        return folderDict
+
+    @classmethod
+    def _saveFolderDict(cls, cacheFile: str, folderDict: dict[str, tuple]):
+        filenames = list(folderDict.keys())
+        entries = list(folderDict.values())
+        infos = [entry[2] for entry in entries]
+        keyframes = [entry[3] for entry in entries]
+
+        # Keyframe PTS of all files are concatenated, files without keyframe table have a time base of 0/0
+        ptsArrays = [kf[1] if kf is not None else np.zeros(0, dtype=np.int64) for kf in keyframes]
+        offsets = np.zeros(len(entries)+1, dtype=np.int64)
+        np.cumsum([len(pts) for pts in ptsArrays], out=offsets[1:])
+
+        # Write to temporary file and replace, so an interrupted write doesn't leave a broken index
+        tempPath = cacheFile + ".tmp"
+        with open(tempPath, 'wb') as file:
+            np.savez(file,
+                version=np.array(cls.VERSION),
+                names=np.frombuffer("\0".join(filenames).encode("utf-8"), dtype=np.uint8),
+                stamps=np.array([entry[:2] for entry in entries], dtype=np.int64).reshape(-1, 2),
+                infos=np.array([(w, h, frames, duration, rot) for w, h, fps, frames, duration, rot in infos], dtype=np.int64).reshape(-1, 5),
+                fps=np.array([info[2] for info in infos], dtype=np.float64),
+                timeBases=np.array([(kf[0].numerator, kf[0].denominator) if kf is not None else (0, 0) for kf in keyframes], dtype=np.int64).reshape(-1, 2),
+                keyframeOffsets=offsets,
+                keyframePts=np.concatenate(ptsArrays, dtype=np.int64) if ptsArrays else np.zeros(0, dtype=np.int64)
+            )
+        os.replace(tempPath, cacheFile)
+
+
+    def _lookup(self, path: str, stamp: FileStamp) -> tuple | None:
+        folder, filename = os.path.split(path)
+        with self._lock:
+            entry = self._getFolderDict(self._getFolderKey(folder)).get(filename)
+
+        if entry is not None and entry[:2] == stamp:
+            return entry
+        return None
+
+    def _store(self, path: str, stamp: FileStamp, info: VideoInfo, keyframes: KeyframeTable | None):
+        folder, filename = os.path.split(path)
+        keyframes = (keyframes.timeBase, keyframes.pts) if keyframes is not None else None
+        with self._lock:
+            folderKey = self._getFolderKey(folder)
+            self._getFolderDict(folderKey)[filename] = (*stamp, tuple(info), keyframes)
+            self.changedFolders.add(folderKey)
+
+
+    def getInfo(self, path: str) -> VideoInfo:
+        stamp = getFileStamp(path)
+        if stamp is None:
+            return videorw.INVALID_VIDEO_INFO
+
+        if entry := self._lookup(path, stamp):
+            return VideoInfo(*entry[2])
+
+        info = videorw.readInfo(path)
+        if info.width >= 0:
+            self._store(path, stamp, info, None)
+        return info
+
+    def getKeyframeTable(self, path: str, build: bool = True) -> KeyframeTable | None:
+        'Without build, only returns tables that are already indexed and never demuxes the video.'
+        stamp = getFileStamp(path)
+        if stamp is None:
+            return None
+
+        entry = self._lookup(path, stamp)
+        if entry and entry[3] is not None:
+            return KeyframeTable(*entry[3])
+        if not build:
+            return None
+
+        try:
+            keyframes = KeyframeTable(*videorw.readKeyframeTable(path))
+        except Exception as ex:
+            print(f"Failed to extract keyframes: {ex} ({type(ex).__name__})")
+            return None
+
+        info = VideoInfo(*entry[2]) if entry else videorw.readInfo(path)
+        self._store(path, stamp, info, keyframes)
+        return keyframes
+
+    def getKeyframes(self, path: str, start: int, end: int) -> list[int]:
+        'Returns the keyframe timestamps in milliseconds within [start, end].'
+        if keyframes := self.getKeyframeTable(path):
+            return keyframes.keyframesInRange(start, end)
+        return []
+
+
+    def save(self):
+        with self._lock:
+            if not self.changedFolders:
+                return
+
+            os.makedirs(Config.pathVideoIndex, exist_ok=True)
+            for folderKey in self.changedFolders:
+                cacheFile = self._getCacheFile(folderKey)
+                try:
+                    self._saveFolderDict(cacheFile, self.folders[folderKey])
+                except OSError as ex:
+                    print(f"WARNING: Failed to save video index '{cacheFile}': {ex}")
+
+            print(f"Updated video index ({len(self.changedFolders)} folders)")
+            self.changedFolders.clear()
@@ -1,4 +1,6 @@
+from __future__ import annotations
 import os
+from typing import NamedTuple
 import numpy as np
 import cv2 as cv
 from PIL import Image
@@ -33,8 +35,17 @@ def readSize(path: str) -> tuple[int, int]:
 
     return -1, -1
 
-def readMetadata(path: str) -> tuple[int, int, float, int, int]:
-    'w, h, fps, frame count, duration (ms)'
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    fps: float
+    frameCount: int
+    duration: int   # ms
+    rotation: int   # degrees from the display matrix, already applied to width and height
+
+INVALID_VIDEO_INFO = VideoInfo(-1, -1, 0.0, 0, 0, 0)
+
+def readInfo(path: str) -> VideoInfo:
     cap = cv.VideoCapture(path)
     try:
         if cap.isOpened():
@@ -42,13 +53,18 @@ def readMetadata(path: str) -> tuple[int, int, float, int, int]:
             frameCount = int(cap.get(cv.CAP_PROP_FRAME_COUNT))
             fps = cap.get(cv.CAP_PROP_FPS)
             duration = int(1000 * frameCount / fps)
-            return w, h, fps, frameCount, duration
+            rotation = int(cap.get(cv.CAP_PROP_ORIENTATION_META))
+            return VideoInfo(w, h, fps, frameCount, duration, rotation)
     except:
         pass
     finally:
         cap.release()
 
-    return -1, -1, 0.0, 0, 0
+    return INVALID_VIDEO_INFO
+
+def readMetadata(path: str) -> tuple[int, int, float, int, int]:
+    'w, h, fps, frame count, duration (ms)'
+    return readInfo(path)[:5]
 
 def cvGetFrameSize(cap: cv.VideoCapture) -> tuple[int, int]:
     w = int(cap.get(cv.CAP_PROP_FRAME_WIDTH))
@@ -74,7 +90,9 @@ try:
     import av
     from av.container import InputContainer
     from av.video.reformatter import VideoReformatter, Interpolation
-    from typing import Callable
+    from typing import Callable, Hashable
+    from fractions import Fraction
+    from abc import ABC, abstractmethod
 
     FrameConvertFunc = Callable[[av.VideoFrame], np.ndarray]
     ConverterFactory = Callable[[int, int], FrameConvertFunc]
@@ -88,6 +106,44 @@ try:
         270:  (cv.ROTATE_90_CLOCKWISE, True)
     }
 
+    class DecodeProfile(NamedTuple):
+        threadType: str = "AUTO"      # NONE, SLICE, FRAME or AUTO. Frame threading adds latency of one frame per thread.
+        threadCount: int = 0          # 0: Automatic
+        skipNonKey: bool = False      # Only decode keyframes
+        lowres: int = 0               # Decode at 1/2^lowres resolution, -1: Automatic from the output size of requests
+        skipLoopFilter: bool = False  # Skip deblocking (H.264, HEVC, VP9). Faster with minor artifacts, for previews.
+
+        def apply(self, stream: av.VideoStream):
+            'Must be called before decoding the first frame.'
+            ctx = stream.codec_context
+            ctx.thread_type = self.threadType
+            ctx.thread_count = self.threadCount
+            if self.skipNonKey:
+                ctx.skip_frame = "NONKEY"
+
+            options = dict()
+            if self.lowres > 0 and ctx.name in LOWRES_CODECS:
+                options["lowres"] = str(self.lowres)
+            if self.skipLoopFilter:
+                options["skip_loop_filter"] = "all"
+            if options:
+                ctx.options = {**ctx.options, **options}
+
+    # Decoders that support reduced resolution (max_lowres > 0)
+    LOWRES_CODECS = frozenset(("mjpeg", "mpeg1video", "mpeg2video", "mpeg4", "h263", "msmpeg4v1", "msmpeg4v2", "msmpeg4v3", "wmv1", "wmv2", "flv", "dvvideo"))
+
+    def getLowres(scale: float) -> int:
+        'Returns the largest lowres level that still decodes at or above the given scale.'
+        lowres = 0
+        while lowres < 3 and scale * (2 << lowres) <= 1.0:
+            lowres += 1
+        return lowres
+
+    DECODE_PROFILE_DEFAULT   = DecodeProfile()
+    DECODE_PROFILE_SEEK      = DecodeProfile(threadType="SLICE")  # Single frames at random positions
+    DECODE_PROFILE_THUMBNAIL = DecodeProfile(threadType="SLICE", threadCount=2, lowres=-1, skipLoopFilter=True)  # Runs in parallel threads
+
+
     def createFrameConverter(
         w: int|None = None, h: int|None = None, rotate: bool = True,
         interpolation: Interpolation = None, format: str = "rgb24", threads: int = 0
@@ -151,229 +207,433 @@ try:
         return keyframes
 
 
-    class NotSeekableException(Exception): pass
+    def readKeyframeTable(path: str) -> tuple[Fraction, np.ndarray]:
+        'Demuxes the whole video stream without decoding. Returns the time base and the PTS of all keyframes.'
+        with av.open(path, 'r') as container:
+            stream = container.streams.video[0]
+            keyframes = [packet.pts for packet in container.demux(stream) if packet.is_keyframe and packet.pts is not None]
+            return stream.time_base, np.sort(np.array(keyframes, dtype=np.int64))
+
+
+    class FrameRequest(ABC):
+        '''
+        Frames requested from a video by one consumer.
+        `prepare()` sets the positions in seconds once the video is opened. They must be ascending.
+        With keyframes=True, the keyframe at or before each position is used instead of the exact frame.
+        With distinct=True, the same keyframe is not used twice: When seeking lands on the last keyframe again,
+        this and all following positions are decoded exactly instead.
+        Requests with a key can be shared between consumers of the same video, see host.imagecache.VideoFrameCache.
+        `clone()` returns a new request with the same parameters and key, which wasn't prepared yet.
+        '''
+
+        def __init__(self, key: Hashable | None = None):
+            self.key = key
+            self.positions = list[float]()
+            self.keyframes = False
+            self.distinct = False
+            self.scale = 1.0  # Output size relative to the video, allows decoding at reduced resolution
+            self.frames = list()
+
+        @abstractmethod
+        def clone(self) -> FrameRequest:
+            ...
+
+        @abstractmethod
+        def prepare(self, container: InputContainer, stream: av.VideoStream):
+            ...
+
+        def addFrame(self, frame: av.VideoFrame):
+            self.frames.append(frame)
+
+        def checkFrames(self):
+            if not self.frames:
+                raise RuntimeError("Failed to extract video frames")
+            elif len(self.frames) < len(self.positions):
+                print(f"Warning: Could not extract all frames from video ({len(self.frames)}/{len(self.positions)})")
+
+
+    class _FrameDecoder:
+        NOT_SEEKABLE_DURATION = 60.0
+
+        def __init__(self, container: InputContainer, stream: av.VideoStream, maxForwardFrames: int):
+            self.container = container
+            self.stream = stream
+            self.duration = float(container.duration / av.time_base) if container.duration else 0.0
+
+            fps = float(stream.average_rate or 24)
+            self.maxForwardPts = int(maxForwardFrames / fps / stream.time_base)
+
+            self.frames = None
+            self.cur: av.VideoFrame | None = None
+            self.lastKey: av.VideoFrame | None = None
+            self.gopPts = 0  # Smallest distance between consecutive keyframes, 0 when unknown
+            self.lastSeekPts = -1
+            self.seekable = True
+            self.ended = False
+            self.numDecoded = 0
+
+        def _next(self) -> bool:
+            frame = next(self.frames, None)
+            if frame is None:
+                self.ended = True
+                return False
+
+            self.numDecoded += 1
+            self.cur = frame
+            if frame.key_frame:
+                if self.lastKey is not None:
+                    gopPts = frame.pts - self.lastKey.pts
+                    self.gopPts = min(self.gopPts, gopPts) if self.gopPts else gopPts
+                self.lastKey = frame
+            return True
+
+        def _start(self):
+            self.frames = self.container.decode(self.stream)
+            self._next()
+
+        def _seek(self, targetPts: int) -> bool:
+            'Returns False if seeking did not move forward.'
+            self.container.seek(targetPts, stream=self.stream)
+            self.frames = self.container.decode(self.stream)
+            self.lastKey = None
+            if not self._next():
+                return False
+
+            # Disable seeking if it moved backward
+            lastSeekPts = self.lastSeekPts
+            if self.cur.pts < lastSeekPts:
+                self.seekable = False
+            self.lastSeekPts = max(self.cur.pts, lastSeekPts)
+            return self.cur.pts > lastSeekPts
+
+        def _disableSeeking(self):
+            self.seekable = False
+            # Forward decoding needs all frames
+            self.stream.codec_context.skip_frame = "DEFAULT"
+
+        def _needSeek(self, targetPts: int) -> bool:
+            if not self.seekable:
+                return False
+            if self.cur is None:
+                return targetPts > self.maxForwardPts
+            if targetPts <= self.cur.pts or targetPts - self.cur.pts <= self.maxForwardPts:
+                return False
+
+            # Seeking would land on the last keyframe if the position is likely within the current GOP
+            return not (self.lastKey is not None and self.gopPts and targetPts < self.lastKey.pts + self.gopPts)
+
+        def decodeExact(self, targetPts: int) -> av.VideoFrame | None:
+            'Returns the first frame at or after the position, or the last frame.'
+            if self._needSeek(targetPts):
+                self._seek(targetPts)
+            elif self.cur is None:
+                self._start()
+
+            while self.cur is not None and self.cur.pts < targetPts and self._next():
+                pass
+            return self.cur
+
+        def decodeKeyframe(self, targetPts: int, distinct: bool = False) -> av.VideoFrame | None:
+            '''
+            Returns the keyframe at or before the position.
+            With distinct=True, seeking is disabled when it lands on the last keyframe again, and the frame is decoded exactly.
+            '''
+            if self.seekable:
+                # All frames from the last keyframe up to the current one were decoded
+                if not distinct and self.lastKey is not None and self.lastKey.pts <= targetPts <= self.cur.pts:
+                    return self.lastKey
+
+                if self._seek(targetPts) or not distinct:
+                    return self.cur
+                self._disableSeeking()
+
+            # Decode forward, but only through the beginning of long videos
+            if self.duration > self.NOT_SEEKABLE_DURATION:
+                targetPts = int(targetPts * self.NOT_SEEKABLE_DURATION / self.duration)
+            return self.decodeExact(targetPts)
+
+
+    class FrameExtractor:
+        '''
+        Decodes the frames of multiple requests in a single pass over the video, using threaded decoding.
+        The positions of all requests are visited in ascending order. Close positions are reached by decoding forward
+        instead of seeking, so a GOP that contains positions of multiple requests is decoded once.
+        The decoded frames are passed to each request, which converts them to its own size and format.
+        '''
+
+        MAX_FORWARD_FRAMES = 24  # Decode forward instead of seeking when the next position is closer
+
+        def __init__(self, profile: DecodeProfile = DECODE_PROFILE_DEFAULT):
+            self.profile = profile
+            self.numDecodedFrames = 0
+
+        def extract(self, source, requests: list[FrameRequest]):
+            with av.open(source, 'r') as container:
+                stream = container.streams.video[0]
 
-    def iterKeyframes(container: InputContainer, numFrames: int, posFunc: Callable[[int], float]):
-        'posFunc: Must return position as [0.0, 1.0]'
+                for request in requests:
+                    request.prepare(container, stream)
 
-        duration = float(container.duration / av.time_base)
-        stream = container.streams.video[0]
-        tb = stream.time_base
+                profile = self.profile
+                if profile.lowres < 0:
+                    profile = profile._replace(lowres=getLowres(max(request.scale for request in requests)))
+                if all(request.keyframes for request in requests):
+                    profile = profile._replace(skipNonKey=True)
+                profile.apply(stream)
 
-        i = 0
-        try:
-            lastPts = -1
-            for i in range(numFrames):
-                targetPts = int((posFunc(i) * duration) / tb)
-                container.seek(targetPts, stream=stream)
-
-                frame = next(container.decode(stream))
-                pts = frame.pts #or 0
-                if pts > lastPts:
-                    lastPts = pts
-                    yield frame
-                else:
-                    raise NotSeekableException()
+                tb = stream.time_base
+                targets = [(pos, request) for request in requests for pos in request.positions]
+                targets.sort(key=lambda target: target[0])
+
+                decoder = _FrameDecoder(container, stream, self.MAX_FORWARD_FRAMES)
+                try:
+                    for i, (pos, request) in enumerate(targets):
+                        targetPts = int(pos / tb)
+                        frame = decoder.decodeKeyframe(targetPts, request.distinct) if request.keyframes else decoder.decodeExact(targetPts)
+                        if frame is None:
+                            break
+
+                        request.addFrame(frame)
+                        if decoder.ended:
+                            # The next position of the other requests also receives the last frame
+                            endedRequests = {id(request)}
+                            for pos, request in targets[i+1:]:
+                                if id(request) not in endedRequests:
+                                    endedRequests.add(id(request))
+                                    request.addFrame(frame)
+                            break
+
+                except Exception as ex:
+                    print(f"Warning: {ex} ({type(ex).__name__})")
+
+                self.numDecodedFrames += decoder.numDecoded
+
+
+    class ThumbnailFrames(FrameRequest):
+        'Tiles of evenly spaced keyframes, excluding the first and last interval. Positions within the same GOP are decoded exactly.'
+
+        def __init__(self, maxWidth: int, tiling: int, key: Hashable | None = None):
+            super().__init__(key)
+            self.maxWidth = round(maxWidth / tiling)
+            self.tiling = tiling
+            self.keyframes = True
+            self.distinct = True
+
+            self.tiles: np.ndarray | None = None
+            self.convert: FrameConvertFunc | None = None
+            self.rotation: int | None = None
+            self.swap = False
+
+        def clone(self) -> FrameRequest:
+            return ThumbnailFrames(self.maxWidth * self.tiling, self.tiling, self.key)
+
+        def prepare(self, container: InputContainer, stream: av.VideoStream):
+            self.origW, self.origH = avGetFrameSize(stream)
+            self.w, self.h = self.origW, self.origH
 
-        except NotSeekableException:
-            duration = min(duration, 60.0)
+            duration = float(container.duration / av.time_base)
+            numIntervals = self.tiling*self.tiling + 1
+            self.positions = [duration * (i+1) / numIntervals for i in range(numIntervals-1)]
+
+            # Rotation is only known after decoding, so use the larger scale
+            self.scale = min(self.maxWidth / min(self.w, self.h), 1.0)
+
+        def _prepareTiles(self, frame: av.VideoFrame):
+            self.rotation, self.swap = CV_ROT_SWAP.get(frame.rotation, (None, False))
+            w, h, maxWidth = self.w, self.h, self.maxWidth
+            if self.swap:
+                if h > maxWidth:
+                    w = round(w * maxWidth/h)
+                    h = maxWidth
+            else:
+                if w > maxWidth:
+                    h = round(h * maxWidth/w)
+                    w = maxWidth
 
-            for i in range(i, numFrames):
-                targetPts = int((posFunc(i) * duration) / tb)
+            self.w, self.h = w, h
+            self.convert = createFrameConverter(w, h, False, Interpolation.AREA, threads=2)
+            self.tiles = np.zeros((h*self.tiling, w*self.tiling, 3), dtype=np.uint8)
 
-                frame = None
-                for frame in container.decode(stream):
-                    if frame.pts >= targetPts:
-                        yield frame
-                        break
-                else:
-                    if frame:
-                        yield frame
-                    break
+        def addFrame(self, frame: av.VideoFrame):
+            if self.tiles is None:
+                self._prepareTiles(frame)
 
-    def iterFrames(container: InputContainer, numFrames: int, posFunc: Callable[[int], float], seek: bool = True):
-        'posFunc: Must return position as seconds'
-
-        stream = container.streams.video[0]
-        tb = stream.time_base
-        lastSeekPts = -1
-
-        for i in range(numFrames):
-            targetPts = int(posFunc(i) / tb)
-            if seek:
-                container.seek(targetPts, stream=stream)
-
-            frame = None
-            for f, frame in enumerate(container.decode(stream)):
-                pts = frame.pts #or 0
-                if f == 0 and seek:
-                    # Disable seeking if it didn't move forward
-                    if pts > lastSeekPts:
-                        lastSeekPts = pts
-                    else:
-                        seek = False
-
-                if pts >= targetPts:
-                    yield frame
-                    break
-            else:
-                if frame:
-                    yield frame
-                break
+            y, x = divmod(len(self.frames), self.tiling)
+            x *= self.w
+            y *= self.h
 
+            self.tiles[y:y+self.h, x:x+self.w, :] = self.convert(frame)
+            self.frames.append(None)
 
-    def thumbnailVideo(path: str, maxWidth: int, tiling: int) -> tuple[np.ndarray, tuple[int, int]]:
-        with av.open(path, 'r') as container:
-            stream = container.streams.video[0]
+        def result(self) -> tuple[np.ndarray, tuple[int, int]]:
+            if self.tiles is None:
+                raise RuntimeError("Failed to extract video frames")
 
-            origW, origH = avGetFrameSize(stream)
-            w = origW
-            h = origH
+            tiles = self.tiles
+            origW, origH = self.origW, self.origH
+            if self.rotation is not None:
+                tiles = cv.rotate(tiles, self.rotation)
+                if self.swap:
+                    origW, origH = origH, origW
 
-            maxWidth = round(maxWidth / tiling)
-            tiles: np.ndarray = None
-            convert: FrameConvertFunc = None
+            return tiles, (origW, origH)
 
-            rotation: int | None = None
-            swap: bool = False
 
-            def prepareTiles(frame: av.VideoFrame):
-                nonlocal w, h, rotation, swap, tiles, convert
-                rotation, swap = CV_ROT_SWAP.get(frame.rotation, (None, False))
-                if swap:
-                    if h > maxWidth:
-                        w = round(w * maxWidth/h)
-                        h = maxWidth
-                else:
-                    if w > maxWidth:
-                        h = round(h * maxWidth/w)
-                        w = maxWidth
+    # For scrub previews
+    class SpriteFrames(FrameRequest):
+        '''
+        Small frames at evenly spaced positions. Short videos use the exact frames,
+        long videos the keyframe at or before each position. Repeated keyframes are only stored once.
+        '''
 
-                convert = createFrameConverter(w, h, False, Interpolation.AREA, threads=2)
-                tiles = np.zeros((h*tiling, w*tiling, 3), dtype=np.uint8)
+        EXACT_DURATION = 10.0  # seconds
 
-            def addTile(i: int, frame: av.VideoFrame):
-                if i == 1:
-                    prepareTiles(frame)
+        def __init__(self, tileSize: int, maxTiles: int, minInterval: float, key: Hashable | None = None):
+            super().__init__(key)
+            self.tileSize = tileSize
+            self.maxTiles = maxTiles
+            self.minInterval = minInterval
+            self.timesMs = list[int]()
 
-                y, x = divmod(i-1, tiling)
-                x *= w
-                y *= h
+        def clone(self) -> FrameRequest:
+            return SpriteFrames(self.tileSize, self.maxTiles, self.minInterval, self.key)
 
-                tiles[y:y+h, x:x+w, :] = convert(frame)
+        def prepare(self, container: InputContainer, stream: av.VideoStream):
+            w, h = avGetFrameSize(stream)
+            self.scale = min(self.tileSize / max(w, h), 1.0)
+            self.convert = createFrameConverter(max(round(w * self.scale), 1), max(round(h * self.scale), 1), True, Interpolation.AREA)
 
-            # Extract evenly spaced frames
-            numIntervals = tiling*tiling + 1
-            posFunc = lambda i: (i+1) / numIntervals
+            duration = float(container.duration / av.time_base) if container.duration else 0.0
+            numTiles = min(max(int(duration / self.minInterval), 1), self.maxTiles)
+            self.positions = [duration * i / numTiles for i in range(numTiles)]
+            self.keyframes = duration > self.EXACT_DURATION
 
-            try:
-                for i, frame in enumerate(iterKeyframes(container, numIntervals-1, posFunc), 1):
-                    addTile(i, frame)
-            except Exception as ex:
-                print(f"Video thumbnail incomplete: {ex} ({type(ex).__name__})")
+        def addFrame(self, frame: av.VideoFrame):
+            timeMs = round(1000 * (frame.time or 0.0))
+            if self.timesMs and timeMs <= self.timesMs[-1]:
+                return
 
-        if rotation is not None:
-            tiles = cv.rotate(tiles, rotation)
-            if swap:
-                origW, origH = origH, origW
+            self.timesMs.append(timeMs)
+            self.frames.append(self.convert(frame))
 
-        return tiles, (origW, origH)
+        def result(self) -> tuple[np.ndarray, np.ndarray]:
+            'Returns the timestamps in milliseconds and the RGB tiles with shape (n, h, w, 3).'
+            if not self.frames:
+                raise RuntimeError("Failed to extract video frames")
+            return np.array(self.timesMs, dtype=np.int64), np.stack(self.frames)
 
 
     # For captioning models
-    def extractFramesPIL(source, sampleFps: float, maxFrames: int = 32) -> tuple[list[Image.Image], dict]:
-        with av.open(source, 'r') as container:
-            stream = container.streams.video[0]
+    class SampleFramesPIL(FrameRequest):
+        def __init__(self, sampleFps: float, maxFrames: int = 32):
+            super().__init__(("pil", sampleFps, maxFrames))
+            self.sampleFps = sampleFps
+            self.maxFrames = maxFrames
+
+        def clone(self) -> FrameRequest:
+            return SampleFramesPIL(self.sampleFps, self.maxFrames)
 
+        def prepare(self, container: InputContainer, stream: av.VideoStream):
             w, h = avGetFrameSize(stream)
-            convert = createFrameConverter(w, h)
+            self.convert = createFrameConverter(w, h)
 
-            duration = float(container.duration / av.time_base)
+            self.duration = duration = float(container.duration / av.time_base)
 
-            if sampleSingleFrame(sampleFps):
+            if sampleSingleFrame(self.sampleFps):
                 numSampleFrames = 1
-                sampleFps = 0.0
-                seek = False
-                posFunc = lambda i: -100.0
+                self.outFps = 0.0
+                self.positions = [-100.0]
             else:
                 fps = float(stream.average_rate or 0)
                 frameCount = stream.frames or int(duration * fps)
 
-                numSampleFrames = min(int(duration * sampleFps), frameCount)
+                numSampleFrames = min(int(duration * self.sampleFps), frameCount)
                 numSampleFrames &= ~1  # Force even frame count by rounding down
-                numSampleFrames = min(max(numSampleFrames, 2), maxFrames)
-                sampleFps = numSampleFrames / duration
+                numSampleFrames = min(max(numSampleFrames, 2), self.maxFrames)
+                self.outFps = numSampleFrames / duration
 
                 posFeed = duration / (numSampleFrames-1) if numSampleFrames < frameCount-1 else 0
-                seek = (posFeed * fps > 24)
-                posFunc = lambda i: i * posFeed
+                self.positions = [i * posFeed for i in range(numSampleFrames)]
 
-            frames = list[Image.Image]()
-            try:
-                for frame in iterFrames(container, numSampleFrames, posFunc, seek):
-                    frames.append(Image.fromarray(convert(frame)))
-            except Exception as ex:
-                print(f"Warning: {ex} ({type(ex).__name__})")
+        def addFrame(self, frame: av.VideoFrame):
+            self.frames.append(Image.fromarray(self.convert(frame)))
 
-        if not frames:
-            raise RuntimeError("Failed to extract video frames")
-        elif len(frames) < numSampleFrames:
-            print(f"Warning: Could not extract all frames from video ({len(frames)}/{numSampleFrames})")
-
-        metadata = {
-            "fps": sampleFps,
-            "frames_indices": list(range(len(frames))),
-            "total_num_frames": len(frames),
-            "duration": duration
-        }
-
-        return frames, metadata
+        def result(self) -> tuple[list[Image.Image], dict]:
+            self.checkFrames()
+            metadata = {
+                "fps": self.outFps,
+                "frames_indices": list(range(len(self.frames))),
+                "total_num_frames": len(self.frames),
+                "duration": self.duration
+            }
+            return self.frames, metadata
 
 
     # For tagging models
-    def extractFramesMat(source, sampleFps: float, maxFrames: int, converterFactory: ConverterFactory) -> list[np.ndarray]:
-        with av.open(source, 'r') as container:
-            stream = container.streams.video[0]
-
+    class SampleFramesMat(FrameRequest):
+        def __init__(self, sampleFps: float, maxFrames: int, converterFactory: ConverterFactory, key: Hashable | None = None):
+            super().__init__(("mat", sampleFps, maxFrames, key) if key is not None else None)
+            self.sampleFps = sampleFps
+            self.maxFrames = maxFrames
+            self.converterFactory = converterFactory
+            self.converterKey = key
+
+        def clone(self) -> FrameRequest:
+            return SampleFramesMat(self.sampleFps, self.maxFrames, self.converterFactory, self.converterKey)
+
+        def prepare(self, container: InputContainer, stream: av.VideoStream):
             w, h = avGetFrameSize(stream)
-            convert = converterFactory(w, h)
+            self.convert = self.converterFactory(w, h)
 
             duration = float(container.duration / av.time_base)
             fps = float(stream.average_rate or 0)
             frameCount = stream.frames or int(duration * fps)
 
-            numSampleFrames = min(round(duration * sampleFps), frameCount)
-            numSampleFrames = min(max(numSampleFrames, 3), maxFrames)
+            numSampleFrames = min(round(duration * self.sampleFps), frameCount)
+            numSampleFrames = min(max(numSampleFrames, 3), self.maxFrames)
 
-            frames = list[np.ndarray]()
-            try:
-                # Short videos: Exact seeking, include first and last frame
-                if duration <= 10.0:
-                    posFunc = lambda i: duration * i / (numSampleFrames-1)
-                    for frame in iterFrames(container, numSampleFrames, posFunc):
-                        frames.append(convert(frame))
+            # Short videos: Exact seeking, include first and last frame
+            if duration <= 10.0:
+                self.positions = [duration * i / (numSampleFrames-1) for i in range(numSampleFrames)]
 
-                # Long videos: Seek to keyframes only, exclude first and last interval
-                else:
-                    numIntervals = numSampleFrames + 1
-                    posFunc = lambda i: (i+1) / numIntervals
-                    for frame in iterKeyframes(container, numSampleFrames, posFunc):
-                        frames.append(convert(frame))
+            # Long videos: Seek to keyframes only, exclude first and last interval.
+            # When keyframes are further apart than the positions, the frames are decoded exactly.
+            else:
+                numIntervals = numSampleFrames + 1
+                self.positions = [duration * (i+1) / numIntervals for i in range(numSampleFrames)]
+                self.keyframes = True
+                self.distinct = True
 
-            except Exception as ex:
-                print(f"Warning: {ex} ({type(ex).__name__})")
+        def addFrame(self, frame: av.VideoFrame):
+            self.frames.append(self.convert(frame))
 
-        if not frames:
-            raise RuntimeError("Failed to extract video frames")
-        elif len(frames) < numSampleFrames:
-            print(f"Warning: Could not extract all frames from video ({len(frames)}/{numSampleFrames})")
+        def result(self) -> list[np.ndarray]:
+            self.checkFrames()
+            return self.frames
+
+
+    def thumbnailVideo(path: str, maxWidth: int, tiling: int) -> tuple[np.ndarray, tuple[int, int]]:
+        request = ThumbnailFrames(maxWidth, tiling)
+        FrameExtractor(DECODE_PROFILE_THUMBNAIL).extract(path, [request])
+        return request.result()
+
+    def extractFramesPIL(source, sampleFps: float, maxFrames: int = 32) -> tuple[list[Image.Image], dict]:
+        request = SampleFramesPIL(sampleFps, maxFrames)
+        FrameExtractor().extract(source, [request])
+        return request.result()
 
-        return frames
+    def extractFramesMat(source, sampleFps: float, maxFrames: int, converterFactory: ConverterFactory) -> list[np.ndarray]:
+        request = SampleFramesMat(sampleFps, maxFrames, converterFactory)
+        FrameExtractor().extract(source, [request])
+        return request.result()
 
 
 
 # ========== OpenCV ==========
 except ImportError:
+    from fractions import Fraction
+
+    FrameRequest = FrameExtractor = None
 
     def getKeyframes(path: str, start: int, end: int) -> list[int]:
         startSec = start / 1000.0
@@ -393,6 +653,27 @@ except ImportError:
             print(f"Failed to extract keyframes: {ex} ({type(ex).__name__})")
             return []
 
+    def readKeyframeTable(path: str) -> tuple[Fraction, np.ndarray]:
+        'Reads the packet flags without decoding. Returns the time base and the PTS of all keyframes.'
+        cmd = [
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=time_base:packet=pts,flags', '-of', 'compact=p=0:nk=1', path
+        ]
+
+        import subprocess
+        result = subprocess.check_output(cmd, text=True)
+
+        timeBase = Fraction(1, 1000)
+        keyframes = list[int]()
+        for line in result.splitlines():
+            values = line.strip().split("|")
+            if len(values) == 1 and "/" in values[0]:
+                timeBase = Fraction(values[0])
+            elif len(values) == 2 and values[1].startswith("K") and values[0] != "N/A":
+                keyframes.append(int(values[0]))
+
+        return timeBase, np.sort(np.array(keyframes, dtype=np.int64))
+
 
     def thumbnailVideo(path: str, maxWidth: int, tiling: int) -> tuple[np.ndarray, tuple[int, int]]:
         cap = cv.VideoCapture(path)
@@ -0,0 +1,154 @@
+import os, hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple
+import numpy as np
+import cv2 as cv
+from config import Config
+from lib.util import Singleton, FileStamp, getFileStamp
+from lib import videorw
+
+
+class SeekSprites(NamedTuple):
+    timesMs: np.ndarray  # int64, ascending
+    tiles: np.ndarray    # uint8 with shape (n, h, w, 3), RGB
+
+    def indexAt(self, posMs: int) -> int:
+        'Returns the index of the last tile at or before the position.'
+        return max(int(np.searchsorted(self.timesMs, posMs, side="right")) - 1, 0)
+
+    def interval(self) -> int:
+        'Average distance between tiles in milliseconds.'
+        if len(self.timesMs) < 2:
+            return 0
+        return int(self.timesMs[-1] - self.timesMs[0]) // (len(self.timesMs) - 1)
+
+
+    def toSheet(self, columns: int) -> np.ndarray:
+        n, h, w, c = self.tiles.shape
+        rows = -(-n // columns)
+        sheet = np.zeros((rows, columns, h, w, c), dtype=np.uint8)
+        sheet.reshape(-1, h, w, c)[:n] = self.tiles
+        return sheet.transpose(0, 2, 1, 3, 4).reshape(rows*h, columns*w, c)
+
+    @staticmethod
+    def fromSheet(timesMs: np.ndarray, sheet: np.ndarray, tileW: int, tileH: int) -> 'SeekSprites':
+        sheetH, sheetW, c = sheet.shape
+        rows, columns = sheetH // tileH, sheetW // tileW
+        tiles = sheet.reshape(rows, tileH, columns, tileW, c).transpose(0, 2, 1, 3, 4).reshape(-1, tileH, tileW, c)
+        return SeekSprites(timesMs, np.ascontiguousarray(tiles[:len(timesMs)]))
+
+
+
+class SeekSpriteStore(metaclass=Singleton):
+    '''
+    Low resolution frames of videos for scrub previews, stored per video as JPEG sprite sheet in Config.pathSeekSprites.
+    Files are validated with size and mtime of the video, so changed videos are extracted again.
+    '''
+
+    TILE_SIZE    = 160
+    MAX_TILES    = 200
+    MIN_INTERVAL = 0.5  # seconds
+    COLUMNS      = 16
+    JPEG_QUALITY = 90
+    MAX_LOADED   = 4
+
+    def __init__(self):
+        self.loaded: OrderedDict[str, tuple[FileStamp, SeekSprites]] = OrderedDict()
+        self.pending: set[str] = set()
+        self._lock = Lock()
+
+    def _getCacheFile(self, path: str) -> str:
+        normPath = os.path.normcase(os.path.abspath(path))
+        key = hashlib.md5(normPath.encode("utf-8"), usedforsecurity=False).hexdigest()
+        return os.path.join(Config.pathSeekSprites, f"{key}.npz")
+
+    def _remember(self, path: str, stamp: FileStamp, sprites: SeekSprites):
+        with self._lock:
+            self.loaded[path] = (stamp, sprites)
+            self.loaded.move_to_end(path)
+            while len(self.loaded) > self.MAX_LOADED:
+                self.loaded.popitem(last=False)
+
+
+    def get(self, path: str) -> SeekSprites | None:
+        'Returns the sprites from memory or disk, or None if they were not extracted yet.'
+        stamp = getFileStamp(path)
+        if stamp is None:
+            return None
+
+        with self._lock:
+            entry = self.loaded.get(path)
+            if entry is not None and entry[0] == stamp:
+                self.loaded.move_to_end(path)
+                return entry[1]
+
+        if sprites := self._load(path, stamp):
+            self._remember(path, stamp, sprites)
+        return sprites
+
+    def getOrCreate(self, path: str) -> SeekSprites | None:
+        return self.get(path) or self.create(path)
+
+    def create(self, path: str) -> SeekSprites | None:
+        'Extracts the sprites and saves them. Returns None if extraction fails or is already running.'
+        stamp = getFileStamp(path)
+        if stamp is None or videorw.FrameExtractor is None:
+            return None
+
+        with self._lock:
+            if path in self.pending:
+                return None
+            self.pending.add(path)
+
+        try:
+            request = videorw.SpriteFrames(self.TILE_SIZE, self.MAX_TILES, self.MIN_INTERVAL)
+            videorw.FrameExtractor(videorw.DECODE_PROFILE_THUMBNAIL).extract(path, [request])
+            sprites = SeekSprites(*request.result())
+        except Exception as ex:
+            print(f"Failed to extract seek sprites: {ex} ({type(ex).__name__})")
+            return None
+        finally:
+            with self._lock:
+                self.pending.discard(path)
+
+        self._remember(path, stamp, sprites)
+        self._save(path, stamp, sprites)
+        return sprites
+
+
+    def _load(self, path: str, stamp: FileStamp) -> SeekSprites | None:
+        cacheFile = self._getCacheFile(path)
+        if not os.path.exists(cacheFile):
+            return None
+
+        try:
+            with np.load(cacheFile) as data:
+                if tuple(data["stamp"].tolist()) != stamp:
+                    return None
+
+                sheet = cv.imdecode(data["sheet"], cv.IMREAD_COLOR)
+                tileW, tileH = data["tileSize"].tolist()
+                return SeekSprites.fromSheet(data["times"], sheet[..., ::-1], tileW, tileH)
+        except Exception as ex:
+            print(f"WARNING: Failed to load seek sprites '{cacheFile}': {ex} ({type(ex).__name__})")
+            return None
+
+    def _save(self, path: str, stamp: FileStamp, sprites: SeekSprites):
+        cacheFile = self._getCacheFile(path)
+        try:
+            sheet = sprites.toSheet(self.COLUMNS)
+            success, jpeg = cv.imencode(".jpg", sheet[..., ::-1], [cv.IMWRITE_JPEG_QUALITY, self.JPEG_QUALITY])
+            if not success:
+                raise ValueError("Failed to encode sprite sheet")
+
+            tileH, tileW = sprites.tiles.shape[1:3]
+            os.makedirs(Config.pathSeekSprites, exist_ok=True)
+
+            # Write to temporary file and replace, so an interrupted write doesn't leave a broken sprite sheet
+            tempPath = cacheFile + ".tmp"
+            with open(tempPath, 'wb') as file:
+                np.savez(file, stamp=np.array(stamp, dtype=np.int64), times=sprites.timesMs, tileSize=np.array((tileW, tileH)), sheet=jpeg)
+            os.replace(tempPath, cacheFile)
+        except Exception as ex:
+            print(f"WARNING: Failed to save seek sprites '{cacheFile}': {ex} ({type(ex).__name__})")
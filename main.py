@@ -237,6 +237,9 @@ def main() -> int:
     QThreadPool.globalInstance().setMaxThreadCount(threadCount)
     del threadCount
 
+    from ui.tiled_image import TilePyramid
+    TilePyramid.removeStale()
+
     win = MainWindow(app)
     win.show()
 
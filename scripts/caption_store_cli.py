@@ -0,0 +1,54 @@
+from scripts_common import *
+from lib.captionstore import CaptionStore, importJson, exportJson
+
+
+def runImport(args: argparse.Namespace) -> int:
+    with tqdm(desc="Reading JSON files", unit=" files") as pbar:
+        count = importJson(args.folder, args.delete_json, lambda path: pbar.update())
+
+    dbPath = os.path.join(os.path.abspath(args.folder), CaptionStore.FILENAME)
+    print(f"Imported {count} caption files into {dbPath}")
+    if args.delete_json:
+        print(f"Deleted {count} JSON files")
+    return 0
+
+def runExport(args: argparse.Namespace) -> int:
+    try:
+        with tqdm(desc="Writing JSON files", unit=" files") as pbar:
+            count = exportJson(args.folder, args.delete_db, lambda path: pbar.update())
+    except FileNotFoundError as ex:
+        print(f"Error: {ex}")
+        return 1
+
+    print(f"Exported {count} caption files")
+    if args.delete_db:
+        print(f"Deleted {CaptionStore.FILENAME}")
+    return 0
+
+
+def readArgs() -> argparse.Namespace:
+    argParser = argparse.ArgumentParser(description=f"Convert between per-image .json caption files and a caption database ({CaptionStore.FILENAME}) in a dataset folder.")
+    commands = argParser.add_subparsers(dest="command", required=True)
+
+    importParser = commands.add_parser("import", help="Import all .json caption files in the folder and its subfolders into the database. Creates the database if necessary.")
+    importParser.add_argument("folder", type=str, help="Dataset root folder.")
+    importParser.add_argument("--delete-json", action="store_true", help="Delete the .json files after importing.")
+
+    exportParser = commands.add_parser("export", help="Write the database content to .json caption files next to the images, for tools that read them directly. Overwrites existing files.")
+    exportParser.add_argument("folder", type=str, help="Dataset root folder which contains the database.")
+    exportParser.add_argument("--delete-db", action="store_true", help="Delete the database after exporting, so qapyq uses the .json files again.")
+
+    return argParser.parse_args()
+
+
+if __name__ == "__main__":
+    args = readArgs()
+
+    Config.pathConfig = os.path.normpath(os.path.join(QAPYQ_DIR, Config.pathConfig))
+    if not Config.load(True):
+        sys.exit(1)
+
+    if args.command == "import":
+        sys.exit(runImport(args))
+    else:
+        sys.exit(runExport(args))
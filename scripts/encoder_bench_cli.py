@@ -0,0 +1,115 @@
+import random, tempfile, time
+from scripts_common import *
+from PIL import Image
+from lib import imagerw
+from ui.export_settings import FORMATS, ENCODER_PROFILES, EncoderProfile, saveImagePIL
+
+
+def collectImages(srcPaths: list[str]) -> list[str]:
+    files = list[str]()
+    for srcPath in srcPaths:
+        srcPath = os.path.abspath(srcPath)
+        if os.path.isfile(srcPath):
+            files.append(srcPath)
+            continue
+
+        for root, dirs, filenames in os.walk(srcPath):
+            for filename in filenames:
+                name, ext = os.path.splitext(filename)
+                if ext.lower() in imagerw.READ_EXTENSIONS and not name.endswith(Config.maskSuffix):
+                    files.append(os.path.join(root, filename))
+
+    files.sort()
+    return files
+
+
+def loadImages(files: list[str]) -> list[Image.Image]:
+    images = list[Image.Image]()
+    for file in tqdm(files, desc="Loading images", unit="file"):
+        try:
+            images.append(imagerw.loadImagePIL(file))
+        except Exception as ex:
+            print(f"WARNING: Failed to load '{file}': {ex}")
+    return images
+
+
+def encodeAll(images: list[Image.Image], folder: str, ext: str, profile: str) -> tuple[float, int]:
+    'Returns the encoding time in seconds and the number of bytes written.'
+    logger = lambda msg: None
+    totalTime = 0.0
+    totalBytes = 0
+
+    for i, img in enumerate(images):
+        path = os.path.join(folder, f"{i:05}.{ext}")
+        tStart = time.perf_counter()
+        saveImagePIL(path, img, logger, profile)
+        totalTime += time.perf_counter() - tStart
+
+        totalBytes += os.path.getsize(path)
+        os.remove(path)
+
+    return totalTime, totalBytes
+
+
+def runBenchmark(args: argparse.Namespace) -> int:
+    files = collectImages(args.src)
+    if not files:
+        print("No images found for the given source path(s).")
+        return 1
+
+    if len(files) > args.sample:
+        random.seed(args.seed)
+        files = random.sample(files, args.sample)
+
+    images = loadImages(files)
+    if not images:
+        return 1
+
+    megaPixels = sum(img.width * img.height for img in images) / 1_000_000
+    print(f"Encoding {len(images)} images ({megaPixels:.1f} MPix) with every profile")
+    print()
+
+    formats  = [fmt.upper() for fmt in args.format] if args.format else list(FORMATS.keys())
+    profiles = args.profile or list(ENCODER_PROFILES)
+
+    print(f"{'Format':<8}{'Profile':<10}{'Images/s':>10}{'MPix/s':>10}{'Written':>12}{'vs. balanced':>14}")
+    with tempfile.TemporaryDirectory(prefix="qapyq_encoder_bench_") as folder:
+        for fmt in formats:
+            if fmt not in FORMATS:
+                print(f"{fmt:<8}Unknown format")
+                continue
+
+            results: dict[str, tuple[float, int]] = dict()
+            for profile in profiles:
+                try:
+                    results[profile] = encodeAll(images, folder, fmt.lower(), profile)
+                except Exception as ex:
+                    print(f"{fmt:<8}{profile:<10}Failed: {ex}")
+
+            refBytes = results.get(EncoderProfile.Balanced, (0.0, 0))[1]
+            for profile, (seconds, numBytes) in results.items():
+                seconds = max(seconds, 1e-9)
+                relSize = f"{(numBytes / refBytes - 1) * 100:+.1f} %" if refBytes else "-"
+                print(f"{fmt:<8}{profile:<10}{len(images)/seconds:>10.2f}{megaPixels/seconds:>10.2f}{numBytes/1_000_000:>9.1f} MB{relSize:>14}", flush=True)
+
+    return 0
+
+
+def readArgs() -> argparse.Namespace:
+    argParser = argparse.ArgumentParser(description="Encode a sample of your images with every encoder profile and report throughput against bytes written. Images are encoded in a temporary folder, the source files are not modified.")
+    argParser.add_argument("--src", action="append", type=str, required=True, help="Source folder(s) or image file(s). Can be passed multiple times.")
+    argParser.add_argument("--sample", "-n", type=int, default=20, help="Number of randomly chosen images. Default: 20")
+    argParser.add_argument("--seed", type=int, default=0, help="Random seed for choosing the sample. Default: 0")
+    argParser.add_argument("--format", "-f", action="append", type=str, choices=[fmt.lower() for fmt in FORMATS.keys()], help="Format(s) to test. Can be passed multiple times. Default: All formats")
+    argParser.add_argument("--profile", "-p", action="append", type=str, choices=ENCODER_PROFILES, help="Encoder profile(s) to test. Can be passed multiple times. Default: All profiles")
+    return argParser.parse_args()
+
+
+if __name__ == "__main__":
+    args = readArgs()
+
+    Config.pathConfig = os.path.normpath(os.path.join(QAPYQ_DIR, Config.pathConfig))
+    if not Config.load(True):
+        sys.exit(1)
+
+    sys.exit(runBenchmark(args))
@@ -3,6 +3,7 @@ import os, traceback, time
 from typing import Iterable, Generator, Callable, Any, TypeVar, cast
 from typing_extensions import override
 from collections import Counter
+import numpy as np
 from PySide6 import QtWidgets, QtGui
 from PySide6.QtCore import (
     Qt, Slot, Signal, QSignalBlocker, QAbstractListModel, QSortFilterProxyModel, QModelIndex, QPersistentModelIndex, QItemSelection,
@@ -11,7 +12,11 @@ from PySide6.QtCore import (
 from ui.tab import ImgTab
 from lib import colorlib, qtlib
 from lib.filelist import FileList, CachedPathSort
+from lib.util import getFileStamp
 from config import Config
+from .stats_cache import StatsCache, CachedLoadFunctor, PersistentCache
+from .stats_pool import StatsProcessPool, AdaptiveChunkSize, ChunkFunctor, ResultPacker
+from .stats_corpus import FileCorpus, countPostings
 
 
 # TODO: Highlight images in gallery for selected rows
@@ -24,6 +29,10 @@ class StatsBaseProxyModel(QSortFilterProxyModel):
     def getFiles(self, sourceIndex: QModelIndex) -> Iterable[str]:
         raise NotImplementedError
 
+    def getFileIds(self, sourceIndex: QModelIndex) -> tuple[FileCorpus, np.ndarray] | None:
+        'Models with a FileCorpus return the sorted file ids, which are combined faster than sets of paths.'
+        return None
+
 
 
 class StatsLayout(QtWidgets.QVBoxLayout):
@@ -208,19 +217,31 @@ class StatsLayout(QtWidgets.QVBoxLayout):
 
     @Slot()
     def _onRowsSelected(self, newItem: QItemSelection, oldItem: QItemSelection):
-        combineClass = self.cboCombineMode.currentData()
-        combiner: CombineMode = combineClass()
+        combineClass: type[CombineMode] = self.cboCombineMode.currentData()
+        srcIndexes = list(self.getSelectedSourceIndexes())
+        numRows = len(srcIndexes)
+        negate = self.chkFilesNegate.isChecked() and numRows > 0
+
+        fileIdSets = [self.proxyModel.getFileIds(srcIndex) for srcIndex in srcIndexes]
+        if fileIdSets and all(fileIds is not None for fileIds in fileIdSets):
+            corpus = fileIdSets[0][0]
+            fileIds = combineClass.combineIds([fileIds for c, fileIds in fileIdSets], len(corpus))
+            if negate:
+                fileSet = corpus.getFileSet(fileIds)
+                files = [file for file in self.tab.filelist.getFiles() if file not in fileSet]
+            else:
+                files = sorted(corpus.getFiles(fileIds), key=CachedPathSort())
 
-        numRows = 0
-        for srcIndex in self.getSelectedSourceIndexes():
-            combiner.addFiles( self.proxyModel.getFiles(srcIndex) )
-            numRows += 1
-
-        fileSet = combiner.getFiles()
-        if self.chkFilesNegate.isChecked() and numRows:
-            files = [file for file in self.tab.filelist.getFiles() if file not in fileSet]
         else:
-            files = sorted(fileSet, key=CachedPathSort())
+            combiner: CombineMode = combineClass()
+            for srcIndex in srcIndexes:
+                combiner.addFiles( self.proxyModel.getFiles(srcIndex) )
+
+            fileSet = combiner.getFiles()
+            if negate:
+                files = [file for file in self.tab.filelist.getFiles() if file not in fileSet]
+            else:
+                files = sorted(fileSet, key=CachedPathSort())
 
         with QSignalBlocker(self.listFiles.selectionModel()):
             self.listModel.setFiles(files)
@@ -427,6 +448,12 @@ class CombineModeUnion:
     def getFiles(self) -> set[str]:
         return self.fileSet
 
+    @staticmethod
+    def combineIds(fileIdSets: list[np.ndarray], numFiles: int) -> np.ndarray:
+        if len(fileIdSets) == 1:
+            return fileIdSets[0]
+        return np.flatnonzero(countPostings(fileIdSets, numFiles))
+
 
 class CombineModeIntersection:
     def __init__(self):
@@ -443,6 +470,12 @@ class CombineModeIntersection:
     def getFiles(self) -> set[str]:
         return self.fileSet
 
+    @staticmethod
+    def combineIds(fileIdSets: list[np.ndarray], numFiles: int) -> np.ndarray:
+        if len(fileIdSets) == 1:
+            return fileIdSets[0]
+        return np.flatnonzero(countPostings(fileIdSets, numFiles) == len(fileIdSets))
+
 
 class CombineModeExclusive:
     def __init__(self):
@@ -454,6 +487,10 @@ class CombineModeExclusive:
     def getFiles(self) -> set[str]:
         return set(f for f, count in self.fileCounter.items() if count == 1)
 
+    @staticmethod
+    def combineIds(fileIdSets: list[np.ndarray], numFiles: int) -> np.ndarray:
+        return np.flatnonzero(countPostings(fileIdSets, numFiles) == 1)
+
 
 class CombineModeMultiple:
     def __init__(self):
@@ -465,6 +502,10 @@ class CombineModeMultiple:
     def getFiles(self) -> set[str]:
         return set(f for f, count in self.fileCounter.items() if count > 1)
 
+    @staticmethod
+    def combineIds(fileIdSets: list[np.ndarray], numFiles: int) -> np.ndarray:
+        return np.flatnonzero(countPostings(fileIdSets, numFiles) > 1)
+
 
 CombineMode = CombineModeUnion | CombineModeIntersection | CombineModeExclusive | CombineModeMultiple
 
@@ -728,54 +769,128 @@ class StatsLoadTask(QRunnable):
         print(f"Stats {self.name}: Read {nr}/{count} items in {tDiff:.2f} ms")
         self.signals.progress.emit(nr, count)
 
-    def map_multiproc(self, items: Iterable[TIn], count: int, func: Callable[[TIn], TOut], chunkSize: int, numProcesses: int) -> Generator[TOut]:
-        from multiprocessing.pool import Pool
-        from multiprocessing.context import TimeoutError
+    def map_multiproc(self, items: list[TIn], count: int, func: Callable[[TIn], TOut]) -> Generator[TOut]:
         from itertools import chain
+        results = (values for chunk, values in self._mapPool(items, func, ResultPacker()))
+        yield from self.map(chain.from_iterable(results), count, lambda x: x)
 
-        # Sometimes the subprocesses freeze which also leaves the thread waiting and the application lingering even after closing.
-        # Use timeout to prevent that.
-        def imap(pool: Pool, func: Callable, items: Iterable):
-            it = pool.imap_unordered(func, items, 1)  # Returns IMapIterator only when chunk size is 1, needed for timeout
+    def map_multiproc_values(self, items: list[TIn], count: int, func: Callable, packer: ResultPacker, bulk: bool = False) -> Generator[tuple[TIn, TOut]]:
+        'Only transfers the packed values back from the workers and yields them paired with their input items.'
+        from itertools import chain
+        results = (zip(chunk, values) for chunk, values in self._mapPool(items, func, packer, bulk))
+        yield from self.map(chain.from_iterable(results), count, lambda x: x)
+
+    def map_bulk(self, items: list[TIn], count: int, func: Callable[[list[TIn]], list[TOut]], chunkSize: int) -> Generator[tuple[TIn, TOut]]:
+        'Calls the function with chunks of items and yields the results paired with their input items.'
+        from itertools import chain
+        results = (zip(chunk, func(chunk)) for chunk in (items[i:i+chunkSize] for i in range(0, len(items), chunkSize)))
+        yield from self.map(chain.from_iterable(results), count, lambda x: x)
+
+    def _mapPool(self, items: list[TIn], func: Callable, packer: ResultPacker, bulk: bool = False) -> Generator[tuple[list[TIn], list[TOut]]]:
+        from queue import SimpleQueue, Empty
+
+        pool, numProcesses = StatsProcessPool.get()
+        maxPending = numProcesses * 2
+        chunkFunc = ChunkFunctor(func, packer, bulk)
+        chunkSize = AdaptiveChunkSize()
+
+        results = SimpleQueue()
+        numPending = 0
+        start = 0
+
+        while True:
+            while numPending < maxPending and start < len(items):
+                chunk = items[start:start+chunkSize.size]
+                start += len(chunk)
+                numPending += 1
+                pool.apply_async(chunkFunc, (chunk,),
+                    callback=lambda result, chunk=chunk: results.put((chunk, result)),
+                    error_callback=lambda ex: results.put((None, ex))
+                )
+
+            if numPending == 0:
+                break
+
+            # Sometimes the subprocesses freeze which also leaves the thread waiting and the application lingering even after closing.
+            # Use timeout to prevent that.
             try:
-                while True:
-                    yield it.next(self.MULTIPROC_TIMEOUT)
-            except TimeoutError:
+                chunk, result = results.get(timeout=self.MULTIPROC_TIMEOUT)
+            except Empty:
                 print(f"Error while loading stats for {self.name}: Timeout")
                 self.signals.fail.emit()
-            except StopIteration:
-                pass
+                StatsProcessPool.reset(pool)
+                return
+
+            numPending -= 1
+            if chunk is None:
+                raise result
 
-        with Pool(numProcesses) as pool:
-            chunkGen = self.iterChunks(items, chunkSize)
-            imapGen = imap(pool, ChunkFunctor(func), chunkGen)
-            yield from self.map(chain.from_iterable(imapGen), count, lambda x: x)
+            packed, elapsedNs = result
+            chunkSize.update(len(chunk), elapsedNs)
+            yield chunk, packer.unpack(packed)
 
     def map_auto(self, items: list[TIn], func: Callable[[TIn], TOut], chunkSize: int = 128) -> Generator[TOut]:
-        count   = len(items)
-        numProc = 1 + (count // (chunkSize*4))
-        numProc = min(numProc, Config.galleryThumbnailThreads)
+        'Uses the shared process pool when there are at least 4 chunks. The chunk size is then adapted to the measured load time.'
+        count = len(items)
+        singleProcess = count < chunkSize*4 or Config.galleryThumbnailThreads < 2
 
-        if numProc > 1:
-            return self.map_multiproc(items, count, func, chunkSize, numProc)
-        else:
+        # Load functors read their files in chunks
+        if isinstance(func, CachedLoadFunctor):
+            if singleProcess:
+                return self.map_bulk(items, count, func.loadValues, chunkSize)
+            return self.map_multiproc_values(items, count, func.loadValues, func.packer, bulk=True)
+
+        if singleProcess:
             return self.map(items, count, func)
+        return self.map_multiproc(items, count, func)
 
-    def iterate(self, items: list[TIn]) -> Generator[TIn]:
-        return self.map(items, len(items), lambda x: x)
+    def map_cached(self, items: list[str], func: CachedLoadFunctor, chunkSize: int = 128, persistent: PersistentCache | None = None) -> Generator[tuple[str, Any]]:
+        '''
+        Yields cached values of unchanged files first, then loads the changed files with map_auto() and updates the cache.
+        The optional persistent cache is checked before loading, and it's updated and saved afterwards.
+        '''
 
-    @staticmethod
-    def iterChunks(items: Iterable[TIn], chunkSize) -> Generator[list[TIn]]:
-        from itertools import islice  # Python 3.12 has 'batched'
-        it = iter(items)
-        while chunk := list(islice(it, chunkSize)):
-            yield chunk
+        section = StatsCache.getSection(func.getCacheKey())
+        staleFiles = list[str]()
+        staleStamps = dict[str, Any]()
 
+        count = len(items)
+        self.signals.progress.emit(0, count)
+        tStart = time.monotonic_ns()
+
+        for nr, file in enumerate(items, 1):
+            stamp = getFileStamp(func.getSourcePath(file))
+            valid, value = section.lookup(file, stamp)
+            if not valid and persistent:
+                valid, value = persistent.lookup(file, stamp)
+                if valid:
+                    section.store(file, stamp, value)
+
+            if valid:
+                yield file, value
+            else:
+                staleFiles.append(file)
+                staleStamps[file] = stamp
+
+            if nr & 255 == 0:
+                self.notifyProgress(nr, count)
+                if self.isAborted():
+                    return
 
+        tDiff = (time.monotonic_ns() - tStart) / 1_000_000
+        print(f"Stats {self.name}: Checked {count} items in {tDiff:.2f} ms ({count-len(staleFiles)} cached, {len(staleFiles)} changed)")
+        self.signals.progress.emit(count, count)
+        if not staleFiles:
+            return
 
-class ChunkFunctor:
-    def __init__(self, func: Callable):
-        self.func = func
+        for file, value in self.map_auto(staleFiles, func, chunkSize):
+            section.store(file, staleStamps[file], value)
+            if persistent:
+                persistent.store(file, staleStamps[file], value)
+            yield file, value
 
-    def __call__(self, items: Iterable) -> list:
-        return [self.func(x) for x in items]
+        if persistent:
+            persistent.save()
+
+    def iterate(self, items: list[TIn]) -> Generator[TIn]:
+        return self.map(items, len(items), lambda x: x)
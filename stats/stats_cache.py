@@ -0,0 +1,91 @@
+from __future__ import annotations
+from typing import Any, Hashable, Protocol
+from collections import OrderedDict
+from PySide6.QtCore import QMutex, QMutexLocker
+from lib.util import FileStamp
+from .stats_pool import ResultPacker
+
+
+
+class StatsCacheSection:
+    'Facts extracted from files with one set of load parameters.'
+
+    def __init__(self):
+        self.entries: dict[str, tuple[FileStamp, Any]] = dict()
+
+    def lookup(self, file: str, stamp: FileStamp) -> tuple[bool, Any]:
+        entry = self.entries.get(file)
+        if entry is not None and entry[0] == stamp:
+            return True, entry[1]
+        return False, None
+
+    def store(self, file: str, stamp: FileStamp, value: Any):
+        self.entries[file] = (stamp, value)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class StatsCache:
+    '''
+    Process-wide store for facts which the stats tabs extract from files (tags, sizes, mask histograms, JSON keys).
+    Entries are validated with size and mtime of the file they were read from, so reloads only re-read changed files.
+    '''
+
+    MAX_SECTIONS = 12
+
+    _mutex = QMutex()
+    _sections: OrderedDict[Hashable, StatsCacheSection] = OrderedDict()
+
+    @classmethod
+    def getSection(cls, key: Hashable) -> StatsCacheSection:
+        with QMutexLocker(cls._mutex):
+            section = cls._sections.get(key)
+            if section is None:
+                cls._sections[key] = section = StatsCacheSection()
+                while len(cls._sections) > cls.MAX_SECTIONS:
+                    cls._sections.popitem(last=False)
+            else:
+                cls._sections.move_to_end(key)
+            return section
+
+    @classmethod
+    def clear(cls):
+        with QMutexLocker(cls._mutex):
+            cls._sections.clear()
+
+
+
+class PersistentCache(Protocol):
+    'Stores values on disk across sessions, with the same validation as StatsCacheSection.'
+
+    def lookup(self, file: str, stamp: FileStamp) -> tuple[bool, Any]: ...
+    def store(self, file: str, stamp: FileStamp, value: Any): ...
+    def save(self): ...
+
+
+
+class CachedLoadFunctor:
+    '''
+    Base for pickleable load functors whose results are stored in the StatsCache.
+    The value must only depend on the cache key and the content of the source file.
+    '''
+
+    # Compact representation for transferring values from worker processes
+    packer = ResultPacker()
+
+    def getCacheKey(self) -> Hashable:
+        raise NotImplementedError()
+
+    def getSourcePath(self, file: str) -> str:
+        return file
+
+    def loadValue(self, file: str) -> Any:
+        raise NotImplementedError()
+
+    def loadValues(self, files: list[str]) -> list[Any]:
+        'Loads a chunk of files. Override to read files in bulk.'
+        return [self.loadValue(file) for file in files]
+
+    def __call__(self, file: str) -> tuple[str, Any]:
+        return file, self.loadValue(file)
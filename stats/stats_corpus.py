@@ -0,0 +1,86 @@
+from __future__ import annotations
+from typing import Iterable
+from array import array
+from collections import defaultdict
+import numpy as np
+
+
+class FileCorpus:
+    '''
+    Interned file paths of one stats load. Files are referenced by their id, which is the index into the file list.
+    Sets of files are stored as sorted int32 id arrays (postings), so combining them doesn't need to hash paths.
+    The files should already be sorted (FileList keeps them in path order), then sorted ids also yield sorted paths.
+    '''
+
+    def __init__(self, files: list[str]):
+        self.files = files
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def createIdMap(self) -> dict[str, int]:
+        return {file: i for i, file in enumerate(self.files)}
+
+    def getFiles(self, ids: np.ndarray) -> list[str]:
+        files = self.files
+        return [files[i] for i in ids.tolist()]
+
+    def getFileSet(self, ids: np.ndarray) -> set[str]:
+        files = self.files
+        return set(files[i] for i in ids.tolist())
+
+
+class PostingsBuilder:
+    'Collects (key, file id) pairs with interned keys and builds deduplicated postings for each key.'
+
+    def __init__(self):
+        self.keys = defaultdict[str, int]()
+        self.keys.default_factory = self.keys.__len__  # Assign next id to new keys
+
+        # Compact buffers: One entry per key occurrence, one entry per file
+        self._keyIds    = array("q")
+        self._fileIds   = array("q")
+        self._fileSizes = array("q")
+
+    def add(self, fileId: int, keys: Iterable[str]):
+        numBefore = len(self._keyIds)
+        self._keyIds.extend(map(self.keys.__getitem__, keys))
+        self._fileIds.append(fileId)
+        self._fileSizes.append(len(self._keyIds) - numBefore)
+
+    def build(self) -> tuple[list[str], list[np.ndarray], np.ndarray]:
+        '''
+        Returns the keys, the sorted file ids for each key (views into one shared array),
+        and the number of occurrences for each key including duplicates within a file.
+        '''
+
+        keys = list(self.keys)
+        if not keys:
+            return keys, [], np.zeros(0, dtype=np.int64)
+
+        keyIds  = np.frombuffer(self._keyIds, dtype=np.int64)
+        fileIds = np.repeat(np.frombuffer(self._fileIds, dtype=np.int64), np.frombuffer(self._fileSizes, dtype=np.int64))
+
+        occurrences = np.bincount(keyIds, minlength=len(keys))
+
+        # Sort by key, then by file, and remove duplicates
+        combined = np.sort((keyIds << 32) | fileIds)
+        del keyIds, fileIds
+        if len(combined) > 1:
+            unique = np.empty(len(combined), dtype=np.bool_)
+            unique[0] = True
+            np.not_equal(combined[1:], combined[:-1], out=unique[1:])
+            combined = combined[unique]
+
+        keyIds = combined >> 32
+        postings = (combined & 0xFFFFFFFF).astype(np.int32)
+        splitPos = np.cumsum(np.bincount(keyIds, minlength=len(keys)))[:-1]
+        return keys, np.split(postings, splitPos), occurrences
+
+
+def countPostings(postings: list[np.ndarray], numFiles: int) -> np.ndarray:
+    'Returns how many of the postings contain each file id. The postings must not have duplicates.'
+    counts = np.zeros(numFiles, dtype=np.int32)
+    for ids in postings:
+        counts[ids] += 1
+    return counts
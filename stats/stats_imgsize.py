@@ -2,9 +2,13 @@ from __future__ import annotations
 from typing_extensions import override
 from PySide6 import QtWidgets, QtGui
 from PySide6.QtCore import Qt, Slot, QAbstractItemModel, QModelIndex
-from lib import colorlib, imagerw, videorw, qtlib
+from lib import colorlib, qtlib
+from lib.mediasize import MediaSizeCache, readMediaSize
 from ui.tab import ImgTab
+from config import Config
 from .stats_base import StatsLayout, StatsTableView, StatsLoadGroupBox, StatsBaseProxyModel, StatsLoadTask, ExportCsv
+from .stats_cache import CachedLoadFunctor
+from .stats_pool import IntTuplePacker
 
 
 class ImageSizeStats(QtWidgets.QWidget):
@@ -83,7 +87,7 @@ class SizeBucketStatsLoadTask(StatsLoadTask):
         summary = SizeBucketSummary()
         buckets: dict[tuple[int, int, int], SizeBucketData] = dict()
 
-        for file, size in self.map_auto(self.files, self.readSize, chunkSize=32):
+        for file, size in self.map_cached(self.files, SizeLoadFunctor(), chunkSize=32, persistent=MediaSizeCache()):
             summary.addFile(size)
             bucket = buckets.get(size)
             if not bucket:
@@ -93,15 +97,20 @@ class SizeBucketStatsLoadTask(StatsLoadTask):
         summary.finalize(len(buckets))
         return list(buckets.values()), summary
 
-    @staticmethod
-    def readSize(file: str) -> tuple[str, tuple[int, int, int]]:
-        if videorw.isVideoFile(file):
-            w, h, _, frames, _ = videorw.readMetadata(file)
-        else:
-            w, h = imagerw.readSize(file)
-            frames = 0
 
-        return file, (w, h, frames)
+class SizeLoadFunctor(CachedLoadFunctor):
+    packer = IntTuplePacker()
+
+    def __init__(self):
+        self.exifTransform = Config.exifTransform
+
+    @override
+    def getCacheKey(self) -> tuple:
+        return ("size", self.exifTransform)
+
+    @override
+    def loadValue(self, file: str) -> tuple[int, int, int]:
+        return readMediaSize(file)
 
 
 
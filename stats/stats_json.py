@@ -1,11 +1,16 @@
 from __future__ import annotations
 from typing_extensions import override
-import json, os
+from typing import Generator
+import os
 from PySide6 import QtWidgets
 from PySide6.QtCore import Qt, Slot, QAbstractItemModel, QModelIndex
 import lib.qtlib as qtlib
+from lib.captionstore import CaptionStore
+from lib.bulkread import BulkReader, parseJson
 from ui.tab import ImgTab
 from .stats_base import StatsLayout, StatsTableView, StatsLoadGroupBox, StatsBaseProxyModel, StatsLoadTask, ExportCsv
+from .stats_cache import CachedLoadFunctor
+from .stats_pool import StringTuplePacker
 
 
 class JsonStats(QtWidgets.QWidget):
@@ -69,7 +74,7 @@ class JsonStatsLoadTask(StatsLoadTask):
         summary = JsonKeySummary()
 
         keyData: dict[str, JsonKeyData] = dict()
-        for file, keys in self.map_auto(self.files, self.loadJsonKeys):
+        for file, keys in self.loadKeys():
             if keys is None:
                 continue
 
@@ -83,19 +88,63 @@ class JsonStatsLoadTask(StatsLoadTask):
         summary.finalize(len(keyData))
         return list(keyData.values()), summary
 
-    @classmethod
-    def loadJsonKeys(cls, imgFile: str) -> tuple[str, list[str] | None]:
+
+    def loadKeys(self) -> Generator[tuple[str, tuple[str, ...] | None]]:
+        'Files in folders with a CaptionStore are read in bulk queries, JSON files are loaded in the worker pool and cached.'
+        jsonPaths = [JsonKeysLoadFunctor.getJsonPath(file) for file in self.files]
+        storeIndices, fileIndices = CaptionStore.groupByStore(jsonPaths)
+
+        for store, indices in storeIndices.items():
+            values = store.getMany(jsonPaths[i] for i in indices)
+            for i in indices:
+                yield self.files[i], JsonKeysLoadFunctor.getKeys(values.get(jsonPaths[i]))
+
+        if fileIndices:
+            yield from self.map_cached([self.files[i] for i in fileIndices], JsonKeysLoadFunctor())
+
+
+
+class JsonKeysLoadFunctor(CachedLoadFunctor):
+    packer = StringTuplePacker()
+
+    @override
+    def getCacheKey(self) -> str:
+        return "json-keys"
+
+    @override
+    def getSourcePath(self, file: str) -> str:
+        return self.getJsonPath(file)
+
+    @staticmethod
+    def getJsonPath(file: str) -> str:
+        return os.path.splitext(file)[0] + ".json"
+
+    @override
+    def loadValue(self, imgFile: str) -> tuple[str, ...] | None:
         try:
-            jsonFile = os.path.splitext(imgFile)[0] + ".json"
-            with open(jsonFile, 'r') as file:
-                data = json.load(file)
+            return self.readKeys(self.getSourcePath(imgFile))
         except FileNotFoundError:
-            return imgFile, None
+            return None
+
+    @override
+    def loadValues(self, imgFiles: list[str]) -> list[tuple[str, ...] | None]:
+        return BulkReader.read([self.getSourcePath(file) for file in imgFiles], self.readKeys)
+
+    @classmethod
+    def readKeys(cls, path: str) -> tuple[str, ...] | None:
+        with open(path, 'rb') as file:
+            data = parseJson(file.read())
+        return cls.getKeys(data)
+
+    @classmethod
+    def getKeys(cls, data: dict | None) -> tuple[str, ...] | None:
+        if data is None:
+            return None
 
         keys: list[str] = list()
         if isinstance(data, dict):
             cls.walkJsonData(keys, "", data)
-        return imgFile, keys
+        return tuple(keys)
 
     @classmethod
     def walkJsonData(cls, keys: list[str], keyPath: str, data: dict) -> None:
@@ -1,16 +1,19 @@
 from __future__ import annotations
 import os
 from enum import Enum
-from typing import Generator, NamedTuple
+from typing import Any, Generator, NamedTuple
 from typing_extensions import override
 from PySide6 import QtWidgets, QtGui
 from PySide6.QtCore import Qt, Slot, QAbstractItemModel, QModelIndex
+import numpy as np
 import cv2 as cv
 from lib import colorlib, imagerw, qtlib
 from ui.tab import ImgTab
 from ui.export_settings import PathSettings, ExportVariableParser
 from config import Config
 from .stats_base import StatsLayout, StatsTableView, StatsLoadGroupBox, StatsBaseProxyModel, StatsLoadTask, ExportCsv
+from .stats_cache import CachedLoadFunctor
+from .stats_pool import OptionalArrayPairPacker, OptionalIntPacker
 
 
 # TODO: Region Position (how centered)
@@ -201,7 +204,8 @@ class MaskStatsLoadTask(StatsLoadTask):
         summary = MaskSummary(self.statsType)
 
         values: list[MaskValue] = list()
-        for file, value in self.map_auto(self.files, self.loadFunc, chunkSize=24):
+        for file, fact in self.map_cached(self.files, self.loadFunc, chunkSize=24):
+            value = self.loadFunc.toValue(fact)
             values.append(MaskValue(file, value))
             summary.addFile(value)
 
@@ -260,27 +264,35 @@ def makeBinsPerValue(values: list[MaskValue]) -> Generator[list[MaskValue]]:
 
 
 
-class MaskLoadFunctor:
+class MaskLoadFunctor(CachedLoadFunctor):
     def __init__(self, pathTemplate: str, threshold: int | None):
         self.pathTemplate = pathTemplate
+        self.pathExport = Config.pathExport
         self.parser = ExportVariableParser()
         self.threshold = threshold
 
-    def __call__(self, file: str) -> tuple[str, float]:
+    @override
+    def getSourcePath(self, file: str) -> str:
         self.parser.setup(file)
-        maskPath = self.parser.parsePath(self.pathTemplate, overwriteFiles=True)
+        return self.parser.parsePath(self.pathTemplate, overwriteFiles=True)
 
+    @override
+    def loadValue(self, file: str) -> Any:
+        maskPath = self.getSourcePath(file)
         if not os.path.isfile(maskPath):
-            return file, -1
+            return None
 
         mat = imagerw.loadMatBGR(maskPath, rgb=True)
         if len(mat.shape) > 2:
             mat = mat[..., 0].copy() # First channel (red), make copy to allow inplace operations
 
-        val = self._processMask(mat)
-        return file, val
+        return self._processMask(mat)
+
+    def _processMask(self, mat) -> Any:
+        raise NotImplementedError()
 
-    def _processMask(self, mat) -> float:
+    def toValue(self, fact: Any | None) -> float:
+        'Returns the stat value from the cached mask facts, or -1 for missing masks.'
         raise NotImplementedError()
 
     def getValueRanges(self, values: list[MaskValue]) -> Generator[list[MaskValue]]:
@@ -288,19 +300,34 @@ class MaskLoadFunctor:
 
 
 class MaskAreaLoadFunctor(MaskLoadFunctor):
+    packer = OptionalArrayPairPacker()
+
     def __init__(self, pathTemplate: str, threshold: int | None, numBins: int = 20):
         super().__init__(pathTemplate, threshold)
         self.numBins = max(numBins-2, 1)
 
-    def _processMask(self, mat) -> float:
-        if self.threshold is not None:
-            cv.threshold(mat, self.threshold, 255, cv.THRESH_BINARY, dst=mat)
+    @override
+    def getCacheKey(self) -> tuple:
+        # Threshold is applied to the cached histogram
+        return ("mask-histogram", self.pathTemplate, self.pathExport)
+
+    @override
+    def _processMask(self, mat) -> tuple[np.ndarray, np.ndarray]:
+        # Sparse histogram: Only store non-empty bins and their pixel counts
+        hist = np.bincount(mat.ravel(), minlength=256)
+        bins = np.flatnonzero(hist)
+        return bins.astype(np.uint8), hist[bins]
 
-        count = cv.countNonZero(mat)
+    @override
+    def toValue(self, fact: tuple[np.ndarray, np.ndarray] | None) -> float:
+        if fact is None:
+            return -1
 
-        h, w = mat.shape
-        filledArea = count / (w * h)
-        return filledArea
+        # Same as cv.threshold with THRESH_BINARY followed by cv.countNonZero
+        bins, counts = fact
+        threshold = 0 if self.threshold is None else self.threshold
+        filledArea = counts[bins > threshold].sum() / counts.sum()
+        return float(filledArea)
 
     def getValueRanges(self, values: list[MaskValue]) -> Generator[list[MaskValue]]:
         if not values:
@@ -332,6 +359,8 @@ class MaskAreaLoadFunctor(MaskLoadFunctor):
 
 
 class MaskRegionLoadFunctor(MaskLoadFunctor):
+    packer = OptionalIntPacker()
+
     def __init__(self, pathTemplate: str, threshold: int | None, blackRegions=False):
         super().__init__(pathTemplate, threshold)
         self.blackRegions = blackRegions
@@ -339,7 +368,12 @@ class MaskRegionLoadFunctor(MaskLoadFunctor):
         if blackRegions:
             self.threshold = 1 if threshold is None else max(threshold, 1)
 
-    def _processMask(self, mat) -> float:
+    @override
+    def getCacheKey(self) -> tuple:
+        return ("mask-regions", self.pathTemplate, self.pathExport, self.threshold, self.blackRegions)
+
+    @override
+    def _processMask(self, mat) -> int:
         if self.blackRegions:
             cv.threshold(mat, self.threshold, 255, cv.THRESH_BINARY, dst=mat)
             cv.bitwise_not(mat, dst=mat)
@@ -350,6 +384,10 @@ class MaskRegionLoadFunctor(MaskLoadFunctor):
         numRegions -= 1
         return numRegions
 
+    @override
+    def toValue(self, fact: int | None) -> float:
+        return -1 if fact is None else fact
+
     def getValueRanges(self, values: list[MaskValue]) -> Generator[list[MaskValue]]:
         if values:
             yield from makeBinsPerValue(values)
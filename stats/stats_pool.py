@@ -0,0 +1,181 @@
+from __future__ import annotations
+import sys, time
+from typing import Any, Callable
+from multiprocessing.pool import Pool
+import numpy as np
+from PySide6.QtCore import QMutex, QMutexLocker
+from config import Config
+
+
+class StatsProcessPool:
+    '''
+    Warm worker processes shared by all stats tabs.
+    The pool is started on first use and kept alive until shutdown, or until it's reset after a timeout.
+    '''
+
+    _mutex = QMutex()
+    _pool: Pool | None = None
+    _numProcesses = 0
+
+    @classmethod
+    def get(cls) -> tuple[Pool, int]:
+        with QMutexLocker(cls._mutex):
+            if cls._pool is None:
+                cls._numProcesses = max(Config.galleryThumbnailThreads, 2)
+                cls._pool = Pool(cls._numProcesses)
+            return cls._pool, cls._numProcesses
+
+    @classmethod
+    def reset(cls, pool: Pool):
+        'Terminates frozen workers. The next load will start a new pool.'
+        with QMutexLocker(cls._mutex):
+            if cls._pool is pool:
+                cls._pool = None
+        pool.terminate()
+
+    @classmethod
+    def shutdown(cls):
+        with QMutexLocker(cls._mutex):
+            if cls._pool is not None:
+                cls._pool.close()
+                cls._pool.terminate()
+                cls._pool = None
+
+
+
+class AdaptiveChunkSize:
+    'Chooses the number of items per chunk from the per-item cost measured in the workers.'
+
+    TARGET_CHUNK_NS = 150_000_000
+    MIN_SIZE = 4
+    MAX_SIZE = 4096
+
+    INITIAL_SIZE = 16
+
+    def __init__(self, initialSize: int = INITIAL_SIZE):
+        self.size = max(min(initialSize, self.MAX_SIZE), self.MIN_SIZE)
+        self._nsPerItem = 0.0
+
+    def update(self, numItems: int, elapsedNs: int):
+        if numItems <= 0:
+            return
+
+        nsPerItem = elapsedNs / numItems
+        if self._nsPerItem:
+            self._nsPerItem += 0.3 * (nsPerItem - self._nsPerItem)  # Exponential moving average
+        else:
+            self._nsPerItem = nsPerItem
+
+        size = int(self.TARGET_CHUNK_NS / (self._nsPerItem + 1))
+        self.size = max(min(size, self.MAX_SIZE), self.MIN_SIZE)
+
+
+
+# Pickleable
+class ChunkFunctor:
+    'Runs in the worker processes. Returns the packed results of a chunk and the processing time.'
+
+    def __init__(self, func: Callable, packer: ResultPacker, bulk: bool = False):
+        'With bulk=True, the function is called once per chunk and returns a list of results.'
+        self.func = func
+        self.packer = packer
+        self.bulk = bulk
+
+    def __call__(self, items: list) -> tuple[Any, int]:
+        tStart = time.monotonic_ns()
+        results = self.func(items) if self.bulk else [self.func(x) for x in items]
+        return self.packer.pack(results), time.monotonic_ns() - tStart
+
+
+
+class ResultPacker:
+    'Converts a list of results into a compact form for the transfer from the worker processes.'
+
+    def pack(self, values: list) -> Any:
+        return values
+
+    def unpack(self, packed: Any) -> list:
+        return packed
+
+
+class StringTuplePacker(ResultPacker):
+    'For values of type tuple[str, ...] | None. Transfers a vocabulary with string ids instead of repeated strings.'
+
+    def pack(self, values: list[tuple[str, ...] | None]) -> tuple[list[str], np.ndarray, np.ndarray]:
+        vocab = dict[str, int]()
+        ids = list[int]()
+        lengths = np.full(len(values), -1, dtype=np.int32)
+
+        for i, strings in enumerate(values):
+            if strings is not None:
+                lengths[i] = len(strings)
+                for s in strings:
+                    id = vocab.get(s)
+                    if id is None:
+                        vocab[s] = id = len(vocab)
+                    ids.append(id)
+
+        return list(vocab), np.array(ids, dtype=np.int32), lengths
+
+    def unpack(self, packed: tuple[list[str], np.ndarray, np.ndarray]) -> list[tuple[str, ...] | None]:
+        vocab, ids, lengths = packed
+        vocab = [sys.intern(s) for s in vocab]
+        strings = [vocab[id] for id in ids.tolist()]
+
+        values = list[tuple[str, ...] | None]()
+        start = 0
+        for length in lengths.tolist():
+            if length < 0:
+                values.append(None)
+            else:
+                end = start + length
+                values.append(tuple(strings[start:end]))
+                start = end
+        return values
+
+
+class IntTuplePacker(ResultPacker):
+    'For values of type tuple[int, ...] with fixed length.'
+
+    def pack(self, values: list[tuple[int, ...]]) -> np.ndarray:
+        return np.array(values, dtype=np.int64)
+
+    def unpack(self, packed: np.ndarray) -> list[tuple[int, ...]]:
+        return [tuple(row) for row in packed.tolist()]
+
+
+class OptionalIntPacker(ResultPacker):
+    'For values of type int | None. Negative values are not allowed.'
+
+    def pack(self, values: list[int | None]) -> np.ndarray:
+        return np.array([-1 if v is None else v for v in values], dtype=np.int64)
+
+    def unpack(self, packed: np.ndarray) -> list[int | None]:
+        return [None if v < 0 else v for v in packed.tolist()]
+
+
+class OptionalArrayPairPacker(ResultPacker):
+    'For values of type tuple[np.ndarray, np.ndarray] | None where both 1D arrays have the same length.'
+
+    def pack(self, values: list[tuple[np.ndarray, np.ndarray] | None]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lengths = np.array([-1 if v is None else len(v[0]) for v in values], dtype=np.int32)
+        present = [v for v in values if v is not None]
+        if present:
+            first  = np.concatenate([v[0] for v in present])
+            second = np.concatenate([v[1] for v in present])
+        else:
+            first = second = np.empty(0)
+        return first, second, lengths
+
+    def unpack(self, packed: tuple[np.ndarray, np.ndarray, np.ndarray]) -> list[tuple[np.ndarray, np.ndarray] | None]:
+        first, second, lengths = packed
+        values = list[tuple[np.ndarray, np.ndarray] | None]()
+        start = 0
+        for length in lengths.tolist():
+            if length < 0:
+                values.append(None)
+            else:
+                end = start + length
+                values.append((first[start:end].copy(), second[start:end].copy()))
+                start = end
+        return values
@@ -1,9 +1,11 @@
 from __future__ import annotations
-from typing import Iterable, Callable
+from typing import Iterable, Callable, Generator
+import numpy as np
 from typing_extensions import override
 from PySide6 import QtWidgets, QtGui
 from PySide6.QtCore import Qt, Slot, Signal, QAbstractItemModel, QModelIndex
-from lib.captionfile import FileTypeSelector
+from lib.captionfile import FileTypeSelector, CaptionBulkLoader
+from lib.captionstore import CaptionStore
 from lib.util import CaptionSplitter
 import lib.qtlib as qtlib
 from ui.tab import ImgTab
@@ -14,6 +16,9 @@ from caption.caption_groups import CaptionControlGroup
 from caption.caption_preset import CaptionPreset, CaptionPresetConditional, MutualExclusivity
 from caption.caption_highlight import MatcherNode
 from .stats_base import StatsLayout, StatsTableView, StatsLoadGroupBox, StatsBaseProxyModel, StatsLoadTask, ExportCsv
+from .stats_cache import CachedLoadFunctor
+from .stats_pool import StringTuplePacker
+from .stats_corpus import FileCorpus, PostingsBuilder
 
 
 class TagStats(QtWidgets.QWidget):
@@ -71,14 +76,15 @@ class TagStats(QtWidgets.QWidget):
 
     def _createTask(self):
         try:
-            matchNode = self._getMatcherNode() if self.chkSplitCombined.isChecked() else None
+            matchCaptions = self._getMatcherCaptions() if self.chkSplitCombined.isChecked() else None
         except ValueError:
             return None
 
         files = self.tab.filelist.getFiles().copy()
-        return TagStatsLoadTask(files, self.captionSrc.createLoadFunc(), self.txtSepChars.text(), matchNode)
+        loadFunc = TagsLoadFunctor(self.captionSrc.createLoadFunc(), (self.captionSrc.type, self.captionSrc.name), self.txtSepChars.text(), matchCaptions)
+        return TagStatsLoadTask(files, loadFunc)
 
-    def _getMatcherNode(self) -> MatcherNode:
+    def _getMatcherCaptions(self) -> tuple[str, ...]:
         captionWin: CaptionContainer | None = self.tab.getWindowContent("caption")
         if not captionWin:
             msgText = 'Splitting combined tags needs the group definitions from the Caption Window, which is not open.\n\n' \
@@ -86,11 +92,11 @@ class TagStats(QtWidgets.QWidget):
             QtWidgets.QMessageBox.information(self, "Caption Window not open", msgText)
             raise ValueError()
 
-        matchNode = MatcherNode[bool]()
-        for group in captionWin.ctx.groups.groups:
-            for caption in group.captionsExpandWildcards:
-                matchNode.add(caption, True)
-        return matchNode
+        return tuple(
+            caption
+            for group in captionWin.ctx.groups.groups
+            for caption in group.captionsExpandWildcards
+        )
 
     @Slot()
     def _onDataLoaded(self, tags: list[TagData], summary: TagSummary):
@@ -126,59 +132,118 @@ class TagStats(QtWidgets.QWidget):
 
 
 class TagStatsLoadTask(StatsLoadTask):
-    def __init__(self, files: list[str], loadCaption: Callable[[str], str | None], sepChars: str, matchNode: MatcherNode | None):
+    def __init__(self, files: list[str], loadTags: TagsLoadFunctor):
         super().__init__("Tag Count")
         self.files = files
-        self.loadTags = TagsLoadFunctor(loadCaption, sepChars, matchNode)
+        self.loadTags = loadTags
 
     def runLoad(self) -> tuple[list[TagData], TagSummary]:
         summary = TagSummary()
+        corpus = FileCorpus(self.files)
+        fileIds = corpus.createIdMap()
+        postings = PostingsBuilder()
 
-        tagData: dict[str, TagData] = dict()
-        for file, tags in self.map_auto(self.files, self.loadTags):
+        for file, tags in self.loadTagsCached():
             if not tags:
                 continue
 
             summary.addFile(tags)
+            postings.add(fileIds[file], tags)
 
-            for tag in tags:
-                data = tagData.get(tag)
-                if not data:
-                    tagData[tag] = data = TagData(tag)
-                data.addFile(file)
+        del fileIds
+        tags, tagFileIds, tagCounts = postings.build()
+        tagData = [
+            TagData(tag, corpus, ids, count)
+            for tag, ids, count in zip(tags, tagFileIds, tagCounts.tolist())
+        ]
 
         summary.finalize(len(tagData))
-        return list(tagData.values()), summary
+        return tagData, summary
+
+    def loadTagsCached(self) -> Generator[tuple[str, tuple[str, ...] | None]]:
+        '''
+        Captions in folders with a CaptionStore are loaded in bulk queries without caching:
+        Their JSON path doesn't exist, so the file stamp wouldn't change when captions are edited.
+        '''
+        if self.loadTags.captionKey[0] == FileTypeSelector.TYPE_TXT:
+            yield from self.map_cached(self.files, self.loadTags)
+            return
+
+        captionPaths = [self.loadTags.getSourcePath(file) for file in self.files]
+        storeIndices, fileIndices = CaptionStore.groupByStore(captionPaths)
+
+        if storeIndices:
+            storeFiles = [self.files[i] for indices in storeIndices.values() for i in indices]
+            yield from self.map_bulk(storeFiles, len(storeFiles), self.loadTags.loadValues, 512)
+
+        if fileIndices:
+            yield from self.map_cached([self.files[i] for i in fileIndices], self.loadTags)
+
 
+class TagsLoadFunctor(CachedLoadFunctor):
+    packer = StringTuplePacker()
 
-class TagsLoadFunctor:
-    def __init__(self, loadCaption: Callable[[str], str | None], sepChars: str, matchNode: MatcherNode | None):
+    def __init__(self, loadCaption: Callable[[str], str | None], captionKey: tuple[str, str], sepChars: str, matchCaptions: tuple[str, ...] | None):
         self.loadCaption = loadCaption
+        self.captionKey = captionKey
+        self.sepChars = sepChars
         self.splitter = CaptionSplitter(sepChars)
-        self.matchNode = matchNode
+        self.matchCaptions = matchCaptions
+
+        if matchCaptions:
+            self.matchNode = MatcherNode[bool]()
+            for caption in matchCaptions:
+                self.matchNode.add(caption, True)
+        else:
+            self.matchNode = None
+
+    @override
+    def getCacheKey(self) -> tuple:
+        return ("tags", self.captionKey, self.sepChars, self.matchCaptions)
+
+    @override
+    def getSourcePath(self, file: str) -> str:
+        return FileTypeSelector.getCaptionPath(self.captionKey[0], file)
 
-    def __call__(self, file: str) -> tuple[str, list[str] | None]:
+    @override
+    def loadValue(self, file: str) -> tuple[str, ...] | None:
         caption = self.loadCaption(file)
         if not caption:
-            return file, None
+            return None
+
+        return self.splitTags(caption)
+
+    @override
+    def loadValues(self, files: list[str]) -> list[tuple[str, ...] | None]:
+        if not isinstance(self.loadCaption, CaptionBulkLoader):
+            return super().loadValues(files)
 
+        captions = self.loadCaption.loadMany(files)
+        return [self.splitTags(caption) if caption else None for caption in captions]
+
+    def splitTags(self, caption: str) -> tuple[str, ...]:
         tags = self.splitter.split(caption)
         if self.matchNode:
-            tags = list(self.matchNode.splitAllPreserveExtra(tags))
-        return file, tags
+            tags = self.matchNode.splitAllPreserveExtra(tags)
+        return tuple(tags)
 
 
 
 class TagData:
-    def __init__(self, tag: str):
+    def __init__(self, tag: str, corpus: FileCorpus, fileIds: np.ndarray, count: int):
         self.tag = tag
-        self.count = 0
-        self.files: set[str] = set()
+        self.count = count
+        self.corpus = corpus
+        self.fileIds = fileIds  # Sorted, without duplicates
         self.color: QtGui.QColor | None = None
 
-    def addFile(self, file: str):
-        self.files.add(file)
-        self.count += 1
+    @property
+    def numFiles(self) -> int:
+        return len(self.fileIds)
+
+    @property
+    def files(self) -> set[str]:
+        return self.corpus.getFileSet(self.fileIds)
 
 
 class TagSummary:
@@ -192,7 +257,7 @@ class TagSummary:
         self.numFiles   = 0
         self.uniqueTags = 0
 
-    def addFile(self, tags: list[str]):
+    def addFile(self, tags: tuple[str, ...]):
         numTags = len(tags)
         self.totalNumTags += numTags
         self.minNumTags = min(self.minNumTags, numTags)
@@ -259,7 +324,7 @@ class TagModel(QAbstractItemModel):
                     case 2:
                         presence = 0
                         if self.summary.numFiles > 0:
-                            presence = len(tagData.files) / self.summary.numFiles
+                            presence = tagData.numFiles / self.summary.numFiles
                         return f"{presence*100:.2f} %"
 
             case Qt.ItemDataRole.FontRole: return self.font
@@ -271,7 +336,7 @@ class TagModel(QAbstractItemModel):
                 match index.column():
                     case 0: return tagData.tag
                     case 1: return tagData.count
-                    case 2: return len(tagData.files) / self.summary.numFiles if self.summary.numFiles else 0.0
+                    case 2: return tagData.numFiles / self.summary.numFiles if self.summary.numFiles else 0.0
 
         return None
 
@@ -302,6 +367,11 @@ class TagProxyModel(StatsBaseProxyModel):
         data: TagData = self.sourceModel().data(sourceIndex, TagModel.ROLE_DATA)
         return data.files
 
+    @override
+    def getFileIds(self, sourceIndex: QModelIndex) -> tuple[FileCorpus, np.ndarray] | None:
+        data: TagData = self.sourceModel().data(sourceIndex, TagModel.ROLE_DATA)
+        return data.corpus, data.fileIds
+
     def lessThan(self, left: QModelIndex, right: QModelIndex) -> bool:
         column = left.column()
         if column == right.column():
@@ -309,7 +379,7 @@ class TagProxyModel(StatsBaseProxyModel):
             dataRight: TagData = self.sourceModel().data(right, TagModel.ROLE_DATA)
             match column:
                 case 1: return dataRight.count < dataLeft.count
-                case 2: return len(dataRight.files) < len(dataLeft.files)
+                case 2: return dataRight.numFiles < dataLeft.numFiles
 
         return super().lessThan(left, right)
 
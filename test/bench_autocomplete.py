@@ -0,0 +1,79 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Benchmark for autocomplete startup. Usage: python test/bench_autocomplete.py [num_tags]
+
+import tempfile, time, random
+from config import Config
+from ui.autocomplete import NGramAutoCompleteSource, CsvAutoCompleteSource, CsvIndexCache, AutocompleteCsvLoader
+
+
+SEARCHES = ("long hair", "blu", "smiling", "sh", "holding umbrella", "x")
+
+
+def createCsv(path: str, numTags: int):
+    # Booru-like tag table: Tags with 1-3 words, Zipf-like frequencies, some aliases
+    words = ["".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=random.randrange(3, 9))) for _ in range(5000)]
+    words[:6] = ["long", "hair", "blue", "smiling", "holding", "umbrella"]
+    tags = set[str]()
+    while len(tags) < numTags:
+        tags.add("_".join(random.choices(words, k=random.choice((1, 2, 2, 3)))))
+
+    with open(path, 'w') as file:
+        for i, tag in enumerate(tags):
+            aliases = f"{tag}s,{tag}_(alt)" if random.random() < 0.1 else ""
+            file.write(f'{tag},{random.choice((0, 0, 0, 4, 5))},{10_000_000 // (i+1)},"{aliases}"\n')
+
+
+def startLegacy(folder: str) -> tuple[float, float, NGramAutoCompleteSource]:
+    tStart = time.perf_counter()
+    source = NGramAutoCompleteSource()
+    AutocompleteCsvLoader(source).loadAll(folder)
+    tLoad = time.perf_counter() - tStart
+    source.getSuggestions(SEARCHES[0])
+    return tLoad, time.perf_counter() - tStart, source
+
+def startIndex(folder: str, build: bool) -> tuple[float, float, CsvAutoCompleteSource]:
+    tStart = time.perf_counter()
+    source = CsvAutoCompleteSource()
+    source.setIndex(CsvIndexCache.build(folder) if build else CsvIndexCache.load(folder))
+    tLoad = time.perf_counter() - tStart
+    source.getSuggestions(SEARCHES[0])
+    return tLoad, time.perf_counter() - tStart, source
+
+def measureQueries(source: NGramAutoCompleteSource) -> tuple[float, list]:
+    tStart = time.perf_counter()
+    results = [sorted(s.nGramRatio for s in source.getSuggestions(search)) for search in SEARCHES]
+    return time.perf_counter() - tStart, results
+
+
+def main(numTags: int):
+    random.seed(1234)
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_autocomplete_") as tempdir:
+        csvFolder = os.path.join(tempdir, "csv")
+        os.makedirs(csvFolder)
+        createCsv(os.path.join(csvFolder, "tags.csv"), numTags)
+        Config.pathAutocompleteCache = os.path.join(tempdir, "cache")
+
+        tLegacyLoad, tLegacyFirst, legacy = startLegacy(csvFolder)
+        tBuildLoad, tBuildFirst, _ = startIndex(csvFolder, True)
+        tIndexLoad, tIndexFirst, indexed = startIndex(csvFolder, False)
+
+        tLegacyQueries, legacyResults = measureQueries(legacy)
+        tIndexQueries, indexResults = measureQueries(indexed)
+        assert indexResults == legacyResults
+
+        indexSize = os.path.getsize(os.path.join(Config.pathAutocompleteCache, CsvIndexCache.INDEX_FILE))
+        print(f"Autocomplete with {numTags} tags ({len(indexed.index)} including aliases, index file {indexSize/1024/1024:.1f} MB)")
+        print(f"Startup to first suggestion (load + first query)")
+        print(f"  Parse CSV into n-gram sets:      {tLegacyFirst:8.3f} s  (load {tLegacyLoad:.3f} s)")
+        print(f"  Parse CSV + build + save index:  {tBuildFirst:8.3f} s  (load {tBuildLoad:.3f} s)")
+        print(f"  Memory-map prebuilt index:       {tIndexFirst:8.3f} s  (load {tIndexLoad:.3f} s)")
+        print(f"Queries ({len(SEARCHES)} searches)")
+        print(f"  N-gram sets:                     {tLegacyQueries:8.3f} s")
+        print(f"  Index:                           {tIndexQueries:8.3f} s", flush=True)
+
+
+if __name__ == "__main__":
+    numTags = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    main(numTags)
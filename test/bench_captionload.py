@@ -0,0 +1,96 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Loading captions of many files with cold and warm page cache. Usage: python test/bench_captionload.py [num_files] [num_folders]
+
+import tempfile, time, random
+from lib.captionfile import CaptionFile, CaptionBulkLoader, FileTypeSelector
+from lib.captionstore import CaptionStore, importJson
+from lib import bulkread
+
+
+def createFiles(root: str, numFiles: int, numFolders: int) -> list[str]:
+    words = ["".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=random.randrange(3, 9))) for _ in range(5000)]
+
+    files = list[str]()
+    for i in range(numFiles):
+        folder = os.path.join(root, f"folder{i % numFolders:03}")
+        if i < numFolders:
+            os.makedirs(folder)
+
+        imgPath = os.path.join(folder, f"img{i:06}.png")
+        files.append(imgPath)
+        if random.random() < 0.1:
+            continue # No captions
+
+        captionFile = CaptionFile(imgPath)
+        captionFile.addTags("tags", ", ".join(random.choices(words, k=random.randrange(10, 40))))
+        captionFile.addCaption("caption", " ".join(random.choices(words, k=random.randrange(20, 80))))
+        captionFile.saveToJson()
+
+    # Gallery order: Sorted by name, which isn't the order on disk
+    random.shuffle(files)
+    files.sort(key=lambda path: os.path.basename(path)[::-1])
+    return files
+
+def dropCache(root: str) -> bool:
+    'Evicts the caption files from the page cache. Returns False if not supported.'
+    if not hasattr(os, "posix_fadvise"):
+        return False
+
+    os.sync()
+    for folder, _, filenames in os.walk(root):
+        for filename in filenames:
+            fd = os.open(os.path.join(folder, filename), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def measure(func, files: list[str], root: str, cold: bool) -> tuple[float, list]:
+    if cold:
+        dropCache(root)
+    tStart = time.perf_counter()
+    results = func(files)
+    return time.perf_counter() - tStart, results
+
+def loadSingle(files: list[str]) -> list[str | None]:
+    return [FileTypeSelector.loadCaptionJson(FileTypeSelector.TYPE_TAGS, "tags", file) for file in files]
+
+
+def main(numFiles: int, numFolders: int):
+    random.seed(1234)
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_captionload_") as root:
+        files = createFiles(root, numFiles, numFolders)
+        loader = CaptionBulkLoader(FileTypeSelector.TYPE_TAGS, "tags")
+        canDrop = dropCache(root)
+
+        print(f"Loading tags of {numFiles} files in {numFolders} folders (JSON parser: {'orjson' if bulkread.orjson else 'json'})")
+        if not canDrop:
+            print("  Cold cache not supported on this platform")
+
+        for cold in ((True, False) if canDrop else (False,)):
+            cache = "cold" if cold else "warm"
+            tSingle, single = measure(loadSingle, files, root, cold)
+            tBulk, bulk = measure(loader.loadMany, files, root, cold)
+            assert bulk == single
+
+            print(f"  File by file ({cache}):      {tSingle:8.3f} s", flush=True)
+            print(f"  Bulk loader ({cache}):       {tBulk:8.3f} s", flush=True)
+
+        importJson(root, deleteJson=True)
+        for cold in ((True, False) if canDrop else (False,)):
+            cache = "cold" if cold else "warm"
+            tStore, stored = measure(loader.loadMany, files, root, cold)
+            assert stored == single
+            print(f"  Caption store ({cache}):     {tStore:8.3f} s", flush=True)
+
+        CaptionStore.resetLookup()
+
+
+if __name__ == "__main__":
+    numFiles   = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    numFolders = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    main(numFiles, numFolders)
@@ -0,0 +1,134 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Benchmark for conditional rules. Usage: python test/bench_conditionals.py [num_captions] [num_rules]
+
+import ast, time, random
+from caption.caption_conditionals import (
+    ConditionalFilterRule, ConditionVariableParser, createCondAllTagsPresent, createCondAnyTagsPresent, createCondNumTagsPresent,
+    createCondAnyWordsPresent, createActionAddTags, createActionRemoveTags, createActionReplaceTags
+)
+from caption.caption_filter import ConditionalsFilter
+
+
+# Previous implementation: Call all condition functions for each rule and walk the AST
+
+class LegacyConditionalFilterRule(ConditionalFilterRule):
+    def evaluateExpression(self, tags: list[str]) -> ConditionVariableParser | None:
+        if self._parsedExpression:
+            results, variables = self._evalAll(tags)
+            if self._eval(results, variables):
+                return ConditionVariableParser(variables)
+            return None
+
+        match self._expression:
+            case "and": variables = self._evalAnd(tags)
+            case "or":  variables = self._evalOr(tags)
+            case _:
+                return None
+
+        if variables:
+            return ConditionVariableParser(variables)
+        return None
+
+    def _eval(self, condResults: dict[str, bool], condVariables: dict[str, list[str]]) -> bool:
+        def eval(node):
+            match node:
+                case ast.UnaryOp(op=op, operand=operand):
+                    return self.OPS[type(op)](eval(operand))
+                case ast.BinOp(left=left, op=op, right=right):
+                    return self.OPS[type(op)](eval(left), eval(right))
+                case ast.Compare(left=left, ops=[op], comparators=[comparator]):
+                    return self.OPS[type(op)](eval(left), eval(comparator))
+                case ast.Attribute(value=ast.Name(id=id), attr="val"):
+                    return condVariables.get(id, [""])[0]
+                case ast.Constant(value=value):
+                    return value
+                case ast.Name(id=id):
+                    return condResults.get(id, False)
+                case _:
+                    raise TypeError(node)
+
+        try:
+            return bool(eval(self._parsedExpression.body))
+        except:
+            return False
+
+class LegacyConditionalsFilter(ConditionalsFilter):
+    def _filterCaptionsKeep(self, captions: list[str]) -> list[str]:
+        for rule in self.rules:
+            if varParser := rule.evaluateExpression(captions):
+                varParser.separator = self.separator
+                for action in rule.actions:
+                    captions = action(varParser, captions)
+        return captions
+
+
+def createVocabulary(numTags: int) -> list[str]:
+    words = [f"w{i}" for i in range(numTags // 2)]
+    tags = set[str]()
+    while len(tags) < numTags:
+        tags.add(" ".join(random.sample(words, random.choice((1, 2, 2, 3)))))
+    return sorted(tags)
+
+def createRules(ruleClass, vocab: list[str], numRules: int) -> list[ConditionalFilterRule]:
+    # Most rules test the presence of tags, which is typical for booru tag presets
+    rules = list[ConditionalFilterRule]()
+    for _ in range(numRules):
+        rule = ruleClass()
+        rule.setExpression(random.choice(("and", "and", "or", "A & not B", "A | B", "A & (A.val != 'x')")))
+        rule.conditions["A"] = random.choice((createCondAnyTagsPresent, createCondAllTagsPresent))([", ".join(random.sample(vocab, random.randrange(1, 6)))])
+
+        match random.randrange(6):
+            case 0: rule.conditions["B"] = createCondAnyWordsPresent([random.choice(vocab).split(" ")[0]])
+            case 1: rule.conditions["B"] = createCondNumTagsPresent([", ".join(random.sample(vocab, 8)), "2", ""])
+            case _: rule.conditions["B"] = createCondAnyTagsPresent([", ".join(random.sample(vocab, random.randrange(1, 4)))])
+
+        match random.randrange(3):
+            case 0: rule.actions.append(createActionAddTags(["{{A}} extra"]))
+            case 1: rule.actions.append(createActionRemoveTags([random.choice(vocab)]))
+            case _: rule.actions.append(createActionReplaceTags([random.choice(vocab), "{{A.all}}"]))
+        rules.append(rule)
+    return rules
+
+def createCaptions(vocab: list[str], numCaptions: int) -> list[list[str]]:
+    weights = [1.0 / (i+1) for i in range(len(vocab))]  # Zipf-like tag frequency
+    return [random.choices(vocab, weights, k=random.randrange(10, 30)) for _ in range(numCaptions)]
+
+
+def measure(filter: ConditionalsFilter, captions: list[list[str]]) -> tuple[float, list[list[str]]]:
+    tStart = time.perf_counter()
+    results = [filter.filterCaptions(list(caption)) for caption in captions]
+    return time.perf_counter() - tStart, results
+
+
+def main(numCaptions: int, numRules: int):
+    random.seed(1234)
+    vocab = createVocabulary(5000)
+    captions = createCaptions(vocab, numCaptions)
+
+    state = random.getstate()
+    legacyFilter = LegacyConditionalsFilter()
+    legacyFilter.setup(createRules(LegacyConditionalFilterRule, vocab, numRules), ", ", False)
+
+    random.setstate(state)
+    tStart = time.perf_counter()
+    filter = ConditionalsFilter()
+    filter.setup(createRules(ConditionalFilterRule, vocab, numRules), ", ", False)
+    tCompile = time.perf_counter() - tStart
+
+    tLegacy, legacyResults = measure(legacyFilter, captions)
+    tCompiled, compiledResults = measure(filter, captions)
+    assert compiledResults == legacyResults
+
+    numChanged = sum(1 for caption, result in zip(captions, compiledResults) if caption != result)
+    print(f"Conditional rules: {numRules} rules, {len(filter.tagBits)} tags in bitset, {numCaptions} captions ({numChanged} changed)")
+    print(f"  Compile:                   {tCompile:8.3f} s")
+    print(f"  Legacy evaluation:         {tLegacy:8.3f} s  ({tLegacy/numCaptions*1e6:7.1f} µs/caption)")
+    print(f"  Compiled bitset:           {tCompiled:8.3f} s  ({tCompiled/numCaptions*1e6:7.1f} µs/caption)", flush=True)
+
+
+if __name__ == "__main__":
+    numCaptions = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    numRules    = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    main(numCaptions, numRules)
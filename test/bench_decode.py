@@ -0,0 +1,104 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Decode time and peak memory when loading large JPEGs as inference inputs, at full and reduced resolution. Usage: python test/bench_decode.py [num_files] [target_size]
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import tempfile, time, subprocess
+import numpy as np
+import cv2 as cv
+from PIL import Image
+from lib import imagerw
+
+
+WIDTH, HEIGHT = 6000, 4000  # 24 MP
+
+
+def createImages(folder: str, numFiles: int) -> list[str]:
+    rng = np.random.default_rng(1234)
+    x = np.linspace(0, 255, WIDTH, dtype=np.float32)
+    y = np.linspace(0, 255, HEIGHT, dtype=np.float32)[:, None]
+
+    files = list[str]()
+    for i in range(numFiles):
+        mat = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        mat[..., 0] = (x + i*31) % 256
+        mat[..., 1] = y
+        mat[..., 2] = (x + y) / 2
+        mat += rng.integers(0, 16, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+        path = os.path.join(folder, f"{i:03}.jpg")
+        Image.fromarray(mat).save(path, quality=90)
+        files.append(path)
+    return files
+
+
+def resizeSquare(mat: np.ndarray, targetSize: int) -> np.ndarray:
+    'Like TagBackend.loadImageSquare without padding.'
+    h, w = mat.shape[:2]
+    scale = targetSize / max(w, h)
+    return cv.resize(mat, (round(w * scale), round(h * scale)), interpolation=cv.INTER_AREA)
+
+# Previous implementation: Always decode at full resolution
+def loadLegacy(path: str, targetSize: int) -> np.ndarray:
+    return resizeSquare(imagerw.loadMatBGR(path, allowGreyscale=False), targetSize)
+
+def loadReduced(path: str, targetSize: int) -> np.ndarray:
+    return resizeSquare(imagerw.loadMatBGR(path, allowGreyscale=False, minSize=targetSize), targetSize)
+
+def loadThumbnail(path: str, targetSize: int) -> np.ndarray:
+    image, size = imagerw.thumbnailQImage(path, targetSize)
+    return np.zeros((image.height(), image.width(), 3), dtype=np.uint8)
+
+VARIANTS = {
+    "full":      loadLegacy,
+    "reduced":   loadReduced,
+    "thumbnail": loadThumbnail
+}
+
+
+def runVariant(variant: str, targetSize: int, files: list[str]):
+    'Runs in a separate process to measure its peak RSS.'
+    loadFunc = VARIANTS[variant]
+    tStart = time.perf_counter()
+    for path in files:
+        mat = loadFunc(path, targetSize)
+        if variant != "thumbnail":
+            np.save(path + f".{variant}.npy", mat)
+    t = time.perf_counter() - tStart
+
+    # ru_maxrss is inherited from the parent, VmHWM is not
+    with open("/proc/self/status") as file:
+        peakRss = next(int(line.split()[1]) for line in file if line.startswith("VmHWM:")) / 1024
+    print(f"{t} {peakRss}")
+
+def measure(name: str, variant: str, targetSize: int, files: list[str]):
+    output = subprocess.check_output([sys.executable, __file__, "--run", variant, str(targetSize), *files], text=True)
+    t, peakRss = map(float, output.split()[-2:])
+    print(f"  {name:<28} {t / len(files) * 1000:7.1f} ms/file   peak RSS: {peakRss:7.1f} MiB", flush=True)
+
+
+def main(numFiles: int, targetSize: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_decode_") as folder:
+        files = createImages(folder, numFiles)
+        print(f"Loading {numFiles} JPEGs ({WIDTH}x{HEIGHT}) as {targetSize} px inputs")
+
+        measure("Full decode + resize", "full", targetSize, files)
+        measure("Reduced decode + resize", "reduced", targetSize, files)
+        measure("Qt thumbnail (unchanged)", "thumbnail", targetSize, files)
+
+        # The DCT scaled image is resized from a smaller source, so the result differs slightly
+        for path in files:
+            legacy  = np.load(path + ".full.npy").astype(np.float32)
+            reduced = np.load(path + ".reduced.npy").astype(np.float32)
+            assert legacy.shape == reduced.shape
+            assert np.abs(legacy - reduced).mean() < 2.0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        runVariant(sys.argv[2], int(sys.argv[3]), sys.argv[4:])
+    else:
+        numFiles   = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+        targetSize = int(sys.argv[2]) if len(sys.argv) > 2 else 448
+        main(numFiles, targetSize)
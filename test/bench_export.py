@@ -0,0 +1,109 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Throughput of batch scale exports, synchronous with new arrays vs. reused buffers and write-behind queue. Usage: python test/bench_export.py [num_images] [target_size]
+
+import tempfile, time, math
+import numpy as np
+import cv2 as cv
+from PIL import Image
+import ui.export_settings as export
+from ui.export_settings import ImageExportTask, ExportWriter, ExportBuffers
+from infer.model_settings import ScaleModelSettings
+
+
+SRC_W, SRC_H = 3000, 2000
+FORMATS = ("png", "jpg", "webp")
+
+
+# Previous implementation: New arrays for each image. Without sigma ramp, the downscale factor must be above SIGMA_RAMP_END.
+def filterLowPassLegacy(mat: np.ndarray, targetWidth: int, targetHeight: int) -> np.ndarray:
+    srcHeight, srcWidth = mat.shape[:2]
+    downScaleX = srcWidth  / targetWidth
+    downScaleY = srcHeight / targetHeight
+    sigmaX, sigmaY = downScaleX / 3, downScaleY / 3
+    ksize = (2 * math.ceil(3*sigmaX) + 1, 2 * math.ceil(3*sigmaY) + 1)
+
+    mat = mat.astype(np.float32)
+    mask = ImageExportTask.createBlendMask(mat, targetWidth, targetHeight, max(downScaleX, downScaleY))
+    filtered = cv.GaussianBlur(mat, ksize, sigmaX=sigmaX, sigmaY=sigmaY, borderType=cv.BORDER_REFLECT_101)
+    return mat + mask*(filtered - mat)
+
+
+def scale(mat: np.ndarray, filtered: np.ndarray, w: int, h: int) -> np.ndarray:
+    mat = cv.resize(filtered, (w, h), interpolation=cv.INTER_LANCZOS4)
+    np.round(mat, out=mat)
+    np.clip(mat, 0, 255, out=mat)
+    return mat.astype(np.uint8)
+
+
+def exportLegacy(sources: list[np.ndarray], folder: str, ext: str, w: int, h: int) -> list[str]:
+    paths = list[str]()
+    for i, mat in enumerate(sources):
+        mat = scale(mat, filterLowPassLegacy(mat, w, h), w, h)
+        path = os.path.join(folder, f"{i:03}.{ext}")
+        export.saveImage(path, mat, logger=lambda msg: None)
+        paths.append(path)
+    return paths
+
+
+def exportQueued(sources: list[np.ndarray], folder: str, ext: str, w: int, h: int) -> list[str]:
+    writer = ExportWriter(logger=lambda msg: None)
+    paths = list[str]()
+    for i, mat in enumerate(sources):
+        filtered = ImageExportTask.filterLowPass(mat, SRC_W, SRC_H, w, h, ScaleModelSettings.LowPassFilter.Adaptive)
+        mat = scale(mat, filtered, w, h)
+        path = os.path.join(folder, f"{i:03}.{ext}")
+        writer.write(path, mat)
+        paths.append(path)
+
+    writer.finish()
+    ExportBuffers.clear()
+    return paths
+
+
+def loadAll(paths: list[str]) -> list[np.ndarray]:
+    mats = []
+    for path in paths:
+        with Image.open(path) as img:
+            mats.append(np.array(img))
+    return mats
+
+
+def main(numImages: int, targetSize: int):
+    ImageExportTask.initKernels()
+    rng = np.random.default_rng(0)
+    sources = [
+        cv.resize(rng.integers(0, 256, (SRC_H//50, SRC_W//50, 3), dtype=np.uint8), (SRC_W, SRC_H), interpolation=cv.INTER_CUBIC)
+        for _ in range(numImages)
+    ]
+
+    w, h = targetSize, round(targetSize * SRC_H / SRC_W)
+    assert SRC_W / w >= ImageExportTask.SIGMA_RAMP_END
+    print(f"Export {numImages} images {SRC_W}x{SRC_H} -> {w}x{h} with adaptive low-pass filter, {ExportWriter.NUM_THREADS} writer threads")
+
+    for ext in FORMATS:
+        with tempfile.TemporaryDirectory(prefix="qapyq_bench_export_") as folder:
+            legacyFolder = os.path.join(folder, "legacy")
+            queuedFolder = os.path.join(folder, "queued")
+            os.makedirs(legacyFolder)
+            os.makedirs(queuedFolder)
+
+            tStart = time.perf_counter()
+            legacyPaths = exportLegacy(sources, legacyFolder, ext, w, h)
+            tLegacy = time.perf_counter() - tStart
+
+            tStart = time.perf_counter()
+            queuedPaths = exportQueued(sources, queuedFolder, ext, w, h)
+            tQueued = time.perf_counter() - tStart
+
+            for legacy, queued in zip(loadAll(legacyPaths), loadAll(queuedPaths)):
+                assert np.array_equal(legacy, queued)
+
+            print(f"  {ext.upper():<5} legacy: {numImages/tLegacy:6.2f} img/s   queued: {numImages/tQueued:6.2f} img/s   ({tLegacy/tQueued:.2f}x)", flush=True)
+
+
+if __name__ == "__main__":
+    numImages  = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    targetSize = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    main(numImages, targetSize)
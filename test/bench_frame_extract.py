@@ -0,0 +1,170 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Decoded frames and time for extracting caption and tag frames of videos, separately and in a single pass. Usage: python test/bench_frame_extract.py [num_videos]
+
+import tempfile, time
+import av
+import numpy as np
+from PIL import Image
+from lib import videorw
+from lib.videorw import avGetFrameSize, createFrameConverter
+from host.imagecache import ImageFile, VideoFrameCache
+from test_videoindex import createVideo
+
+
+CAPTION_FPS, CAPTION_MAX_FRAMES = 1.0, 32
+TAG_FPS, TAG_MAX_FRAMES, TAG_SIZE = 0.5, 48, 448
+
+
+def tagConverterFactory(w: int, h: int):
+    scale = min(TAG_SIZE/w, TAG_SIZE/h)
+    return createFrameConverter(round(w * scale), round(h * scale), interpolation=videorw.Interpolation.AREA, format="bgr24")
+
+
+def createVideos(folder: str, numVideos: int) -> list[str]:
+    files = list[str]()
+    for i in range(numVideos):
+        seconds = (6, 20, 45)[i % 3]
+        path = os.path.join(folder, f"{i:03}.mp4")
+        createVideo(path, seconds*24, fps=24, gop=48, w=640, h=360, draw=lambda mat, f: mat.fill((f*3) % 256))
+        files.append(path)
+    return files
+
+
+# Previous implementation: Each consumer opens, seeks and decodes the video separately
+class Legacy:
+    numDecoded = 0
+
+    @classmethod
+    def decode(cls, container, stream):
+        for frame in container.decode(stream):
+            cls.numDecoded += 1
+            yield frame
+
+    class NotSeekableException(Exception): pass
+
+    @classmethod
+    def iterKeyframes(cls, container, numFrames: int, posFunc):
+        duration = float(container.duration / av.time_base)
+        stream = container.streams.video[0]
+        tb = stream.time_base
+
+        lastPts = -1
+        for i in range(numFrames):
+            targetPts = int((posFunc(i) * duration) / tb)
+            container.seek(targetPts, stream=stream)
+            frame = next(cls.decode(container, stream))
+            if frame.pts > lastPts:
+                lastPts = frame.pts
+                yield frame
+            else:
+                raise cls.NotSeekableException()
+
+    @classmethod
+    def iterFrames(cls, container, numFrames: int, posFunc, seek: bool = True):
+        stream = container.streams.video[0]
+        tb = stream.time_base
+        lastSeekPts = -1
+
+        for i in range(numFrames):
+            targetPts = int(posFunc(i) / tb)
+            if seek:
+                container.seek(targetPts, stream=stream)
+
+            frame = None
+            for f, frame in enumerate(cls.decode(container, stream)):
+                if f == 0 and seek:
+                    if frame.pts > lastSeekPts:
+                        lastSeekPts = frame.pts
+                    else:
+                        seek = False
+                if frame.pts >= targetPts:
+                    yield frame
+                    break
+            else:
+                if frame:
+                    yield frame
+                break
+
+    @classmethod
+    def extractFramesPIL(cls, path: str, sampleFps: float, maxFrames: int) -> list[Image.Image]:
+        with av.open(path, 'r') as container:
+            stream = container.streams.video[0]
+            w, h = avGetFrameSize(stream)
+            convert = createFrameConverter(w, h)
+            duration = float(container.duration / av.time_base)
+
+            fps = float(stream.average_rate or 0)
+            frameCount = stream.frames or int(duration * fps)
+            numSampleFrames = min(int(duration * sampleFps), frameCount)
+            numSampleFrames &= ~1
+            numSampleFrames = min(max(numSampleFrames, 2), maxFrames)
+
+            posFeed = duration / (numSampleFrames-1) if numSampleFrames < frameCount-1 else 0
+            seek = (posFeed * fps > 24)
+            return [Image.fromarray(convert(frame)) for frame in cls.iterFrames(container, numSampleFrames, lambda i: i * posFeed, seek)]
+
+    @classmethod
+    def extractFramesMat(cls, path: str, sampleFps: float, maxFrames: int, converterFactory) -> list[np.ndarray]:
+        with av.open(path, 'r') as container:
+            stream = container.streams.video[0]
+            w, h = avGetFrameSize(stream)
+            convert = converterFactory(w, h)
+
+            duration = float(container.duration / av.time_base)
+            fps = float(stream.average_rate or 0)
+            frameCount = stream.frames or int(duration * fps)
+            numSampleFrames = min(round(duration * sampleFps), frameCount)
+            numSampleFrames = min(max(numSampleFrames, 3), maxFrames)
+
+            if duration <= 10.0:
+                frames = cls.iterFrames(container, numSampleFrames, lambda i: duration * i / (numSampleFrames-1))
+            else:
+                numIntervals = numSampleFrames + 1
+                frames = cls.iterKeyframes(container, numSampleFrames, lambda i: (i+1) / numIntervals)
+            return [convert(frame) for frame in frames]
+
+
+def runLegacy(files: list[str]) -> list:
+    results = list()
+    for path in files:
+        caption = Legacy.extractFramesPIL(path, CAPTION_FPS, CAPTION_MAX_FRAMES)
+        tags = Legacy.extractFramesMat(path, TAG_FPS, TAG_MAX_FRAMES, tagConverterFactory)
+        results.append((caption, tags))
+    return results
+
+def runSinglePass(files: list[str]) -> list:
+    results = list()
+    for path in files:
+        imgFile = ImageFile(path)
+        caption, metadata = imgFile.getVideoFrames(CAPTION_FPS, CAPTION_MAX_FRAMES)
+        tags = imgFile.getVideoFramesCvMat(TAG_FPS, TAG_MAX_FRAMES, tagConverterFactory, "bench")
+        results.append((caption, tags))
+    return results
+
+
+def main(numVideos: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_frames_") as folder:
+        files = createVideos(folder, numVideos)
+        print(f"Extracting caption ({CAPTION_FPS} fps) and tag frames ({TAG_FPS} fps) of {numVideos} videos (6-45 s, 640x360, keyframes every 2 s)")
+
+        tStart = time.perf_counter()
+        legacy = runLegacy(files)
+        t = time.perf_counter() - tStart
+        print(f"  {'Separate':<12} {t:7.3f} s   decoded frames: {Legacy.numDecoded}", flush=True)
+
+        tStart = time.perf_counter()
+        single = runSinglePass(files)
+        t = time.perf_counter() - tStart
+        print(f"  {'Single pass':<12} {t:7.3f} s   decoded frames: {VideoFrameCache().extractor.numDecodedFrames}", flush=True)
+
+        for (legacyCaption, legacyTags), (caption, tags) in zip(legacy, single):
+            assert len(caption) == len(legacyCaption) and len(tags) == len(legacyTags)
+            assert all(np.array_equal(np.array(a), np.array(b)) for a, b in zip(caption, legacyCaption))
+            assert all(np.array_equal(a, b) for a, b in zip(tags, legacyTags))
+
+
+if __name__ == "__main__":
+    numVideos = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    main(numVideos)
@@ -0,0 +1,103 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Loading images with an embedded Adobe RGB profile, with and without cached color transforms. Usage: python test/bench_icc.py [num_files] [size]
+
+import tempfile, time, hashlib
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageCms
+from PySide6.QtGui import QColorSpace, QImageReader
+from lib import imagerw
+from lib.imagerw import ColorTransformCache
+
+
+def createImages(folder: str, numFiles: int, size: int) -> list[str]:
+    iccProfile = QColorSpace(QColorSpace.NamedColorSpace.AdobeRgb).iccProfile().data()
+    rng = np.random.default_rng(1234)
+
+    # Encode a few templates, then copy the bytes
+    templates = list[bytes]()
+    for _ in range(8):
+        buffer = BytesIO()
+        Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)).save(buffer, "JPEG", quality=90, icc_profile=iccProfile)
+        templates.append(buffer.getvalue())
+
+    files = list[str]()
+    for i in range(numFiles):
+        path = os.path.join(folder, f"{i:06}.jpg")
+        with open(path, 'wb') as file:
+            file.write(templates[i % len(templates)])
+        files.append(path)
+    return files
+
+
+# Previous implementation without cache
+def normalizeColorSpacePILLegacy(img: Image.Image):
+    if iccProfile := img.info.get('icc_profile'):
+        profile = ImageCms.ImageCmsProfile(BytesIO(iccProfile))
+        profileName = ImageCms.getProfileName(profile).lower()
+        if ("srgb" not in profileName) or ("linear" in profileName):
+            ImageCms.profileToProfile(img, profile, imagerw._getSrgbProfile(), inPlace=True)
+
+
+def loadPIL(files: list[str], normalize) -> str:
+    digest = hashlib.sha1()
+    for path in files:
+        with Image.open(path) as img:
+            img.load()
+            normalize(img)
+            digest.update(img.tobytes())
+    return digest.hexdigest()
+
+def loadQt(files: list[str], normalize) -> str:
+    digest = hashlib.sha1()
+    for path in files:
+        image = QImageReader(path).read()
+        normalize(image)
+        digest.update(image.constBits().tobytes())
+    return digest.hexdigest()
+
+def loadQtCachedTransform(files: list[str], normalize) -> str:
+    'Applies a shared QColorTransform instead of converting each image separately.'
+    transforms = dict[bytes, object]()
+    digest = hashlib.sha1()
+    for path in files:
+        image = QImageReader(path).read()
+        iccProfile = image.colorSpace().iccProfile().data()
+        if (transform := transforms.get(iccProfile)) is None:
+            transforms[iccProfile] = transform = image.colorSpace().transformationToColorSpace(QColorSpace.NamedColorSpace.SRgb)
+        image.applyColorTransform(transform)
+        image.setColorSpace(QColorSpace.NamedColorSpace.SRgb)
+        digest.update(image.constBits().tobytes())
+    return digest.hexdigest()
+
+
+def measure(name: str, func, files: list[str], normalize) -> str:
+    tStart = time.perf_counter()
+    digest = func(files, normalize)
+    t = time.perf_counter() - tStart
+    print(f"  {name:<24} {t:8.3f} s   {t / len(files) * 1000:6.3f} ms/file", flush=True)
+    return digest
+
+
+def main(numFiles: int, size: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_icc_") as folder:
+        files = createImages(folder, numFiles, size)
+        print(f"Loading {numFiles} Adobe RGB JPEGs ({size}x{size})")
+
+        ColorTransformCache.clear()
+        legacy = measure("PIL without cache", loadPIL, files, normalizeColorSpacePILLegacy)
+        cached = measure("PIL with cache", loadPIL, files, imagerw.normalizeColorSpacePIL)
+        assert cached == legacy
+
+        # For comparison: The Qt path is unchanged, Qt reuses the lookup tables of its transforms
+        qt       = measure("Qt", loadQt, files, imagerw.normalizeColorSpace)
+        qtShared = measure("Qt with shared transform", loadQtCachedTransform, files, None)
+        assert qtShared == qt
+
+
+if __name__ == "__main__":
+    numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    size     = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    main(numFiles, size)
@@ -0,0 +1,96 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Benchmark for reading image sizes. Usage: python test/bench_imgsize.py [num_files]
+
+import tempfile, time, random
+from PIL import Image
+from PySide6.QtGui import QImageReader
+from config import Config
+from lib import imagerw
+from lib.util import Singleton
+from lib.mediasize import MediaSizeCache
+
+
+FORMATS = (("PNG", "png"), ("JPEG", "jpg"), ("WEBP", "webp"), ("GIF", "gif"), ("BMP", "bmp"), ("AVIF", "avif"))
+
+
+def createImages(folder: str, numFiles: int) -> list[str]:
+    # Encode a few templates per format, then copy the bytes
+    os.makedirs(folder, exist_ok=True)
+    templates = list[tuple[str, bytes]]()
+    for format, ext in FORMATS:
+        for _ in range(4):
+            maxSize = 256 if format == "BMP" else 4096  # Uncompressed
+            w, h = random.randrange(16, maxSize), random.randrange(16, maxSize)
+            path = os.path.join(folder, f"template.{ext}")
+            Image.new("RGB", (w, h), (random.randrange(256), 90, 30)).save(path, format)
+            with open(path, 'rb') as file:
+                templates.append((ext, file.read()))
+            os.remove(path)
+
+    files = list[str]()
+    for i in range(numFiles):
+        subfolder = os.path.join(folder, f"{i // 1000:04}")
+        if i % 1000 == 0:
+            os.makedirs(subfolder, exist_ok=True)
+
+        ext, data = random.choice(templates)
+        path = os.path.join(subfolder, f"{i:07}.{ext}")
+        with open(path, 'wb') as file:
+            file.write(data)
+        files.append(path)
+    return files
+
+
+def readSizeLegacy(imgPath: str) -> tuple[int, int]:
+    'Previous implementation with QImageReader and PIL fallback.'
+    try:
+        reader = QImageReader(imgPath)
+        w, h = reader.size().toTuple()
+        if w < 0:
+            w, h = imagerw._readSizePIL(imgPath)
+        elif Config.exifTransform and imagerw._exifSwapSizeQt(reader):
+            w, h = h, w
+        return (w, h)
+    except:
+        return (-1, -1)
+
+
+def measure(files: list[str], func) -> tuple[float, list]:
+    tStart = time.perf_counter()
+    results = [func(file) for file in files]
+    return time.perf_counter() - tStart, results
+
+
+def main(numFiles: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_imgsize_") as tempdir:
+        Config.pathSizeCache = os.path.join(tempdir, "cache")
+        files = createImages(os.path.join(tempdir, "img"), numFiles)
+
+        tLegacy, legacySizes = measure(files, readSizeLegacy)
+        tHeader, headerSizes = measure(files, imagerw.readSize)
+        assert headerSizes == legacySizes
+
+        cache = MediaSizeCache()
+        tStore, _ = measure(files, cache.readSize)
+        tStart = time.perf_counter()
+        cache.save()
+        tSave = time.perf_counter() - tStart
+
+        # New session: Load persisted sizes
+        Singleton._instances.pop(MediaSizeCache)
+        cache = MediaSizeCache()
+        tCached, cachedSizes = measure(files, cache.readSize)
+        assert [size[:2] for size in cachedSizes] == legacySizes
+
+        print(f"Image sizes for {numFiles} files ({', '.join(ext for format, ext in FORMATS)})")
+        print(f"  QImageReader / PIL:             {tLegacy:8.3f} s")
+        print(f"  Header parser:                  {tHeader:8.3f} s")
+        print(f"  Header parser + cache update:   {tStore:8.3f} s (save: {tSave:.3f} s)")
+        print(f"  Persisted cache (new session):  {tCached:8.3f} s", flush=True)
+
+
+if __name__ == "__main__":
+    numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    main(numFiles)
@@ -0,0 +1,102 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Time to display during sequential navigation, with and without prefetching. Usage: python test/bench_imgview.py [num_files] [dwell_seconds] [size]
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import tempfile, time, statistics
+import numpy as np
+from PySide6.QtGui import QImage, QPixmap
+from PySide6.QtWidgets import QApplication
+from lib import imagerw
+from lib.filelist import FileList, resetReadExtensions
+from ui.image_cache import ImageCache
+from config import Config
+
+
+def createFiles(root: str, numFiles: int, size: int) -> list[str]:
+    rng = np.random.default_rng(1234)
+    w, h = size, size * 2 // 3
+
+    # Smooth gradients with noise compress like photos, which are slower to decode than flat images
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+
+    files = list[str]()
+    for i in range(numFiles):
+        noise = rng.integers(0, 24, (h, w, 3), dtype=np.uint8)
+        mat = np.empty((h, w, 3), dtype=np.uint8)
+        mat[..., 0] = (x + i*7) % 256
+        mat[..., 1] = y
+        mat[..., 2] = (x + y) / 2
+        mat += noise
+
+        path = os.path.join(root, f"img{i:03}.png")
+        QImage(mat.data, w, h, 3*w, QImage.Format.Format_RGB888).save(path)
+        files.append(path)
+    return files
+
+
+def loadLegacy(path: str) -> QPixmap:
+    return QPixmap.fromImage(imagerw.loadQImage(path))
+
+def loadCached(path: str) -> QPixmap:
+    cache = ImageCache()
+    image = cache.get(path)
+    if image is None:
+        image = imagerw.loadQImage(path)
+        cache.put(path, image)
+    return QPixmap.fromImage(image)
+
+
+def navigate(filelist: FileList, loadFunc, prefetch: bool, dwell: float) -> tuple[list[float], list[tuple[int, int]]]:
+    times = list[float]()
+    sizes = list[tuple[int, int]]()
+    filelist.setCurrentIndex(0)
+
+    for _ in range(filelist.getNumFiles()):
+        tStart = time.perf_counter()
+        pixmap = loadFunc(filelist.getCurrentFile())
+        times.append(time.perf_counter() - tStart)
+        sizes.append(pixmap.size().toTuple())
+
+        if prefetch:
+            ImageCache().prefetch(filelist.getAdjacentFiles(Config.viewPrefetchCount))
+
+        time.sleep(dwell)  # Viewing the image
+        filelist.setNextFile()
+
+    return times, sizes
+
+def printStats(name: str, times: list[float]):
+    ms = sorted(t * 1000 for t in times)
+    p90 = ms[int(len(ms) * 0.9)]
+    print(f"  {name:<14} median: {statistics.median(ms):7.1f} ms   p90: {p90:7.1f} ms   max: {ms[-1]:7.1f} ms   total: {sum(ms)/1000:6.2f} s", flush=True)
+
+
+def main(numFiles: int, dwell: float, size: int):
+    app = QApplication.instance() or QApplication()
+    resetReadExtensions()
+
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_imgview_") as root:
+        files = createFiles(root, numFiles, size)
+        filelist = FileList()
+        filelist.loadFilesFixed(files)
+
+        print(f"Sequential navigation through {numFiles} PNG images ({size}x{size*2//3}), {dwell:.2f} s per image, {Config.viewPrefetchThreads} prefetch threads")
+
+        legacyTimes, legacySizes = navigate(filelist, loadLegacy, False, dwell)
+        printStats("Synchronous", legacyTimes)
+
+        prefetchTimes, prefetchSizes = navigate(filelist, loadCached, True, dwell)
+        assert prefetchSizes == legacySizes
+        printStats("Prefetch", prefetchTimes)
+
+        ImageCache().shutdown()
+
+
+if __name__ == "__main__":
+    numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    dwell    = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    size     = int(sys.argv[3]) if len(sys.argv) > 3 else 3000
+    main(numFiles, dwell, size)
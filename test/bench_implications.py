@@ -0,0 +1,91 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Benchmark for tag implications. Usage: python test/bench_implications.py [num_rows] [num_captions]
+
+import tempfile, time, random
+from caption.caption_filter import ImplicationFilter
+from caption.caption_implications import ImplicationGraph
+from caption.caption_highlight import MatcherNode
+
+
+# Previous implementation: Resolve transitive implications with recursion for each caption
+
+def filterLegacy(implications: dict[str, frozenset[str]], captions: list[str]) -> list[str]:
+    impliedTags = set[str]()
+    for cap in captions:
+        addImpliedTagsLegacy(implications, impliedTags, cap)
+    return [cap for cap in captions if cap not in impliedTags] if impliedTags else captions
+
+def addImpliedTagsLegacy(implications: dict[str, frozenset[str]], impliedTags: set[str], tag: str):
+    if consequents := implications.get(tag):
+        impliedTags.update(consequents)
+        for consTag in consequents:
+            addImpliedTagsLegacy(implications, impliedTags, consTag)
+
+
+def createCsv(path: str, numRows: int) -> list[str]:
+    # Implications form a shallow hierarchy like on boorus: Tags imply one or two more general tags
+    tags = [f"tag_{i}" for i in range(numRows * 2 // 3)]
+    with open(path, 'w') as file:
+        file.write("antecedent_name,consequent_name,status\n")
+        for row in range(numRows):
+            i = random.randrange(2, len(tags)) if row >= len(tags)-2 else row+2
+            k = random.randrange(i // 8, i // 2)
+            file.write(f"{tags[i]},{tags[k]},active\n")
+    return [tag.replace("_", " ") for tag in tags]
+
+def createCaptions(tags: list[str], numCaptions: int) -> list[list[str]]:
+    return [random.sample(tags, random.randrange(10, 30)) for _ in range(numCaptions)]
+
+
+def loadCsv() -> tuple[float, dict[str, frozenset[str]]]:
+    tStart = time.perf_counter()
+    loader = ImplicationFilter.ImplicationCsvLoader()
+    loader.loadAll(ImplicationFilter.ImplicationCsvLoader.FOLDER)
+    implications = {k: frozenset(v) for k, v in loader.implications.items()}
+    return time.perf_counter() - tStart, implications
+
+def loadGraph() -> tuple[float, ImplicationGraph]:
+    tStart = time.perf_counter()
+    graph = ImplicationFilter.ImplicationCsvLoader.loadImplications()
+    return time.perf_counter() - tStart, graph
+
+
+def main(numRows: int, numCaptions: int):
+    random.seed(1234)
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_implications_") as tempdir:
+        ImplicationFilter.ImplicationCsvLoader.FOLDER = tempdir
+        tags = createCsv(os.path.join(tempdir, "implications.csv"), numRows)
+        captions = createCaptions(tags, numCaptions)
+
+        tCsv, implications = loadCsv()
+        tCompile, _ = loadGraph()
+        tCached, graph = loadGraph()
+
+        ImplicationFilter.IMPLICATIONS = graph
+        filter = ImplicationFilter()
+        filter.setup(MatcherNode())
+
+        tStart = time.perf_counter()
+        legacyResults = [filterLegacy(implications, caption) for caption in captions]
+        tLegacy = time.perf_counter() - tStart
+
+        tStart = time.perf_counter()
+        results = [filter.filterCaptions(caption) for caption in captions]
+        tClosure = time.perf_counter() - tStart
+        assert results == legacyResults
+
+        print(f"Tag implications with {numRows} rows ({len(graph)} tags, {len(graph.impliedIds)} closure entries)")
+        print(f"  Load CSV:                    {tCsv:8.3f} s")
+        print(f"  Load CSV + compile + save:   {tCompile:8.3f} s")
+        print(f"  Load compiled cache:         {tCached:8.3f} s")
+        print(f"Filter {numCaptions} captions")
+        print(f"  Recursive lookup:            {tLegacy:8.3f} s")
+        print(f"  Precompiled closure:         {tClosure:8.3f} s", flush=True)
+
+
+if __name__ == "__main__":
+    numRows     = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    numCaptions = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    main(numRows, numCaptions)
@@ -0,0 +1,96 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Benchmark for MatcherNode. Usage: python test/bench_matcher.py [num_group_tags] [num_tags]
+
+import time, random
+from caption.caption_highlight import MatcherNode, MatcherAutomaton
+from test_matchernode import matchTrie, splitWordsTrie
+
+
+def createGroupTags(numTags: int) -> list[str]:
+    # Tags share their last words, like colors and styles of clothing
+    nouns = [f"n{i}" for i in range(numTags // 20)]
+    adjectives = [f"a{i}" for i in range(2000)]
+    tags = set[str]()
+    while len(tags) < numTags:
+        numAdj = random.choice((0, 1, 1, 1, 2))
+        tags.add(" ".join(random.sample(adjectives, numAdj) + [random.choice(nouns)]))
+    return sorted(tags)
+
+def createTags(groupTags: list[str], numTags: int) -> list[str]:
+    # Mix of group tags, combined tags and tags with extra words
+    tags = list[str]()
+    for _ in range(numTags):
+        match random.randrange(4):
+            case 0: tags.append(random.choice(groupTags))
+            case 1: tags.append(f"w{random.randrange(10000)} {random.choice(groupTags)}")
+            case 2:
+                tag1, tag2 = random.choice(groupTags).split(" "), random.choice(groupTags).split(" ")
+                tags.append(" ".join(tag1[:-1] + tag2))
+            case _: tags.append(" ".join(f"w{random.randrange(10000)}" for _ in range(random.randrange(1, 4))))
+    return tags
+
+
+def splitAllPreserveExtraTrie(node: MatcherNode, cap: str) -> list[str]:
+    'Previous implementation with the trie walk.'
+    captionWords = cap.split(" ")
+    if matchSplitWords := splitWordsTrie(node, captionWords):
+        splitCaptionWords = list[list[str]]()
+        usedWords = set[str]()
+        matchSplitWords.sort(key=len, reverse=True)
+        for matchWords in matchSplitWords:
+            if not usedWords.issuperset(matchWords):
+                usedWords.update(matchWords)
+                splitCaptionWords.append(matchWords)
+
+        if usedWords.issuperset(word for word in captionWords if word):
+            return [" ".join(matchWords) for matchWords in splitCaptionWords]
+    return [cap]
+
+
+def measure(func, tags: list[str]) -> tuple[float, list]:
+    tStart = time.perf_counter()
+    results = [func(tag) for tag in tags]
+    return time.perf_counter() - tStart, results
+
+
+def main(numGroupTags: int, numTags: int):
+    random.seed(1234)
+    groupTags = createGroupTags(numGroupTags)
+    tags = createTags(groupTags, numTags)
+
+    node = MatcherNode[int]()
+    for i, tag in enumerate(groupTags):
+        node.add(tag, i)
+
+    tStart = time.perf_counter()
+    automaton = MatcherAutomaton(node)
+    tCompile = time.perf_counter() - tStart
+
+    tMatchTrie, trieMatch = measure(lambda tag: matchTrie(node, tag.split(" ")), tags)
+    tMatch, match = measure(lambda tag: automaton.match(tag.split(" ")), tags)
+    assert match == trieMatch
+
+    tSplitTrie, splitTrie = measure(lambda tag: [" ".join(words) for words in splitWordsTrie(node, tag.split(" "))], tags)
+    tSplit, split = measure(lambda tag: automaton.split(tag.split(" ")), tags)
+    assert split == splitTrie
+
+    tPreserveTrie, preserveTrie = measure(lambda tag: splitAllPreserveExtraTrie(node, tag), tags)
+    tPreserve, preserve = measure(lambda tag: list(automaton.splitAllPreserveExtra((tag,))), tags)
+    assert preserve == preserveTrie
+
+    print(f"MatcherNode with {numGroupTags} group tags, {numTags} tags")
+    print(f"  Compile automaton:                  {tCompile:8.3f} s")
+    print(f"  match() trie walk:                  {tMatchTrie:8.3f} s")
+    print(f"  match() automaton:                  {tMatch:8.3f} s")
+    print(f"  split() trie walk:                  {tSplitTrie:8.3f} s")
+    print(f"  split() automaton:                  {tSplit:8.3f} s")
+    print(f"  splitAllPreserveExtra() trie walk:  {tPreserveTrie:8.3f} s")
+    print(f"  splitAllPreserveExtra() automaton:  {tPreserve:8.3f} s", flush=True)
+
+
+if __name__ == "__main__":
+    numGroupTags = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    numTags      = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    main(numGroupTags, numTags)
@@ -0,0 +1,225 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Benchmark for caption rules processing. Usage: python test/bench_rules.py [num_captions] [working_set]
+
+import re, time, random
+from caption.caption_filter import CaptionRulesProcessor, CaptionRulesSettings, SearchReplaceFilter, MutuallyExclusiveFilter, PriorityFilter, SubsetFilter
+from caption.caption_preset import MutualExclusivity
+from caption.caption_conditionals import ConditionalFilterRule, createCondAnyTagsPresent, createCondAllTagsPresent, createActionAddTags, createActionRemoveTags
+
+
+# Previous implementations: Loop over all groups for each caption, parse replacement for each match, no memoization
+
+class LegacyMutuallyExclusiveFilter(MutuallyExclusiveFilter):
+    def setup(self, captionGroups):
+        self.groups = [set(caps) for caps in captionGroups]
+
+    def filterCaptions(self, captions: list[str]) -> list[str]:
+        enumerated = self.enumerate(captions)
+        deleteIndices = set()
+
+        for group in self.groups:
+            exists = False
+            for i, cap in enumerated:
+                if cap in group:
+                    if exists:
+                        deleteIndices.add(i)
+                    exists = True
+
+        for i in sorted(deleteIndices, reverse=True):
+            del captions[i]
+        return captions
+
+class LegacyPriorityFilter(PriorityFilter):
+    def setup(self, captionGroups):
+        self.groups = [{ cap: prio for prio, cap in enumerate(group) } for group in captionGroups]
+
+    def filterCaptions(self, captions: list[str]) -> list[str]:
+        enumerated = list(enumerate(captions))
+        allDeleteIndices: set[int] = set()
+        deleteIndices: set[int] = set()
+
+        for group in self.groups:
+            deleteIndices.clear()
+            keepIndex = -1
+            maxPrio = -1
+
+            for i, cap in enumerated:
+                prio = group.get(cap)
+                if prio is None:
+                    continue
+
+                deleteIndices.add(i)
+                if prio > maxPrio:
+                    maxPrio = prio
+                    keepIndex = i
+
+            deleteIndices.discard(keepIndex)
+            allDeleteIndices.update(deleteIndices)
+
+        for i in sorted(allDeleteIndices, reverse=True):
+            del captions[i]
+        return captions
+
+class LegacySubsetFilter(SubsetFilter):
+    def filterCaptions(self, captions: list[str]) -> list[str]:
+        captionWords: list[set[str]] = list()
+        for cap in captions:
+            words = (w.lower() for word in cap.split(" ") if (w := word.strip()))
+            captionWords.append(set(words))
+
+        newCaptions: list[str] = list()
+        for i, cap in enumerate(captions):
+            if not self._supersetExistsLegacy(captionWords, i):
+                newCaptions.append(cap)
+
+        return newCaptions
+
+    @staticmethod
+    def _supersetExistsLegacy(captionWords: list[set[str]], index: int) -> bool:
+        for k in range(len(captionWords)):
+            if k != index and captionWords[k] != captionWords[index] and captionWords[k].issuperset(captionWords[index]):
+                return True
+        return False
+
+class NoTagCache:
+    def get(self, tag: str, func):
+        return func(tag)
+
+    def map(self, tags, func):
+        return [func(tag) for tag in tags]
+
+    def clear(self):
+        pass
+
+class LegacySearchReplaceFilter(SearchReplaceFilter):
+    def filterText(self, text: str) -> str:
+        varParser = self.ReplacementParser()
+        for pattern, replacement, isTemplate in self.legacyPairs:
+            text = pattern.sub(lambda match: varParser.getReplacement(replacement, match), text)
+        return text
+
+class LegacyCaptionRulesProcessor(CaptionRulesProcessor):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.exclusiveFilterLast = LegacyMutuallyExclusiveFilter(MutualExclusivity.KeepLast)
+        self.exclusiveFilterFirst = LegacyMutuallyExclusiveFilter(MutualExclusivity.KeepFirst)
+        self.exclusiveFilterPriority = LegacyPriorityFilter()
+        self.subsetFilter = LegacySubsetFilter()
+        self.replaceFilter = LegacySearchReplaceFilter()
+        self.sortFilter.sortKeyCache = NoTagCache()
+        self.combineFilter.splitCache = NoTagCache()
+        self.whitelistFilter.validCache = NoTagCache()
+
+    def setSearchReplacePairs(self, pairs: list[tuple[str, str]]):
+        super().setSearchReplacePairs(pairs)
+        self.replaceFilter.legacyPairs = [(re.compile(pattern), replace, True) for pattern, replace in pairs]
+
+    def process(self, text: str, settings: CaptionRulesSettings = CaptionRulesSettings()) -> str:
+        return self._process(text, settings)
+
+
+# Realistic preset: Groups with mutual exclusivity and combination, banned tags, replacements, conditionals
+COLORS = ["black", "white", "red", "blue", "green", "brown", "blonde", "grey", "pink", "purple"]
+
+def createVocabulary(numTags: int) -> list[str]:
+    words = [f"w{i}" for i in range(numTags // 2)]
+    tags = set[str]()
+    while len(tags) < numTags:
+        numWords = random.choice((1, 1, 2, 2, 2, 3))
+        tags.add(" ".join(random.sample(words, numWords)))
+    return sorted(tags)
+
+def createGroups(vocab: list[str]) -> list[tuple[list[str], MutualExclusivity, bool]]:
+    groups = list()
+    for noun in ("hair", "eyes", "shirt", "pants", "skirt", "shoes", "jacket", "hat", "background", "dress"):
+        groups.append(([f"{color} {noun}" for color in COLORS], MutualExclusivity.KeepLast, noun != "eyes"))
+    groups.append((["standing", "sitting", "lying", "kneeling", "squatting"], MutualExclusivity.Priority, False))
+    groups.append((["from side", "from behind", "from above", "from below", "straight-on"], MutualExclusivity.KeepFirst, False))
+    groups.append((["solo", "1girl", "1boy", "2girls", "multiple girls"], MutualExclusivity.Disabled, False))
+
+    for i in range(27):
+        groups.append((random.sample(vocab, 8), random.choice(list(MutualExclusivity)), False))
+    return groups
+
+def createRules() -> list[ConditionalFilterRule]:
+    rules = list()
+    for condFactory, condTags, actionFactory, actionTags in (
+        (createCondAnyTagsPresent, "1girl, 2girls, multiple girls", createActionRemoveTags, "1boy"),
+        (createCondAllTagsPresent, "solo, standing",                createActionAddTags,    "full body"),
+        (createCondAnyTagsPresent, "black hair, brown hair",        createActionAddTags,    "dark hair"),
+        (createCondAnyTagsPresent, "blonde hair",                   createActionRemoveTags, "dark hair"),
+        (createCondAllTagsPresent, "from behind, sitting",          createActionAddTags,    "{{A.all}} view"),
+    ):
+        rule = ConditionalFilterRule()
+        rule.setExpression("and")
+        rule.conditions["A"] = condFactory([condTags])
+        rule.actions.append(actionFactory([actionTags]))
+        rules.append(rule)
+    return rules
+
+def setupProcessor(processorClass, vocab, groups, banned) -> CaptionRulesProcessor:
+    processor = processorClass(", ", True, False, True, False, False)
+    processor.setPrefixSuffix("photo", "", True, False)
+    processor.setSearchReplacePairs([
+        ("greyscale", "monochrome"),
+        ("grey ", "gray "),
+        (r"\bw1 w2\b", "w3"),
+        ("looking at viewer", "looking at camera"),
+        (r"(\w+) with (\w+)", "{{1}} {{0}}"),
+    ])
+    processor.setBannedCaptions(banned)
+    processor.setCaptionGroups(groups)
+    processor.setConditionalRules(createRules(), False)
+    return processor
+
+def createCaptions(vocab: list[str], groups, numCaptions: int) -> list[str]:
+    groupTags = [tag for tags, _, _ in groups for tag in tags]
+    weights = [1.0 / (i+1) for i in range(len(vocab))]  # Zipf-like tag frequency
+    captions = list[str]()
+    for _ in range(numCaptions):
+        tags = random.choices(vocab, weights, k=random.randrange(10, 25))
+        tags += random.sample(groupTags, random.randrange(3, 10))
+        random.shuffle(tags)
+        captions.append(", ".join(tags))
+    return captions
+
+
+def measure(processor: CaptionRulesProcessor, captions: list[str]) -> tuple[float, list[str]]:
+    tStart = time.perf_counter()
+    results = [processor.process(caption) for caption in captions]
+    return time.perf_counter() - tStart, results
+
+
+def main(numCaptions: int, workingSet: int):
+    random.seed(1234)
+    vocab  = createVocabulary(5000)
+    groups = createGroups(vocab)
+    banned = random.sample(vocab, 200)
+    captions = createCaptions(vocab, groups, numCaptions)
+
+    legacy = setupProcessor(LegacyCaptionRulesProcessor, vocab, groups, banned)
+    compiled = setupProcessor(CaptionRulesProcessor, vocab, groups, banned)
+
+    tLegacy, legacyResults = measure(legacy, captions)
+    tCompiled, compiledResults = measure(compiled, captions)
+    assert compiledResults == legacyResults
+
+    # Repeated processing of the same captions, like the gallery and caption window do
+    repeated = captions[:workingSet] * 10
+    tLegacyRep, _ = measure(legacy, repeated)
+    tCompiledRep, _ = measure(compiled, repeated)
+
+    print(f"Caption rules for {numCaptions} captions ({len(groups)} groups, {len(banned)} banned, 5 replacements, 5 conditionals)")
+    print(f"  Legacy processor:    {tLegacy:8.3f} s  ({tLegacy/numCaptions*1e6:6.1f} µs/caption)")
+    print(f"  Compiled processor:  {tCompiled:8.3f} s  ({tCompiled/numCaptions*1e6:6.1f} µs/caption)")
+    print(f"Repeated processing of {workingSet} captions (10x)")
+    print(f"  Legacy processor:    {tLegacyRep:8.3f} s")
+    print(f"  Compiled + memo:     {tCompiledRep:8.3f} s", flush=True)
+
+
+if __name__ == "__main__":
+    numCaptions = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workingSet  = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    main(numCaptions, workingSet)
@@ -0,0 +1,114 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Latency of seek thumbnail updates while scrubbing over the seek bar, decoded vs. from sprites. Usage: python test/bench_scrub_preview.py [seconds] [num_updates]
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import tempfile, time, random
+import av
+import numpy as np
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QGuiApplication, QPixmap
+from av.video.reformatter import Interpolation
+from config import Config
+from lib import qtlib, videorw
+from lib.util import Singleton
+from lib.videosprites import SeekSpriteStore, SeekSprites
+from test_videoindex import createVideo
+
+
+THUMBNAIL_SIZE = 300
+W, H = 1280, 720
+
+
+def drawFrame(mat: np.ndarray, i: int):
+    mat[..., 0] = (np.arange(mat.shape[1]) + i*4) % 256
+    mat[..., 1] = (i * 3) % 256
+
+
+# Previous implementation: Each update seeks and decodes the frame in FrameExtractWorker
+class DecodePreview:
+    def __init__(self, path: str):
+        self.container = av.open(path, 'r')
+        stream = self.container.streams.video[0]
+        videorw.DECODE_PROFILE_SEEK.apply(stream)
+        self.convert = videorw.createFrameConverter(THUMBNAIL_SIZE, round(THUMBNAIL_SIZE * H / W), True, Interpolation.AREA)
+
+    def update(self, posMs: int) -> QPixmap:
+        stream = self.container.streams.video[0]
+        targetPts = int((posMs/1000) / stream.time_base)
+        self.container.seek(targetPts, stream=stream)
+
+        for frame in self.container.decode(stream):
+            if frame.pts + frame.duration >= targetPts:
+                image = qtlib.numpyToQImage(self.convert(frame), fromRGB=True)
+                return QPixmap.fromImage(image)
+        raise ValueError(f"No frame at position {posMs}")
+
+    def close(self):
+        self.container.close()
+
+
+# Same as SeekThumbnail.setSpriteTile
+def spritePreview(sprites: SeekSprites, posMs: int) -> QPixmap:
+    tile = sprites.tiles[sprites.indexAt(posMs)]
+    image = qtlib.numpyToQImage(tile, fromRGB=True)
+    image = image.scaled(THUMBNAIL_SIZE, round(THUMBNAIL_SIZE * H / W), Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    return QPixmap.fromImage(image)
+
+
+def printLatency(name: str, times: list[float]):
+    times = np.array(times) * 1000
+    print(f"  {name:<20} mean: {np.mean(times):8.3f} ms   p95: {np.percentile(times, 95):8.3f} ms   max: {np.max(times):8.3f} ms", flush=True)
+
+
+def main(seconds: int, numUpdates: int):
+    app = QGuiApplication()
+
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_scrub_") as folder:
+        Config.pathSeekSprites = os.path.join(folder, "sprites")
+        path = os.path.join(folder, "video.mp4")
+        createVideo(path, seconds*24, fps=24, gop=48, w=W, h=H, draw=drawFrame)
+        print(f"Scrub preview of {seconds} s video ({W}x{H}, keyframes every 2 s), {numUpdates} hover positions")
+
+        random.seed(0)
+        positions = [random.randrange(0, seconds*1000) for _ in range(numUpdates)]
+
+        tStart = time.perf_counter()
+        sprites = SeekSpriteStore().getOrCreate(path)
+        tCreate = time.perf_counter() - tStart
+
+        Singleton._instances.pop(SeekSpriteStore)
+        tStart = time.perf_counter()
+        loaded = SeekSpriteStore().get(path)
+        tLoad = time.perf_counter() - tStart
+        assert np.array_equal(loaded.timesMs, sprites.timesMs)
+
+        print(f"  Sprites: {len(sprites.timesMs)} tiles, created in {tCreate*1000:.1f} ms, loaded from disk in {tLoad*1000:.1f} ms")
+
+        decoder = DecodePreview(path)
+        decodeTimes, decodeSizes = list[float](), set()
+        for pos in positions:
+            tStart = time.perf_counter()
+            pixmap = decoder.update(pos)
+            decodeTimes.append(time.perf_counter() - tStart)
+            decodeSizes.add(pixmap.size().toTuple())
+        decoder.close()
+
+        spriteTimes, spriteSizes = list[float](), set()
+        for pos in positions:
+            tStart = time.perf_counter()
+            pixmap = spritePreview(loaded, pos)
+            spriteTimes.append(time.perf_counter() - tStart)
+            spriteSizes.add(pixmap.size().toTuple())
+
+        assert decodeSizes == spriteSizes
+        printLatency("Decode", decodeTimes)
+        printLatency("Sprites", spriteTimes)
+
+
+if __name__ == "__main__":
+    seconds    = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    numUpdates = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    main(seconds, numUpdates)
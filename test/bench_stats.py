@@ -0,0 +1,197 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Benchmark for stats loading. Usage: python test/bench_stats.py [num_files] [num_edited] [num_pool_files] [num_corpus_files]
+
+import tempfile, time, random, gc
+from collections import defaultdict
+from multiprocessing import Pool
+import numpy as np
+import cv2 as cv
+from PySide6.QtWidgets import QApplication
+app = QApplication()  # Needed for loading fonts during import
+
+from lib.captionfile import FileTypeSelector
+from stats.stats_tags import TagStatsLoadTask, TagsLoadFunctor
+from stats.stats_mask import MaskAreaLoadFunctor
+from stats.stats_pool import StatsProcessPool
+from stats.stats_corpus import FileCorpus, PostingsBuilder
+from stats.stats_base import CombineModeUnion, CombineModeIntersection, CombineModeExclusive, CombineModeMultiple
+from config import Config
+from lib.filelist import CachedPathSort
+
+
+def createCaptions(folder: str, numFiles: int, tagsPerFile: int = 20, vocabulary: int = 5000) -> list[str]:
+    files = list[str]()
+    for i in range(numFiles):
+        subfolder = os.path.join(folder, f"{i // 1000:04}")
+        if i % 1000 == 0:
+            os.makedirs(subfolder, exist_ok=True)
+
+        imgPath = os.path.join(subfolder, f"{i:07}.png")
+        files.append(imgPath)
+
+        tags = (f"tag {random.randrange(vocabulary)}" for _ in range(tagsPerFile))
+        FileTypeSelector.saveCaptionTxt(imgPath, ", ".join(tags))
+    return files
+
+
+def createMasks(files: list[str], size: int = 64):
+    for file in files:
+        mat = np.zeros((size, size), dtype=np.uint8)
+        x, y = random.randrange(size), random.randrange(size)
+        cv.circle(mat, (x, y), random.randrange(4, size//2), 255, -1)
+        cv.imwrite(file + "-masklabel.png", mat)
+
+
+class LegacyChunkFunctor:
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, items: list) -> list:
+        return [self.func(x) for x in items]
+
+
+def mapLegacyPool(files: list[str], func, chunkSize: int) -> float:
+    'Previous implementation: A new pool for each load and fixed chunk sizes.'
+    tStart = time.perf_counter()
+    chunks = [files[i:i+chunkSize] for i in range(0, len(files), chunkSize)]
+    with Pool(max(Config.galleryThumbnailThreads, 2)) as pool:
+        for result in pool.imap_unordered(LegacyChunkFunctor(func), chunks, 1):
+            pass
+    return time.perf_counter() - tStart
+
+
+def mapWarmPool(files: list[str], func, chunkSize: int) -> float:
+    task = TagStatsLoadTask(files, func)
+    tStart = time.perf_counter()
+    for result in task.map_auto(files, func, chunkSize):
+        pass
+    return time.perf_counter() - tStart
+
+
+def loadTags(files: list[str]) -> float:
+    loadFunc = TagsLoadFunctor(FileTypeSelector.loadCaptionTxt, (FileTypeSelector.TYPE_TXT, ""), ",", None)
+    task = TagStatsLoadTask(files, loadFunc)
+
+    tStart = time.perf_counter()
+    task.runLoad()
+    return time.perf_counter() - tStart
+
+
+def main(numFiles: int, numEdited: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_stats_") as tempdir:
+        import builtins
+        printOrig = builtins.print
+        builtins.print = lambda *args, **kwargs: None
+        try:
+            files = createCaptions(tempdir, numFiles)
+            tFull = loadTags(files)
+
+            for file in random.sample(files, numEdited):
+                FileTypeSelector.saveCaptionTxt(file, "edited tag, another tag")
+            tRefresh = loadTags(files)
+        finally:
+            builtins.print = printOrig
+
+        print(f"Tag stats for {numFiles} files")
+        print(f"  Full load:                        {tFull:8.3f} s")
+        print(f"  Refresh after editing {numEdited:5} files: {tRefresh:8.3f} s", flush=True)
+
+
+def mainPool(numFiles: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_pool_") as tempdir:
+        import builtins
+        printOrig = builtins.print
+        builtins.print = lambda *args, **kwargs: None
+        try:
+            files = createCaptions(tempdir, numFiles)
+            createMasks(files)
+
+            tagFunc  = TagsLoadFunctor(FileTypeSelector.loadCaptionTxt, (FileTypeSelector.TYPE_TXT, ""), ",", None)
+            maskFunc = MaskAreaLoadFunctor("{{path}}-masklabel.png", None)
+
+            times = dict[str, tuple[float, float, float]]()
+            for name, func, chunkSize in (("Tags", tagFunc, 128), ("Masks", maskFunc, 24)):
+                StatsProcessPool.shutdown()
+                tLegacy = mapLegacyPool(files, func, chunkSize)
+                tCold   = mapWarmPool(files, func, chunkSize)
+                tWarm   = mapWarmPool(files, func, chunkSize)
+                times[name] = (tLegacy, tCold, tWarm)
+        finally:
+            builtins.print = printOrig
+            StatsProcessPool.shutdown()
+
+        print(f"Multiprocessing for {numFiles} files (without cache)")
+        for name, (tLegacy, tCold, tWarm) in times.items():
+            print(f"  {name:5}  New pool per load: {tLegacy:8.3f} s   Shared pool (first): {tCold:8.3f} s   Shared pool (warm): {tWarm:8.3f} s", flush=True)
+
+
+def mainCorpus(numFiles: int, tagsPerFile: int = 50, vocabulary: int = 20000):
+    files = [f"/dataset/{i // 1000:04}/{i:07}.png" for i in range(numFiles)]
+    vocab = [sys.intern(f"tag {i}") for i in range(vocabulary)]
+    rng = np.random.default_rng(0)
+    fileTags = [
+        tuple(vocab[id] for id in ids)
+        for ids in (vocabulary * rng.random((numFiles, tagsPerFile))**3).astype(np.int32).tolist()
+    ]
+
+    # Previous implementation: Set of paths for each tag
+    tStart = time.perf_counter()
+    tagFiles = defaultdict[str, list[str]](list)
+    for file, tags in zip(files, fileTags):
+        for tag in tags:
+            tagFiles[tag].append(file)
+    tagSets = {tag: set(tagFiles) for tag, tagFiles in tagFiles.items()}
+    del tagFiles
+    tLegacyBuild = time.perf_counter() - tStart
+    memLegacy = sum(sys.getsizeof(fileSet) for fileSet in tagSets.values())
+
+    # Postings index
+    tStart = time.perf_counter()
+    corpus = FileCorpus(files)
+    fileIds = corpus.createIdMap()
+    builder = PostingsBuilder()
+    for file, tags in zip(files, fileTags):
+        builder.add(fileIds[file], tags)
+    del fileIds
+    tags, postings, counts = builder.build()
+    tagPostings = dict(zip(tags, postings))
+    tBuild = time.perf_counter() - tStart
+    memPostings = postings[0].base.nbytes if postings and postings[0].base is not None else sum(p.nbytes for p in postings)
+    del builder, fileTags
+    gc.collect()
+
+    # Select the most frequent tags
+    selection = sorted(tags, key=lambda tag: len(tagPostings[tag]), reverse=True)[:4]
+
+    print(f"Tag index for {numFiles} files with {tagsPerFile} tags ({len(tags)} unique)")
+    print(f"  Build:       Sets of paths: {tLegacyBuild:8.3f} s   Postings: {tBuild:8.3f} s")
+    print(f"  Memory:      Sets of paths: {memLegacy/1024**2:8.1f} MB  Postings: {memPostings/1024**2:8.1f} MB (without shared strings)")
+
+    for combineClass in (CombineModeUnion, CombineModeIntersection, CombineModeExclusive, CombineModeMultiple):
+        tStart = time.perf_counter()
+        combiner = combineClass()
+        for tag in selection:
+            combiner.addFiles(tagSets[tag])
+        legacyFiles = sorted(combiner.getFiles(), key=CachedPathSort())
+        tLegacy = time.perf_counter() - tStart
+
+        tStart = time.perf_counter()
+        ids = combineClass.combineIds([tagPostings[tag] for tag in selection], len(corpus))
+        newFiles = corpus.getFiles(ids)
+        tNew = time.perf_counter() - tStart
+
+        assert newFiles == legacyFiles
+        name = combineClass.__name__.removeprefix("CombineMode")
+        print(f"  {name:12} Sets of paths: {tLegacy*1000:8.1f} ms  Postings: {tNew*1000:8.1f} ms  ({len(newFiles)} files)", flush=True)
+
+
+if __name__ == "__main__":
+    numFiles  = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    numEdited = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    numPoolFiles = int(sys.argv[3]) if len(sys.argv) > 3 else 100_000
+    main(numFiles, numEdited)
+    numCorpusFiles = int(sys.argv[4]) if len(sys.argv) > 4 else 1_000_000
+    mainPool(numPoolFiles)
+    mainCorpus(numCorpusFiles)
@@ -0,0 +1,131 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Per-keystroke latency of autocomplete suggestions. Usage: python test/bench_suggestions.py [num_tags] [num_typed_tags]
+
+import tempfile, time, random, heapq
+from difflib import SequenceMatcher
+import numpy as np
+from config import Config
+from ui.autocomplete import (
+    NGramAutoCompleteSource, CsvAutoCompleteSource, CsvIndexCache, AutocompleteCsvLoader, AutoCompleteModel,
+    Suggestion, SuggestionScore, TagData
+)
+
+
+# Previous implementation: Jaccard index of each candidate from n-gram sets, ranking with difflib
+
+class LegacyNGramAutoCompleteSource(NGramAutoCompleteSource):
+    def getSuggestions(self, search: str) -> list[Suggestion]:
+        candidateTags = set[TagData]()
+        searchNgrams = set(self.getNgrams(search))
+        for ngram in searchNgrams:
+            if tags := self.ngrams.get(ngram):
+                candidateTags.update(tags)
+
+        candidates = list[tuple[float, TagData]]()
+        for tagData in candidateTags:
+            tagNgrams = set(self.getNgrams(tagData.tag))
+
+            intersect = len(searchNgrams & tagNgrams)
+            union     = len(searchNgrams) + len(tagNgrams) - intersect
+            jaccardIndex = intersect / union
+
+            if jaccardIndex >= self.MIN_RATIO:
+                if len(candidates) < self.MAX_RESULTS:
+                    heapq.heappush(candidates, (jaccardIndex, tagData))
+                elif jaccardIndex > candidates[0][0]:
+                    heapq.heapreplace(candidates, (jaccardIndex, tagData))
+
+        return [tagData.toSuggestion(self.scoreFactor, ratio) for ratio, tagData in candidates]
+
+class LegacySuggestionScore(SuggestionScore):
+    __slots__ = ('matcher',)
+
+    @property
+    def matchRatio(self) -> float:
+        if self._matchRatio < 0:
+            self.matcher.set_seq1(self.suggestion.tag)
+            self._matchRatio = self.matcher.ratio()
+        return self._matchRatio
+
+def scoreLegacy(source: NGramAutoCompleteSource, search: str) -> list[SuggestionScore]:
+    ctx = SuggestionScore.createContext(search, [search])
+    matcher = SequenceMatcher(b=search, autojunk=False)
+    scores = list[SuggestionScore]()
+    for sug in source.getSuggestions(search):
+        score = LegacySuggestionScore(ctx, sug)
+        score.matcher = matcher
+        scores.append(score)
+    return sorted(scores, reverse=True)
+
+
+def createCsv(path: str, numTags: int) -> list[str]:
+    # Booru-like tag table: Common words like 'hair' appear in many tags, frequencies follow a Zipf distribution
+    words = ["".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=random.randrange(3, 9))) for _ in range(8000)]
+    words[:8] = ["hair", "long", "eyes", "blue", "shirt", "holding", "smile", "open"]
+    weights = [1.0 / (i+1) for i in range(len(words))]
+
+    tags = set[str]()
+    while len(tags) < numTags:
+        tags.add("_".join(random.choices(words, weights, k=random.choice((1, 2, 2, 3)))))
+
+    with open(path, 'w') as file:
+        for i, tag in enumerate(tags):
+            aliases = f"{tag}s" if random.random() < 0.1 else ""
+            file.write(f'{tag},0,{10_000_000 // (i+1)},"{aliases}"\n')
+    return [tag.replace("_", " ") for tag in tags]
+
+def createTypedTexts(tags: list[str], numTexts: int) -> list[str]:
+    # Typed tags, some with typos
+    texts = random.sample(tags, numTexts)
+    for i in range(0, numTexts, 4):
+        pos = random.randrange(len(texts[i]))
+        texts[i] = texts[i][:pos] + random.choice("aeiou") + texts[i][pos+1:]
+    return texts
+
+
+def measureKeystrokes(scoreFunc, texts: list[str]) -> tuple[np.ndarray, list]:
+    times = list[float]()
+    results = list()
+    for text in texts:
+        for end in range(2, len(text)+1):  # TextEditCompleter.MIN_PREFIX_LEN
+            search = text[:end].strip()
+            tStart = time.perf_counter()
+            scores = scoreFunc(search)
+            times.append(time.perf_counter() - tStart)
+            results.append(sorted(score.suggestion.nGramRatio for score in scores))
+    return np.array(times) * 1000, results
+
+def printStats(name: str, times: np.ndarray):
+    p50, p90, p99 = np.percentile(times, (50, 90, 99))
+    print(f"  {name:28} p50 {p50:7.2f} ms   p90 {p90:7.2f} ms   p99 {p99:7.2f} ms   max {times.max():7.2f} ms", flush=True)
+
+
+def main(numTags: int, numTexts: int):
+    random.seed(1234)
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_suggestions_") as tempdir:
+        csvFolder = os.path.join(tempdir, "csv")
+        os.makedirs(csvFolder)
+        tags = createCsv(os.path.join(csvFolder, "tags.csv"), numTags)
+        texts = createTypedTexts(tags, numTexts)
+        Config.pathAutocompleteCache = os.path.join(tempdir, "cache")
+
+        legacy = LegacyNGramAutoCompleteSource()
+        AutocompleteCsvLoader(legacy).loadAll(csvFolder)
+        indexed = CsvAutoCompleteSource()
+        indexed.setIndex(CsvIndexCache.build(csvFolder))
+
+        tLegacy, legacyResults = measureKeystrokes(lambda search: scoreLegacy(legacy, search), texts)
+        tIndexed, indexResults = measureKeystrokes(lambda search: AutoCompleteModel.scoreSuggestions([indexed], search, [search]), texts)
+        assert indexResults == legacyResults
+
+        print(f"Autocomplete with {numTags} tags, {len(tLegacy)} keystrokes")
+        printStats("N-gram sets + difflib:", tLegacy)
+        printStats("Index counts + LCS:", tIndexed)
+
+
+if __name__ == "__main__":
+    numTags  = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    numTexts = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    main(numTags, numTexts)
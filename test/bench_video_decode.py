@@ -0,0 +1,107 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Decode time with different decode profiles and frame conversions. Usage: python test/bench_video_decode.py [seconds] [width] [height]
+
+import tempfile, time
+import av
+import numpy as np
+import cv2 as cv
+from lib import videorw
+from lib.videorw import DecodeProfile, createFrameConverter, Interpolation
+from test_videoindex import createVideo
+
+
+TARGET_SIZE = 448
+SAMPLE_INTERVAL = 12  # Convert every 12th frame
+
+CODECS = (("H.264", "libx264", "mp4"), ("VP9", "libvpx-vp9", "webm"), ("MPEG-4", "mpeg4", "avi"))
+
+PROFILES = (
+    ("NONE",              DecodeProfile(threadType="NONE", threadCount=1)),
+    ("SLICE",             DecodeProfile(threadType="SLICE")),
+    ("FRAME",             DecodeProfile(threadType="FRAME")),
+    ("AUTO",              DecodeProfile()),
+    ("AUTO, 2 threads",   DecodeProfile(threadCount=2)),
+    ("AUTO, no deblock",  DecodeProfile(skipLoopFilter=True)),
+)
+
+
+def drawFrame(mat: np.ndarray, i: int):
+    h, w = mat.shape[:2]
+    x = np.arange(w, dtype=np.uint16)
+    y = np.arange(h, dtype=np.uint16)[:, None]
+    mat[..., 0] = (x + i*4) % 256
+    mat[..., 1] = (y + i*2) % 256
+    mat[..., 2] = ((x ^ y) + i) % 256
+
+
+# Previous conversion: Full size RGB, then resize
+def convertFullSize(w: int, h: int):
+    convert = createFrameConverter()
+    scale = TARGET_SIZE / max(w, h)
+    size = (round(w * scale), round(h * scale))
+    return lambda frame: cv.resize(convert(frame), size, interpolation=cv.INTER_AREA)
+
+def convertScaled(w: int, h: int):
+    scale = TARGET_SIZE / max(w, h)
+    return createFrameConverter(round(w * scale), round(h * scale), interpolation=Interpolation.AREA)
+
+
+def decodeAll(path: str, profile: DecodeProfile, converterFactory) -> tuple[float, list[np.ndarray]]:
+    'Sequential decoding, every 12th frame is converted.'
+    tStart = time.perf_counter()
+    frames = list[np.ndarray]()
+    with av.open(path, 'r') as container:
+        stream = container.streams.video[0]
+        profile.apply(stream)
+        convert = converterFactory(*videorw.avGetFrameSize(stream))
+        for i, frame in enumerate(container.decode(stream)):
+            if i % SAMPLE_INTERVAL == 0:
+                frames.append(convert(frame))
+    return time.perf_counter() - tStart, frames
+
+def sampleKeyframes(path: str, profile: DecodeProfile) -> tuple[float, list[np.ndarray]]:
+    'Thumbnail tiles from keyframes.'
+    tStart = time.perf_counter()
+    request = videorw.ThumbnailFrames(512, 3)
+    videorw.FrameExtractor(profile).extract(path, [request])
+    tiles, size = request.result()
+    return time.perf_counter() - tStart, [tiles]
+
+
+def printResult(name: str, t: float, frames: list[np.ndarray], reference: list[np.ndarray]):
+    assert len(frames) == len(reference) and all(a.shape == b.shape for a, b in zip(frames, reference))
+    diff = max(float(np.mean(np.abs(a.astype(np.float32) - b))) for a, b in zip(frames, reference))
+    print(f"    {name:<26} {t*1000:8.1f} ms   mean abs diff: {diff:5.2f}", flush=True)
+
+
+def main(seconds: int, w: int, h: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_decode_") as folder:
+        for codecName, codec, ext in CODECS:
+            path = os.path.join(folder, f"clip.{ext}")
+            createVideo(path, seconds*24, fps=24, gop=48, w=w, h=h, draw=drawFrame, codec=codec)
+            print(f"{codecName}: {seconds} s, {w}x{h}, keyframes every 2 s, {os.cpu_count()} CPUs")
+
+            print(f"  Sequential decode, every {SAMPLE_INTERVAL}th frame converted to {TARGET_SIZE} px")
+            t, reference = decodeAll(path, PROFILES[0][1], convertScaled)
+            printResult(PROFILES[0][0], t, reference, reference)
+            for name, profile in PROFILES[1:]:
+                t, frames = decodeAll(path, profile, convertScaled)
+                printResult(name, t, frames, reference)
+
+            t, frames = decodeAll(path, DecodeProfile(), convertFullSize)
+            printResult("AUTO, full size + resize", t, frames, reference)
+
+            print(f"  Thumbnail from 9 keyframes")
+            t, reference = sampleKeyframes(path, DecodeProfile())
+            printResult("Default", t, reference, reference)
+            t, frames = sampleKeyframes(path, videorw.DECODE_PROFILE_THUMBNAIL)
+            printResult("Thumbnail profile", t, frames, reference)
+
+
+if __name__ == "__main__":
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    w       = int(sys.argv[2]) if len(sys.argv) > 2 else 1920
+    h       = int(sys.argv[3]) if len(sys.argv) > 3 else 1080
+    main(seconds, w, h)
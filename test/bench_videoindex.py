@@ -0,0 +1,76 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+# Reading video metadata and keyframes, with and without the persistent video index. Usage: python test/bench_videoindex.py [num_files]
+
+import tempfile, time, shutil
+from config import Config
+from lib import videorw
+from lib.util import Singleton
+from lib.videoindex import VideoIndex
+from test_videoindex import createVideo
+
+
+def createVideos(folder: str, numFiles: int) -> list[str]:
+    # Encode a few templates of different length, then copy the files
+    templates = list[str]()
+    for i, seconds in enumerate((2, 4, 8, 16)):
+        path = os.path.join(folder, f"template{i}.mp4")
+        createVideo(path, seconds*24, fps=24, gop=24, w=320, h=240)
+        templates.append(path)
+
+    files = list[str]()
+    for i in range(numFiles):
+        path = os.path.join(folder, f"{i:05}.mp4")
+        shutil.copyfile(templates[i % len(templates)], path)
+        files.append(path)
+    return files
+
+
+# Previous implementation: Open the video for each call
+def readLegacy(files: list[str]) -> list:
+    results = list()
+    for path in files:
+        w, h, fps, frameCount, duration = videorw.readMetadata(path)
+        results.append((w, h, frameCount, videorw.getKeyframes(path, 1, duration)))
+    return results
+
+def readIndex(files: list[str]) -> list:
+    index = VideoIndex()
+    results = list()
+    for path in files:
+        info = index.getInfo(path)
+        results.append((info.width, info.height, info.frameCount, index.getKeyframes(path, 1, info.duration)))
+    return results
+
+
+def measure(name: str, func, files: list[str]) -> list:
+    tStart = time.perf_counter()
+    results = func(files)
+    t = time.perf_counter() - tStart
+    print(f"  {name:<28} {t:8.3f} s   {t / len(files) * 1000:7.3f} ms/file", flush=True)
+    return results
+
+
+def main(numFiles: int):
+    with tempfile.TemporaryDirectory(prefix="qapyq_bench_videoindex_") as folder:
+        Config.pathVideoIndex = os.path.join(folder, "index")
+        files = createVideos(folder, numFiles)
+        print(f"Reading metadata and keyframes of {numFiles} videos (2-16 s, 320x240)")
+
+        legacy = measure("Without index", readLegacy, files)
+
+        cold = measure("Index: First read", readIndex, files)
+        assert cold == legacy
+        warm = measure("Index: Cached", readIndex, files)
+        assert warm == legacy
+
+        VideoIndex().save()
+        Singleton._instances.pop(VideoIndex)
+        loaded = measure("Index: Loaded from disk", readIndex, files)
+        assert loaded == legacy
+
+
+if __name__ == "__main__":
+    numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    main(numFiles)
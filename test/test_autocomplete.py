@@ -0,0 +1,163 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile, random, time
+from config import Config
+from lib.ngram_index import NGramIndex, NGramIndexBuilder
+from ui.autocomplete import NGramAutoCompleteSource, CsvAutoCompleteSource, CsvIndexCache, AutocompleteCsvLoader, SuggestionScore
+
+
+def writeCsv(path: str, rand: random.Random, numTags: int):
+    words = ["hair", "long", "blue", "black", "eyes", "shirt", "skirt", "smile", "open", "mouth", "cat", "ears", "ü", "日本"]
+    with open(path, 'w', encoding="utf-8") as file:
+        for i in range(numTags):
+            tag = "_".join(rand.sample(words, rand.randrange(1, 4)))
+            aliases = ",".join(f"{tag}_{k}" for k in range(rand.randrange(3))) if rand.random() < 0.2 else ""
+            file.write(f'{tag},{rand.randrange(6)},{rand.randrange(30, 100000)},"{aliases}"\n')
+
+
+
+class NGramIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_autocomplete_")
+        self.csvFolder = os.path.join(self.tempdir.name, "csv")
+        os.makedirs(self.csvFolder)
+        self.csvPath = os.path.join(self.csvFolder, "tags.csv")
+        writeCsv(self.csvPath, random.Random(42), 2000)
+
+        self.origCachePath = Config.pathAutocompleteCache
+        self.origExclude = Config.autocomplete["exclude_categories"]
+        Config.pathAutocompleteCache = os.path.join(self.tempdir.name, "cache")
+        Config.autocomplete["exclude_categories"] = [5]
+
+    def tearDown(self):
+        Config.pathAutocompleteCache = self.origCachePath
+        Config.autocomplete["exclude_categories"] = self.origExclude
+        self.tempdir.cleanup()
+
+    def loadLegacy(self) -> NGramAutoCompleteSource:
+        source = NGramAutoCompleteSource()
+        AutocompleteCsvLoader(source).loadAll(self.csvFolder)
+        return source
+
+
+    def test_suggestions(self):
+        legacy = self.loadLegacy()
+        built = CsvAutoCompleteSource()
+        built.setIndex(CsvIndexCache.build(self.csvFolder))
+        loaded = CsvAutoCompleteSource()
+        loaded.setIndex(CsvIndexCache.load(self.csvFolder))
+        self.assertIsNotNone(loaded.index)
+
+        searches = ("hair", "blue ey", "ca", "x", "", "long hair", "日本", "smile open mouth", "zzz")
+        for search in searches:
+            # Ties at the result limit are resolved in set order by the legacy source, so compare only the scores
+            expected = sorted(s.nGramRatio for s in legacy.getSuggestions(search))
+            self.assertEqual(sorted(s.nGramRatio for s in built.getSuggestions(search)), expected, f"Search: {search}")
+
+        origMaxResults = NGramAutoCompleteSource.MAX_RESULTS
+        NGramAutoCompleteSource.MAX_RESULTS = 100_000
+        try:
+            for search in searches:
+                expected = sorted(legacy.getSuggestions(search))
+                self.assertEqual(sorted(built.getSuggestions(search)), expected, f"Search: {search}")
+                self.assertEqual(sorted(loaded.getSuggestions(search)), expected, f"Search: {search}")
+        finally:
+            NGramAutoCompleteSource.MAX_RESULTS = origMaxResults
+
+        loaded.setIndex(None)
+        self.assertEqual(loaded.getSuggestions("hair"), [])
+
+    def test_save_load(self):
+        builder = NGramIndexBuilder()
+        builder.addTag("long hair", 0, 100)
+        builder.addTag("ü", 1, 5)
+        builder.addTag("long_hair", 0, 0, aliasFor="long hair")
+        index = builder.build("build1")
+
+        path = os.path.join(self.tempdir.name, "index.ngram")
+        index.save(path)
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+        loaded = NGramIndex.load(path)
+        self.assertIsNotNone(loaded)
+        self.assertEqual(loaded.buildId, "build1")
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual([loaded.getTag(i) for i in range(3)], ["long hair", "ü", "long_hair"])
+        self.assertEqual(loaded.aliasFor.tolist(), [-1, -1, 0])
+        self.assertEqual(loaded.postings.tolist(), index.postings.tolist())
+        self.assertEqual(loaded.getCandidates(["lon", "air"]).tolist(), [0, 2])
+        self.assertEqual(loaded.getCandidates(["  ü"]).tolist(), [1])
+        self.assertEqual(len(loaded.getCandidates(["xyz"])), 0)
+
+        ids, ratios = loaded.getRatios({" lo", "lon", "ong", "xyz"})
+        self.assertEqual(ids.tolist(), [0, 2])
+        self.assertEqual(ratios.tolist(), [2/9, 2/9])
+        ids, ratios = loaded.getRatios({"  ü", " ü "})
+        self.assertEqual(ids.tolist(), [1])
+        self.assertEqual(ratios.tolist(), [0.5])
+        loaded.close()
+
+        self.assertIsNone(NGramIndex.load(os.path.join(self.tempdir.name, "missing.ngram")))
+
+    def test_validation(self):
+        CsvIndexCache.build(self.csvFolder)
+        self.assertIsNotNone(CsvIndexCache.load(self.csvFolder))
+
+        # Same content with new mtime is still valid
+        time.sleep(0.01)
+        with open(self.csvPath, 'rb') as file:
+            data = file.read()
+        with open(self.csvPath, 'wb') as file:
+            file.write(data)
+        self.assertIsNotNone(CsvIndexCache.load(self.csvFolder))
+
+        # Changed settings
+        Config.autocomplete["exclude_categories"] = []
+        self.assertIsNone(CsvIndexCache.load(self.csvFolder))
+        Config.autocomplete["exclude_categories"] = [5]
+        self.assertIsNotNone(CsvIndexCache.load(self.csvFolder))
+
+        # Changed content
+        time.sleep(0.01)
+        with open(self.csvPath, 'a') as file:
+            file.write("new_tag,0,500,\n")
+        self.assertIsNone(CsvIndexCache.load(self.csvFolder))
+
+        # Additional file
+        CsvIndexCache.build(self.csvFolder)
+        self.assertIsNotNone(CsvIndexCache.load(self.csvFolder))
+        writeCsv(os.path.join(self.csvFolder, "more.csv"), random.Random(1), 10)
+        self.assertIsNone(CsvIndexCache.load(self.csvFolder))
+
+
+
+class SuggestionScoreTest(unittest.TestCase):
+    @staticmethod
+    def lcsLength(a: str, b: str) -> int:
+        table = [[0] * (len(b)+1) for _ in range(len(a)+1)]
+        for i, charA in enumerate(a):
+            for k, charB in enumerate(b):
+                table[i+1][k+1] = table[i][k] + 1 if charA == charB else max(table[i][k+1], table[i+1][k])
+        return table[-1][-1]
+
+    def test_indel_ratio(self):
+        rand = random.Random(42)
+        for _ in range(2000):
+            search = "".join(rand.choices("abc dü", k=rand.randrange(0, 12)))
+            tag = "".join(rand.choices("abc dü", k=rand.randrange(0, 12)))
+            expected = 2 * self.lcsLength(search, tag) / (len(search) + len(tag)) if (search or tag) else 1.0
+
+            ctx = SuggestionScore.createContext(search, [search])
+            self.assertEqual(SuggestionScore.indelRatio(ctx, tag), expected, f"Search: '{search}', Tag: '{tag}'")
+
+    def test_long_search(self):
+        search = "very long search text " * 10
+        ctx = SuggestionScore.createContext(search, [search])
+        self.assertEqual(SuggestionScore.indelRatio(ctx, search), 1.0)
+        self.assertEqual(SuggestionScore.indelRatio(ctx, "very long"), 2 * 9 / (len(search) + 9))
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
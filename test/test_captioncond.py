@@ -1,8 +1,9 @@
 import sys, os
 sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
 
-import unittest
+import unittest, random, ast
 from caption.caption_conditionals import *
+from caption.caption_filter import ConditionalsFilter
 
 
 class CaptionFilterTest(unittest.TestCase):
@@ -139,5 +140,180 @@ class CaptionFilterTest(unittest.TestCase):
 
 
 
+class LegacyConditionalFilterRule(ConditionalFilterRule):
+    'Previous evaluator which walks the AST for each evaluation.'
+
+    def evaluateExpression(self, tags: list[str]) -> ConditionVariableParser | None:
+        if self._parsedExpression:
+            results, variables = self._evalAll(tags)
+            if self._eval(results, variables):
+                return ConditionVariableParser(variables)
+            return None
+
+        match self._expression:
+            case "and": variables = self._evalAnd(tags)
+            case "or":  variables = self._evalOr(tags)
+            case _:
+                return None
+
+        if variables:
+            return ConditionVariableParser(variables)
+        return None
+
+    def _eval(self, condResults: dict[str, bool], condVariables: dict[str, list[str]]) -> bool:
+        def getAttr(value, attr: str):
+            match attr:
+                case "val":
+                    return condVariables.get(value, [""])[0]
+                case _:
+                    return False
+
+        def eval(node):
+            match node:
+                case ast.UnaryOp(op=op, operand=operand):
+                    return self.OPS[type(op)](eval(operand))
+                case ast.BinOp(left=left, op=op, right=right):
+                    return self.OPS[type(op)](eval(left), eval(right))
+                case ast.Compare(left=left, ops=[op], comparators=[comparator]):
+                    return self.OPS[type(op)](eval(left), eval(comparator))
+                case ast.Attribute(value=value, attr=attr):
+                    return getAttr(value.id, attr) if isinstance(value, ast.Name) else False
+                case ast.Constant(value=value):
+                    return value
+                case ast.Name(id=id):
+                    return condResults.get(id, False)
+                case _:
+                    raise TypeError(node)
+
+        try:
+            return bool(eval(self._parsedExpression.body))
+        except:
+            return False
+
+
+class CompiledRuleTest(unittest.TestCase):
+    TAGS = [f"tag{i}" for i in range(12)] + ["red shirt", "blue shirt", "long hair", "hair"]
+
+    EXPRESSIONS = [
+        "", "and", "or", "AND", "A", "not A", "A & B", "A and B", "A or B", "A xor B", "(A | B) & not C",
+        "A == B", "A != C", "A.val == 'tag1'", "A.val != B.val", "A.all", "D.val == ''", "True", "False",
+        "~A", "A < B", "A and (B or C)", "A +", "1 == 1 == 1", "E", "A & 'x'",
+    ]
+
+    def randomTags(self, rand: random.Random, maxTags: int = 8) -> list[str]:
+        # With duplicates
+        return rand.choices(self.TAGS, k=rand.randrange(0, maxTags))
+
+    def randomCondition(self, rand: random.Random) -> ConditionFunc:
+        tagParam = ", ".join(self.randomTags(rand, 4))
+        match rand.randrange(8):
+            case 0: return createCondAllTagsPresent([tagParam])
+            case 1: return createCondAnyTagsPresent([tagParam])
+            case 2: return createCondNumTagsPresent([tagParam, str(rand.randrange(0, 3)), rand.choice(["", "1", "2", "3"])])
+            case 3: return createCondAnyWordsPresent([rand.choice(["shirt", "hair", "red, long"])])
+            case 4: return createCondAnyStringsPresent([rand.choice(["ta", "g1", "shi"])])
+            case 5: return createCondAllLengthsBetween([str(rand.randrange(0, 5)), str(rand.randrange(4, 10))])
+            case 6: return createCondAnyTagContainsRegex([rand.choice([r"tag(\d)", r"(\w+) shirt", "["])])
+            case _: return createCondNumTagsPresent([tagParam, "2", "1"])
+
+    def createRules(self, rand: random.Random, ruleClass) -> list[ConditionalFilterRule]:
+        rules = list[ConditionalFilterRule]()
+        for _ in range(rand.randrange(1, 6)):
+            rule = ruleClass()
+            rule.setExpression(rand.choice(self.EXPRESSIONS))
+            for var in "ABCD"[:rand.randrange(0, 5)]:
+                rule.conditions[var] = self.randomCondition(rand)
+
+            match rand.randrange(3):
+                case 0: rule.actions.append(createActionAddTags([f"{{{{A}}}} x, tag{rand.randrange(12)}"]))
+                case 1: rule.actions.append(createActionRemoveTags([", ".join(self.randomTags(rand, 3))]))
+                case _: rule.actions.append(createActionReplaceTags([", ".join(self.randomTags(rand, 3)), "{{B.all}},hair"]))
+            rules.append(rule)
+        return rules
+
+    def copyRules(self, rules: list[ConditionalFilterRule], ruleClass) -> list[ConditionalFilterRule]:
+        copies = list[ConditionalFilterRule]()
+        for rule in rules:
+            copy = ruleClass()
+            copy._expression, copy._parsedExpression = rule._expression, rule._parsedExpression
+            copy.conditions = dict(rule.conditions)
+            copy.actions = list(rule.actions)
+            copies.append(copy)
+        return copies
+
+    def assertVarParserEqual(self, expected: ConditionVariableParser | None, actual: ConditionVariableParser | None, msg: str):
+        if expected is None:
+            self.assertIsNone(actual, msg)
+        else:
+            self.assertIsNotNone(actual, msg)
+            self.assertEqual(expected.vars, actual.vars, msg)
+
+
+    def test_random_rules(self):
+        rand = random.Random(1234)
+        for _ in range(300):
+            rules = self.createRules(rand, ConditionalFilterRule)
+            legacyRules = self.copyRules(rules, LegacyConditionalFilterRule)
+
+            for _ in range(20):
+                tags = self.randomTags(rand)
+                for rule, legacyRule in zip(rules, legacyRules):
+                    msg = f"Expression: '{rule._expression}', Tags: {tags}"
+                    self.assertVarParserEqual(legacyRule.evaluateExpression(tags), rule.evaluateExpression(tags), msg)
+                    self.assertEqual(legacyRule.evaluateExpressionForUpdate(tags), rule.evaluateExpressionForUpdate(tags), msg)
+
+    def test_random_filter(self):
+        rand = random.Random(5678)
+        for sidechain in (False, True):
+            for _ in range(300):
+                rules = self.createRules(rand, ConditionalFilterRule)
+                legacyRules = self.copyRules(rules, LegacyConditionalFilterRule)
+
+                filter = ConditionalsFilter()
+                filter.setup(rules, "; ", sidechain)
+
+                for _ in range(20):
+                    tags = self.randomTags(rand)
+                    expected = self.filterLegacy(legacyRules, list(tags), "; ", sidechain)
+                    self.assertEqual(expected, filter.filterCaptions(list(tags)), f"Tags: {tags}")
+
+    @staticmethod
+    def filterLegacy(rules: list[ConditionalFilterRule], captions: list[str], separator: str, sidechain: bool) -> list[str]:
+        newCaptions = list[str]()
+        for rule in rules:
+            if varParser := rule.evaluateExpression(captions):
+                if sidechain:
+                    for action in rule.actions:
+                        newCaptions = action(varParser, newCaptions)
+                else:
+                    varParser.separator = separator
+                    for action in rule.actions:
+                        captions = action(varParser, captions)
+
+        return newCaptions if sidechain else captions
+
+    def test_shared_bitset(self):
+        ruleA = ConditionalFilterRule()
+        ruleA.setExpression("and")
+        ruleA.conditions["A"] = createCondAllTagsPresent(["tag1, tag2"])
+        ruleB = ConditionalFilterRule()
+        ruleB.setExpression("not A")
+        ruleB.conditions["A"] = createCondAnyTagsPresent(["tag3, tag2"])
+
+        tagBits = ConditionalFilterRule.assignTagBits([ruleA, ruleB])
+        self.assertEqual(len(tagBits), 3)
+        ruleA.compile(tagBits)
+        ruleB.compile(tagBits)
+
+        bitset = TagBitset(["tag2", "tag0", "tag1"], tagBits)
+        self.assertEqual(ruleA.evaluateBitset(bitset).vars, {"A": ["tag2", "tag1"]})
+        self.assertIsNone(ruleB.evaluateBitset(bitset))
+
+        bitset = TagBitset(["tag1", "tag1"], tagBits)
+        self.assertIsNone(ruleA.evaluateBitset(bitset))
+        self.assertEqual(ruleB.evaluateBitset(bitset).vars, {})
+
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,329 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile, json, threading, multiprocessing, random
+from unittest import mock
+from config import Config
+from lib import captionfile
+from lib.captionfile import CaptionFile, CaptionFileWriter, CaptionFileLock, CaptionBulkLoader, FileTypeSelector
+from lib.captionstore import CaptionStore, importJson
+from lib.bulkread import BulkReader
+
+
+def updateKeys(jsonPath: str, prefix: str, count: int):
+    for i in range(count):
+        captionFile = CaptionFile(jsonPath)
+        captionFile.addCaption(f"{prefix}_{i}", f"caption {i}")
+        captionFile.updateToJson()
+
+def crashWhileWriting(jsonPath: str):
+    'Writes half of the JSON and then exits the process without cleanup.'
+    def dumpCrash(data, file, **kwargs):
+        text = json.dumps(data, **kwargs)
+        file.write(text[:len(text)//2])
+        file.flush()
+        os._exit(1)
+
+    with mock.patch.object(captionfile.json, "dump", dumpCrash):
+        captionFile = CaptionFile(jsonPath)
+        captionFile.addCaption("caption", "new " * 1000)
+        captionFile.saveToJson()
+
+
+
+class CaptionFileWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_captionfile_")
+        self.jsonPath = os.path.join(self.tempdir.name, "image.json")
+
+        captionFile = CaptionFile(self.jsonPath)
+        captionFile.addCaption("caption", "old caption")
+        captionFile.addTags("tags", "a, b")
+        captionFile.saveToJson()
+
+        with open(self.jsonPath, 'r') as file:
+            self.origText = file.read()
+
+    def tearDown(self):
+        Config.captionJsonCompact = False
+        self.tempdir.cleanup()
+
+    def load(self) -> CaptionFile:
+        captionFile = CaptionFile(self.jsonPath)
+        self.assertTrue(captionFile.loadFromJson())
+        return captionFile
+
+    def assertUnchanged(self):
+        with open(self.jsonPath, 'r') as file:
+            self.assertEqual(file.read(), self.origText)
+        self.assertEqual(self.load().getCaption("caption"), "old caption")
+
+    def assertNoTempFiles(self):
+        self.assertEqual(os.listdir(self.tempdir.name), ["image.json"])
+
+
+    def test_save_update(self):
+        captionFile = CaptionFile(self.jsonPath)
+        captionFile.addCaption("caption", "new caption")
+        captionFile.addCaption("other", "other caption")
+        self.assertTrue(captionFile.updateToJson())
+
+        captionFile = self.load()
+        self.assertEqual(captionFile.captions, {"caption": "new caption", "other": "other caption"})
+        self.assertEqual(captionFile.tags, {"tags": "a, b"})
+        self.assertNoTempFiles()
+
+    def test_compact(self):
+        Config.captionJsonCompact = True
+        captionFile = self.load()
+        captionFile.addCaption("other", "other caption")
+        captionFile.saveToJson()
+
+        with open(self.jsonPath, 'r') as file:
+            text = file.read()
+        self.assertNotIn("\n", text)
+        self.assertNotIn(", ", text.replace("a, b", ""))
+        self.assertEqual(self.load().captions, {"caption": "old caption", "other": "other caption"})
+
+    @unittest.skipIf(os.name == "nt", "No POSIX permissions")
+    def test_keep_permissions(self):
+        os.chmod(self.jsonPath, 0o640)
+        self.load().saveToJson()
+        self.assertEqual(os.stat(self.jsonPath).st_mode & 0o777, 0o640)
+
+
+    def test_fail_during_dump(self):
+        def dumpFail(data, file, **kwargs):
+            file.write('{"version": "1.0", "capt')
+            raise RuntimeError("Injected failure")
+
+        captionFile = self.load()
+        captionFile.addCaption("caption", "new caption")
+        with mock.patch.object(captionfile.json, "dump", dumpFail):
+            with self.assertRaises(RuntimeError):
+                captionFile.saveToJson()
+            with self.assertRaises(RuntimeError):
+                captionFile.updateToJson()
+
+        self.assertUnchanged()
+        self.assertNoTempFiles()
+
+    def test_fail_fsync(self):
+        captionFile = self.load()
+        captionFile.addCaption("caption", "new caption")
+        with mock.patch.object(captionfile.os, "fsync", side_effect=OSError("Injected failure")):
+            with self.assertRaises(OSError):
+                captionFile.saveToJson()
+
+        self.assertUnchanged()
+        self.assertNoTempFiles()
+
+    def test_fail_replace(self):
+        captionFile = self.load()
+        captionFile.addCaption("caption", "new caption")
+        with mock.patch.object(captionfile.os, "replace", side_effect=OSError("Injected failure")):
+            with self.assertRaises(OSError):
+                captionFile.saveToJson()
+
+        self.assertUnchanged()
+        self.assertNoTempFiles()
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Requires fork")
+    def test_crash_during_write(self):
+        proc = multiprocessing.get_context("fork").Process(target=crashWhileWriting, args=(self.jsonPath,))
+        proc.start()
+        proc.join()
+        self.assertEqual(proc.exitcode, 1)
+
+        # The temporary file of the crashed process is left behind, but the caption file is intact
+        self.assertUnchanged()
+
+
+    def test_concurrent_threads(self):
+        numThreads, numUpdates = 6, 30
+        readErrors = list[str]()
+        stopReading = threading.Event()
+
+        def read():
+            while not stopReading.is_set():
+                try:
+                    with open(self.jsonPath, 'r') as file:
+                        json.load(file)
+                except Exception as ex:
+                    readErrors.append(str(ex))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+
+        threads = [threading.Thread(target=updateKeys, args=(self.jsonPath, f"t{i}", numUpdates)) for i in range(numThreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stopReading.set()
+        reader.join()
+
+        self.assertEqual(readErrors, [])
+        self.assertEqual(len(self.load().captions), numThreads * numUpdates + 1)
+        self.assertNoTempFiles()
+        self.assertEqual(CaptionFileLock._locks, {})
+
+    @unittest.skipUnless(captionfile.fcntl and hasattr(os, "fork"), "Requires fcntl and fork")
+    def test_concurrent_processes(self):
+        numProcs, numUpdates = 4, 30
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=updateKeys, args=(self.jsonPath, f"p{i}", numUpdates)) for i in range(numProcs)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+            self.assertEqual(proc.exitcode, 0)
+
+        self.assertEqual(len(self.load().captions), numProcs * numUpdates + 1)
+        self.assertNoTempFiles()
+
+
+
+class CaptionFileWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_captionfile_")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_coalesce(self):
+        pngPath = os.path.join(self.tempdir.name, "image.png")
+        jpgPath = os.path.join(self.tempdir.name, "image.jpg")
+        otherPath = os.path.join(self.tempdir.name, "other.png")
+
+        with mock.patch.object(captionfile, "writeJsonAtomic", wraps=captionfile.writeJsonAtomic) as writeMock:
+            with CaptionFileWriter() as writer:
+                captionFile = writer.load(pngPath)
+                captionFile.addCaption("caption", "png caption")
+                writer.save(captionFile)
+
+                captionFile = writer.load(jpgPath)
+                self.assertEqual(captionFile.getCaption("caption"), "png caption")
+                captionFile.addTags("tags", "jpg tags")
+                writer.save(captionFile)
+
+                captionFile = writer.load(otherPath)
+                captionFile.addCaption("caption", "other caption")
+                writer.save(captionFile)
+
+                self.assertEqual(writeMock.call_count, 0)
+                self.assertFalse(os.path.exists(os.path.join(self.tempdir.name, "image.json")))
+
+            self.assertEqual(writeMock.call_count, 2)
+
+        captionFile = CaptionFile(pngPath)
+        self.assertTrue(captionFile.loadFromJson())
+        self.assertEqual(captionFile.captions, {"caption": "png caption"})
+        self.assertEqual(captionFile.tags, {"tags": "jpg tags"})
+
+    def test_invalid_file(self):
+        jsonPath = os.path.join(self.tempdir.name, "image.json")
+        with open(jsonPath, 'w') as file:
+            file.write("{invalid")
+
+        writer = CaptionFileWriter()
+        self.assertIsNone(writer.load(jsonPath))
+        self.assertEqual(writer.flush(), 0)
+
+
+
+class CaptionBulkLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_captionfile_")
+        self.origMinScan = BulkReader.MIN_SCAN
+        BulkReader.MIN_SCAN = 8
+
+        rand = random.Random(42)
+        self.files = list[str]()
+        for folderNr in range(3):
+            folder = os.path.join(self.tempdir.name, f"folder{folderNr}")
+            os.makedirs(folder)
+            for i in range(150):
+                imgPath = os.path.join(folder, f"img{i:03}.png")
+                self.files.append(imgPath)
+
+                match rand.randrange(5):
+                    case 0: continue # No caption files
+                    case 1:
+                        with open(os.path.splitext(imgPath)[0] + ".json", 'w') as file:
+                            file.write("{invalid")
+                        continue
+                    case 2:
+                        with open(os.path.splitext(imgPath)[0] + ".json", 'w') as file:
+                            json.dump({"captions": {"caption": "no version"}}, file)
+                        continue
+
+                captionFile = CaptionFile(imgPath)
+                captionFile.addCaption("caption", f"caption {folderNr} {i}")
+                if i % 2:
+                    captionFile.addTags("tags", f"tags {folderNr} {i}")
+                captionFile.saveToJson()
+
+                with open(os.path.splitext(imgPath)[0] + ".txt", 'w') as file:
+                    file.write(f"text {folderNr} {i} ü")
+
+        rand.shuffle(self.files)
+        self.files.append(self.files[0])
+        self.files.append(os.path.join(self.tempdir.name, "missing", "img.png"))
+
+    def tearDown(self):
+        BulkReader.MIN_SCAN = self.origMinScan
+        CaptionStore.resetLookup()
+        self.tempdir.cleanup()
+
+    def assertSameAsSingle(self, keyType: str, key: str):
+        if keyType == FileTypeSelector.TYPE_TXT:
+            expected = [FileTypeSelector.loadCaptionTxt(file) for file in self.files]
+        else:
+            expected = [FileTypeSelector.loadCaptionJson(keyType, key, file) for file in self.files]
+
+        loader = CaptionBulkLoader(keyType, key)
+        self.assertEqual(loader.loadMany(self.files), expected)
+        self.assertEqual(loader(self.files[5]), expected[5])
+        return expected
+
+
+    def test_load_many(self):
+        with mock.patch("builtins.print"):
+            self.assertIn("text 2 139 ü", self.assertSameAsSingle(FileTypeSelector.TYPE_TXT, ""))
+            self.assertSameAsSingle(FileTypeSelector.TYPE_CAPTIONS, "caption")
+            self.assertSameAsSingle(FileTypeSelector.TYPE_TAGS, "tags")
+            self.assertEqual(set(self.assertSameAsSingle(FileTypeSelector.TYPE_TAGS, "missing")), {None})
+
+    def test_store(self):
+        with mock.patch("builtins.print"):
+            importJson(os.path.join(self.tempdir.name, "folder1"))
+            self.assertSameAsSingle(FileTypeSelector.TYPE_CAPTIONS, "caption")
+            self.assertSameAsSingle(FileTypeSelector.TYPE_TAGS, "tags")
+
+    def test_caption_file_load_many(self):
+        with mock.patch("builtins.print"):
+            results = CaptionFile.loadMany(self.files)
+            expected = dict[str, CaptionFile]()
+            for file in self.files:
+                captionFile = CaptionFile(file)
+                if captionFile.loadFromJson():
+                    expected[file] = captionFile
+
+        self.assertEqual(list(results.keys()), list(expected.keys()))
+        for file, captionFile in results.items():
+            self.assertEqual(captionFile._toData(), expected[file]._toData())
+
+    def test_read_errors(self):
+        def readFail(path: str):
+            raise RuntimeError("Injected failure")
+
+        with self.assertRaises(RuntimeError):
+            BulkReader.read(self.files, readFail)
+        self.assertEqual(BulkReader.read([], readFail), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -1,8 +1,8 @@
 import sys, os
 sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
 
-import unittest, itertools
-from caption.caption_filter import CaptionRulesProcessor
+import unittest, itertools, random
+from caption.caption_filter import CaptionRulesProcessor, CaptionRulesSettings, MutuallyExclusiveFilter, PriorityFilter
 from caption.caption_preset import MutualExclusivity
 import caption.caption_conditionals as cond
 
@@ -488,6 +488,117 @@ class CaptionFilterConditionalsTest(BaseCaptionFilterTest):
         self.assertProcessedEqual("b, a, z, x, c", "b, _z_")
 
 
+class CaptionFilterExclusiveTablesTest(unittest.TestCase):
+    'Compares the filters, which are compiled into lookup tables, with a straightforward implementation.'
+
+    def setUp(self):
+        random.seed(1234)
+        self.tags = [f"tag{i}" for i in range(30)]
+        self.groups = [random.sample(self.tags, random.randrange(1, 6)) for _ in range(12)]
+        self.groups.append(["tag1", "tag2", "tag1"])  # Duplicate in group
+
+    def randomCaptions(self) -> list[str]:
+        return [random.choice(self.tags) for _ in range(random.randrange(0, 20))]
+
+    @staticmethod
+    def referenceExclusive(groups: list[list[str]], captions: list[str], keepFirst: bool) -> list[str]:
+        enumerated = list(enumerate(captions))
+        if not keepFirst:
+            enumerated.reverse()
+
+        deleteIndices = set()
+        for group in groups:
+            exists = False
+            for i, cap in enumerated:
+                if cap in group:
+                    if exists:
+                        deleteIndices.add(i)
+                    exists = True
+        return [cap for i, cap in enumerate(captions) if i not in deleteIndices]
+
+    @staticmethod
+    def referencePriority(groups: list[list[str]], captions: list[str]) -> list[str]:
+        allDeleteIndices = set()
+        for group in groups:
+            prios = {cap: prio for prio, cap in enumerate(group)}
+            indices = [i for i, cap in enumerate(captions) if cap in prios]
+            if indices:
+                keepIndex = max(indices, key=lambda i: (prios[captions[i]], -i))
+                allDeleteIndices.update(i for i in indices if i != keepIndex)
+        return [cap for i, cap in enumerate(captions) if i not in allDeleteIndices]
+
+    def test_exclusive(self):
+        for exclusivity, keepFirst in ((MutualExclusivity.KeepFirst, True), (MutualExclusivity.KeepLast, False)):
+            filter = MutuallyExclusiveFilter(exclusivity)
+            filter.setup(self.groups)
+            for _ in range(500):
+                captions = self.randomCaptions()
+                expected = self.referenceExclusive(self.groups, captions, keepFirst)
+                self.assertEqual(filter.filterCaptions(captions.copy()), expected, f"{exclusivity} {captions}")
+
+    def test_priority(self):
+        filter = PriorityFilter()
+        filter.setup(self.groups)
+        for _ in range(500):
+            captions = self.randomCaptions()
+            expected = self.referencePriority(self.groups, captions)
+            self.assertEqual(filter.filterCaptions(captions.copy()), expected, f"{captions}")
+
+
+
+class CaptionRulesMemoTest(BaseCaptionFilterTest):
+    def setUp(self):
+        self.rulesProcessor = CaptionRulesProcessor(", ", True, False, True, False, False)
+        self.rulesProcessor.setPrefixSuffix("", "", False, False)
+        self.rulesProcessor.setCaptionGroups([(["a", "b", "c"], MutualExclusivity.Disabled, False)])
+
+    def tearDown(self):
+        del self.rulesProcessor
+
+
+    def test_memoized(self):
+        self.assertProcessedEqual("x, c, a", "a, c, x")
+        self.assertEqual(len(self.rulesProcessor._memo), 1)
+        self.assertProcessedEqual("x, c, a", "a, c, x")
+        self.assertEqual(len(self.rulesProcessor._memo), 1)
+
+    def test_invalidate(self):
+        self.assertProcessedEqual("x, c, a", "a, c, x")
+
+        self.rulesProcessor.setBannedCaptions(["x"])
+        self.assertProcessedEqual("x, c, a", "a, c")
+
+        self.rulesProcessor.setSearchReplacePairs([("a", "b")])
+        self.assertProcessedEqual("x, c, a", "b, c")
+
+        self.rulesProcessor.setPrefixSuffix("p", "", True, False)
+        self.assertProcessedEqual("x, c, a", "p, b, c")
+
+        self.rulesProcessor.setCaptionGroups([(["c", "b"], MutualExclusivity.Disabled, False)])
+        self.assertProcessedEqual("x, c, a", "p, c, b")
+
+    def test_settings(self):
+        settings = CaptionRulesSettings()
+        self.assertEqual(self.rulesProcessor.process("c, a", settings), "a, c")
+
+        settings.sort = False
+        self.assertEqual(self.rulesProcessor.process("c, a", settings), "c, a")
+
+    def test_nondeterministic(self):
+        self.rulesProcessor.setSearchReplacePairs([("a", "{{static:a, b#shuffle}}")])
+        self.assertFalse(self.rulesProcessor.replaceFilter.deterministic)
+        self.rulesProcessor.process("a")
+        self.assertEqual(len(self.rulesProcessor._memo), 0)
+
+        self.rulesProcessor.setSearchReplacePairs([("(a)", "{{0#upper}}")])
+        self.assertTrue(self.rulesProcessor.replaceFilter.deterministic)
+
+    def test_literal_replacement(self):
+        # Replacements without variables are parsed once: Stripped, and backslashes are not interpreted by re.sub
+        self.rulesProcessor.setSearchReplacePairs([("a", r" \1  \n ")])
+        self.assertProcessedEqual("a", r"\1 \n")
+
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,165 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile, json, threading, sqlite3
+from lib.captionfile import CaptionFile, CaptionFileWriter
+from lib.captionstore import CaptionStore, importJson, exportJson
+
+
+class CaptionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_captionstore_")
+        self.root = self.tempdir.name
+        self.subdir = os.path.join(self.root, "sub")
+        os.makedirs(self.subdir)
+
+        for folder, name in ((self.root, "a"), (self.subdir, "b")):
+            captionFile = CaptionFile(os.path.join(folder, f"{name}.png"))
+            captionFile.addCaption("caption", f"caption {name}")
+            captionFile.addTags("tags", f"tag {name}")
+            captionFile.addMetric("score", 0.5)
+            captionFile.saveToJson()
+
+        with open(os.path.join(self.root, "other.json"), 'w') as file:
+            json.dump({"not": "a caption file"}, file)
+
+    def tearDown(self):
+        CaptionStore.resetLookup()
+        self.tempdir.cleanup()
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def load(self, imgPath: str) -> CaptionFile | None:
+        captionFile = CaptionFile(imgPath)
+        return captionFile if captionFile.loadFromJson() else None
+
+
+    def test_import(self):
+        self.assertIsNone(CaptionStore.forFolder(self.subdir))
+        self.assertEqual(importJson(self.root, deleteJson=True), 2)
+
+        self.assertFalse(os.path.exists(self.path("a.json")))
+        self.assertFalse(os.path.exists(self.path("sub", "b.json")))
+        self.assertTrue(os.path.exists(self.path("other.json")))
+
+        store = CaptionStore.forFolder(self.subdir)
+        self.assertIs(store, CaptionStore.forFolder(self.root))
+        self.assertEqual(store.count(), 2)
+
+        captionFile = self.load(self.path("sub", "b.png"))
+        self.assertEqual(captionFile.captions, {"caption": "caption b"})
+        self.assertEqual(captionFile.tags, {"tags": "tag b"})
+        self.assertEqual(captionFile.metrics, {"score": 0.5})
+        self.assertTrue(captionFile.jsonExists())
+
+        self.assertIsNone(self.load(self.path("missing.png")))
+        self.assertIsNone(self.load(self.path("other.png")))
+
+    def test_save_update(self):
+        importJson(self.root, deleteJson=True)
+
+        captionFile = CaptionFile(self.path("a.png"))
+        captionFile.addCaption("other", "other caption")
+        self.assertTrue(captionFile.updateToJson())
+        self.assertEqual(self.load(self.path("a.png")).captions, {"caption": "caption a", "other": "other caption"})
+
+        captionFile = CaptionFile(self.path("sub", "new.png"))
+        self.assertFalse(captionFile.jsonExists())
+        captionFile.addTags("tags", "new tags")
+        captionFile.saveToJson()
+        self.assertEqual(self.load(self.path("sub", "new.png")).tags, {"tags": "new tags"})
+        self.assertFalse(os.path.exists(self.path("sub", "new.json")))
+
+        with CaptionFileWriter() as writer:
+            captionFile = writer.load(self.path("sub", "new.jpg"))
+            captionFile.addCaption("caption", "new caption")
+            writer.save(captionFile)
+        captionFile = self.load(self.path("sub", "new.png"))
+        self.assertEqual((captionFile.captions, captionFile.tags), ({"caption": "new caption"}, {"tags": "new tags"}))
+
+        self.assertTrue(captionFile.deleteJson())
+        self.assertFalse(captionFile.jsonExists())
+        self.assertFalse(captionFile.deleteJson())
+
+    def test_load_many(self):
+        files = [self.path("sub", "b.png"), self.path("missing.png"), self.path("a.png")]
+        jsonResults = CaptionFile.loadMany(files)
+        self.assertEqual(list(jsonResults.keys()), [files[0], files[2]])
+
+        importJson(self.root, deleteJson=True)
+        storeResults = CaptionFile.loadMany(files)
+        self.assertEqual(list(storeResults.keys()), [files[0], files[2]])
+        for file in storeResults:
+            self.assertEqual(storeResults[file]._toData(), jsonResults[file]._toData())
+
+    def test_concurrent_updates(self):
+        importJson(self.root, deleteJson=True)
+        numThreads, numUpdates = 4, 25
+
+        def update(prefix: str):
+            for i in range(numUpdates):
+                captionFile = CaptionFile(self.path("a.png"))
+                captionFile.addCaption(f"{prefix}_{i}", "caption")
+                self.assertTrue(captionFile.updateToJson())
+
+        threads = [threading.Thread(target=update, args=(f"t{i}",)) for i in range(numThreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.load(self.path("a.png")).captions), numThreads * numUpdates + 1)
+
+    def test_export(self):
+        with open(self.path("a.json"), 'r') as file:
+            origData = json.load(file)
+
+        importJson(self.root, deleteJson=True)
+        captionFile = CaptionFile(self.path("sub", "b.png"))
+        captionFile.addCaption("caption", "changed")
+        captionFile.updateToJson()
+
+        self.assertEqual(exportJson(self.root, deleteStore=True), 2)
+        self.assertFalse(os.path.exists(self.path(CaptionStore.FILENAME)))
+        self.assertIsNone(CaptionStore.forFolder(self.root))
+
+        with open(self.path("a.json"), 'r') as file:
+            self.assertEqual(json.load(file), origData)
+        self.assertEqual(self.load(self.path("sub", "b.png")).captions, {"caption": "changed"})
+
+        with self.assertRaises(FileNotFoundError):
+            exportJson(self.root)
+
+    def test_external_changes(self):
+        # Databases created and removed by another process are found when the cached lookup expires
+        self.assertIsNone(CaptionStore.forFolder(self.subdir))
+
+        dbPath = self.path(CaptionStore.FILENAME)
+        con = sqlite3.connect(dbPath)
+        con.execute("CREATE TABLE captions (path TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID")
+        con.close()
+        self.assertIsNone(CaptionStore.forFolder(self.subdir))
+
+        origTTL = CaptionStore.LOOKUP_TTL
+        CaptionStore.LOOKUP_TTL = 0
+        try:
+            store = CaptionStore.forFolder(self.subdir)
+            self.assertIsNotNone(store)
+            self.assertEqual(store.count(), 0)
+
+            os.remove(dbPath)
+            self.assertIsNone(CaptionStore.forFolder(self.subdir))
+            self.assertIsNone(self.load(self.path("missing.png")))
+
+            # Removed database is not recreated
+            with self.assertRaises(sqlite3.OperationalError):
+                store.count()
+            self.assertFalse(os.path.exists(dbPath))
+        finally:
+            CaptionStore.LOOKUP_TTL = origTTL
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
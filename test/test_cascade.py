@@ -651,5 +651,86 @@ class CascadeTest(unittest.TestCase):
 
 
 
+    def testIncrementalLargeGraph(self):
+        # 100 chains with 100 nodes each: Half of the chains start with 'tags.a', the other half with 'tags.b'
+        numChains, chainLength = 100, 100
+        templates = dict[str, str]()
+        for c in range(numChains):
+            templates[f"tags.c{c}_0"] = "{{tags.a}}" if c < numChains//2 else "{{tags.b}}"
+            for k in range(1, chainLength):
+                templates[f"tags.c{c}_{k}"] = f"{{{{tags.c{c}_{k-1}}}}}{k%10}"
+        templates["text"] = f"{{{{tags.c0_{chainLength-1}}}}} {{{{tags.c{numChains-1}_{chainLength-1}}}}}"
+
+        def expectedTags(a: str, b: str) -> dict[str, str]:
+            tags = {"a": a, "b": b}
+            for c in range(numChains):
+                value = a if c < numChains//2 else b
+                for k in range(chainLength):
+                    if k > 0:
+                        value += str(k%10)
+                    tags[f"c{c}_{k}"] = value
+            return tags
+
+        with tempfile.TemporaryDirectory(prefix="qapyq_test_cascade_") as tempdir:
+            imgPath = os.path.join(tempdir, "test.jpg")
+            update = CascadeUpdate()
+            update._cache = CascadeGraphCache()
+            update._cache.addEntry(tempdir, templates)
+
+            graph = update._cache.getGraph(imgPath)
+            self.assertEqual(len(graph.nodes), numChains*chainLength + 3)
+
+            fullResets = 0
+            resetState = graph.resetState
+            def countResets(nodes=None):
+                nonlocal fullResets
+                fullResets += (nodes is None)
+                resetState(nodes)
+            graph.resetState = countResets
+
+            def save(captionFile: CaptionFile, key: str, expectedEvaluations: int):
+                numEvaluated = update.numEvaluated
+                update.saveCascade(imgPath, captionFile, "tags", key)
+                self.assertEqual(update.numEvaluated - numEvaluated, expectedEvaluations)
+                self.assertTrue(all(node.state == 0 for node in graph.nodes.values()))
+
+            captionFile = CaptionFile(imgPath)
+            captionFile.addTags("a", "A")
+            captionFile.addTags("b", "B")
+            save(captionFile, "a", numChains//2 * chainLength + 1 + chainLength)  # Last chain of 'tags.b' is evaluated as upstream for 'text'
+            save(captionFile, "b", numChains//2 * chainLength - chainLength)  # Reuses the upstream results and 'text'
+
+            expected = expectedTags("A", "B")
+            self.assertDictEqual(captionFile.tags, expected)
+            self.assertTextFile(imgPath, f"{expected[f'c0_{chainLength-1}']} {expected[f'c{numChains-1}_{chainLength-1}']}")
+
+            # Unchanged inputs: Nothing is evaluated again
+            save(captionFile, "a", 0)
+
+            # Only the chains downstream of the changed key are evaluated
+            captionFile.addTags("b", "X")
+            save(captionFile, "b", numChains//2 * chainLength + 1)
+            self.assertDictEqual(captionFile.tags, expectedTags("A", "X"))
+
+            # Modified values are restored from the remembered result
+            captionFile.addTags("c0_50", "modified")
+            save(captionFile, "a", 0)
+            self.assertDictEqual(captionFile.tags, expectedTags("A", "X"))
+
+            # Compare with full evaluation
+            fullUpdate = CascadeUpdate()
+            fullUpdate._cache = CascadeGraphCache()
+            fullUpdate._cache.addEntry(tempdir, templates)
+            fullCaptionFile = CaptionFile(imgPath)
+            fullCaptionFile.addTags("a", "A")
+            fullCaptionFile.addTags("b", "X")
+            fullUpdate.saveCascade(imgPath, fullCaptionFile, "tags", "a")
+            fullUpdate.saveCascade(imgPath, fullCaptionFile, "tags", "b")
+            self.assertDictEqual(captionFile.tags, fullCaptionFile.tags)
+
+            self.assertEqual(fullResets, 0)
+
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,164 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile
+import numpy as np
+import cv2 as cv
+from PIL import Image
+import ui.export_settings as export
+from ui.export_settings import ExportWriter, ExportBuffers, ImageExportTask
+from infer.model_settings import ScaleModelSettings
+
+
+class ExportWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_export_")
+        self.messages = list[str]()
+        self.writer = ExportWriter(self.messages.append)
+
+    def tearDown(self):
+        self.writer.finish()
+        self.tempdir.cleanup()
+
+    def load(self, path: str) -> np.ndarray:
+        with Image.open(path) as img:
+            return np.array(img)
+
+
+    def test_write(self):
+        path = os.path.join(self.tempdir.name, "sub", "image.png")
+        mat = np.zeros((8, 12, 3), dtype=np.uint8)
+        mat[..., 0] = 255  # Blue
+
+        self.writer.write(path, mat)
+        self.writer.finish()
+        self.assertEqual(self.load(path)[0, 0].tolist(), [0, 0, 255])
+        self.assertFalse(ExportWriter.isReserved(path))
+
+    def test_reserved_counter(self):
+        parser = export.ExportVariableParser()
+        pathTemplate = os.path.join(self.tempdir.name, "image.png")
+
+        paths = list[str]()
+        for i in range(5):
+            path = parser.parsePath(pathTemplate, False)
+            paths.append(path)
+            self.writer.write(path, np.full((4, 4, 3), i, dtype=np.uint8))
+
+        self.writer.finish()
+        self.assertEqual(len(set(paths)), 5)
+        self.assertEqual([int(self.load(path)[0, 0, 0]) for path in paths], list(range(5)))
+
+    def test_same_path_ordered(self):
+        path = os.path.join(self.tempdir.name, "image.png")
+        for i in range(6):
+            self.writer.write(path, np.full((64, 64, 3), i, dtype=np.uint8))
+
+        self.writer.finish()
+        self.assertEqual(int(self.load(path)[0, 0, 0]), 5)
+
+    def test_remove_alpha(self):
+        path = os.path.join(self.tempdir.name, "image.jpg")
+        mat = np.zeros((16, 16, 4), dtype=np.uint8)
+        mat[..., 2] = 255  # Red
+        mat[..., 3] = 255
+
+        self.writer.write(path, mat)
+        self.writer.finish()
+        pixel = self.load(path)[8, 8]
+        self.assertEqual(len(pixel), 3)
+        self.assertGreater(int(pixel[0]), 240)
+
+    def test_failed(self):
+        path = os.path.join(self.tempdir.name, "image.unknown")
+        self.writer.write(path, np.zeros((4, 4, 3), dtype=np.uint8))
+        self.writer.finish()
+        self.assertEqual(self.writer.numFailed, 1)
+        self.assertTrue(any(msg.startswith("WARNING: Failed to save") for msg in self.messages))
+
+
+
+class EncoderProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_encoder_")
+        rng = np.random.default_rng(5)
+        self.mat = rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_params(self):
+        for key, format in export.FORMATS.items():
+            for profile in export.ENCODER_PROFILES:
+                self.assertIs(format.getSaveParams(profile), format.profiles[profile], key)
+            self.assertIs(format.getSaveParams("unknown"), format.profiles[export.EncoderProfile.Balanced], key)
+
+        # Previous fixed settings
+        self.assertEqual(export.FORMATS["PNG"].getSaveParams(export.EncoderProfile.Legacy), {"optimize": True, "compress_level": 9})
+
+    def test_preset_profile(self):
+        self.assertEqual(export.getPresetEncoderProfile({}), export.EncoderProfile.Balanced)
+        self.assertEqual(export.getPresetEncoderProfile({"path_template": "{{name}}.png"}), export.EncoderProfile.Legacy)
+        self.assertEqual(export.getPresetEncoderProfile({"encoder_profile": export.EncoderProfile.Fast}), export.EncoderProfile.Fast)
+
+    def test_same_pixels(self):
+        for ext in ("png", "jpg", "webp", "tiff"):
+            decoded = []
+            for profile in export.ENCODER_PROFILES:
+                path = os.path.join(self.tempdir.name, f"{profile}.{ext}")
+                export.saveImage(path, self.mat.copy(), logger=lambda msg: None, profile=profile)
+                with Image.open(path) as img:
+                    decoded.append(np.array(img))
+
+            for mat in decoded[1:]:
+                self.assertTrue(np.array_equal(decoded[0], mat), ext)
+
+    def test_writer_profile(self):
+        writer = ExportWriter(profile=export.EncoderProfile.Fast)
+        pathFast = os.path.join(self.tempdir.name, "fast.png")
+        pathSmall = os.path.join(self.tempdir.name, "small.png")
+        mat = np.zeros((256, 256, 3), dtype=np.uint8)
+        mat[:, :, 1] = np.arange(256, dtype=np.uint8)
+
+        writer.write(pathFast, mat.copy())
+        writer.write(pathSmall, mat.copy(), profile=export.EncoderProfile.Smallest)
+        writer.finish()
+        self.assertLess(os.path.getsize(pathSmall), os.path.getsize(pathFast))
+
+
+
+class ExportBuffersTest(unittest.TestCase):
+    def tearDown(self):
+        ExportBuffers.clear()
+
+    def test_reuse(self):
+        large = ExportBuffers.get("test", (10, 20, 3), np.float32)
+        small = ExportBuffers.get("test", (5, 4, 3), np.float32)
+        self.assertEqual(small.shape, (5, 4, 3))
+        self.assertTrue(np.shares_memory(large, small))
+
+        other = ExportBuffers.get("other", (5, 4, 3), np.float32)
+        self.assertFalse(np.shares_memory(small, other))
+
+        larger = ExportBuffers.get("test", (20, 20, 3), np.uint8)
+        self.assertEqual(larger.dtype, np.uint8)
+        self.assertTrue(np.shares_memory(large, larger))
+
+        ExportBuffers.get("test", (21, 20, 3), np.float32)[:] = 0  # Grows
+
+    def test_lowpass(self):
+        ImageExportTask.initKernels()
+        rng = np.random.default_rng(3)
+        mat = cv.resize(rng.integers(0, 256, (30, 40, 3), dtype=np.uint8), (400, 300), interpolation=cv.INTER_CUBIC)
+
+        # Results don't depend on previous contents of the buffers
+        for mode in (ScaleModelSettings.LowPassFilter.Adaptive, ScaleModelSettings.LowPassFilter.Full):
+            first = ImageExportTask.filterLowPass(mat, 400, 300, 100, 75, mode).copy()
+            ImageExportTask.filterLowPass(np.zeros_like(mat), 400, 300, 100, 75, mode)
+            second = ImageExportTask.filterLowPass(mat, 400, 300, 100, 75, mode)
+            self.assertTrue(np.array_equal(first, second))
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
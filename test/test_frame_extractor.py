@@ -0,0 +1,157 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile
+import numpy as np
+from lib import videorw
+from lib.util import Singleton
+from host.imagecache import ImageFile, VideoFrameCache
+from test_videoindex import createVideo
+
+
+def drawIndex(mat: np.ndarray, i: int):
+    'Encodes the frame index as 9 bits in columns of the frame.'
+    w = mat.shape[1]
+    for bit in range(9):
+        mat[:, bit*w//9 : (bit+1)*w//9] = 255 if (i >> bit) & 1 else 0
+
+def frameIndex(mat: np.ndarray) -> int:
+    w = mat.shape[1]
+    columns = np.mean(mat, axis=(0, 2))
+    return sum(1 << bit for bit in range(9) if columns[(2*bit+1)*w//18] > 127)
+
+def converterFactory(w: int, h: int):
+    return videorw.createFrameConverter(w, h, format="rgb24")
+
+
+class FrameExtractorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_frames_")
+        cls.shortPath = os.path.join(cls.tempdir.name, "short.mp4")
+        createVideo(cls.shortPath, 120, fps=24, gop=24, w=144, draw=drawIndex)  # 5 s
+        cls.longPath = os.path.join(cls.tempdir.name, "long.mp4")
+        createVideo(cls.longPath, 288, fps=24, gop=48, w=144, draw=drawIndex)  # 12 s
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.cleanup()
+
+    def tearDown(self):
+        Singleton._instances.pop(VideoFrameCache, None)
+
+
+    def test_exact(self):
+        frames = videorw.extractFramesMat(self.shortPath, 1.0, 32, converterFactory)
+        self.assertEqual([frameIndex(f) for f in frames], [0, 30, 60, 90, 119])
+
+        frames, metadata = videorw.extractFramesPIL(self.shortPath, 0.0)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frameIndex(np.array(frames[0])), 0)
+
+    def test_keyframes(self):
+        # Long videos are sampled at keyframes: Positions at 2, 4, 6, 8, 10 s -> keyframes every 2 s
+        frames = videorw.extractFramesMat(self.longPath, 0.5, 5, converterFactory)
+        self.assertEqual([frameIndex(f) for f in frames], [48, 96, 144, 192, 240])
+
+        tiles, size = videorw.thumbnailVideo(self.longPath, 128, 2)
+        self.assertEqual(size, (144, 48))
+        self.assertEqual(tiles.shape, (42, 128, 3))
+
+    def test_thumbnail_long_gop(self):
+        # Tile interval (1 s) is shorter than the GOP: Repeated keyframes are replaced with exact frames
+        for gop in (48, 240):
+            path = os.path.join(self.tempdir.name, f"gop{gop}.mp4")
+            createVideo(path, 240, fps=24, gop=gop, w=144, draw=drawIndex)  # 10 s
+
+            tiles, size = videorw.thumbnailVideo(path, 3*144, 3)
+            h, w = tiles.shape[0] // 3, tiles.shape[1] // 3
+            indices = [frameIndex(tiles[y*h:(y+1)*h, x*w:(x+1)*w]) for y in range(3) for x in range(3)]
+            self.assertEqual(indices, [0, 48, 72, 96, 120, 144, 168, 192, 216], f"GOP {gop}")
+
+    def test_sample_long_gop(self):
+        # Keyframes every 10 s, sampled every ~1.8 s: Repeated keyframes are replaced with exact frames
+        path = os.path.join(self.tempdir.name, "gop120.mp4")
+        createVideo(path, 360, fps=12, gop=120, w=144, draw=drawIndex)  # 30 s
+
+        frames = videorw.extractFramesMat(path, 1.0, 16, converterFactory)
+        indices = [frameIndex(f) for f in frames]
+        self.assertEqual(len(indices), 16)
+        self.assertEqual(indices, sorted(set(indices)))
+        self.assertEqual(indices[0], 0)
+
+    def test_single_pass(self):
+        single = videorw.FrameExtractor()
+        caption = videorw.SampleFramesPIL(2.0, 32)
+        single.extract(self.shortPath, [caption])
+        tag = videorw.SampleFramesMat(1.0, 32, converterFactory)
+        single.extract(self.shortPath, [tag])
+
+        combined = videorw.FrameExtractor()
+        captionComb = caption.clone()
+        tagComb = tag.clone()
+        combined.extract(self.shortPath, [captionComb, tagComb])
+
+        self.assertEqual([frameIndex(np.array(f)) for f in captionComb.result()[0]], [frameIndex(np.array(f)) for f in caption.result()[0]])
+        self.assertEqual([frameIndex(f) for f in tagComb.result()], [frameIndex(f) for f in tag.result()])
+        self.assertLess(combined.numDecodedFrames, single.numDecodedFrames)
+
+    def test_profile(self):
+        self.assertEqual([videorw.getLowres(scale) for scale in (1.0, 0.6, 0.5, 0.3, 0.25, 0.1)], [0, 0, 1, 1, 2, 3])
+
+        # MPEG-4 Part 2 supports decoding at reduced resolution
+        path = os.path.join(self.tempdir.name, "mpeg4.avi")
+        createVideo(path, 96, fps=24, gop=24, w=640, h=480, codec="mpeg4")
+
+        class Request(videorw.ThumbnailFrames):
+            def addFrame(self, frame):
+                self.decodedSizes.append((frame.width, frame.height))
+                super().addFrame(frame)
+
+        request = Request(128, 2)
+        request.decodedSizes = []
+        videorw.FrameExtractor(videorw.DECODE_PROFILE_THUMBNAIL).extract(path, [request])
+        self.assertEqual(request.decodedSizes, [(160, 120)] * 4)
+        self.assertEqual(request.result()[0].shape, (96, 128, 3))
+
+    def test_cache(self):
+        cache = VideoFrameCache()
+        for path in (self.shortPath, self.longPath, self.shortPath):
+            imgFile = ImageFile(path)
+            captionFrames, metadata = imgFile.getVideoFrames(2.0, 32)
+            numDecoded = cache.extractor.numDecodedFrames
+            tagFrames = imgFile.getVideoFramesCvMat(1.0, 32, converterFactory, "test")
+            decodedForTags = cache.extractor.numDecodedFrames - numDecoded
+            self.assertTrue(captionFrames)
+            self.assertTrue(tagFrames)
+
+        # The tag frames were extracted together with the caption frames, and released when they were returned
+        self.assertEqual(decodedForTags, 0)
+        self.assertFalse(cache.results)
+
+        # Unused requests are forgotten
+        ImageFile(self.longPath).getVideoFrames(2.0, 32)
+        ImageFile(self.shortPath).getVideoFrames(2.0, 32)
+        self.assertEqual(len(cache.sharedRequests), 1)
+
+    def test_cache_changed_file(self):
+        path = os.path.join(self.tempdir.name, "changed.mp4")
+        createVideo(path, 120, fps=24, gop=24, w=144, draw=drawIndex)
+
+        imgFile = ImageFile(path)
+        imgFile.getVideoFrames(1.0, 32)
+        imgFile.getVideoFramesCvMat(1.0, 32, converterFactory, "test")
+        imgFile.getVideoFrames(1.0, 32)  # Also extracts the tag frames
+
+        # Overwritten in place: The tag frames of the previous video are not used
+        stat = os.stat(path)
+        createVideo(path, 120, fps=24, gop=24, w=144, draw=lambda mat, i: drawIndex(mat, i+100))
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        frames = ImageFile(path).getVideoFramesCvMat(1.0, 32, converterFactory, "test")
+        self.assertEqual(frameIndex(frames[0]), 100)
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,144 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import unittest, tempfile, time
+from PySide6.QtCore import QCoreApplication
+from PySide6.QtWidgets import QApplication
+from lib.filelist import FileList, resetReadExtensions
+from lib.captionfile import FileTypeSelector
+from gallery.gallery_caption import GalleryCaption
+from gallery.gallery_model import GalleryModel
+from gallery.caption_loader import CaptionLoader
+
+
+app = QApplication.instance() or QApplication()
+resetReadExtensions()
+
+
+class SlowCaptionSource:
+    'Fakes slow I/O when loading captions.'
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.prefix = "caption"
+
+    def loadCaption(self, file: str) -> str:
+        time.sleep(self.delay)
+        return f"{self.prefix} {os.path.basename(file)}"
+
+    def loadCaptions(self, files: list[str]) -> list[str]:
+        time.sleep(self.delay)
+        return [f"{self.prefix} {os.path.basename(file)}" for file in files]
+
+
+class GalleryCaptionLoadingTest(unittest.TestCase):
+    NUM_FILES = 24
+    IO_DELAY  = 0.05
+    MAX_FRAME_TIME = 0.03
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_gallery_caption_")
+        files = list[str]()
+        for i in range(self.NUM_FILES):
+            path = os.path.join(self.tempdir.name, f"img{i:02}.png")
+            open(path, 'wb').close()
+            files.append(path)
+
+        self.filelist = FileList()
+        self.filelist.loadFilesFixed(files)
+
+        captionSrc = FileTypeSelector()
+        self.source = SlowCaptionSource(self.IO_DELAY)
+        captionSrc.loadCaption = self.source.loadCaption
+        captionSrc.loadCaptions = self.source.loadCaptions
+
+        self.galleryCaption = GalleryCaption(captionSrc)
+        self.galleryCaption.captionsEnabled = True
+
+        self.model = GalleryModel(self.filelist, self.galleryCaption)
+        self.model.reloadImages()
+
+        self.changedRows = set[int]()
+        self.numDataChanged = 0
+        self.model.dataChanged.connect(self._onDataChanged)
+
+    def tearDown(self):
+        CaptionLoader().threadpool.waitForDone()
+        QCoreApplication.processEvents()
+        self.model.deleteLater()
+        self.tempdir.cleanup()
+
+    def _onDataChanged(self, startIndex, endIndex, roles):
+        self.numDataChanged += 1
+        self.changedRows.update(range(startIndex.row(), endIndex.row()+1))
+
+
+    def indexes(self):
+        return [self.model.getFileIndex(file) for file in self.filelist.getFiles()]
+
+    def paintFrame(self) -> tuple[float, list]:
+        tStart = time.perf_counter()
+        captions = [index.data(GalleryModel.ROLE_CAPTION) for index in self.indexes()]
+        return time.perf_counter() - tStart, captions
+
+    def waitLoaded(self, timeout: float = 10.0):
+        tEnd = time.monotonic() + timeout
+        while self.model._captionRequests or self.model._thumbnailUpdateQueue.endRow >= 0:
+            self.assertLess(time.monotonic(), tEnd, "Timeout while loading captions")
+            QCoreApplication.processEvents()
+            time.sleep(0.005)
+
+    def expectedCaption(self, index) -> str:
+        return f"{self.source.prefix} {index.data(GalleryModel.ROLE_FILENAME)}"
+
+
+    def test_frame_time(self):
+        frameTime, captions = self.paintFrame()
+        self.assertLess(frameTime, self.MAX_FRAME_TIME)
+        self.assertEqual(captions, [None] * self.NUM_FILES)
+
+        self.waitLoaded()
+
+        frameTime, captions = self.paintFrame()
+        self.assertLess(frameTime, self.MAX_FRAME_TIME)
+        self.assertEqual(captions, [self.expectedCaption(index) for index in self.indexes()])
+
+    def test_batched_updates(self):
+        self.paintFrame()
+        self.waitLoaded()
+
+        rows = set(index.row() for index in self.indexes())
+        self.assertEqual(self.changedRows, rows)
+        self.assertLess(self.numDataChanged, self.NUM_FILES)
+
+    def test_no_duplicate_requests(self):
+        for _ in range(5):
+            self.paintFrame()
+        self.assertEqual(len(self.model._captionRequests), self.NUM_FILES)
+
+    def test_reset_discards_outdated(self):
+        self.paintFrame()
+        self.model.resetCaptions(modelReset=False)
+        self.source.prefix = "reloaded"
+
+        _, captions = self.paintFrame()
+        self.assertEqual(captions, [None] * self.NUM_FILES)
+        self.waitLoaded()
+
+        _, captions = self.paintFrame()
+        self.assertEqual(captions, [self.expectedCaption(index) for index in self.indexes()])
+
+    def test_pending_document(self):
+        index = self.indexes()[0]
+        doc = index.data(GalleryModel.ROLE_CAPTION_DOC)
+        self.assertEqual(doc.toPlainText(), "")
+
+        self.waitLoaded()
+        self.assertEqual(doc.toPlainText(), self.expectedCaption(index))
+        self.assertFalse(doc.isUndoAvailable())
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
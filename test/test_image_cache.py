@@ -0,0 +1,145 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import unittest, tempfile, time
+from PySide6.QtGui import QImage, QColor
+from PySide6.QtWidgets import QApplication
+from lib.filelist import FileList, resetReadExtensions
+from ui.image_cache import ImageCache
+from config import Config
+
+
+app = QApplication.instance() or QApplication()
+resetReadExtensions()
+
+
+class ImageCacheTest(unittest.TestCase):
+    NUM_FILES = 8
+    IMAGE_SIZE = 64  # 64*64*4 = 16 KB
+
+    def setUp(self):
+        self.origCacheSize = Config.viewCacheSize
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_imagecache_")
+        self.files = list[str]()
+        for i in range(self.NUM_FILES):
+            path = os.path.join(self.tempdir.name, f"img{i}.png")
+            image = QImage(self.IMAGE_SIZE, self.IMAGE_SIZE, QImage.Format.Format_ARGB32)
+            image.fill(QColor(i*10, 0, 0))
+            image.save(path)
+            self.files.append(path)
+
+        self.cache = ImageCache()
+        self.cache._images.clear()
+        self.cache._size = 0
+
+    def tearDown(self):
+        self.cache.threadpool.waitForDone()
+        self.cache._images.clear()
+        self.cache._size = 0
+        Config.viewCacheSize = self.origCacheSize
+        self.tempdir.cleanup()
+
+    def loadImage(self, path: str) -> QImage:
+        image = QImage(path)
+        self.cache.put(path, image)
+        return image
+
+
+    def test_lru_size(self):
+        imageSize = QImage(self.files[0]).sizeInBytes()
+        Config.viewCacheSize = 1
+        maxImages = Config.viewCacheSize * 1024 * 1024 // imageSize
+        numImages = maxImages + 3
+
+        files = [os.path.join(self.tempdir.name, f"more{i}.png") for i in range(numImages)]
+        image = QImage(self.files[0])
+        for path in files:
+            image.save(path)
+
+        for path in files[:maxImages]:
+            self.loadImage(path)
+        self.assertIsNotNone(self.cache.get(files[0]))  # Most recently used
+
+        for path in files[maxImages:]:
+            self.loadImage(path)
+
+        self.assertLessEqual(self.cache.size, Config.viewCacheSize * 1024 * 1024)
+        self.assertIsNotNone(self.cache.get(files[0]))
+        self.assertIsNone(self.cache.get(files[1]))
+        self.assertIsNotNone(self.cache.get(files[-1]))
+
+    def test_invalidate(self):
+        path = self.files[0]
+        self.loadImage(path)
+        self.assertIsNotNone(self.cache.get(path))
+
+        image = QImage(self.IMAGE_SIZE*2, self.IMAGE_SIZE, QImage.Format.Format_ARGB32)
+        image.fill(QColor(0, 255, 0))
+        image.save(path)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        self.assertIsNone(self.cache.get(path))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_prefetch(self):
+        self.cache.prefetch(self.files[1:4] + ["missing.png"])
+        self.cache.threadpool.waitForDone()
+
+        for path in self.files[1:4]:
+            image = self.cache.get(path)
+            self.assertIsNotNone(image)
+            self.assertEqual(image.size().toTuple(), (self.IMAGE_SIZE, self.IMAGE_SIZE))
+
+        self.assertIsNone(self.cache.get(self.files[0]))
+        self.assertIsNone(self.cache.get("missing.png"))
+        self.assertEqual(self.cache._numWorkers, 0)
+
+    def test_wait_for_loading(self):
+        # get() waits while the file is loading instead of returning None
+        self.cache.prefetch(self.files)
+        tStart = time.monotonic()
+        while self.cache._numWorkers > 0 and time.monotonic() - tStart < 10:
+            for path in self.files:
+                if path in self.cache._loading:
+                    self.assertIsNotNone(self.cache.get(path))
+
+        self.cache.threadpool.waitForDone()
+        self.assertEqual(len(self.cache._images), self.NUM_FILES)
+
+
+    def test_adjacent_files(self):
+        filelist = FileList()
+        filelist.loadFilesFixed(self.files)
+        files = filelist.getFiles()
+
+        filelist.setCurrentIndex(0)
+        self.assertEqual(filelist.getAdjacentFiles(2), [files[1], files[-1], files[2], files[-2]])
+
+        filelist.setCurrentIndex(3)
+        self.assertEqual(filelist.getAdjacentFiles(1), [files[4], files[2]])
+        self.assertEqual(filelist.getAdjacentFiles(0), [])
+
+        # All files, without duplicates and without the current file
+        self.assertEqual(sorted(filelist.getAdjacentFiles(self.NUM_FILES)), sorted(files[:3] + files[4:]))
+
+        # Selection
+        filelist.setSelection([files[1], files[3], files[6]])
+        filelist.setCurrentIndex(3)
+        self.assertEqual(filelist.getAdjacentFiles(1), [files[6], files[1]])
+        self.assertEqual(filelist.getAdjacentFiles(3), [files[6], files[1]])
+
+        # Adjacent files match navigation
+        filelist.setSelection([])
+        adjacent = filelist.getAdjacentFiles(1)
+        filelist.setNextFile()
+        self.assertEqual(filelist.getCurrentFile(), adjacent[0])
+        filelist.setPrevFile()
+        filelist.setPrevFile()
+        self.assertEqual(filelist.getCurrentFile(), adjacent[1])
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,122 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile
+from PIL import Image, features
+import numpy as np
+from lib.imageheader import readImageSize
+from lib.mediasize import MediaSizeCache
+from lib.util import Singleton, getFileStamp
+from config import Config
+
+
+class ImageHeaderTest(unittest.TestCase):
+    SIZES = ((123, 45), (1, 1), (4000, 3), (16383, 2))
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_imageheader_")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def save(self, img: Image.Image, name: str, format: str, **kwargs) -> str:
+        path = os.path.join(self.tempdir.name, name)
+        img.save(path, format, **kwargs)
+        return path
+
+    def checkFormat(self, format: str, ext: str, mode="RGB", **kwargs):
+        for w, h in self.SIZES:
+            path = self.save(Image.new(mode, (w, h)), f"{w}x{h}.{ext}", format, **kwargs)
+            with Image.open(path) as img:
+                self.assertEqual(img.size, (w, h))
+            self.assertEqual(readImageSize(path), (w, h, False), f"{format} {kwargs} {w}x{h}")
+
+
+    def test_png(self):
+        self.checkFormat("PNG", "png")
+        self.checkFormat("PNG", "png", mode="LA")
+
+    def test_jpeg(self):
+        self.checkFormat("JPEG", "jpg")
+        self.checkFormat("JPEG", "jpg", progressive=True)
+        self.checkFormat("JPEG", "jpg", icc_profile=b"\x00" * 5000)
+
+    def test_jpeg_exif_orientation(self):
+        for orientation in range(1, 9):
+            exif = Image.Exif()
+            exif[0x0112] = orientation
+            path = self.save(Image.new("RGB", (64, 32)), f"exif{orientation}.jpg", "JPEG", exif=exif.tobytes())
+            self.assertEqual(readImageSize(path), (64, 32, orientation >= 5))
+
+    def test_webp(self):
+        self.checkFormat("WEBP", "webp")
+        self.checkFormat("WEBP", "webp", lossless=True)
+        self.checkFormat("WEBP", "webp", mode="RGBA")
+
+    def test_gif(self):
+        self.checkFormat("GIF", "gif")
+
+    def test_bmp(self):
+        self.checkFormat("BMP", "bmp")
+
+    @unittest.skipUnless(features.check("avif"), "PIL without AVIF support")
+    def test_avif(self):
+        self.checkFormat("AVIF", "avif")
+        self.checkFormat("AVIF", "avif", mode="RGBA")
+
+
+    def test_invalid(self):
+        path = self.save(Image.new("RGB", (64, 32)), "valid.jpg", "JPEG")
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        truncatedPath = os.path.join(self.tempdir.name, "truncated.jpg")
+        with open(truncatedPath, 'wb') as file:
+            file.write(data[:20])
+        self.assertIsNone(readImageSize(truncatedPath))
+
+        textPath = os.path.join(self.tempdir.name, "text.png")
+        with open(textPath, 'w') as file:
+            file.write("not an image")
+        self.assertIsNone(readImageSize(textPath))
+
+        self.assertIsNone(readImageSize(os.path.join(self.tempdir.name, "missing.png")))
+
+
+
+class MediaSizeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_mediasize_")
+        self.origPath = Config.pathSizeCache
+        Config.pathSizeCache = os.path.join(self.tempdir.name, "cache")
+        Singleton._instances.pop(MediaSizeCache, None)
+
+        self.files = list[str]()
+        for w, h in ((30, 20), (7, 9)):
+            path = os.path.join(self.tempdir.name, f"{w}x{h} ä.png")
+            Image.new("RGB", (w, h)).save(path)
+            self.files.append(path)
+
+    def tearDown(self):
+        Singleton._instances.pop(MediaSizeCache, None)
+        Config.pathSizeCache = self.origPath
+        self.tempdir.cleanup()
+
+    def test_persist(self):
+        sizes = [MediaSizeCache().readSize(file) for file in self.files]
+        self.assertEqual(sizes, [(30, 20, 0), (7, 9, 0)])
+        MediaSizeCache().save()
+
+        cacheFiles = os.listdir(Config.pathSizeCache)
+        self.assertEqual(len(cacheFiles), 1)
+        with np.load(os.path.join(Config.pathSizeCache, cacheFiles[0]), allow_pickle=False) as data:
+            self.assertEqual(data["entries"].shape, (2, 6))
+
+        Singleton._instances.pop(MediaSizeCache)
+        for file, size in zip(self.files, sizes):
+            self.assertEqual(MediaSizeCache().lookup(file, getFileStamp(file)), (True, size))
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,92 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageCms
+from PySide6.QtGui import QColorSpace
+from lib import imagerw
+from lib.imagerw import ColorTransformCache
+
+
+class ColorTransformCacheTest(unittest.TestCase):
+    def setUp(self):
+        ColorTransformCache.clear()
+        self.adobeProfile = QColorSpace(QColorSpace.NamedColorSpace.AdobeRgb).iccProfile().data()
+        self.srgbProfile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        rng = np.random.default_rng(7)
+        self.mat = rng.integers(0, 256, (32, 48, 3), dtype=np.uint8)
+
+    def loadPIL(self, iccProfile: bytes, mode: str = "RGB") -> Image.Image:
+        buffer = BytesIO()
+        Image.fromarray(self.mat).convert(mode).save(buffer, "PNG", icc_profile=iccProfile)
+        img = Image.open(buffer)
+        img.load()
+        return img
+
+    def test_pil(self):
+        expected = self.loadPIL(self.adobeProfile)
+        profile = ImageCms.ImageCmsProfile(BytesIO(self.adobeProfile))
+        ImageCms.profileToProfile(expected, profile, ImageCms.createProfile("sRGB"), inPlace=True)
+
+        for _ in range(2):
+            img = self.loadPIL(self.adobeProfile)
+            imagerw.normalizeColorSpacePIL(img)
+            self.assertEqual(img.tobytes(), expected.tobytes())
+        self.assertEqual(len(ColorTransformCache._transforms), 1)
+
+        # Separate transforms for each mode
+        img = self.loadPIL(self.adobeProfile, "RGBA")
+        imagerw.normalizeColorSpacePIL(img)
+        self.assertEqual(img.convert("RGB").tobytes(), expected.tobytes())
+        self.assertEqual(len(ColorTransformCache._transforms), 2)
+
+        # sRGB is not converted
+        img = self.loadPIL(self.srgbProfile)
+        imagerw.normalizeColorSpacePIL(img)
+        self.assertEqual(img.tobytes(), self.mat.tobytes())
+        self.assertEqual(len(ColorTransformCache._transforms), 3)
+
+    def test_max_size(self):
+        for i in range(ColorTransformCache.MAX_SIZE + 5):
+            ColorTransformCache.get(bytes([i]), "RGB", lambda: i)
+        self.assertEqual(len(ColorTransformCache._transforms), ColorTransformCache.MAX_SIZE)
+        self.assertEqual(ColorTransformCache.get(bytes([ColorTransformCache.MAX_SIZE + 4]), "RGB", lambda: None), ColorTransformCache.MAX_SIZE + 4)
+
+
+class ReducedDecodeTest(unittest.TestCase):
+    WIDTH  = 2000
+    HEIGHT = 1200
+
+    @classmethod
+    def setUpClass(cls):
+        mat = np.random.default_rng(3).integers(0, 256, (cls.HEIGHT, cls.WIDTH, 3), dtype=np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(mat).save(buffer, "JPEG", quality=90)
+        cls.jpeg = buffer.getvalue()
+        buffer = BytesIO()
+        Image.fromarray(mat).save(buffer, "PNG", compress_level=1)
+        cls.png = buffer.getvalue()
+
+    def loadSize(self, data: bytes, minSize) -> tuple[int, int]:
+        return imagerw.loadImagePIL(BytesIO(data), minSize=minSize).size
+
+    def test_jpeg(self):
+        self.assertEqual(self.loadSize(self.jpeg, None), (2000, 1200))
+        self.assertEqual(self.loadSize(self.jpeg, 448), (500, 300))       # Longest side
+        self.assertEqual(self.loadSize(self.jpeg, 250), (250, 150))
+        self.assertEqual(self.loadSize(self.jpeg, 1001), (2000, 1200))
+        self.assertEqual(self.loadSize(self.jpeg, (384, 384)), (1000, 600)) # Both sides
+        self.assertEqual(self.loadSize(self.jpeg, (250, 150)), (250, 150))
+
+        mat = imagerw.decodeMatBGR(self.jpeg, minSize=448)
+        self.assertEqual(mat.shape, (300, 500, 3))
+
+    def test_other_formats(self):
+        self.assertEqual(self.loadSize(self.png, 250), (2000, 1200))
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,152 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile, random, time
+from caption.caption_implications import ImplicationGraph
+from caption.caption_filter import ImplicationFilter
+from caption.caption_highlight import MatcherNode
+
+
+def referenceReachable(implications: dict[str, set[str]], tag: str) -> set[str]:
+    reached = set[str]()
+    queue = list(implications.get(tag, ()))
+    while queue:
+        t = queue.pop()
+        if t not in reached:
+            reached.add(t)
+            queue.extend(implications.get(t, ()))
+    return reached
+
+def referenceClosure(implications: dict[str, set[str]], tag: str) -> set[str]:
+    'Reachable tags, excluding tags that lead back to the start tag.'
+    return {t for t in referenceReachable(implications, tag) if tag not in referenceReachable(implications, t)}
+
+
+
+class ImplicationGraphTest(unittest.TestCase):
+    def assertImplied(self, graph: ImplicationGraph, tag: str, expected: set[str]):
+        self.assertEqual(set(graph.getImpliedTags(tag)), expected, f"Tag: {tag}")
+
+    def test_chain(self):
+        graph = ImplicationGraph.compile({"a": {"b"}, "b": {"c"}, "c": {"d"}})
+        self.assertImplied(graph, "a", {"b", "c", "d"})
+        self.assertImplied(graph, "c", {"d"})
+        self.assertImplied(graph, "d", set())
+        self.assertImplied(graph, "unknown", set())
+
+    def test_diamond(self):
+        graph = ImplicationGraph.compile({"a": {"b", "c"}, "b": {"d"}, "c": {"d"}, "d": {"e"}})
+        self.assertImplied(graph, "a", {"b", "c", "d", "e"})
+        self.assertEqual(len(graph.getImpliedIds(graph.tagIds["a"])), 4)
+
+    def test_cycle(self):
+        graph = ImplicationGraph.compile({"a": {"b"}, "b": {"c"}, "c": {"a", "d"}, "x": {"a"}})
+        self.assertImplied(graph, "a", {"d"})
+        self.assertImplied(graph, "b", {"d"})
+        self.assertImplied(graph, "x", {"a", "b", "c", "d"})
+
+    def test_self_implication(self):
+        graph = ImplicationGraph.compile({"a": {"a", "b"}})
+        self.assertImplied(graph, "a", {"b"})
+
+    def test_long_chain(self):
+        # Deeper than the recursion limit
+        numTags = sys.getrecursionlimit() * 2
+        implications = {f"t{i}": {f"t{i+1}"} for i in range(numTags)}
+        implications[f"t{numTags}"] = {"t0"}
+        graph = ImplicationGraph.compile(implications)
+        self.assertImplied(graph, "t5", set())
+
+    def test_random(self):
+        rand = random.Random(42)
+        for _ in range(20):
+            tags = [f"tag{i}" for i in range(40)]
+            implications = dict[str, set[str]]()
+            for _ in range(rand.randrange(10, 80)):
+                implications.setdefault(rand.choice(tags), set()).add(rand.choice(tags))
+
+            graph = ImplicationGraph.compile(implications)
+            for tag in tags:
+                self.assertImplied(graph, tag, referenceClosure(implications, tag))
+
+    def test_save_load(self):
+        graph = ImplicationGraph.compile({"a": {"b", "ü c"}, "b": {"d"}})
+        stamp = [("file.csv", 10, 123)]
+
+        with tempfile.TemporaryDirectory(prefix="qapyq_test_implications_") as tempdir:
+            path = os.path.join(tempdir, ImplicationGraph.CACHE_FILE)
+            graph.save(path, stamp)
+            self.assertEqual(os.listdir(tempdir), [ImplicationGraph.CACHE_FILE])
+
+            loaded = ImplicationGraph.load(path, stamp)
+            self.assertIsNotNone(loaded)
+            self.assertEqual(loaded.tags, graph.tags)
+            self.assertEqual(loaded.offsets, graph.offsets)
+            self.assertEqual(loaded.impliedIds, graph.impliedIds)
+            self.assertEqual(set(loaded.getImpliedTags("a")), {"b", "ü c", "d"})
+
+            self.assertIsNone(ImplicationGraph.load(path, [("file.csv", 10, 124)]))
+            self.assertIsNone(ImplicationGraph.load(path, stamp + [("other.csv", 5, 1)]))
+            self.assertIsNone(ImplicationGraph.load(os.path.join(tempdir, "missing.npz"), stamp))
+
+
+
+class ImplicationFilterTest(unittest.TestCase):
+    CSV_HEADER = "antecedent_name,consequent_name,status\n"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_implications_")
+        self.csvPath = os.path.join(self.tempdir.name, "implications.csv")
+        self.writeCsv([("long_hair", "hair"), ("black_hair", "dark_hair"), ("dark_hair", "hair"), ("cat", "animal"), ("animal", "cat")])
+
+        self.origFolder = ImplicationFilter.ImplicationCsvLoader.FOLDER
+        ImplicationFilter.ImplicationCsvLoader.FOLDER = self.tempdir.name
+        ImplicationFilter.IMPLICATIONS = None
+
+    def tearDown(self):
+        ImplicationFilter.ImplicationCsvLoader.FOLDER = self.origFolder
+        ImplicationFilter.IMPLICATIONS = None
+        self.tempdir.cleanup()
+
+    def writeCsv(self, rows: list[tuple[str, str]]):
+        with open(self.csvPath, 'w') as file:
+            file.write(self.CSV_HEADER)
+            for antecedent, consequent in rows:
+                file.write(f"{antecedent},{consequent},active\n")
+
+    def createFilter(self) -> ImplicationFilter:
+        ImplicationFilter.IMPLICATIONS = None
+        filter = ImplicationFilter()
+        filter.setup(MatcherNode())
+        return filter
+
+
+    def test_filter(self):
+        filter = self.createFilter()
+        captions = ["black hair", "hair", "dark hair", "long hair", "cat", "animal", "smile"]
+        self.assertEqual(filter.filterCaptions(captions), ["black hair", "long hair", "cat", "animal", "smile"])
+        self.assertEqual(filter.filterCaptions(["smile"]), ["smile"])
+
+    def test_compiled_cache(self):
+        self.createFilter()
+        cachePath = os.path.join(self.tempdir.name, ImplicationGraph.CACHE_FILE)
+        self.assertTrue(os.path.exists(cachePath))
+
+        # Loaded from cache
+        stamp = ImplicationGraph.getFolderStamp(self.tempdir.name)
+        self.assertIsNotNone(ImplicationGraph.load(cachePath, stamp))
+        filter = self.createFilter()
+        self.assertEqual(filter.filterCaptions(["long hair", "hair"]), ["long hair"])
+
+        # Changed CSV invalidates the cache
+        time.sleep(0.01)
+        self.writeCsv([("hair", "long_hair")])
+        self.assertIsNone(ImplicationGraph.load(cachePath, ImplicationGraph.getFolderStamp(self.tempdir.name)))
+
+        filter = self.createFilter()
+        self.assertEqual(filter.filterCaptions(["long hair", "hair"]), ["hair"])
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
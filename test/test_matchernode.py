@@ -1,10 +1,81 @@
 import sys, os
 sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
 
-import unittest
+import unittest, random
 from caption.caption_highlight import MatcherNode
 
 
+# Reference implementations for the automaton: Walking the trie
+
+class MatcherStackEntry:
+    def __init__(self, node: MatcherNode, index: int):
+        self.node = node
+        self.index = index
+
+def matchTrie(root: MatcherNode, words: list[str]) -> dict[int, object]:
+    node = root
+    stack = list[MatcherStackEntry]()
+    payloads = dict[int, object]()
+
+    def checkMatch(node: MatcherNode, child: MatcherNode, index: int, override=False) -> MatcherNode:
+        if child.payload is not None:
+            for entry in stack:
+                if override or (entry.index not in payloads):
+                    payloads[entry.index] = child.payload
+            payloads[index] = child.payload
+
+        if child.children:
+            stack.append(MatcherStackEntry(child, index))
+            return child
+        return node
+
+    for i in range(len(words)-1, -1, -1):
+        word = words[i]
+        if not word:
+            continue
+
+        if child := node.children.get(word):
+            node = checkMatch(node, child, i, True)
+
+        # Search for a different transition by unwinding stack
+        elif len(stack) > 1 and (child := stack[-2].node.children.get(word)):
+            stack.pop()
+            node = checkMatch(stack[-1].node, child, i)
+
+    return payloads
+
+def splitWordsTrie(root: MatcherNode, words: list[str]) -> list[list[str]]:
+    node = root
+    stack = list[MatcherNode]()
+    groups = list[list[str]]()
+
+    def checkMatch(node: MatcherNode, child: MatcherNode) -> MatcherNode:
+        if child.payload is not None:
+            group = [n.name for n in stack]
+            group.append(child.name)
+            group.reverse()
+            groups.append(group)
+
+        if child.children:
+            stack.append(child)
+            return child
+        return node
+
+    for word in reversed(words):
+        if not word:
+            continue
+
+        if child := node.children.get(word):
+            node = checkMatch(node, child)
+
+        # Search for a different transition by unwinding stack
+        elif len(stack) > 1 and (child := stack[-2].children.get(word)):
+            stack.pop()
+            node = checkMatch(stack[-1], child)
+
+    return groups
+
+
 class MatcherNodeTest(unittest.TestCase):
     def setUp(self):
         self.values = {
@@ -134,5 +205,72 @@ class MatcherNodeTest(unittest.TestCase):
 
 
 
+class MatcherAutomatonTest(unittest.TestCase):
+    WORDS = ["hair", "long", "short", "black", "blonde", "pants", "tank", "top", "polka", "dot", "red", "blue", "very", "ornament"]
+
+    def randomTag(self, rand: random.Random, maxWords: int) -> str:
+        return " ".join(rand.choices(self.WORDS, k=rand.randrange(1, maxWords+1)))
+
+    def createNode(self, rand: random.Random) -> MatcherNode[int]:
+        node = MatcherNode[int]()
+        for i in range(rand.randrange(1, 30)):
+            node.add(self.randomTag(rand, 4), i)
+        return node
+
+    @staticmethod
+    def splitAllPreserveExtraTrie(node: MatcherNode, captions: list[str]) -> list[str]:
+        result = list[str]()
+        for cap in captions:
+            captionWords = cap.split(" ")
+            if matchSplitWords := splitWordsTrie(node, captionWords):
+                splitCaptionWords = list[list[str]]()
+                usedWords = set[str]()
+                matchSplitWords.sort(key=len, reverse=True)
+                for matchWords in matchSplitWords:
+                    if not usedWords.issuperset(matchWords):
+                        usedWords.update(matchWords)
+                        splitCaptionWords.append(matchWords)
+
+                if usedWords.issuperset(word for word in captionWords if word):
+                    result.extend(" ".join(matchWords) for matchWords in splitCaptionWords)
+                    continue
+
+            result.append(cap)
+        return result
+
+
+    def test_random(self):
+        rand = random.Random(4321)
+        for _ in range(300):
+            node = self.createNode(rand)
+            for _ in range(30):
+                caption = self.randomTag(rand, 7)
+                if rand.random() < 0.2:
+                    caption = caption.replace(" ", "  ", 1)  # Empty word
+
+                words = caption.split(" ")
+                msg = f"Caption: '{caption}'"
+                self.assertEqual(matchTrie(node, words), node.match(words), msg)
+                self.assertEqual(splitWordsTrie(node, words), node.splitWords(words), msg)
+                self.assertEqual([" ".join(w) for w in splitWordsTrie(node, words)], node.split(words), msg)
+
+            captions = [self.randomTag(rand, 5) for _ in range(10)]
+            self.assertEqual(self.splitAllPreserveExtraTrie(node, captions), list(node.splitAllPreserveExtra(captions)))
+
+    def test_invalidate(self):
+        node = MatcherNode[int]()
+        node.add("long hair", 1)
+        self.assertEqual(node.split(["long", "black", "hair"]), ["long hair"])
+
+        node.add("black hair", 2)
+        self.assertEqual(node.split(["long", "black", "hair"]), ["black hair", "long hair"])
+
+    def test_empty(self):
+        node = MatcherNode[int]()
+        self.assertEqual(node.match(["long", "hair"]), {})
+        self.assertEqual(list(node.splitAll(["long hair"])), ["long hair"])
+
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
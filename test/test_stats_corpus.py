@@ -0,0 +1,84 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, random
+from lib.filelist import CachedPathSort
+from stats.stats_corpus import FileCorpus, PostingsBuilder
+from stats.stats_base import CombineModeUnion, CombineModeIntersection, CombineModeExclusive, CombineModeMultiple
+
+
+def createCorpus(numFiles: int, numTags: int, maxTagsPerFile: int) -> tuple[FileCorpus, dict[str, list[str]]]:
+    files = [f"/data/{i % 7}/img{i}.png" for i in range(numFiles)]
+    random.shuffle(files)
+
+    fileTags = {
+        file: [f"tag{random.randrange(numTags)}" for _ in range(random.randrange(maxTagsPerFile+1))]
+        for file in files
+    }
+    return FileCorpus(sorted(files, key=CachedPathSort())), fileTags
+
+
+class PostingsTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(1234)
+        self.corpus, self.fileTags = createCorpus(500, 40, 12)
+
+        fileIds = self.corpus.createIdMap()
+        builder = PostingsBuilder()
+        for file, tags in self.fileTags.items():
+            builder.add(fileIds[file], tags)
+
+        tags, postings, counts = builder.build()
+        self.postings = dict(zip(tags, postings))
+        self.counts = dict(zip(tags, counts.tolist()))
+
+    def expectedFiles(self, tag: str) -> set[str]:
+        return set(file for file, tags in self.fileTags.items() if tag in tags)
+
+
+    def test_postings(self):
+        for tag, ids in self.postings.items():
+            self.assertEqual(sorted(ids.tolist()), ids.tolist())
+            self.assertEqual(self.corpus.getFileSet(ids), self.expectedFiles(tag))
+            self.assertEqual(self.counts[tag], sum(tags.count(tag) for tags in self.fileTags.values()))
+
+    def test_files_sorted(self):
+        ids = next(iter(self.postings.values()))
+        files = self.corpus.getFiles(ids)
+        self.assertEqual(files, [f for f in self.corpus.files if f in set(files)])
+
+    def test_empty(self):
+        tags, postings, counts = PostingsBuilder().build()
+        self.assertEqual(tags, [])
+        self.assertEqual(postings, [])
+        self.assertEqual(len(counts), 0)
+
+
+    def checkCombineMode(self, combineClass):
+        tags = list(self.postings.keys())
+        for numSelected in (1, 2, 3, 6):
+            selected = random.sample(tags, numSelected)
+
+            combiner = combineClass()
+            for tag in selected:
+                combiner.addFiles(self.expectedFiles(tag))
+
+            ids = combineClass.combineIds([self.postings[tag] for tag in selected], len(self.corpus))
+            self.assertEqual(self.corpus.getFileSet(ids), combiner.getFiles(), f"{combineClass.__name__} {selected}")
+
+    def test_union(self):
+        self.checkCombineMode(CombineModeUnion)
+
+    def test_intersection(self):
+        self.checkCombineMode(CombineModeIntersection)
+
+    def test_exclusive(self):
+        self.checkCombineMode(CombineModeExclusive)
+
+    def test_multiple(self):
+        self.checkCombineMode(CombineModeMultiple)
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
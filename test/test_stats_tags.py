@@ -0,0 +1,58 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import unittest, tempfile
+from PySide6.QtWidgets import QApplication
+app = QApplication.instance() or QApplication()  # Needed for loading fonts during import
+
+from lib.captionfile import CaptionFile, FileTypeSelector, CaptionBulkLoader
+from lib.captionstore import CaptionStore, importJson
+from stats.stats_cache import StatsCache
+from stats.stats_tags import TagStatsLoadTask, TagsLoadFunctor
+
+
+class TagStatsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_stats_tags_")
+        self.files = [os.path.join(self.tempdir.name, f"{name}.png") for name in ("a", "b")]
+        for file in self.files:
+            self.saveTags(file, "tag a, tag b")
+
+    def tearDown(self):
+        StatsCache.clear()
+        CaptionStore.resetLookup()
+        self.tempdir.cleanup()
+
+    def saveTags(self, file: str, tags: str):
+        captionFile = CaptionFile(file)
+        captionFile.loadFromJson()
+        captionFile.addTags("tags", tags)
+        captionFile.saveToJson()
+
+    def loadCounts(self) -> dict[str, int]:
+        keyType = FileTypeSelector.TYPE_TAGS
+        loadTags = TagsLoadFunctor(CaptionBulkLoader(keyType, "tags"), (keyType, "tags"), ",", None)
+        tagData, summary = TagStatsLoadTask(self.files, loadTags).runLoad()
+        return {data.tag: data.count for data in tagData}
+
+
+    def test_json_reload(self):
+        self.assertEqual(self.loadCounts(), {"tag a": 2, "tag b": 2})
+
+        self.saveTags(self.files[0], "tag a, tag c")
+        self.assertEqual(self.loadCounts(), {"tag a": 2, "tag b": 1, "tag c": 1})
+
+    def test_store_reload(self):
+        importJson(self.tempdir.name, deleteJson=True)
+        self.assertEqual(self.loadCounts(), {"tag a": 2, "tag b": 2})
+
+        # Stored captions have no JSON file with a changing stamp
+        self.saveTags(self.files[0], "tag a, tag c")
+        self.assertFalse(os.path.exists(os.path.splitext(self.files[0])[0] + ".json"))
+        self.assertEqual(self.loadCounts(), {"tag a": 2, "tag b": 1, "tag c": 1})
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
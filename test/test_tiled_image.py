@@ -0,0 +1,202 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import unittest, tempfile
+import numpy as np
+from PIL import Image
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QImage, QPainter
+from PySide6.QtWidgets import QApplication, QGraphicsScene
+from ui.tiled_image import TilePyramid, TiledImgItem, useTiledView
+from config import Config
+
+
+app = QApplication.instance() or QApplication()
+
+
+def toNumpyRGB(image: QImage) -> np.ndarray:
+    image = image.convertToFormat(QImage.Format.Format_RGB888)
+    w, h = image.size().toTuple()
+    mat = np.frombuffer(image.constBits(), dtype=np.uint8).reshape((h, image.bytesPerLine()))
+    return mat[:, :w*3].reshape((h, w, 3)).copy()
+
+
+class FakeImgView:
+    def __init__(self):
+        self._scene = QGraphicsScene()
+
+    def scene(self) -> QGraphicsScene:
+        return self._scene
+
+
+class TiledImageTest(unittest.TestCase):
+    WIDTH  = 3001
+    HEIGHT = 1999
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_tiled_")
+        rng = np.random.default_rng(42)
+        cls.mat = rng.integers(0, 256, (cls.HEIGHT, cls.WIDTH, 3), dtype=np.uint8)
+        cls.path = os.path.join(cls.tempdir.name, "large.png")
+        Image.fromarray(cls.mat).save(cls.path, compress_level=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        TilePyramid.releaseAll()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        self.origMinPixels = Config.viewTiledMinPixels
+        self.origTileCache = Config.pathTileCache
+        Config.pathTileCache = os.path.join(self.tempdir.name, "tiles")
+        TilePyramid.releaseAll()
+
+    def tearDown(self):
+        Config.viewTiledMinPixels = self.origMinPixels
+        Config.pathTileCache = self.origTileCache
+
+
+    def test_use_tiled(self):
+        Config.viewTiledMinPixels = self.WIDTH * self.HEIGHT
+        self.assertTrue(useTiledView(self.path))
+        Config.viewTiledMinPixels += 1
+        self.assertFalse(useTiledView(self.path))
+        Config.viewTiledMinPixels = 0
+        self.assertFalse(useTiledView(self.path))
+
+    def test_levels(self):
+        previews = list[QImage]()
+        pyramid = TilePyramid.get(self.path, previews.append)
+
+        self.assertEqual(len(previews), 1)
+        self.assertLessEqual(max(previews[0].size().toTuple()), TilePyramid.PREVIEW_SIZE)
+
+        shapes = [level.shape for level in pyramid.levels]
+        self.assertEqual(shapes, [(1999, 3001, 3), (1000, 1501, 3), (500, 751, 3), (250, 376, 3)])
+        np.testing.assert_array_equal(pyramid.levels[0], self.mat)
+
+        # 2x2 average, last column repeated
+        padded = np.concatenate((self.mat, self.mat[:, -1:]), axis=1).astype(np.uint16)
+        padded = np.concatenate((padded, padded[-1:]), axis=0)
+        expected = (padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2] + 2) >> 2
+        np.testing.assert_array_equal(pyramid.levels[1], expected.astype(np.uint8))
+
+        # Edge tile
+        numX, numY = pyramid.numTiles(0)
+        self.assertEqual((numX, numY), (6, 4))
+        tile = pyramid.loadTile(0, numX-1, numY-1)
+        self.assertEqual(tile.size().toTuple(), (3001 - 5*512, 1999 - 3*512))
+        np.testing.assert_array_equal(toNumpyRGB(tile), self.mat[3*512:, 5*512:])
+
+        self.assertEqual(os.path.dirname(pyramid.folder), Config.pathTileCache)
+
+        # Reused while cached, files are deleted when released
+        self.assertIs(TilePyramid.get(self.path), pyramid)
+        pyramid.release()
+        pyramid.release()
+        self.assertTrue(os.path.isdir(pyramid.folder))
+        TilePyramid.releaseAll()
+        self.assertFalse(os.path.exists(pyramid.folder))
+
+    def test_jpeg_preview(self):
+        path = os.path.join(self.tempdir.name, "large.jpg")
+        Image.fromarray(self.mat).save(path, quality=90)
+
+        previews = list[QImage]()
+        pyramid = TilePyramid.get(path, previews.append)
+        self.assertEqual(len(previews), 1)
+        self.assertEqual(previews[0].size().toTuple(), (2048, 1364))
+        self.assertEqual(pyramid.levels[0].shape, (1999, 3001, 3))
+        pyramid.release()
+
+    def test_render_visible_tiles(self):
+        imgview = FakeImgView()
+        item = TiledImgItem(imgview)
+        item.threadpool.setMaxThreadCount(1)
+        imgview.scene().addItem(item)
+
+        self.assertTrue(item.loadFile(self.path))
+        self.assertEqual(item.mediaSize().toTuple(), (self.WIDTH, self.HEIGHT))
+        item.threadpool.waitForDone()
+        app.processEvents()
+        self.assertIsNotNone(item._pyramid)
+
+        def render(scale: float, sceneRect: QRectF) -> QImage:
+            w, h = round(sceneRect.width() * scale), round(sceneRect.height() * scale)
+            target = QImage(w, h, QImage.Format.Format_RGB32)
+            painter = QPainter(target)
+            imgview.scene().render(painter, QRectF(0, 0, w, h), sceneRect)
+            painter.end()
+            return target
+
+        # Whole image at 1/8 scale: Only tiles of level 3 are loaded
+        render(1/8, item.boundingRect())
+        self.assertEqual({key[0] for key in item._tiles}, {3})
+        self.assertEqual(len(item._tiles), 1)
+
+        # Zoomed into a region at full scale: Only the visible tiles of level 0
+        item._tiles.clear()
+        target = render(1.0, QRectF(1000, 600, 400, 300))
+        self.assertEqual(set(item._tiles.keys()), {(0, 1, 1), (0, 2, 1)})
+
+        np.testing.assert_array_equal(toNumpyRGB(target), self.mat[600:900, 1000:1400])
+
+        self.assertEqual(item.pixmap().size().toTuple(), (self.WIDTH, self.HEIGHT))
+        item.deleteLater()
+        self.assertIsNone(item._pyramid)
+
+    def test_load_unreadable(self):
+        # Readable size, broken checksum
+        path = os.path.join(self.tempdir.name, "broken.png")
+        with open(self.path, 'rb') as file:
+            header = file.read(64)
+        with open(path, 'wb') as file:
+            file.write(header[:24] + b"\0" * 40)
+
+        item = TiledImgItem(FakeImgView())
+        self.assertFalse(item.loadFile(path))
+
+    def test_above_pixel_limit(self):
+        # Larger than PIL's decompression bomb limit. Mode "1" keeps the file small.
+        w, h = 15000, 12000
+        self.assertGreater(w * h, 2 * Image.MAX_IMAGE_PIXELS)
+        path = os.path.join(self.tempdir.name, "huge.png")
+        img = Image.new("1", (w, h), 1)
+        img.putpixel((w-1, h-1), 0)
+        img.save(path)
+        del img
+
+        origLimit = Image.MAX_IMAGE_PIXELS
+        imgview = FakeImgView()
+        item = TiledImgItem(imgview)
+        self.assertTrue(item.loadFile(path))
+        item.threadpool.waitForDone()
+        app.processEvents()
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, origLimit)
+
+        pyramid = item._pyramid
+        self.assertIsNotNone(pyramid)
+        self.assertEqual((pyramid.width, pyramid.height), (w, h))
+        self.assertEqual(pyramid.levels[0][-1, -1].tolist(), [0, 0, 0])
+        item.deleteLater()
+
+    def test_remove_stale(self):
+        os.makedirs(Config.pathTileCache, exist_ok=True)
+        stale = tempfile.mkdtemp(prefix=TilePyramid.FOLDER_PREFIX, dir=Config.pathTileCache)
+        recent = tempfile.mkdtemp(prefix=TilePyramid.FOLDER_PREFIX, dir=Config.pathTileCache)
+        other = tempfile.mkdtemp(prefix="other_", dir=Config.pathTileCache)
+        for folder in (stale, other):
+            mtime = os.stat(folder).st_mtime - TilePyramid.STALE_AGE - 1
+            os.utime(folder, (mtime, mtime))
+
+        TilePyramid.removeStale()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.isdir(recent))
+        self.assertTrue(os.path.isdir(other))
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,101 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile
+import av
+import numpy as np
+from lib import videorw
+from lib.util import Singleton
+from lib.videoindex import VideoIndex
+from config import Config
+
+
+def createVideo(path: str, numFrames: int, fps: int = 24, gop: int = 12, w: int = 64, h: int = 48, draw=None, codec="libx264"):
+    with av.open(path, 'w') as container:
+        stream = container.add_stream(codec, rate=fps)
+        stream.width, stream.height = w, h
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = gop
+        if codec == "libx264":
+            stream.options = {"keyint_min": str(gop), "sc_threshold": "0", "bf": "0"}
+
+        mat = np.zeros((h, w, 3), dtype=np.uint8)
+        for i in range(numFrames):
+            if draw:
+                draw(mat, i)
+            else:
+                mat[:] = (i * 5) % 256
+            for packet in stream.encode(av.VideoFrame.from_ndarray(mat, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+class VideoIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_videoindex_")
+        self.origPath = Config.pathVideoIndex
+        Config.pathVideoIndex = os.path.join(self.tempdir.name, "index")
+
+        self.path = os.path.join(self.tempdir.name, "video.mp4")
+        createVideo(self.path, 48)
+        Singleton._instances.pop(VideoIndex, None)
+
+    def tearDown(self):
+        Singleton._instances.pop(VideoIndex, None)
+        Config.pathVideoIndex = self.origPath
+        self.tempdir.cleanup()
+
+    def test_keyframes(self):
+        index = VideoIndex()
+        info = index.getInfo(self.path)
+        self.assertEqual(info[:5], videorw.readMetadata(self.path))
+        self.assertEqual((info.width, info.height, info.frameCount), (64, 48, 48))
+
+        # Keyframes every 12 frames at 24 fps
+        keyframes = index.getKeyframes(self.path, 0, info.duration)
+        self.assertEqual(keyframes, [0, 500, 1000, 1500])
+        self.assertEqual(index.getKeyframes(self.path, 1, info.duration), videorw.getKeyframes(self.path, 1, info.duration))
+        self.assertEqual(index.getKeyframes(self.path, 400, 1000), [500, 1000])
+
+        table = index.getKeyframeTable(self.path, build=False)
+        self.assertEqual(table.timesMs().tolist(), keyframes)
+
+    def test_no_build(self):
+        index = VideoIndex()
+        index.getInfo(self.path)
+        self.assertIsNone(index.getKeyframeTable(self.path, build=False))
+        self.assertIsNotNone(index.getKeyframeTable(self.path))
+        self.assertIsNotNone(index.getKeyframeTable(self.path, build=False))
+
+    def test_persist(self):
+        table = VideoIndex().getKeyframeTable(self.path)
+        info = VideoIndex().getInfo(self.path)
+        VideoIndex().save()
+        cacheFile = VideoIndex()._getCacheFile(VideoIndex()._getFolderKey(self.tempdir.name))
+        self.assertEqual(os.listdir(Config.pathVideoIndex), [os.path.basename(cacheFile)])
+
+        Singleton._instances.pop(VideoIndex)
+        index = VideoIndex()
+        entry = index._lookup(self.path, (os.path.getsize(self.path), os.stat(self.path).st_mtime_ns))
+        self.assertIsNotNone(entry)
+        self.assertEqual(len(entry[3][1]), 4)
+        self.assertEqual(index.getInfo(self.path), info)
+
+        loadedTable = index.getKeyframeTable(self.path, build=False)
+        self.assertEqual(loadedTable.timeBase, table.timeBase)
+        self.assertTrue(np.array_equal(loadedTable.pts, table.pts))
+
+        # Plain arrays, no pickled objects
+        with np.load(cacheFile, allow_pickle=False) as data:
+            self.assertEqual(data["timeBases"].dtype, np.int64)
+
+        # Changed file is probed again
+        createVideo(self.path, 24)
+        self.assertEqual(index.getInfo(self.path).frameCount, 24)
+        self.assertEqual(index.getKeyframes(self.path, 0, 10_000), [0, 500])
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,78 @@
+import sys, os
+sys.path.append( os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) )
+
+import unittest, tempfile
+import numpy as np
+from lib.util import Singleton
+from lib.videosprites import SeekSpriteStore, SeekSprites
+from config import Config
+from test_videoindex import createVideo
+from test_frame_extractor import drawIndex, frameIndex
+
+
+class SeekSpriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="qapyq_test_sprites_")
+        self.origPath = Config.pathSeekSprites
+        Config.pathSeekSprites = os.path.join(self.tempdir.name, "sprites")
+        Singleton._instances.pop(SeekSpriteStore, None)
+
+    def tearDown(self):
+        Singleton._instances.pop(SeekSpriteStore, None)
+        Config.pathSeekSprites = self.origPath
+        self.tempdir.cleanup()
+
+    def createVideo(self, name: str, numFrames: int, gop: int) -> str:
+        path = os.path.join(self.tempdir.name, name)
+        createVideo(path, numFrames, fps=24, gop=gop, w=288, h=96, draw=drawIndex)
+        return path
+
+
+    def test_sheet(self):
+        tiles = np.random.randint(0, 256, (21, 9, 16, 3), dtype=np.uint8)
+        sprites = SeekSprites(np.arange(21, dtype=np.int64) * 500, tiles)
+        sheet = sprites.toSheet(8)
+        self.assertEqual(sheet.shape, (27, 128, 3))
+
+        restored = SeekSprites.fromSheet(sprites.timesMs, sheet, 16, 9)
+        self.assertTrue(np.array_equal(restored.tiles, tiles))
+        self.assertEqual(sprites.interval(), 500)
+        self.assertEqual([sprites.indexAt(pos) for pos in (-10, 0, 499, 500, 99_999)], [0, 0, 0, 1, 20])
+
+    def test_exact(self):
+        # Short videos: Exact frames every 0.5 s
+        path = self.createVideo("short.mp4", 120, gop=48)
+        sprites = SeekSpriteStore().getOrCreate(path)
+        self.assertEqual(sprites.timesMs.tolist(), list(range(0, 5000, 500)))
+        self.assertEqual(sprites.tiles.shape, (10, 53, 160, 3))
+        self.assertEqual([frameIndex(tile) for tile in sprites.tiles], list(range(0, 120, 12)))
+
+    def test_keyframes(self):
+        # Long videos: Keyframes every 2 s, repeated keyframes are stored once
+        path = self.createVideo("long.mp4", 288, gop=48)
+        sprites = SeekSpriteStore().getOrCreate(path)
+        self.assertEqual(sprites.timesMs.tolist(), list(range(0, 12000, 2000)))
+        self.assertEqual([frameIndex(tile) for tile in sprites.tiles], list(range(0, 288, 48)))
+        self.assertEqual(sprites.indexAt(5999), 2)
+
+    def test_persist(self):
+        path = self.createVideo("video.mp4", 120, gop=48)
+        sprites = SeekSpriteStore().getOrCreate(path)
+        self.assertEqual(len(os.listdir(Config.pathSeekSprites)), 1)
+
+        Singleton._instances.pop(SeekSpriteStore)
+        loaded = SeekSpriteStore().get(path)
+        self.assertTrue(np.array_equal(loaded.timesMs, sprites.timesMs))
+        self.assertEqual(loaded.tiles.shape, sprites.tiles.shape)
+        self.assertEqual([frameIndex(tile) for tile in loaded.tiles], [frameIndex(tile) for tile in sprites.tiles])
+
+        # Changed file is extracted again
+        Singleton._instances.pop(SeekSpriteStore)
+        self.createVideo("video.mp4", 48, gop=48)
+        self.assertIsNone(SeekSpriteStore().get(path))
+        self.assertEqual(len(SeekSpriteStore().getOrCreate(path).timesMs), 4)
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
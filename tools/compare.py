@@ -215,7 +215,7 @@ class CompareTool(ViewTool):
         if path:
             try:
                 mat = qtlib.qimageToNumpy(pixmap.toImage())
-                export.saveImage(path, mat)
+                export.saveImage(path, mat, profile=export.EncoderProfile.Legacy)
                 self._overlayExportPath = os.path.dirname(path)
 
                 message = f"Saved overlay to: {path}"
@@ -232,7 +232,7 @@ class MaskTool(ViewTool):
         combined = np.dstack(masks)
 
         # TODO: Save layer names to meta data?
-        task = MaskExportTask(currentFile, destFile, combined)
+        task = MaskExportTask(currentFile, destFile, combined, self._toolbar.exportWidget.getEncoderProfile())
         task.signals.done.connect(self.onExportDone, Qt.ConnectionType.BlockingQueuedConnection)
         task.signals.fail.connect(self.onExportFailed, Qt.ConnectionType.BlockingQueuedConnection)
         QThreadPool.globalInstance().start(task)
@@ -535,18 +535,19 @@ class MaskExportTask(QRunnable):
         done = Signal(str, str)
         fail = Signal(str)
 
-    def __init__(self, srcFile, destFile, mask):
+    def __init__(self, srcFile, destFile, mask, encoderProfile: str):
         super().__init__()
         self.signals = self.ExportTaskSignals()
 
         self.srcFile = srcFile
         self.destFile = destFile
         self.mask = mask
+        self.encoderProfile = encoderProfile
 
     @Slot()
     def run(self):
         try:
-            export.saveImage(self.destFile, self.mask)
+            export.saveImage(self.destFile, self.mask, profile=self.encoderProfile)
             self.signals.done.emit(self.srcFile, self.destFile)
         except Exception as ex:
             print(f"Export failed: {ex}")
@@ -80,6 +80,7 @@ class ScaleTool(ViewTool):
         scaleConfig = self._toolbar.exportWidget.getScaleConfig(scaleFactor)
 
         task = ScaledExportTask(currentFile, destFile, pixmap, rot, w, h, scaleConfig)
+        task.encoderProfile = self._toolbar.exportWidget.getEncoderProfile()
         task.signals.done.connect(self.onExportDone, Qt.ConnectionType.BlockingQueuedConnection)
         task.signals.progress.connect(self.onExportProgress, Qt.ConnectionType.BlockingQueuedConnection)
         task.signals.fail.connect(self.onExportFailed, Qt.ConnectionType.BlockingQueuedConnection)
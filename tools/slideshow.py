@@ -247,6 +247,41 @@ class SlideshowTool(ViewTool):
         self._history.insert(self._historyIndex, HistoryEntry(index, lcgState))
         #self._printHistory()
 
+    def _extendHistory(self, count: int):
+        'Determines the next random entries in advance, so their files can be prefetched.'
+        filelist = self.tab.filelist
+        if not self._history or filelist.getNumFiles() <= 0:
+            return
+
+        while len(self._history) - self._historyIndex - 1 < count:
+            if len(self._history) >= self.HISTORY_MAX_LENGTH:
+                if self._historyIndex == 0:
+                    break
+                self._history.popleft()
+                self._historyIndex -= 1
+
+            self._history.append(self.getRandomEntry(self._history[-1].lcgState))
+
+    def getPrefetchFiles(self, count: int) -> list[str] | None:
+        if not self._shuffle:
+            return None
+
+        self._extendHistory(count)
+        files = self.tab.filelist.files
+        start = max(self._historyIndex - count, 0)
+        entries = list(islice(self._history, start, self._historyIndex + count + 1))
+        current = self._historyIndex - start
+
+        # Next files first, alternating with previous files
+        indices = dict[int, None]()
+        for i in range(1, count+1):
+            if current + i < len(entries):
+                indices[entries[current + i].idx] = None
+            if current - i >= 0:
+                indices[entries[current - i].idx] = None
+
+        return [files[idx] for idx in indices if 0 <= idx < len(files) and files[idx] != self.tab.filelist.currentFile]
+
     def _setIndexNoHistory(self, index: int):
         try:
             self._rememberHistory = False
@@ -47,6 +47,10 @@ class Tool:
     def onTabActive(self, active: bool):
         pass
 
+    def getPrefetchFiles(self, count: int) -> list[str] | None:
+        'Returns the files which will likely be shown next, or None to prefetch the adjacent files of the FileList.'
+        return None
+
 
     def onSceneUpdate(self):
         pass
@@ -1,10 +1,11 @@
 from __future__ import annotations
-import csv, time, enum, heapq
+import os, csv, time, enum, heapq, json, hashlib, uuid
 from abc import ABC, abstractmethod
 from typing import Any, NamedTuple, Iterable, Callable
 from typing_extensions import override
 from collections import defaultdict, Counter
 from itertools import islice, takewhile
+import numpy as np
 from PySide6.QtWidgets import QCompleter, QPlainTextEdit, QTableView
 from PySide6.QtGui import QTextCursor, QGuiApplication, QKeyEvent, QFont, QColor
 from PySide6.QtCore import Qt, Signal, Slot, QAbstractTableModel, QModelIndex, QPersistentModelIndex, QTimer, QObject, QThreadPool, QThread, QRect
@@ -12,6 +13,7 @@ from difflib import SequenceMatcher
 #from rapidfuzz import fuzz, distance
 from lib import colorlib, qtlib
 from lib.csv import CsvLoader, ColumnGetter
+from lib.ngram_index import NGramIndex, NGramIndexBuilder, getNgrams
 from config import Config
 
 
@@ -28,8 +30,11 @@ def getAutoCompleteSource(type: AutoCompleteSourceType):
 
     match type:
         case AutoCompleteSourceType.Csv:
-            source = NGramAutoCompleteSource()
-            LoadCsvTask.loadAsync(source)
+            source = CsvAutoCompleteSource()
+            if index := CsvIndexCache.load(LoadCsvTask.FOLDER):
+                source.setIndex(index)
+            else:
+                LoadCsvTask.loadAsync(source)
 
         case AutoCompleteSourceType.Template:
             source = TemplateAutoCompleteSource()
@@ -59,7 +64,14 @@ class SuggestionScore:
     class Context(NamedTuple):
         search: str
         searchParts: list[str]
-        matcher: SequenceMatcher
+        charMasks: dict[str, int] # Bit mask of positions in search for each char
+
+    @classmethod
+    def createContext(cls, search: str, searchParts: list[str]) -> Context:
+        charMasks = dict[str, int]()
+        for i, char in enumerate(search):
+            charMasks[char] = charMasks.get(char, 0) | (1 << i)
+        return cls.Context(search, searchParts, charMasks)
 
     __slots__ = ('ctx', 'suggestion', 'prefixScore', '_matchRatio')
 
@@ -123,11 +135,31 @@ class SuggestionScore:
 
             #self._matchRatio = distance.Levenshtein.normalized_similarity(search, tag)
 
-            self.ctx.matcher.set_seq1(self.suggestion.tag)
-            self._matchRatio = self.ctx.matcher.ratio()
+            self._matchRatio = self.indelRatio(self.ctx, self.suggestion.tag)
 
         return self._matchRatio
 
+    @staticmethod
+    def indelRatio(ctx: Context, tag: str) -> float:
+        '''
+        Normalized Indel similarity: 2 * LCS / (len(search) + len(tag)), like rapidfuzz's fuzz.ratio.
+        The longest common subsequence is calculated bit-parallel with one integer operation per char of the tag.
+        '''
+        searchLen = len(ctx.search)
+        totalLen = searchLen + len(tag)
+        if totalLen == 0:
+            return 1.0
+
+        full = (1 << searchLen) - 1
+        v = full
+        charMasks = ctx.charMasks
+        for char in tag:
+            u = v & charMasks.get(char, 0)
+            v = ((v + u) | (v - u)) & full
+
+        lcs = searchLen - v.bit_count()
+        return 2.0 * lcs / totalLen
+
     def __lt__(self, other: SuggestionScore) -> bool:
         prefixDiff = self.prefixScore - other.prefixScore
         if abs(prefixDiff) > 0.2:
@@ -203,6 +235,18 @@ class AutoCompleteModel(QAbstractTableModel):
         except: pass
 
 
+    @staticmethod
+    def scoreSuggestions(sources: list[AutoCompleteSource], search: str, searchParts: list[str]) -> list[SuggestionScore]:
+        suggestions: dict[str, Suggestion] = {}
+        for source in sources:
+            for sug in source.getSuggestions(search):
+                if existingSug := suggestions.get(sug.tag):
+                    sug = existingSug.max(sug)
+                suggestions[sug.tag] = sug
+
+        ctx = SuggestionScore.createContext(search, searchParts)
+        return sorted((SuggestionScore(ctx, sug) for sug in suggestions.values()), reverse=True)
+
     def updateSuggestions(self, search: str):
         searchWords = list(filter(None, search.split()))
         search = " ".join(searchWords)
@@ -215,15 +259,7 @@ class AutoCompleteModel(QAbstractTableModel):
             else:
                 break
 
-        suggestions: dict[str, Suggestion] = {}
-        for source in self.sources:
-            for sug in source.getSuggestions(search):
-                if existingSug := suggestions.get(sug.tag):
-                    sug = existingSug.max(sug)
-                suggestions[sug.tag] = sug
-
-        ctx = SuggestionScore.Context(search, searchParts, SequenceMatcher(b=search, autojunk=False))
-        scores = sorted((SuggestionScore(ctx, sug) for sug in suggestions.values()), reverse=True)
+        scores = self.scoreSuggestions(self.sources, search, searchParts)
 
         # print("Scored Suggestions:")
         # for i, score in enumerate(scores[:20], 1):
@@ -373,6 +409,7 @@ class TextEditCompleter:
 
     COMPLETE_INTERVAL = 30 # ms
     COMPLETE_INTERVAL_NS = COMPLETE_INTERVAL * 1_000_000
+    MAX_COMPLETE_INTERVAL_NS = 250 * 1_000_000
 
 
     def __init__(self, textEdit: QPlainTextEdit, autoCompleteSources: list[AutoCompleteSource], separator: str = ", "):
@@ -397,6 +434,7 @@ class TextEditCompleter:
         self._timer = QTimer(textEdit, singleShot=True, interval=self.COMPLETE_INTERVAL)
         self._timer.timeout.connect(self._updateComplete)
         self._tLastComplete = 0
+        self._completeIntervalNs = self.COMPLETE_INTERVAL_NS
 
         self._waylandPositionFix = ("wayland" in QGuiApplication.platformName())
 
@@ -572,13 +610,14 @@ class TextEditCompleter:
         if force or prefix != self.completer.completionPrefix():
             self.completer.setCompletionPrefix(prefix)
 
-            if self._tLastComplete > time.monotonic_ns() - self.COMPLETE_INTERVAL_NS:
+            if self._tLastComplete > time.monotonic_ns() - self._completeIntervalNs:
                 self._timer.start()
             else:
                 self._updateComplete()
 
     @Slot()
     def _updateComplete(self):
+        tStart = time.monotonic_ns()
         self.model.updateSuggestions( self.completer.completionPrefix() )
         QTimer.singleShot(0, self._resetSelection)
 
@@ -593,6 +632,11 @@ class TextEditCompleter:
 
         self._tLastComplete = time.monotonic_ns()
 
+        # Latency budget: When updates are slow, wait longer before the next one so they don't block typing
+        interval = min(max(2 * (self._tLastComplete - tStart), self.COMPLETE_INTERVAL_NS), self.MAX_COMPLETE_INTERVAL_NS)
+        self._completeIntervalNs = interval
+        self._timer.setInterval(interval // 1_000_000)
+
     def _fixPopupPosition(self, cursorRect: QRect):
         popup: AutoCompletePopup = self.completer.popup()
         if not popup.isVisible():
@@ -771,11 +815,7 @@ class NGramAutoCompleteSource(AutoCompleteSource):
         self.ngrams = defaultdict[str, set[TagData]](set)
 
     def getNgrams(self, text: str) -> Iterable[str]:
-        if len(text) < self.n:
-            text = text.center(self.n, " ") # 'ab' => ' ab' (right-justified)
-
-        for i in range(len(text) - self.n + 1):
-            yield text[i:i+self.n]
+        return getNgrams(text, self.n)
 
     def addTag(self, tag: str, category: int, freq: int, aliasFor: str | None = None):
         tagData = TagData(tag, category, freq, aliasFor)
@@ -839,6 +879,152 @@ class GroupNGramAutoCompleteSource(NGramAutoCompleteSource):
 
 
 
+class CsvAutoCompleteSource(NGramAutoCompleteSource):
+    'Tags from CSV files, looked up in a compiled NGramIndex. Scores tags with the same Jaccard index as NGramAutoCompleteSource.'
+
+    def __init__(self):
+        super().__init__()
+        self.index: NGramIndex | None = None
+
+    def setIndex(self, index: NGramIndex | None):
+        oldIndex, self.index = self.index, index
+        if oldIndex is not None:
+            oldIndex.close()
+
+    @override
+    def getSuggestions(self, search: str) -> list[Suggestion]:
+        index = self.index
+        if index is None:
+            return []
+
+        # Ratios of all candidates are calculated from the posting lists
+        candidateIds, ratios = index.getRatios(set(self.getNgrams(search)))
+        selected = np.flatnonzero(ratios >= self.MIN_RATIO)
+
+        # Keep top results. Equal ratios at the limit are taken in the order of the CSV files.
+        if len(selected) > self.MAX_RESULTS:
+            selectedRatios = ratios[selected]
+            kth = len(selected) - self.MAX_RESULTS
+            minRatio = np.partition(selectedRatios, kth)[kth]
+            above = selected[selectedRatios > minRatio]
+            ties  = selected[selectedRatios == minRatio][:self.MAX_RESULTS-len(above)]
+            selected = np.sort(np.concatenate((above, ties)))
+
+        selectedIds = candidateIds[selected]
+        candidates = zip(ratios[selected].tolist(), index.getTags(selectedIds), selectedIds.tolist())
+
+        suggestions = list[Suggestion]()
+        for ratio, tag, tagId in candidates:
+            aliasId = int(index.aliasFor[tagId])
+            aliasFor = index.getTag(aliasId) if aliasId >= 0 else None
+            suggestions.append(Suggestion(tag, int(index.category[tagId]), int(index.freq[tagId]), aliasFor, self.scoreFactor, ratio))
+        return suggestions
+
+
+
+class CsvIndexCache:
+    '''
+    Compiled NGramIndex of the CSV files, stored in Config.pathAutocompleteCache and memory-mapped at startup.
+    The metadata file holds size, mtime and content hash of the CSV files and the excluded categories.
+    When only the mtime changed, the files are compared by hash, so touching or copying them doesn't trigger a rebuild.
+    '''
+
+    INDEX_FILE = "tags.ngram"
+    META_FILE  = "tags.json"
+
+    @staticmethod
+    def getSettings() -> dict:
+        return {"exclude_categories": sorted(map(int, Config.autocomplete["exclude_categories"]))}
+
+    @staticmethod
+    def getFolderStamp(folder: str) -> list[list]:
+        'Returns relative path, size and mtime_ns for each CSV file.'
+        stamp = list[list]()
+        for path in sorted(CsvLoader.listFiles(folder)):
+            try:
+                stat = os.stat(path)
+                stamp.append([os.path.relpath(path, folder), stat.st_size, stat.st_mtime_ns])
+            except OSError:
+                pass
+        return stamp
+
+    @staticmethod
+    def hashFiles(folder: str, stamp: list[list]) -> list[str]:
+        hashes = list[str]()
+        for relPath, *_ in stamp:
+            try:
+                fileHash = hashlib.blake2b()
+                with open(os.path.join(folder, relPath), 'rb') as file:
+                    while chunk := file.read(1048576):
+                        fileHash.update(chunk)
+                hashes.append(fileHash.hexdigest())
+            except OSError:
+                hashes.append("")
+        return hashes
+
+
+    @classmethod
+    def load(cls, folder: str) -> NGramIndex | None:
+        'Returns None if the index is missing or outdated.'
+        metaPath = os.path.join(Config.pathAutocompleteCache, cls.META_FILE)
+        try:
+            with open(metaPath, 'r') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("settings") != cls.getSettings():
+            return None
+
+        stamp = cls.getFolderStamp(folder)
+        if stamp != meta.get("stamp"):
+            if [entry[0] for entry in stamp] != [entry[0] for entry in meta["stamp"]]:
+                return None
+            if cls.hashFiles(folder, stamp) != meta.get("hashes"):
+                return None
+
+            meta["stamp"] = stamp
+            cls._saveMeta(meta)
+
+        index = NGramIndex.load(os.path.join(Config.pathAutocompleteCache, cls.INDEX_FILE))
+        if index is not None and index.buildId != meta.get("build"):
+            index.close()
+            return None
+        return index
+
+    @classmethod
+    def build(cls, folder: str) -> NGramIndex:
+        'Loads the CSV files and saves the compiled index.'
+        stamp = cls.getFolderStamp(folder)
+        hashes = cls.hashFiles(folder, stamp)
+
+        builder = NGramIndexBuilder()
+        loader = AutocompleteCsvLoader(builder)
+        loader.loadAll(folder)
+        index = builder.build(uuid.uuid4().hex)
+
+        try:
+            os.makedirs(Config.pathAutocompleteCache, exist_ok=True)
+            index.save(os.path.join(Config.pathAutocompleteCache, cls.INDEX_FILE))
+            cls._saveMeta({"build": index.buildId, "settings": cls.getSettings(), "stamp": stamp, "hashes": hashes})
+        except OSError as ex:
+            print(f"WARNING: Failed to save autocomplete index to '{Config.pathAutocompleteCache}': {ex}")
+
+        return index
+
+    @classmethod
+    def _saveMeta(cls, meta: dict):
+        metaPath = os.path.join(Config.pathAutocompleteCache, cls.META_FILE)
+        tempPath = metaPath + ".tmp"
+        try:
+            with open(tempPath, 'w') as file:
+                json.dump(meta, file)
+            os.replace(tempPath, metaPath)
+        except OSError as ex:
+            print(f"WARNING: Failed to save autocomplete index metadata to '{metaPath}': {ex}")
+
+
+
 class LoadCsvTask(QObject):
     FOLDER = "./user/autocomplete/"
 
@@ -850,28 +1036,23 @@ class LoadCsvTask(QObject):
         delay = 1500 if timeSinceStart < 1_000_000_000 else 200
         QThread.msleep(delay)
 
-        csvSource = NGramAutoCompleteSource()
-
+        index = None
         try:
-            loader = AutocompleteCsvLoader(csvSource)
-            loader.loadAll(self.FOLDER)
+            index = CsvIndexCache.build(self.FOLDER)
         finally:
-            self.done.emit(csvSource.ngrams)
+            self.done.emit(index)
 
     @staticmethod
-    def loadAsync(source: NGramAutoCompleteSource):
-        def setNGrams(ngrams: defaultdict):
-            source.ngrams = ngrams
-
+    def loadAsync(source: CsvAutoCompleteSource):
         task = LoadCsvTask()
-        task.done.connect(setNGrams, Qt.ConnectionType.BlockingQueuedConnection)
+        task.done.connect(source.setIndex, Qt.ConnectionType.BlockingQueuedConnection)
         QThreadPool.globalInstance().start(task)
 
 
 class AutocompleteCsvLoader(CsvLoader):
     ALIAS_SEP = ","
 
-    def __init__(self, source: NGramAutoCompleteSource):
+    def __init__(self, source: NGramAutoCompleteSource | NGramIndexBuilder):
         super().__init__()
         self.source = source
 
@@ -956,7 +1137,7 @@ class AutocompleteCsvLoader(CsvLoader):
 
         if aliases:
             for alias in aliases.split(self.ALIAS_SEP):
-                if (alias := self.source.prepareTag(alias)) and alias not in self.existingTags:
+                if (alias := NGramAutoCompleteSource.prepareTag(alias)) and alias not in self.existingTags:
                     self.existingTags.add(alias)
                     self.source.addTag(alias, category, 0, aliasFor=tag)
                     self.numAliases += 1
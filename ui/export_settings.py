@@ -1,4 +1,6 @@
 import os, superqt, copy, traceback, math, enum
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock, Semaphore, local
 from difflib import SequenceMatcher
 from typing_extensions import override
 from PySide6 import QtWidgets, QtGui
@@ -22,20 +24,72 @@ INTERP_MODES = {
 }
 
 
+class EncoderProfile:
+    Fast     = "fast"
+    Balanced = "balanced"
+    Smallest = "smallest"
+    Legacy   = "legacy"  # Fixed settings used before encoder profiles were added
+
+ENCODER_PROFILES = (EncoderProfile.Fast, EncoderProfile.Balanced, EncoderProfile.Smallest)
+
+def getPresetEncoderProfile(preset: dict) -> str:
+    'Presets saved before encoder profiles were added keep the previous settings. New presets use the balanced profile.'
+    if not preset:
+        return EncoderProfile.Balanced
+    return preset.get("encoder_profile", EncoderProfile.Legacy)
+
+
 class Format:
-    def __init__(self, saveParams: dict, conversion: dict = {}):
-        self.saveParams = saveParams
+    def __init__(self, profiles: dict[str, dict], conversion: dict = {}):
+        self.profiles   = profiles
         self.conversion = conversion
 
+    def getSaveParams(self, profile: str) -> dict:
+        if params := self.profiles.get(profile):
+            return params
+        return self.profiles.get(EncoderProfile.Balanced, {})
+
 UNKNOWN_FORMAT = Format({})
 
+# Encoder profiles only trade encoding time against file size. Decoded pixels are the same with all profiles.
 # https://pillow.readthedocs.io/en/stable/handbook/concepts.html#concept-modes
+# https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html
 FORMATS = {
-    "JPG":  Format({"optimize": True, "quality": 100, "subsampling": 0}, {"RGBA": "RGB", "P": "RGB"}),
-    "JXL":  Format({"lossless": True, "quality": 100}, {"P": "RGB"}),
-    "PNG":  Format({"optimize": True, "compress_level": 9}),
-    "TIFF": Format({"compression": "tiff_lzw"}),
-    "WEBP": Format({"lossless": True, "quality": 100, "exact": True}),
+    "JPG": Format({
+        EncoderProfile.Fast:     {"quality": 100, "subsampling": 0},
+        EncoderProfile.Balanced: {"optimize": True, "quality": 100, "subsampling": 0},
+        EncoderProfile.Smallest: {"optimize": True, "quality": 100, "subsampling": 0},
+        EncoderProfile.Legacy:   {"optimize": True, "quality": 100, "subsampling": 0},
+    }, {"RGBA": "RGB", "P": "RGB"}),
+
+    "JXL": Format({
+        EncoderProfile.Fast:     {"lossless": True, "quality": 100, "effort": 2},
+        EncoderProfile.Balanced: {"lossless": True, "quality": 100, "effort": 5},
+        EncoderProfile.Smallest: {"lossless": True, "quality": 100, "effort": 9},
+        EncoderProfile.Legacy:   {"lossless": True, "quality": 100},
+    }, {"P": "RGB"}),
+
+    "PNG": Format({
+        EncoderProfile.Fast:     {"compress_level": 1},
+        EncoderProfile.Balanced: {"compress_level": 6},
+        EncoderProfile.Smallest: {"optimize": True, "compress_level": 9},
+        EncoderProfile.Legacy:   {"optimize": True, "compress_level": 9},
+    }),
+
+    "TIFF": Format({
+        EncoderProfile.Fast:     {"compression": "packbits"},
+        EncoderProfile.Balanced: {"compression": "tiff_lzw"},
+        EncoderProfile.Smallest: {"compression": "tiff_adobe_deflate"},
+        EncoderProfile.Legacy:   {"compression": "tiff_lzw"},
+    }),
+
+    # For lossless WEBP, 'quality' is the compression effort
+    "WEBP": Format({
+        EncoderProfile.Fast:     {"lossless": True, "quality": 0,   "method": 1, "exact": True},
+        EncoderProfile.Balanced: {"lossless": True, "quality": 75,  "method": 4, "exact": True},
+        EncoderProfile.Smallest: {"lossless": True, "quality": 100, "method": 5, "exact": True},
+        EncoderProfile.Legacy:   {"lossless": True, "quality": 100, "exact": True},
+    }),
 }
 
 EXTENSION_MAP = {
@@ -50,14 +104,24 @@ def getFormat(extension: str):
     key = EXTENSION_MAP.get(key, "")
     return FORMATS.get(key, UNKNOWN_FORMAT)
 
-def saveImage(path: str, mat: np.ndarray, logger=print, convertFromBGR=True):
+def saveImage(path: str, mat: np.ndarray, logger=print, convertFromBGR=True, profile: str = EncoderProfile.Balanced):
     if convertFromBGR:
-        mat[..., :3] = mat[..., 2::-1] # Convert BGR(A) -> RGB(A)
+        channels = mat.shape[2] if len(mat.shape) > 2 else 1
+        if channels == 4 and getFormat(os.path.splitext(path)[1]).conversion.get("RGBA") == "RGB":
+            # Remove alpha together with the channel swap
+            logger(f"Save Image: Converting color mode from RGBA to RGB")
+            mat = cv.cvtColor(mat, cv.COLOR_BGRA2RGB)
+        elif channels == 4:
+            cv.cvtColor(mat, cv.COLOR_BGRA2RGBA, dst=mat)
+        elif channels == 3:
+            cv.cvtColor(mat, cv.COLOR_BGR2RGB, dst=mat)
+        else:
+            mat[..., :3] = mat[..., 2::-1] # Convert BGR(A) -> RGB(A)
 
     img = Image.fromarray(mat.squeeze()) # No copy!
-    saveImagePIL(path, img, logger)
+    saveImagePIL(path, img, logger, profile)
 
-def saveImagePIL(path: str, img: Image.Image, logger=print):
+def saveImagePIL(path: str, img: Image.Image, logger=print, profile: str = EncoderProfile.Balanced):
     ext = os.path.splitext(path)[1]
     format = getFormat(ext)
 
@@ -66,12 +130,13 @@ def saveImagePIL(path: str, img: Image.Image, logger=print):
         img = img.convert(convertMode)
 
     createFolders(path, logger)
+    saveParams = format.getSaveParams(profile)
 
     try:
-        img.save(path, **format.saveParams)
+        img.save(path, **saveParams)
     except Exception as ex:
         try:
-            saveParams = {k: v for k, v in format.saveParams.items() if k != "optimize"}
+            saveParams = {k: v for k, v in saveParams.items() if k != "optimize"}
             img.save(path, **saveParams)
             logger(f"Save Image: Saved without optimization")
         except Exception as ex:
@@ -82,7 +147,121 @@ def createFolders(filename, logger=print) -> None:
     folder = os.path.dirname(filename)
     if not os.path.exists(folder):
         logger(f"Creating folder: {folder}")
-        os.makedirs(folder)
+        os.makedirs(folder, exist_ok=True)
+
+def destinationExists(path: str) -> bool:
+    'Also true for paths of images that are still queued in an ExportWriter.'
+    return os.path.lexists(path) or ExportWriter.isReserved(path)
+
+
+
+class ExportWriter:
+    '''
+    Write-behind queue for exported images. Images are encoded and written in a thread pool,
+    so the next image can be processed meanwhile, and multiple images are encoded in parallel.
+    The number of queued images per writer is limited, so memory doesn't grow when encoding is slower than processing.
+    Paths of queued images are reserved: ExportVariableParser won't choose them again for new files.
+    '''
+
+    NUM_THREADS = max(min(os.cpu_count() or 1, 8) // 2, 1)
+    MAX_QUEUED  = NUM_THREADS + 2
+
+    _mutex = Lock()
+    _executor: ThreadPoolExecutor | None = None
+    _executorPid = 0
+    _reserved: dict[str, Future] = dict()  # Normalized path -> Queued write
+
+
+    @classmethod
+    def getExecutor(cls) -> ThreadPoolExecutor:
+        with cls._mutex:
+            # Threads are not inherited by forked processes
+            if cls._executor is None or cls._executorPid != os.getpid():
+                cls._executor = ThreadPoolExecutor(cls.NUM_THREADS, thread_name_prefix="qapyq-export")
+                cls._executorPid = os.getpid()
+            return cls._executor
+
+    @classmethod
+    def isReserved(cls, path: str) -> bool:
+        key = os.path.normcase(os.path.abspath(path))
+        with cls._mutex:
+            return key in cls._reserved
+
+
+    def __init__(self, logger=print, profile: str = EncoderProfile.Balanced):
+        self.logger = logger
+        self.profile = profile
+        self.numFailed = 0
+
+        self._futures = list[Future]()
+        self._queueSlots = Semaphore(self.MAX_QUEUED)
+
+    def write(self, path: str, mat: np.ndarray, convertFromBGR=True, profile: str | None = None):
+        '''
+        Queues the image for saving. The writer takes ownership of the array, it must not be modified afterwards.
+        Uses the writer's encoder profile if `profile` is None.
+        '''
+        key = os.path.normcase(os.path.abspath(path))
+        executor = self.getExecutor()
+        self._queueSlots.acquire()
+
+        with self._mutex:
+            # Writes to the same path are done in order
+            previous = self._reserved.get(key)
+            future = executor.submit(self._write, path, mat, convertFromBGR, profile or self.profile, previous)
+            self._reserved[key] = future
+
+        future.add_done_callback(lambda f: self._onWritten(key, path, f))
+        self._futures.append(future)
+
+    def _write(self, path: str, mat: np.ndarray, convertFromBGR: bool, profile: str, previous: Future | None):
+        if previous is not None:
+            previous.exception()  # Wait
+        saveImage(path, mat, self.logger, convertFromBGR, profile)
+
+    def _onWritten(self, key: str, path: str, future: Future):
+        with self._mutex:
+            if self._reserved.get(key) is future:
+                del self._reserved[key]
+
+        self._queueSlots.release()
+        if ex := future.exception():
+            self.numFailed += 1
+            self.logger(f"WARNING: Failed to save '{path}': {ex}")
+
+    def finish(self):
+        'Waits until all queued images are written.'
+        for future in self._futures:
+            future.exception()
+        self._futures.clear()
+
+
+
+class ExportBuffers:
+    '''
+    Per-thread memory for full-size intermediate arrays that would otherwise be allocated for every exported image.
+    A buffer grows to the largest requested size and is reused for all smaller arrays.
+    Returned arrays are only valid until the buffer with the same name is requested again in the same thread.
+    '''
+
+    _local = local()
+
+    @classmethod
+    def get(cls, name: str, shape: tuple[int, ...], dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        size = math.prod(shape) * dtype.itemsize
+
+        buffers: dict[str, np.ndarray] = cls._local.__dict__.setdefault("buffers", dict())
+        buffer = buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=np.uint8)
+            buffers[name] = buffer
+
+        return buffer[:size].view(dtype).reshape(shape)
+
+    @classmethod
+    def clear(cls):
+        cls._local.__dict__.pop("buffers", None)
 
 
 
@@ -95,6 +274,30 @@ class ExportFileType(enum.IntEnum):
     Video   = 2
 
 
+class EncoderProfileComboBox(QtWidgets.QComboBox):
+    def __init__(self):
+        super().__init__()
+        self.setToolTip("Encoder settings for saving images.\nAll profiles keep the same image quality, they only trade encoding time against file size.")
+        self.addItem("Fast", EncoderProfile.Fast)
+        self.addItem("Balanced", EncoderProfile.Balanced)
+        self.addItem("Smallest Files", EncoderProfile.Smallest)
+        self.addItem("Legacy", EncoderProfile.Legacy)
+        self.setItemData(self.count()-1, "Settings used before encoder profiles were added", Qt.ItemDataRole.ToolTipRole)
+        self.profile = EncoderProfile.Balanced
+
+    @property
+    def profile(self) -> str:
+        return self.currentData()
+
+    @profile.setter
+    def profile(self, profile: str):
+        index = self.findData(profile)
+        if index < 0:
+            index = self.findData(EncoderProfile.Balanced)
+        self.setCurrentIndex(index)
+
+
+
 class ExportWidget(QtWidgets.QWidget):
     MODE_AUTO = "auto"
     MODE_MANUAL = "manual"
@@ -116,11 +319,14 @@ class ExportWidget(QtWidgets.QWidget):
         config = Config.exportPresets.get(configKey, {})
         self.pathTemplate   = config.get("path_template", "{{name}}_{{date}}_{{time}}_{{w}}x{{h}}.png")
         self.overwriteFiles = config.get("overwrite", False)
+        encoderProfile      = getPresetEncoderProfile(config)
 
         self.parser = ExportVariableParser()
         self.fileType: ExportFileType = ExportFileType.Unknown
 
         self._build()
+        self.cboEncoderProfile.profile = encoderProfile
+        self.cboEncoderProfile.currentIndexChanged.connect(self.saveToPreset)
         self._onSaveModeChanged(self.cboSaveMode.currentIndex())
 
     def _build(self):
@@ -169,6 +375,12 @@ class ExportWidget(QtWidgets.QWidget):
             lblScaling.hide()
             self.cboScalePreset.hide()
 
+        row += 1
+        self.lblEncoderProfile = QtWidgets.QLabel("Encoder:")
+        self.cboEncoderProfile = EncoderProfileComboBox()
+        layout.addWidget(self.lblEncoderProfile, row, 0)
+        layout.addWidget(self.cboEncoderProfile, row, 1)
+
         row += 1
         lblPath = QtWidgets.QLabel("<a href='export_settings'>Path:</a>")
         lblPath.linkActivated.connect(self.openExportSettings)
@@ -198,10 +410,12 @@ class ExportWidget(QtWidgets.QWidget):
             self.saveToPreset()
             self.updateSample()
 
+    @Slot()
     def saveToPreset(self):
         Config.exportPresets[self.configKey] = {
             "path_template": self.pathTemplate,
-            "overwrite": self.overwriteFiles
+            "overwrite": self.overwriteFiles,
+            "encoder_profile": self.cboEncoderProfile.profile
         }
 
     @Slot()
@@ -231,6 +445,8 @@ class ExportWidget(QtWidgets.QWidget):
 
         for widget in (self.lblFps, self.spinFps):
             widget.setVisible(isVideo)
+        for widget in (self.lblEncoderProfile, self.cboEncoderProfile):
+            widget.setVisible(not isVideo)
 
         self.fileTypeChanged.emit(fileType)
         return True
@@ -245,6 +461,9 @@ class ExportWidget(QtWidgets.QWidget):
     def getScaleConfig(self, scaleFactor: float):
         return self.cboScalePreset.getScaleConfig(scaleFactor)
 
+    def getEncoderProfile(self) -> str:
+        return self.cboEncoderProfile.profile
+
 
     def setExportSize(self, width: int, height: int, rotation: float = 0.0, length: int = 0, speed: float = 1.0):
         self.parser.width = width
@@ -321,17 +540,17 @@ Examples:
     {{name}}_{{tags.tags#replace:, :_}}.{{ext}}"""
 
 
-    def __init__(self, parser, showInfo=True, showSkip=False):
+    def __init__(self, parser, showInfo=True, showSkip=False, showEncoder=False):
         super().__init__()
         self._extension = "ext"
 
         self.parser: ExportVariableParser = parser
         self.highlighter = template_parser.VariableHighlighter()
 
-        self._build(showInfo, showSkip)
+        self._build(showInfo, showSkip, showEncoder)
         self.updatePreview()
 
-    def _build(self, showInfo: bool, showSkip: bool):
+    def _build(self, showInfo: bool, showSkip: bool, showEncoder: bool):
         layout = QtWidgets.QGridLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
         layout.setColumnStretch(0, 0)
@@ -387,6 +606,12 @@ Examples:
         if showSkip:
             layout.addWidget(self.chkSkipExisting, row, 2)
 
+        self.cboEncoderProfile = EncoderProfileComboBox()
+        if showEncoder:
+            row += 1
+            layout.addWidget(QtWidgets.QLabel("Encoder:"), row, 0)
+            layout.addWidget(self.cboEncoderProfile, row, 1)
+
     def setAsInput(self):
         self.chkOverwrite.hide()
         self.chkSkipExisting.hide()
@@ -430,6 +655,15 @@ Examples:
         self.chkSkipExisting.setEnabled(not state)
 
 
+    @property
+    def encoderProfile(self) -> str:
+        return self.cboEncoderProfile.profile
+
+    @encoderProfile.setter
+    def encoderProfile(self, profile: str):
+        self.cboEncoderProfile.profile = profile
+
+
     @property
     def skipExistingFiles(self) -> bool:
         return self.chkSkipExisting.isChecked()
@@ -566,7 +800,7 @@ class ExportVariableParser(template_parser.TemplateVariableParser):
         head = path
         path = f"{head}{extension}"
         counter = 1
-        while os.path.lexists(path):
+        while destinationExists(path):
             path = f"{head}_{counter:03}{extension}"
             counter += 1
 
@@ -873,6 +1107,7 @@ class ImageExportTask(QRunnable):
         self.scaleConfig    = scaleConfig
 
         self.borderMode     = cv.BORDER_REPLICATE
+        self.encoderProfile = EncoderProfile.Balanced
 
         # Initialize kernels in main thread
         self.initKernels()
@@ -905,7 +1140,7 @@ class ImageExportTask(QRunnable):
                 np.clip(matDest, 0, 255, out=matDest)
                 matDest = matDest.astype(np.uint8)
 
-            saveImage(self.destFile, matDest)
+            saveImage(self.destFile, matDest, profile=self.encoderProfile)
             self.signals.done.emit(self.srcFile, self.destFile)
 
             del matSrc
@@ -916,6 +1151,7 @@ class ImageExportTask(QRunnable):
             self.signals.fail.emit(str(ex))
         finally:
             del self.img
+            ExportBuffers.clear() # Single exports don't keep the memory
 
     def inferUpscale(self, mat: np.ndarray) -> np.ndarray:
         from infer.inference import Inference
@@ -1020,13 +1256,22 @@ class ImageExportTask(QRunnable):
 
         #print(f"downscaling by x:{downScaleX} / y:{downScaleY}, gauss sigma x:{sigmaX} / y:{sigmaY} @ kernel size {ksize}")
 
+        # The result is written to a reused buffer. It's only used as input for scaling.
         if filterMode == ScaleModelSettings.LowPassFilter.Adaptive:
-            mat = mat.astype(np.float32)
-            mask = cls.createBlendMask(mat, targetWidth, targetHeight, max(downScaleX, downScaleY))
-            filtered = cv.GaussianBlur(mat, ksize, sigmaX=sigmaX, sigmaY=sigmaY, borderType=cv.BORDER_REFLECT_101)
-            filtered = mat + mask*(filtered - mat)
+            matF32 = ExportBuffers.get("lowpass-src", mat.shape, np.float32)
+            np.copyto(matF32, mat)
+            mask = cls.createBlendMask(matF32, targetWidth, targetHeight, max(downScaleX, downScaleY))
+
+            filtered = ExportBuffers.get("lowpass", mat.shape, np.float32)
+            cv.GaussianBlur(matF32, ksize, dst=filtered, sigmaX=sigmaX, sigmaY=sigmaY, borderType=cv.BORDER_REFLECT_101)
+
+            # mat + mask*(filtered - mat)
+            filtered -= matF32
+            filtered *= mask
+            filtered += matF32
         else:
-            filtered = cv.GaussianBlur(mat, ksize, sigmaX=sigmaX, sigmaY=sigmaY, borderType=cv.BORDER_REFLECT_101)
+            filtered = ExportBuffers.get("lowpass", mat.shape, mat.dtype)
+            cv.GaussianBlur(mat, ksize, dst=filtered, sigmaX=sigmaX, sigmaY=sigmaY, borderType=cv.BORDER_REFLECT_101)
 
         return filtered
 
@@ -0,0 +1,188 @@
+from collections import OrderedDict, deque
+from threading import Condition
+from PySide6.QtCore import Slot, QThreadPool, QRunnable
+from PySide6.QtGui import QImage
+from lib import imagerw, videorw
+from lib.util import getFileStamp, FileStamp
+from config import Config
+
+
+class CachedImage:
+    __slots__ = ('image', 'stamp', 'exifTransform', 'size')
+
+    def __init__(self, image: QImage, stamp: FileStamp, exifTransform: bool):
+        self.image = image
+        self.stamp = stamp
+        self.exifTransform = exifTransform
+        self.size = image.sizeInBytes()
+
+    def isValid(self, path: str) -> bool:
+        return self.exifTransform == Config.exifTransform and self.stamp == getFileStamp(path)
+
+
+
+class ImageCache:
+    '''
+    Keeps recently shown and prefetched images in decoded form, so navigating through the files doesn't wait for decoding.
+    The cache is bounded by the size of the decoded images and evicts the least recently used images first.
+
+    Prefetching loads the images that will likely be shown next in a background thread pool. When an image is requested
+    while it is still loading, get() waits for it instead of decoding it a second time.
+    Entries are validated against the file's size and modification time.
+    '''
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(ImageCache, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, '_singleton_initialized', False):
+            return
+        self._singleton_initialized = True
+
+        self._active = True
+        self._cond = Condition()
+        self._images = OrderedDict[str, CachedImage]()
+        self._size = 0
+
+        self._queue = deque[str]()
+        self._loading = set[str]()
+        self._numWorkers = 0
+
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(max(Config.viewPrefetchThreads, 1))
+
+    def shutdown(self):
+        with self._cond:
+            self._active = False
+            self._queue.clear()
+            self._images.clear()
+            self._size = 0
+            self._cond.notify_all()
+        self.threadpool.clear()
+
+    @property
+    def maxSize(self) -> int:
+        return Config.viewCacheSize * 1024 * 1024
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+
+    def get(self, path: str) -> QImage | None:
+        'Returns the cached image, or waits for the image if it is currently loading. Returns None if the image is not cached.'
+        with self._cond:
+            while path in self._loading:
+                self._cond.wait()
+
+            entry = self._images.get(path)
+            if entry is None:
+                return None
+
+            self._images.move_to_end(path)
+
+        # Check stamp outside of lock
+        if entry.isValid(path):
+            return entry.image
+
+        with self._cond:
+            if self._images.get(path) is entry:
+                self._remove(path)
+        return None
+
+    def put(self, path: str, image: QImage, stamp: FileStamp = None):
+        if image.isNull():
+            return
+
+        entry = CachedImage(image, stamp or getFileStamp(path), Config.exifTransform)
+        if entry.stamp is None or entry.size > self.maxSize:
+            return
+
+        with self._cond:
+            if self._active:
+                self._remove(path)
+                self._images[path] = entry
+                self._size += entry.size
+                self._evict()
+
+    def _remove(self, path: str):
+        if entry := self._images.pop(path, None):
+            self._size -= entry.size
+
+    def _evict(self):
+        # Keep the most recently used image
+        maxSize = self.maxSize
+        while self._size > maxSize and len(self._images) > 1:
+            _, entry = self._images.popitem(last=False)
+            self._size -= entry.size
+
+
+    def prefetch(self, files: list[str]):
+        '''
+        Loads the given files in the background, in order of the list. Replaces the files of previous calls
+        which didn't start loading yet. Videos and files that are already cached are skipped.
+        '''
+        if Config.viewCacheSize <= 0:
+            return
+
+        with self._cond:
+            if not self._active:
+                return
+
+            self._queue.clear()
+            for file in files:
+                if not (file in self._images or file in self._loading or videorw.isVideoFile(file)):
+                    self._queue.append(file)
+
+            numStart = min(len(self._queue), self.threadpool.maxThreadCount()) - self._numWorkers
+            self._numWorkers += max(numStart, 0)
+
+        for _ in range(numStart):
+            self.threadpool.start(ImagePrefetchTask(self))
+
+    def _takeNext(self) -> str | None:
+        with self._cond:
+            if self._active and self._queue:
+                path = self._queue.popleft()
+                self._loading.add(path)
+                return path
+
+            self._numWorkers -= 1
+            return None
+
+    def _finishLoading(self, path: str, image: QImage | None, stamp: FileStamp):
+        if image is not None and stamp is not None:
+            self.put(path, image, stamp)
+
+        with self._cond:
+            self._loading.discard(path)
+            self._cond.notify_all()
+
+
+
+class ImagePrefetchTask(QRunnable):
+    def __init__(self, cache: ImageCache):
+        super().__init__()
+        self.setAutoDelete(True)
+        self.cache = cache
+
+    @Slot()
+    def run(self):
+        from .tiled_image import useTiledView
+
+        while path := self.cache._takeNext():
+            image = stamp = None
+            try:
+                if useTiledView(path):
+                    continue  # Large images are not cached
+                # Take stamp before loading: Changes during loading will invalidate the entry
+                stamp = getFileStamp(path)
+                image = imagerw.loadQImage(path)
+            except Exception as ex:
+                print(f"Couldn't prefetch image: {ex} ({type(ex).__name__})")
+            finally:
+                self.cache._finishLoading(path, image, stamp)
@@ -3,13 +3,14 @@ from enum import IntEnum
 from typing import NamedTuple, TYPE_CHECKING
 from typing_extensions import override
 from PySide6 import QtGui
-from PySide6.QtCore import Qt, QRect, QRectF, QSize, QEvent
+from PySide6.QtCore import Qt, QRect, QRectF, QSize, QEvent, QTimer
 from PySide6.QtGui import QBrush, QColor, QPainter, QPixmap, QTransform, QPalette, QShortcut, QKeySequence
 from PySide6.QtWidgets import QGraphicsPixmapItem, QGraphicsView, QGraphicsItem, QGraphicsScene
 from lib import colorlib, imagerw, videorw
 from lib.filelist import FileList
 from config import Config
 from .dropview import DropView
+from .image_cache import ImageCache
 
 if TYPE_CHECKING:
     from tools.tool import Tool
@@ -18,6 +19,7 @@ if TYPE_CHECKING:
 class MediaItemType(IntEnum):
     Image = 0
     Video = 1
+    Tiled = 2
 
 
 class MouseLocation(IntEnum):
@@ -55,6 +57,7 @@ class ImgView(DropView):
         self._playShortcut.activated.connect(lambda: self.image.togglePlay())
 
         self._mouseLoc: MouseLocation = MouseLocation.Outside
+        self._prefetchPending = False
 
     def _setupBackground(self):
         palette = self.palette()
@@ -76,16 +79,27 @@ class ImgView(DropView):
 
 
     def onFileChanged(self, currentFile: str):
+        from .tiled_image import TiledImgItem, useTiledView
+
         isVideoFile = videorw.isVideoFile(currentFile)
         requiresPlayback = isVideoFile & (Config.mediaPlaybackEnabled | Config.mediaPlaybackStarted)
 
-        if (isVideoFile, requiresPlayback) != (self.image.TYPE == MediaItemType.Video, self.image.PLAYBACK):
+        if isVideoFile:
+            itemType = MediaItemType.Video
+        elif useTiledView(currentFile):
+            itemType = MediaItemType.Tiled
+        else:
+            itemType = MediaItemType.Image
+
+        if (itemType, requiresPlayback) != (self.image.TYPE, self.image.PLAYBACK):
             self.image.removeFromScene(self.scene(), self._guiScene)
             self.image.deleteLater()
 
             if isVideoFile:
                 from .video_player import VideoItem, FrozenVideoItem
                 self.image = VideoItem(self) if requiresPlayback else FrozenVideoItem(self)
+            elif itemType == MediaItemType.Tiled:
+                self.image = TiledImgItem(self)
             else:
                 self.image = ImgItem()
 
@@ -97,6 +111,11 @@ class ImgView(DropView):
         self.updateImageTransform()
         self.updateView()
 
+        # Start prefetching after the current image is shown and all listeners were notified
+        if not self._prefetchPending:
+            self._prefetchPending = True
+            QTimer.singleShot(0, self._prefetch)
+
         if self.takeFocusOnFilechange:
             # TODO: On Windows, this delays the re-painting of selection borders
             self.setFocus()
@@ -106,6 +125,17 @@ class ImgView(DropView):
         if currentFile != self.image.filepath:
             self.onFileChanged(currentFile)
 
+    def _prefetch(self):
+        self._prefetchPending = False
+        if not self.isVisible():
+            return
+
+        count = Config.viewPrefetchCount
+        files = self._tool.getPrefetchFiles(count) if self._tool else None
+        if files is None:
+            files = self.filelist.getAdjacentFiles(count)
+        ImageCache().prefetch(files)
+
 
     def updateImageTransform(self):
         self.image.updateTransform(self.viewport().rect(), self.rotation)
@@ -348,7 +378,12 @@ class ImgItem(MediaItemMixin, QGraphicsPixmapItem):
         if not super().loadFile(path):
             return False
 
-        image = imagerw.loadQImage(path)
+        cache = ImageCache()
+        image = cache.get(path)
+        if image is None:
+            image = imagerw.loadQImage(path)
+            cache.put(path, image)
+
         pixmap = QPixmap.fromImage(image)
         self.setPixmap(pixmap)
         if pixmap.isNull():
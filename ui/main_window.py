@@ -276,6 +276,24 @@ class MainWindow(QtWidgets.QMainWindow):
         from gallery.thumbnail_cache import ThumbnailCache
         ThumbnailCache().shutdown()
 
+        from gallery.caption_loader import CaptionLoader
+        CaptionLoader().shutdown()
+
+        from .image_cache import ImageCache
+        ImageCache().shutdown()
+
+        from .tiled_image import TilePyramid
+        TilePyramid.releaseAll()
+
+        from stats.stats_pool import StatsProcessPool
+        StatsProcessPool.shutdown()
+
+        from lib.mediasize import MediaSizeCache
+        MediaSizeCache().save()
+
+        from lib.videoindex import VideoIndex
+        VideoIndex().save()
+
         aux_window.saveWindowPos(self, "main")
         Config.toolbarPosition = qtlib.toolbarAreaToString(self.toolBarArea(self.toolbar))
 
@@ -0,0 +1,451 @@
+from __future__ import annotations
+import math, os, shutil, tempfile, time, weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable
+from typing_extensions import override
+import numpy as np
+from PIL import Image
+from PySide6.QtCore import Qt, Signal, Slot, QObject, QRectF, QSize, QThreadPool, QRunnable
+from PySide6.QtGui import QImage, QImageReader, QPainter, QPixmap
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget
+from lib import imagerw, videorw
+from lib.util import getFileStamp
+from config import Config
+from .imgview import ImgView, MediaItemType, MediaMetadata, MediaItemMixin
+
+
+def useTiledView(path: str) -> bool:
+    'Returns True for images which are too large to be shown as one pixmap.'
+    if Config.viewTiledMinPixels <= 0 or videorw.isVideoFile(path):
+        return False
+    try:
+        w, h = imagerw.readSize(path)
+        return w * h >= Config.viewTiledMinPixels
+    except Exception:
+        return False
+
+
+_pixelLimitLock = Lock()
+_pixelLimitLifted = 0
+_pixelLimitOrig: int | None = None
+
+@contextmanager
+def _liftPixelLimit():
+    '''
+    Disables PIL's decompression bomb check, which would reject images above ~179 MP.
+    The limit is global, so it's restored when the last overlapping load finishes.
+    '''
+    global _pixelLimitLifted, _pixelLimitOrig
+    with _pixelLimitLock:
+        if _pixelLimitLifted == 0:
+            _pixelLimitOrig = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = None
+        _pixelLimitLifted += 1
+    try:
+        yield
+    finally:
+        with _pixelLimitLock:
+            _pixelLimitLifted -= 1
+            if _pixelLimitLifted == 0:
+                Image.MAX_IMAGE_PIXELS = _pixelLimitOrig
+
+
+
+class TilePyramid:
+    '''
+    Stores an image and its downscaled mip levels (each half the size of the previous level) as memory-mapped files.
+    Tiles are read from the mapped files on demand, so the memory use while viewing depends on the visible tiles only.
+    The files are written to a temporary folder in Config.pathTileCache ('path_tile_cache' in the config file),
+    which should be on a disk: In the system's temp folder they could end up in RAM (tmpfs).
+    The folder is deleted when the pyramid is released. Folders left behind by a crash are removed on startup.
+    '''
+
+    TILE_SIZE    = 512
+    PREVIEW_SIZE = 2048
+    BAND_HEIGHT  = 1024  # Rows processed at once while building. Must be even.
+
+    _mutex = Lock()
+    _recent = OrderedDict[tuple, 'TilePyramid']()  # Keeps the pyramids of recently viewed images
+    MAX_RECENT = 2
+
+    FOLDER_PREFIX = "qapyq_tiles_"
+    STALE_AGE = 3600  # Seconds. Younger folders may still be in use by another instance.
+
+
+    def __init__(self, folder: str, levels: list[np.ndarray]):
+        self.folder = folder
+        self.levels = levels
+        self._refs = 0
+
+    @property
+    def width(self) -> int:
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.levels[0].shape[0]
+
+    @property
+    def channels(self) -> int:
+        return self.levels[0].shape[2]
+
+    def numTiles(self, level: int) -> tuple[int, int]:
+        h, w = self.levels[level].shape[:2]
+        return math.ceil(w / self.TILE_SIZE), math.ceil(h / self.TILE_SIZE)
+
+    def loadTile(self, level: int, tx: int, ty: int) -> QImage:
+        x, y = tx * self.TILE_SIZE, ty * self.TILE_SIZE
+        return self.toQImage(self.levels[level][y:y+self.TILE_SIZE, x:x+self.TILE_SIZE])
+
+    def loadFull(self) -> QImage:
+        return self.toQImage(self.levels[0])
+
+    @staticmethod
+    def toQImage(mat: np.ndarray) -> QImage:
+        'Returns a copy that owns its memory.'
+        h, w, channels = mat.shape
+        format = QImage.Format.Format_RGBA8888 if channels == 4 else QImage.Format.Format_RGB888
+        image = QImage(w, h, format)
+        buffer = np.frombuffer(image.bits(), dtype=np.uint8).reshape((h, image.bytesPerLine()))
+        buffer[:, :w*channels] = mat.reshape((h, w*channels))
+        return image
+
+
+    @classmethod
+    def get(cls, path: str, onPreview: Callable[[QImage], None] | None = None) -> TilePyramid | None:
+        'Returns the cached pyramid or builds it. Calls onPreview with a downscaled image while building.'
+        key = (path, getFileStamp(path), Config.exifTransform)
+        with cls._mutex:
+            if pyramid := cls._recent.get(key):
+                cls._recent.move_to_end(key)
+                pyramid._refs += 1
+                return pyramid
+
+        pyramid = cls._build(path, onPreview)
+        if pyramid is None:
+            return None
+
+        with cls._mutex:
+            pyramid._refs += 1
+            cls._recent[key] = pyramid
+            while len(cls._recent) > cls.MAX_RECENT:
+                _, old = cls._recent.popitem(last=False)
+                if old._refs == 0:
+                    old._delete()
+        return pyramid
+
+    def release(self):
+        with self._mutex:
+            self._refs -= 1
+            if self._refs == 0 and self not in self._recent.values():
+                self._delete()
+
+    @classmethod
+    def releaseAll(cls):
+        with cls._mutex:
+            for pyramid in cls._recent.values():
+                pyramid._delete()
+            cls._recent.clear()
+
+    def _delete(self):
+        self.levels = []  # Unmap files
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    @classmethod
+    def removeStale(cls):
+        'Deletes folders left behind by previous sessions that were not shut down properly.'
+        try:
+            entries = list(os.scandir(Config.pathTileCache))
+        except OSError:
+            return
+
+        minTime = time.time() - cls.STALE_AGE
+        for entry in entries:
+            try:
+                if entry.name.startswith(cls.FOLDER_PREFIX) and entry.is_dir() and entry.stat().st_mtime < minTime:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError as ex:
+                print(f"WARNING: Failed to remove stale tile cache folder '{entry.path}': {ex}")
+
+
+    @classmethod
+    def _build(cls, path: str, onPreview: Callable[[QImage], None] | None) -> TilePyramid | None:
+        previewDone = False
+        if onPreview:
+            # Fast preview with DCT scaling
+            reader = QImageReader(path)
+            if reader.format().data() == b"jpeg":
+                w, h = reader.size().toTuple()
+                scale = cls.PREVIEW_SIZE / max(w, h, 1)
+                reader.setScaledSize(QSize(max(round(w*scale), 1), max(round(h*scale), 1)))
+                reader.setAutoTransform(Config.exifTransform)
+                preview = reader.read()
+                if not preview.isNull():
+                    imagerw.normalizeColorSpace(preview)
+                    onPreview(preview)
+                    previewDone = True
+
+        with _liftPixelLimit():
+            img = imagerw.loadImagePIL(path)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+        if onPreview and not previewDone:
+            factor = math.ceil(max(img.size) / cls.PREVIEW_SIZE)
+            preview = img.reduce(factor) if factor > 1 else img
+            onPreview(cls.toQImage(np.asarray(preview)))
+            del preview
+
+        os.makedirs(Config.pathTileCache, exist_ok=True)
+        folder = tempfile.mkdtemp(prefix=cls.FOLDER_PREFIX, dir=Config.pathTileCache)
+        try:
+            w, h = img.size
+            channels = len(img.getbands())
+            level = np.memmap(os.path.join(folder, "0.raw"), dtype=np.uint8, mode="w+", shape=(h, w, channels))
+            for y in range(0, h, cls.BAND_HEIGHT):
+                y1 = min(y + cls.BAND_HEIGHT, h)
+                level[y:y1] = np.asarray(img.crop((0, y, w, y1)))
+            del img
+
+            levels = [level]
+            while max(w, h) > cls.TILE_SIZE:
+                level = cls._downscale(level, os.path.join(folder, f"{len(levels)}.raw"))
+                levels.append(level)
+                h, w = level.shape[:2]
+
+            for level in levels:
+                level.flush()
+            return TilePyramid(folder, levels)
+        except:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+
+    @classmethod
+    def _downscale(cls, src: np.ndarray, path: str) -> np.ndarray:
+        'Halves the size by averaging 2x2 pixels. Odd sizes repeat the last row or column.'
+        h, w, channels = src.shape
+        dstW, dstH = (w+1) // 2, (h+1) // 2
+        dst = np.memmap(path, dtype=np.uint8, mode="w+", shape=(dstH, dstW, channels))
+
+        for y in range(0, h, cls.BAND_HEIGHT):
+            band = src[y:y+cls.BAND_HEIGHT].astype(np.uint16)
+            if band.shape[0] % 2:
+                band = np.concatenate((band, band[-1:]), axis=0)
+            if w % 2:
+                band = np.concatenate((band, band[:, -1:]), axis=1)
+
+            band = band[0::2, 0::2] + band[1::2, 0::2] + band[0::2, 1::2] + band[1::2, 1::2] + 2
+            dst[y//2 : y//2 + band.shape[0]] = (band >> 2).astype(np.uint8)
+        return dst
+
+
+
+class PyramidLoadTask(QRunnable):
+    def __init__(self, slots: TiledImageSlots, path: str):
+        super().__init__()
+        self.setAutoDelete(True)
+        self.slots = weakref.ref(slots)
+        self.path = path
+
+    def emit(self, signalName: str, *args) -> bool:
+        if (slots := self.slots()) is not None:
+            try:
+                getattr(slots, signalName).emit(self.path, *args)
+                return True
+            except RuntimeError:
+                pass  # Deleted
+        return False
+
+    @Slot()
+    def run(self):
+        try:
+            pyramid = TilePyramid.get(self.path, lambda preview: self.emit("previewLoaded", preview))
+        except Exception as ex:
+            print(f"Failed to load image: {self.path}: {ex} ({type(ex).__name__})")
+            pyramid = None
+
+        if not self.emit("pyramidLoaded", pyramid) and pyramid:
+            pyramid.release()
+
+
+
+class TiledImageSlots(QObject):
+    previewLoaded = Signal(str, QImage)
+    pyramidLoaded = Signal(str, object)
+
+    def __init__(self, item: TiledImgItem, parent: QObject):
+        super().__init__(parent)
+        self.item = item
+        self.previewLoaded.connect(self.onPreviewLoaded, Qt.ConnectionType.QueuedConnection)
+        self.pyramidLoaded.connect(self.onPyramidLoaded, Qt.ConnectionType.QueuedConnection)
+
+    @Slot(str, QImage)
+    def onPreviewLoaded(self, path: str, image: QImage):
+        if path == self.item.filepath and self.item._pyramid is None:
+            self.item._preview = QPixmap.fromImage(image)
+            self.item.update()
+
+    @Slot(str, object)
+    def onPyramidLoaded(self, path: str, pyramid: TilePyramid | None):
+        if pyramid is None:
+            return
+        if path == self.item.filepath and self.item._pyramid is None:
+            self.item._pyramid = pyramid
+            self.item.update()
+        else:
+            pyramid.release()
+
+
+
+class TiledImgItem(MediaItemMixin, QGraphicsItem):
+    '''
+    Shows large images from a tile pyramid, so only the visible part is held in memory at the resolution of the current zoom.
+    A downscaled preview is shown while the pyramid is built in the background.
+    '''
+
+    TYPE = MediaItemType.Tiled
+    PLAYBACK = False
+
+    MAX_TILES = 96  # Cached tile pixmaps: ~96 MB at 512x512 RGBA
+
+    def __init__(self, imgview: ImgView):
+        super().__init__()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+        self._slots = TiledImageSlots(self, imgview.scene())
+        self.threadpool = QThreadPool.globalInstance()
+
+        self._size = QSize()
+        self._alpha = False
+        self._smooth = True
+        self._preview: QPixmap | None = None
+        self._pyramid: TilePyramid | None = None
+        self._tiles = OrderedDict[tuple[int, int, int], QPixmap]()
+        self._fullPixmap: QPixmap | None = None
+
+    def deleteLater(self):
+        self.clearImage()
+        self._slots.deleteLater()
+
+    @override
+    def clearImage(self):
+        super().clearImage()
+        self._reset(QSize())
+
+    def _reset(self, size: QSize):
+        self.prepareGeometryChange()
+        self._size = size
+        self._preview = None
+        self._tiles.clear()
+        self._fullPixmap = None
+        if self._pyramid:
+            self._pyramid.release()
+            self._pyramid = None
+
+    @override
+    def loadFile(self, path: str) -> bool:
+        if not super().loadFile(path):
+            return False
+
+        try:
+            w, h = imagerw.readSize(path)
+        except Exception:
+            w = h = -1
+
+        self._reset(QSize(w, h))
+        if w <= 0 or h <= 0:
+            print(f"Failed to load image: {path}")
+            return False
+
+        try:
+            with _liftPixelLimit(), Image.open(path) as img:
+                self._alpha = "A" in img.getbands() or "transparency" in img.info
+        except Exception as ex:
+            print(f"Failed to load image: {path} ({ex})")
+            self._reset(QSize(-1, -1))
+            return False
+
+        self.threadpool.start(PyramidLoadTask(self._slots, path))
+        return True
+
+    @override
+    def mediaSize(self) -> QSize:
+        return self._size
+
+    @override
+    def mediaMetadata(self) -> MediaMetadata:
+        return MediaMetadata(self._alpha)
+
+    @override
+    def setSmooth(self, enabled: bool):
+        if enabled != self._smooth:
+            self._smooth = enabled
+            self.update()
+
+    def pixmap(self) -> QPixmap:
+        'Decodes the full image for tools which need all pixels.'
+        if self._fullPixmap is None:
+            if not self.filepath:
+                return QPixmap()
+            image = self._pyramid.loadFull() if self._pyramid else imagerw.loadQImage(self.filepath)
+            self._fullPixmap = QPixmap.fromImage(image)
+        return self._fullPixmap
+
+
+    @override
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, max(self._size.width(), 0), max(self._size.height(), 0))
+
+    @override
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget | None = None):
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, self._smooth)
+
+        if self._pyramid is None:
+            if self._preview is not None:
+                painter.drawPixmap(self.boundingRect(), self._preview, QRectF(self._preview.rect()))
+            return
+
+        # Choose the level with at least one image pixel per screen pixel
+        transform = painter.worldTransform()
+        scale = math.hypot(transform.m11(), transform.m12())
+        numLevels = len(self._pyramid.levels)
+        level = min(max(int(math.floor(math.log2(1.0 / scale))), 0), numLevels-1) if scale > 0 else numLevels-1
+
+        levelScale = 1 << level
+        tileSize = TilePyramid.TILE_SIZE * levelScale
+        numX, numY = self._pyramid.numTiles(level)
+
+        # Limit to the painted device, in case the exposed rect is not set
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        device = painter.device()
+        inverted, invertible = transform.inverted()
+        if invertible:
+            exposed = exposed.intersected(inverted.mapRect(QRectF(0, 0, device.width(), device.height())))
+        if exposed.isEmpty():
+            return
+        x0 = max(int(exposed.left()   // tileSize), 0)
+        y0 = max(int(exposed.top()    // tileSize), 0)
+        x1 = min(int(exposed.right()  // tileSize), numX-1)
+        y1 = min(int(exposed.bottom() // tileSize), numY-1)
+
+        # Keep at least the visible tiles
+        maxTiles = max(self.MAX_TILES, (x1-x0+1) * (y1-y0+1))
+
+        for ty in range(y0, y1+1):
+            for tx in range(x0, x1+1):
+                tile = self._getTile(level, tx, ty, maxTiles)
+                target = QRectF(tx*tileSize, ty*tileSize, tile.width()*levelScale, tile.height()*levelScale)
+                painter.drawPixmap(target, tile, QRectF(tile.rect()))
+
+    def _getTile(self, level: int, tx: int, ty: int, maxTiles: int) -> QPixmap:
+        key = (level, tx, ty)
+        if tile := self._tiles.get(key):
+            self._tiles.move_to_end(key)
+            return tile
+
+        tile = QPixmap.fromImage(self._pyramid.loadTile(level, tx, ty))
+        self._tiles[key] = tile
+        while len(self._tiles) > maxTiles:
+            self._tiles.popitem(last=False)
+        return tile
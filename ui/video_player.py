@@ -4,7 +4,7 @@ from typing_extensions import override
 import av, math, traceback
 from av.video.reformatter import Interpolation
 from PySide6 import QtWidgets
-from PySide6.QtCore import Qt, Signal, Slot, QRect, QRectF, QSize, QUrl, QThread, QTimer, QObject, QSignalBlocker
+from PySide6.QtCore import Qt, Signal, SignalInstance, Slot, QRect, QRectF, QSize, QUrl, QThread, QThreadPool, QRunnable, QTimer, QObject, QSignalBlocker
 from PySide6.QtGui import QPixmap, QImage, QColor, QMouseEvent, QWheelEvent, QSinglePointEvent, QPainter, QPen, QBrush
 from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput, QAudio
 from PySide6.QtMultimediaWidgets import QGraphicsVideoItem
@@ -13,6 +13,8 @@ from PySide6.QtWidgets import (
     QApplication, QWidget, QStyleOptionGraphicsItem
 )
 from lib import qtlib, colorlib, videorw
+from lib.videoindex import VideoIndex, KeyframeTable
+from lib.videosprites import SeekSpriteStore, SeekSprites
 from tools.tool import MediaEvent
 from config import Config
 from .imgview import ImgView, MediaItemType, MediaMetadata, MediaItemMixin
@@ -28,6 +30,9 @@ VOLUME_SCALE = QAudio.VolumeScale.CubicVolumeScale
 
 T = TypeVar("T", bound='VideoItemMixin')
 class BaseSlots(QObject, Generic[T]):
+    spritesLoaded = Signal(str, object)    # file, SeekSprites | None
+    keyframesLoaded = Signal(str, object)  # file, KeyframeTable | None
+
     def __init__(self, videoItem: T, parent: QObject):
         super().__init__(parent)
         self.videoItem = videoItem
@@ -44,13 +49,28 @@ class BaseSlots(QObject, Generic[T]):
         self.videoItem.player.setPlaybackRate(speed)
         self.videoItem.imgview.tool.onMediaEvent(MediaEvent.PlaybackSpeedChanged)
 
-    @Slot(str, QImage)
-    def onThumbnailDone(self, file: str, image: QImage):
+    @Slot(str, int, QImage)
+    def onThumbnailDone(self, file: str, pos: int, image: QImage):
         if file == self.videoItem.filepath:
-            pixmap = QPixmap.fromImage(image)
-            self.videoItem.playbackControls.seekThumbnail.setPixmap(pixmap)
+            seekThumbnail = self.videoItem.playbackControls.seekThumbnail
+            # Don't replace the sprite preview of a newer position
+            if self.videoItem.seekSprites is not None and pos != seekThumbnail.requestPos:
+                return
+
+            seekThumbnail.setPixmap(QPixmap.fromImage(image))
+            seekThumbnail.spriteIndex = -1
             self.videoItem._redrawMainViewport()
 
+    @Slot(str, object)
+    def onSpritesLoaded(self, file: str, sprites: SeekSprites | None):
+        if file == self.videoItem.filepath:
+            self.videoItem.seekSprites = sprites
+
+    @Slot(str, object)
+    def onKeyframesLoaded(self, file: str, keyframes: KeyframeTable | None):
+        if file == self.videoItem.filepath:
+            self.videoItem.keyframeTable = keyframes
+
 
 S = TypeVar("S", bound=BaseSlots)
 class VideoItemMixin(MediaItemMixin, Generic[S]):
@@ -65,6 +85,9 @@ class VideoItemMixin(MediaItemMixin, Generic[S]):
 
         self.player: QMediaPlayer = None
         self.audioOutput: QAudioOutput = None
+        self.seekSprites: SeekSprites | None = None
+        self.keyframeTable: KeyframeTable | None = None
+        self._keyframeTableRequested = False
 
     def _initMixin(self):
         self.menu = SeekContextMenu(self)
@@ -83,6 +106,9 @@ class VideoItemMixin(MediaItemMixin, Generic[S]):
         self.frameExtractor.thumbnailDone.connect(self._slots.onThumbnailDone, Qt.ConnectionType.QueuedConnection)
         self._extractorThread.start()
 
+        self._slots.spritesLoaded.connect(self._slots.onSpritesLoaded, Qt.ConnectionType.QueuedConnection)
+        self._slots.keyframesLoaded.connect(self._slots.onKeyframesLoaded, Qt.ConnectionType.QueuedConnection)
+
         self.playbackControls.updateSize(self.imgview.viewport().rect())
 
     def qtParent(self) -> QObject:
@@ -95,6 +121,21 @@ class VideoItemMixin(MediaItemMixin, Generic[S]):
     def _loadVideo(self, path: str, duration: int):
         pass
 
+    def _loadSprites(self, path: str):
+        if Config.mediaSeekThumbnailSize > 0:
+            QThreadPool.globalInstance().start(SeekSpriteTask(self._slots.spritesLoaded, path))
+
+    def getKeyframes(self, start: int, end: int) -> list[int]:
+        'Returns the keyframe timestamps in milliseconds within [start, end].'
+        if self.keyframeTable is not None:
+            return self.keyframeTable.keyframesInRange(start, end)
+
+        # Building the table demuxes the whole video: Do it in the background and only demux the range until it's ready
+        if not self._keyframeTableRequested:
+            self._keyframeTableRequested = True
+            QThreadPool.globalInstance().start(KeyframeTableTask(self._slots.keyframesLoaded, self.filepath))
+        return videorw.getKeyframes(self.filepath, start, end)
+
 
     def _redrawMainViewport(self):
         # The GUI scene is rendered separately as overlay. It's not automatically redrawn when geometries change.
@@ -181,6 +222,8 @@ class VideoItemMixin(MediaItemMixin, Generic[S]):
     def clearImage(self):
         super().clearImage()
         self.frameExtractor.unload()
+        self.seekSprites = None
+        self.keyframeTable = None
 
     @override
     def loadFile(self, path: str) -> bool:
@@ -191,11 +234,16 @@ class VideoItemMixin(MediaItemMixin, Generic[S]):
         self.info.reset()
         self._slots.reset()
         self.clearSegment()
+        self.seekSprites = None
+        self.keyframeTable = None
 
         if not super().loadFile(path):
             return False
 
-        w, h, fps, frameCount, duration = videorw.readMetadata(path)
+        self.keyframeTable = VideoIndex().getKeyframeTable(path, build=False)
+        self._keyframeTableRequested = self.keyframeTable is not None
+
+        w, h, fps, frameCount, duration, rotation = VideoIndex().getInfo(path)
 
         self._size = QSize(w, h)
         if not self._checkLoadVideo(self._size):
@@ -209,8 +257,10 @@ class VideoItemMixin(MediaItemMixin, Generic[S]):
         self.player.setPlaybackRate(1.0)
 
         self._loadVideo(path, duration)
+        self._loadSprites(path)
 
         self.playbackControls.seekThumbnail.setPixmap(QPixmap())
+        self.playbackControls.seekThumbnail.spriteIndex = -1
         self.playbackControls.seekThumbnail.hide()
         self.playbackControls.labelSeekTime.hide()
         return True
@@ -459,10 +509,12 @@ class FrozenVideoItemSlots(BaseSlots['FrozenVideoItem']):
     def __init__(self, videoItem: FrozenVideoItem, parent: QObject):
         super().__init__(videoItem, parent)
         self._needsTransformUpdate = True
+        self.previewShown = False
 
     @override
     def reset(self):
         self._needsTransformUpdate = True
+        self.previewShown = False
 
     @override
     @Slot(bool)
@@ -470,9 +522,14 @@ class FrozenVideoItemSlots(BaseSlots['FrozenVideoItem']):
         if playing:
             self.videoItem.menu.updateValues()
 
-    @Slot(str, QImage)
-    def onFrameDone(self, file: str, image: QImage):
+    @Slot(str, int, QImage)
+    def onFrameDone(self, file: str, pos: int, image: QImage):
         if file == self.videoItem.filepath:
+            # Don't replace the sprite preview of a newer position
+            if self.previewShown and pos != self.videoItem.player.position():
+                return
+            self.previewShown = False
+
             pixmap = QPixmap.fromImage(image)
             self.videoItem.setPixmap(pixmap.copy())
 
@@ -529,10 +586,27 @@ class FrozenVideoItem(VideoItemMixin[FrozenVideoItemSlots], QGraphicsPixmapItem)
     @override
     def setVideoPosition(self, position: int) -> bool:
         if self.info.isVideoReady():
+            self._showSpritePreview(position)
             self.frameExtractor.requestFrame(self.filepath, position)
             return super().setVideoPosition(position)
         return False
 
+    def _showSpritePreview(self, position: int):
+        'Shows the upscaled sprite tile while the full frame is decoded. Only used for jumps, not for stepping through frames.'
+        sprites = self.seekSprites
+        if sprites is None:
+            return
+
+        interval = sprites.interval()
+        if interval <= 0 or abs(position - self.player.position()) < interval:
+            return
+
+        tile = sprites.tiles[sprites.indexAt(position)]
+        image = qtlib.numpyToQImage(tile, fromRGB=True)
+        image = image.scaled(self._size, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        self.setPixmap(QPixmap.fromImage(image))
+        self._slots.previewShown = True
+
     @override
     def _loadVideo(self, path: str, duration: int):
         self.info.duration = duration
@@ -780,7 +854,13 @@ class PlaybackControls(QGraphicsItemGroup):
         self.labelSeekTime.show()
 
         if self.videoItem.info.isThumbnailsEnabled():
-            self.videoItem.frameExtractor.requestThumbnail(self.videoItem.filepath, videoPos)
+            # Show the sprite tile instantly and decode the exact frame once the position settles
+            sprites = self.videoItem.seekSprites
+            if sprites is not None:
+                self.seekThumbnail.setSpriteTile(sprites, videoPos)
+
+            self.seekThumbnail.requestPos = videoPos
+            self.videoItem.frameExtractor.requestThumbnail(self.videoItem.filepath, videoPos, sprites is not None)
             self.seekThumbnail.setBoundedX(mouseX, sceneW)
             self.seekThumbnail.show()
 
@@ -888,11 +968,28 @@ class SeekThumbnail(QGraphicsPixmapItem):
         self.setShapeMode(QGraphicsPixmapItem.ShapeMode.BoundingRectShape)
         self.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
 
+        self.requestPos: int = -1
+        self.spriteIndex: int = -1
+
     @override
     def setPixmap(self, pixmap: QPixmap | QImage):
         super().setPixmap(pixmap)
         self.setY(-pixmap.height())
 
+    def setSpriteTile(self, sprites: SeekSprites, pos: int):
+        index = sprites.indexAt(pos)
+        if index == self.spriteIndex:
+            return
+
+        self.spriteIndex = index
+        tile = sprites.tiles[index]
+        h, w = tile.shape[:2]
+        w, h = FrameExtractWorker._calcThumbnailSize(w, h)
+
+        image = qtlib.numpyToQImage(tile, fromRGB=True)
+        image = image.scaled(w, h, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        self.setPixmap(QPixmap.fromImage(image))
+
     def setBoundedX(self, x: float, sceneWidth: float):
         w = self.boundingRect().width()
         x = min(x, sceneWidth - w)
@@ -1173,7 +1270,7 @@ class SeekContextMenu(qtlib.AutoCloseMenu):
         self._setKeyframe(currentPos, -8000, 8000, timeChooser)
 
     def _setKeyframe(self, currentPos: int, startOffset: int, endOffset: int, timeChooser: Callable[[list[int]], int]):
-        keyframes = videorw.getKeyframes(self.videoItem.filepath, currentPos+startOffset, currentPos+endOffset)
+        keyframes = self.videoItem.getKeyframes(currentPos+startOffset, currentPos+endOffset)
         if not keyframes:
             print("No keyframes")
             return
@@ -1186,19 +1283,52 @@ class SeekContextMenu(qtlib.AutoCloseMenu):
 
 
 
+class SeekSpriteTask(QRunnable):
+    def __init__(self, doneSignal: SignalInstance, file: str):
+        super().__init__()
+        self.setAutoDelete(True)
+        self.done = doneSignal
+        self.file = file
+
+    @Slot()
+    def run(self):
+        sprites = SeekSpriteStore().getOrCreate(self.file)
+        try:
+            self.done.emit(self.file, sprites)
+        except RuntimeError:
+            pass  # Video item was deleted
+
+
+class KeyframeTableTask(QRunnable):
+    def __init__(self, doneSignal: SignalInstance, file: str):
+        super().__init__()
+        self.setAutoDelete(True)
+        self.done = doneSignal
+        self.file = file
+
+    @Slot()
+    def run(self):
+        keyframes = VideoIndex().getKeyframeTable(self.file)
+        try:
+            self.done.emit(self.file, keyframes)
+        except RuntimeError:
+            pass  # Video item was deleted
+
+
+
 class ThumbnailRequest(NamedTuple):
     file: str
     pos: int
 
 class FrameExtractWorker(QObject):
-    THUMBNAIL_INTERVAL = 100  # ms
+    THUMBNAIL_INTERVAL = 100  # ms. Throttles requests, or waits for the position to settle when sprites are shown.
 
     _unload = Signal()
-    _requestThumbnail = Signal(str, int) # file, pos
-    _requestFrame = Signal(str, int)     # file, pos
+    _requestThumbnail = Signal(str, int, bool) # file, pos, settle
+    _requestFrame = Signal(str, int)           # file, pos
 
-    thumbnailDone = Signal(str, QImage)  # file, img
-    frameDone = Signal(str, QImage)      # file, img
+    thumbnailDone = Signal(str, int, QImage)  # file, pos, img
+    frameDone = Signal(str, int, QImage)      # file, pos, img
 
 
     def __init__(self):
@@ -1214,9 +1344,14 @@ class FrameExtractWorker(QObject):
         self._thumbnailTimer = QTimer(self, singleShot=True, interval=self.THUMBNAIL_INTERVAL)
         self._thumbnailTimer.timeout.connect(self._doExtractThumbnail)
 
+        # Only the last of the queued frame requests is decoded
+        self._frameRequest: ThumbnailRequest | None = None
+        self._frameTimer = QTimer(self, singleShot=True, interval=0)
+        self._frameTimer.timeout.connect(self._doExtractFrame)
+
         self._unload.connect(self._onUnload, Qt.ConnectionType.QueuedConnection)
         self._requestThumbnail.connect(self._onThumbnailRequested, Qt.ConnectionType.QueuedConnection)
-        self._requestFrame.connect(self._doExtractFrame, Qt.ConnectionType.QueuedConnection)
+        self._requestFrame.connect(self._onFrameRequested, Qt.ConnectionType.QueuedConnection)
 
     def unload(self):
         self._unload.emit()
@@ -1243,6 +1378,7 @@ class FrameExtractWorker(QObject):
                 self.file = file
 
                 stream = self.container.streams.video[0]
+                videorw.DECODE_PROFILE_SEEK.apply(stream)
                 w, h = videorw.avGetFrameSize(stream)
                 if min(w, h) <= 0:
                     raise ValueError(f"Invalid video size of width={w}, height={h}")
@@ -1269,13 +1405,13 @@ class FrameExtractWorker(QObject):
         return w, h
 
 
-    def requestThumbnail(self, file: str, pos: int):
-        self._requestThumbnail.emit(file, pos)
+    def requestThumbnail(self, file: str, pos: int, settle: bool = False):
+        self._requestThumbnail.emit(file, pos, settle)
 
-    @Slot(str, int)
-    def _onThumbnailRequested(self, file: str, pos: int):
+    @Slot(str, int, bool)
+    def _onThumbnailRequested(self, file: str, pos: int, settle: bool):
         self._thumbnailRequest = ThumbnailRequest(file, pos)
-        if not self._thumbnailTimer.isActive():
+        if settle or not self._thumbnailTimer.isActive():
             self._thumbnailTimer.start()
 
     @Slot()
@@ -1292,7 +1428,7 @@ class FrameExtractWorker(QObject):
                 self.thumbnailConvert = videorw.createFrameConverter(w, h, True, Interpolation.AREA)
 
             image = self._extractFrame(container, req.pos, self.thumbnailConvert)
-            self.thumbnailDone.emit(req.file, image)
+            self.thumbnailDone.emit(req.file, req.pos, image)
         except Exception as ex:
             print(f"Failed to extract thumbnail: {ex} ({type(ex).__name__})")
 
@@ -1301,15 +1437,25 @@ class FrameExtractWorker(QObject):
         self._requestFrame.emit(file, pos)
 
     @Slot(str, int)
-    def _doExtractFrame(self, file: str, pos: int):
+    def _onFrameRequested(self, file: str, pos: int):
+        self._frameRequest = ThumbnailRequest(file, pos)
+        if not self._frameTimer.isActive():
+            self._frameTimer.start()
+
+    @Slot()
+    def _doExtractFrame(self):
+        req = self._frameRequest
+        if req is None:
+            return
+
         try:
-            container = self._prepareContainer(file)
+            container = self._prepareContainer(req.file)
             if self.frameConvert is None:
                 w, h = self.frameSize.toTuple()
                 self.frameConvert = videorw.createFrameConverter(w, h, True, Interpolation.LANCZOS)
 
-            image = self._extractFrame(container, pos, self.frameConvert)
-            self.frameDone.emit(file, image)
+            image = self._extractFrame(container, req.pos, self.frameConvert)
+            self.frameDone.emit(req.file, req.pos, image)
         except Exception as ex:
             print(f"Failed to extract video frame: {ex} ({type(ex).__name__})")
 